@@ -0,0 +1,246 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    midi_diff/align.py
+
+Description:
+    Transposition- and time-shift-invariant comparison.
+
+    When a part has been moved by an octave or shifted by a bar, every one of its
+    notes differs from the original. This module estimates the pitch and tick offset
+    that best maps the second input onto the first, then re-keys the second input's
+    notes by that offset so the ordinary diff engine matches them.
+
+    The estimate votes with the interval/rhythm n-gram terms of
+    :mod:`midi_diff.fragments`, which do not change under transposition or shifting.
+    Both inputs' terms are hashed; every term of the second input that also occurs in
+    the first votes for the ``(pitch, tick)`` offset between the two occurrences.
+    Terms occurring more than ``max_bucket`` times in the first input (repeated
+    figures, drum patterns) are skipped, so the pass costs time linear in the number
+    of notes instead of comparing all pairs. The offset with the most votes wins.
+"""
+
+from __future__ import annotations
+
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Final, Iterable
+
+from midi_diff.fragments import DEFAULT_NGRAM, iter_terms, onsets
+from midi_diff.midi_utils import NoteRecord
+from midi_diff.note_keys import PITCH_MASK, pack_key, unpack_key
+
+ALIGN_GLOBAL: Final[str] = 'global'
+"""Estimate one offset for the whole second input."""
+
+ALIGN_TRACKS: Final[str] = 'tracks'
+"""Estimate an offset per track, falling back to the global one."""
+
+ALIGN_MODES: Final[tuple[str, ...]] = (ALIGN_GLOBAL, ALIGN_TRACKS)
+
+DEFAULT_MAX_BUCKET: Final[int] = 8
+"""Terms occurring more often than this in the first input do not vote."""
+
+MIN_TRACK_VOTES: Final[int] = 3
+"""Votes a per-track estimate needs to override the global offset."""
+
+
+@dataclass(frozen=True, slots=True)
+class Offset:
+    """
+    How far the second input is moved relative to the first.
+
+    Attributes:
+        pitch (int):
+            Semitones added to the first input's pitches.
+
+        ticks (int):
+            Ticks added to the first input's start times.
+
+        votes (int):
+            Number of matching terms that supported the offset (0 if nothing voted).
+    """
+
+    pitch: int = 0
+    ticks: int = 0
+    votes: int = 0
+
+
+def _term_table(records: Iterable[NoteRecord], ticks_per_beat: int, n: int) -> dict[int, list[tuple[int, int]]]:
+    """Map each term of ``records`` to the ``(start, pitch)`` of its occurrences."""
+    stream = onsets(records)
+    table: dict[int, list[tuple[int, int]]] = defaultdict(list)
+    for term, position, _start in iter_terms(stream, ticks_per_beat, n):
+        table[term].append(stream[position])
+    return table
+
+
+def _vote(
+    table_a: dict[int, list[tuple[int, int]]],
+    records_b: Iterable[NoteRecord],
+    ticks_per_beat: int,
+    n: int,
+    max_bucket: int,
+) -> Offset:
+    """Return the offset most terms of ``records_b`` agree on against ``table_a``."""
+    stream = onsets(records_b)
+    votes: Counter = Counter()
+    for term, position, _start in iter_terms(stream, ticks_per_beat, n):
+        occurrences = table_a.get(term)
+        if not occurrences or len(occurrences) > max_bucket:
+            continue
+        start_b, pitch_b = stream[position]
+        for start_a, pitch_a in occurrences:
+            votes[pitch_b - pitch_a, start_b - start_a] += 1
+    if not votes:
+        return Offset()
+    # Most votes first; among ties prefer the smallest move.
+    (pitch, ticks), count = min(votes.items(), key=lambda item: (-item[1], abs(item[0][0]), abs(item[0][1])))
+    return Offset(pitch, ticks, count)
+
+
+def estimate_offset(
+    records_a: Iterable[NoteRecord],
+    records_b: Iterable[NoteRecord],
+    ticks_per_beat: int,
+    n: int = DEFAULT_NGRAM,
+    max_bucket: int = DEFAULT_MAX_BUCKET,
+) -> Offset:
+    """
+    Estimate the pitch and tick offset of the second input relative to the first.
+
+    Parameters:
+        records_a (Iterable[NoteRecord]):
+            Records of the first input.
+
+        records_b (Iterable[NoteRecord]):
+            Records of the second input, at the same resolution.
+
+        ticks_per_beat (int):
+            Resolution of both inputs.
+
+        n (int):
+            Onsets per voting term.
+
+        max_bucket (int):
+            Terms occurring more often than this in the first input are skipped.
+
+    Returns:
+        Offset:
+            The best-supported offset, or a zero offset if no term matched.
+    """
+    return _vote(_term_table(records_a, ticks_per_beat, n), records_b, ticks_per_beat, n, max_bucket)
+
+
+def estimate_track_offsets(
+    records_a: list[NoteRecord],
+    records_b: list[NoteRecord],
+    ticks_per_beat: int,
+    n: int = DEFAULT_NGRAM,
+    max_bucket: int = DEFAULT_MAX_BUCKET,
+) -> tuple[Offset, dict[int, Offset]]:
+    """
+    Estimate a global offset and one offset per track of the second input.
+
+    Each track of the second input votes against the same track of the first input
+    (or against the whole first input if it has no such track). Tracks with fewer than
+    :data:`MIN_TRACK_VOTES` votes use the global offset.
+
+    Parameters:
+        records_a (list[NoteRecord]):
+            Records of the first input.
+
+        records_b (list[NoteRecord]):
+            Records of the second input, at the same resolution.
+
+        ticks_per_beat (int):
+            Resolution of both inputs.
+
+        n (int):
+            Onsets per voting term.
+
+        max_bucket (int):
+            Terms occurring more often than this in the compared notes are skipped.
+
+    Returns:
+        tuple[Offset, dict[int, Offset]]:
+            The global offset and the offset of every track of the second input.
+    """
+    table_a = _term_table(records_a, ticks_per_beat, n)
+    overall = _vote(table_a, records_b, ticks_per_beat, n, max_bucket)
+
+    tracks_a: dict[int, list[NoteRecord]] = defaultdict(list)
+    tracks_b: dict[int, list[NoteRecord]] = defaultdict(list)
+    for record in records_a:
+        tracks_a[record[2]].append(record)
+    for record in records_b:
+        tracks_b[record[2]].append(record)
+
+    per_track: dict[int, Offset] = {}
+    for track, records in tracks_b.items():
+        table = _term_table(tracks_a[track], ticks_per_beat, n) if track in tracks_a else table_a
+        offset = _vote(table, records, ticks_per_beat, n, max_bucket)
+        per_track[track] = offset if offset.votes >= MIN_TRACK_VOTES else overall
+    return overall, per_track
+
+
+def align_records(
+    records: Iterable[NoteRecord],
+    offset: Offset,
+    track_offsets: dict[int, Offset] | None = None,
+) -> tuple[list[NoteRecord], dict[int, int]]:
+    """
+    Re-key the second input's records into the first input's frame.
+
+    Each record is moved back by its track's offset (or ``offset``). A note that would
+    land before tick 0 or outside the MIDI pitch range cannot match anything, so it is
+    given a key no real note has (the bitwise complement of its own key).
+
+    Parameters:
+        records (Iterable[NoteRecord]):
+            Records of the second input.
+
+        offset (Offset):
+            Offset applied to tracks without their own.
+
+        track_offsets (dict[int, Offset] | None):
+            Per-track offsets, from :func:`estimate_track_offsets`.
+
+    Returns:
+        tuple[list[NoteRecord], dict[int, int]]:
+            The re-keyed records, and a map from each new key back to the first
+            original key that produced it.
+    """
+    track_offsets = track_offsets or {}
+    aligned: list[NoteRecord] = []
+    origin: dict[int, int] = {}
+    for key, velocity, track in records:
+        move = track_offsets.get(track, offset)
+        pitch, channel, start, duration = unpack_key(key)
+        pitch -= move.pitch
+        start -= move.ticks
+        if 0 <= pitch <= PITCH_MASK and start >= 0:
+            new_key = pack_key(pitch, channel, start, duration)
+        else:
+            new_key = ~key
+        origin.setdefault(new_key, key)
+        aligned.append((new_key, velocity, track))
+    return aligned, origin
+
+
+__all__ = [
+    'ALIGN_GLOBAL',
+    'ALIGN_MODES',
+    'ALIGN_TRACKS',
+    'DEFAULT_MAX_BUCKET',
+    'MIN_TRACK_VOTES',
+    'Offset',
+    'align_records',
+    'estimate_offset',
+    'estimate_track_offsets',
+]
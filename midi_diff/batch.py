@@ -0,0 +1,414 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    midi_diff/batch.py
+
+Description:
+    Diff many file pairs in one run.
+
+    Files in two directory trees are paired by relative path. Before anything is
+    parsed, every file is pre-scanned (see :mod:`midi_diff.prescan`): malformed and
+    truncated files are rejected up front with the reason, instead of failing after a
+    partial parse, and the remaining jobs are ordered by estimated size, largest first,
+    so that with several workers the longest jobs start early and do not leave one
+    worker busy at the end of the run.
+
+    Each completed pair can be appended to a :class:`midi_diff.journal.Journal` with
+    the content hashes of its inputs, so a run that is killed can be restarted and skip
+    every pair whose inputs have not changed since (see :func:`completed_jobs`).
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import multiprocessing
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Final, Iterable, Union
+
+from midi_diff.cache import content_hash
+from midi_diff.core import render_diff, stream_diff_files
+from midi_diff.journal import Journal
+from midi_diff.metrics import active, collecting, observe_diff
+from midi_diff.outputs import replace_output
+from midi_diff.prescan import FileScan, prescan
+from midi_diff.report import FORMAT_JSONL, REPORT_SUFFIXES
+from midi_diff.sources import COMPRESSED_SUFFIXES, MIDI_SUFFIXES, iter_midi_files
+
+DEFAULT_BATCH_FORMAT: Final[str] = FORMAT_JSONL
+
+DEFAULT_JOURNAL_NAME: Final[str] = '.midi-diff-journal.jsonl'
+"""Journal file name, inside the output directory, used by the ``batch`` command."""
+
+
+@dataclass(frozen=True, slots=True)
+class BatchJob:
+    """
+    One pair of files to diff.
+
+    Attributes:
+        name (str):
+            Relative path shared by both files.
+
+        file_a (pathlib.Path):
+            File in the first tree.
+
+        file_b (pathlib.Path):
+            File in the second tree.
+
+        cost (int):
+            Estimated events in both files, used for scheduling.
+    """
+
+    name: str
+    file_a: Path
+    file_b: Path
+    cost: int = 0
+
+
+@dataclass(frozen=True, slots=True)
+class Rejected:
+    """
+    A file pair that will not be diffed.
+
+    Attributes:
+        name (str):
+            Relative path of the pair.
+
+        reason (str):
+            Why it was rejected.
+    """
+
+    name: str
+    reason: str
+
+
+@dataclass(frozen=True, slots=True)
+class BatchResult:
+    """
+    Outcome of one job.
+
+    Attributes:
+        job (BatchJob):
+            The job.
+
+        output (pathlib.Path | None):
+            The written diff, or None if the job failed.
+
+        counts (dict[str, int]):
+            Differing notes per side.
+
+        error (str | None):
+            Failure message, if any.
+
+        seconds (float):
+            Time the job took.
+
+        hashes (tuple[str, str] | None):
+            Content hashes of both inputs, as diffed.
+
+        metrics (dict[str, Any] | None):
+            Snapshot of the job's metrics (see :meth:`midi_diff.metrics.Registry.snapshot`),
+            if they were collected.
+    """
+
+    job: BatchJob
+    output: Path | None = None
+    counts: dict[str, int] = field(default_factory=dict)
+    error: str | None = None
+    seconds: float = 0.0
+    hashes: tuple[str, str] | None = None
+    metrics: dict[str, Any] | None = None
+
+
+def _relative_names(directory: Path) -> dict[str, Path]:
+    return {path.relative_to(directory).as_posix(): path for path in iter_midi_files(directory)}
+
+
+def _scan_problem(scan: FileScan) -> str | None:
+    if scan.ok:
+        return None
+    kind = 'truncated' if scan.truncated else 'invalid'
+    return f'{scan.source} is {kind}: {"; ".join(scan.problems)}'
+
+
+def plan_batch(dir_a: Union[str, Path], dir_b: Union[str, Path]) -> tuple[list[BatchJob], list[Rejected]]:
+    """
+    Pair the MIDI files of two trees and pre-scan them.
+
+    Parameters:
+        dir_a (str | pathlib.Path):
+            First tree.
+
+        dir_b (str | pathlib.Path):
+            Second tree.
+
+    Returns:
+        tuple[list[BatchJob], list[Rejected]]:
+            Jobs, largest estimated first, and the pairs rejected because a file is
+            missing from one tree, unreadable, malformed or truncated, in name order.
+    """
+    files_a, files_b = _relative_names(Path(dir_a)), _relative_names(Path(dir_b))
+    jobs: list[BatchJob] = []
+    rejected: list[Rejected] = []
+    for name in sorted(files_a.keys() | files_b.keys()):
+        if name not in files_b:
+            rejected.append(Rejected(name, f'missing from {dir_b}'))
+            continue
+        if name not in files_a:
+            rejected.append(Rejected(name, f'missing from {dir_a}'))
+            continue
+        try:
+            scans = prescan(files_a[name]), prescan(files_b[name])
+        except OSError as e:
+            rejected.append(Rejected(name, str(e)))
+            continue
+        problems = [problem for problem in map(_scan_problem, scans) if problem]
+        if problems:
+            rejected.append(Rejected(name, '; '.join(problems)))
+            continue
+        cost = scans[0].estimated_events + scans[1].estimated_events
+        jobs.append(BatchJob(name, files_a[name], files_b[name], cost))
+    jobs.sort(key=lambda job: job.cost, reverse=True)
+    return jobs, rejected
+
+
+def output_path(out_dir: Union[str, Path], name: str, output_format: str) -> Path:
+    """
+    Return where the diff of pair ``name`` is written.
+
+    The MIDI and compression suffixes of ``name`` are replaced by the format's.
+    """
+    relative = Path(name)
+    while relative.suffix.lower() in COMPRESSED_SUFFIXES + MIDI_SUFFIXES:
+        relative = relative.with_suffix('')
+    return Path(out_dir) / relative.with_name(relative.name + REPORT_SUFFIXES[output_format])
+
+
+def run_job(
+    job: BatchJob,
+    out_path: Path,
+    output_format: str,
+    report_changes: bool,
+    collect_metrics: bool = False,
+) -> BatchResult:
+    """
+    Diff one pair and write the result, returning failures instead of raising.
+
+    Parameters:
+        job (BatchJob):
+            The pair.
+
+        out_path (pathlib.Path):
+            Output file, replaced if it exists.
+
+        output_format (str):
+            Any format accepted by ``diff --format``.
+
+        report_changes (bool):
+            Also report matched notes whose velocity changed.
+
+        collect_metrics (bool):
+            Record the job's metrics in a registry of its own and return a snapshot,
+            so they can be merged wherever the job ran.
+
+    Returns:
+        BatchResult:
+            The outcome.
+    """
+    if collect_metrics:
+        with collecting() as registry:
+            result = _run_job(job, out_path, output_format, report_changes)
+        return dataclasses.replace(result, metrics=registry.snapshot())
+    return _run_job(job, out_path, output_format, report_changes)
+
+
+def _run_job(job: BatchJob, out_path: Path, output_format: str, report_changes: bool) -> BatchResult:
+    started = time.perf_counter()
+    try:
+        hashes = content_hash(job.file_a), content_hash(job.file_b)
+        entries, ticks_per_beat = stream_diff_files(job.file_a, job.file_b, report_changes=report_changes)
+        with replace_output(out_path) as fh:
+            counts = render_diff(
+                entries,
+                output_format,
+                ticks_per_beat,
+                report_changes,
+                fh,
+                sources=(job.file_a, job.file_b),
+            )
+    except Exception as e:
+        seconds = time.perf_counter() - started
+        observe_diff(seconds, failed=True)
+        return BatchResult(job, error=str(e) or type(e).__name__, seconds=seconds)
+    seconds = time.perf_counter() - started
+    observe_diff(seconds, counts)
+    return BatchResult(job, out_path, dict(Counter(counts)), seconds=seconds, hashes=hashes)
+
+
+def journal_record(
+    result: BatchResult,
+    output_format: str,
+    report_changes: bool,
+    out_dir: Union[str, Path],
+) -> dict[str, Any]:
+    """Return the journal record of a successful job, with its output relative to ``out_dir``."""
+    return {
+        'name': result.job.name,
+        'a': result.hashes[0],
+        'b': result.hashes[1],
+        'format': output_format,
+        'changes': report_changes,
+        'counts': result.counts,
+        'output': result.output.relative_to(out_dir).as_posix(),
+    }
+
+
+def completed_jobs(
+    jobs: Iterable[BatchJob],
+    records: Iterable[dict[str, Any]],
+    output_format: str,
+    report_changes: bool,
+    out_dir: Union[str, Path],
+) -> list[tuple[BatchJob, dict[str, Any]]]:
+    """
+    Find the jobs a previous run already completed.
+
+    A job counts as completed if the journal holds a record for its name with the same
+    output options, the record names the output this run would write below
+    ``out_dir`` and that file still exists, and both inputs still have the recorded
+    content hashes. Inputs are only hashed for jobs that have a record.
+
+    Parameters:
+        jobs (Iterable[BatchJob]):
+            Jobs of this run.
+
+        records (Iterable[dict[str, Any]]):
+            Journal records, from :func:`midi_diff.journal.read_journal`.
+
+        output_format (str):
+            Output format of this run.
+
+        report_changes (bool):
+            Whether this run reports velocity changes.
+
+        out_dir (str | pathlib.Path):
+            Output directory of this run; recorded outputs are relative to it.
+
+    Returns:
+        list[tuple[BatchJob, dict[str, Any]]]:
+            Completed jobs with their latest record.
+    """
+    latest = {
+        record.get('name'): record
+        for record in records
+        if record.get('format') == output_format and record.get('changes') == report_changes
+    }
+    done: list[tuple[BatchJob, dict[str, Any]]] = []
+    for job in jobs:
+        record = latest.get(job.name)
+        out_path = output_path(out_dir, job.name, output_format)
+        if record is None or record.get('output') != out_path.relative_to(out_dir).as_posix() or not out_path.is_file():
+            continue
+        try:
+            hashes = content_hash(job.file_a), content_hash(job.file_b)
+        except OSError:
+            continue
+        if hashes == (record.get('a'), record.get('b')):
+            done.append((job, record))
+    return done
+
+
+def run_batch(
+    jobs: Iterable[BatchJob],
+    out_dir: Union[str, Path],
+    output_format: str = DEFAULT_BATCH_FORMAT,
+    report_changes: bool = False,
+    workers: int | None = None,
+    on_result: Callable[[BatchResult], None] | None = None,
+    journal: Journal | None = None,
+) -> list[BatchResult]:
+    """
+    Run jobs, in the given order, and write each diff below ``out_dir``.
+
+    Parameters:
+        jobs (Iterable[BatchJob]):
+            Jobs, e.g. from :func:`plan_batch`; they are started in this order.
+
+        out_dir (str | pathlib.Path):
+            Output directory; each diff mirrors its pair's relative path.
+
+        output_format (str):
+            Any format accepted by ``diff --format``.
+
+        report_changes (bool):
+            Also report matched notes whose velocity changed.
+
+        workers (int | None):
+            Worker processes (default: CPU count). With 1, jobs run in this process.
+
+        on_result (Callable[[BatchResult], None] | None):
+            Called as each job finishes.
+
+        journal (Journal | None):
+            Journal each successful job is appended to as it finishes.
+
+        When metrics are enabled (:func:`midi_diff.metrics.enable`), every job's
+        metrics are merged into the active registry as it finishes.
+
+    Returns:
+        list[BatchResult]:
+            Results in completion order.
+    """
+    jobs = list(jobs)
+    results: list[BatchResult] = []
+    registry = active()
+    run = partial(run_job, output_format=output_format, report_changes=report_changes, collect_metrics=registry is not None)
+
+    def finished(result: BatchResult) -> None:
+        results.append(result)
+        if registry is not None and result.metrics is not None:
+            registry.merge(result.metrics)
+        if journal is not None and result.error is None:
+            journal.append(journal_record(result, output_format, report_changes, out_dir))
+        if on_result is not None:
+            on_result(result)
+
+    if workers == 1 or len(jobs) <= 1:
+        for job in jobs:
+            finished(run(job, output_path(out_dir, job.name, output_format)))
+        return results
+
+    context = multiprocessing.get_context()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = [
+            pool.submit(run, job, output_path(out_dir, job.name, output_format))
+            for job in jobs
+        ]
+        for future in as_completed(futures):
+            finished(future.result())
+    return results
+
+
+__all__ = [
+    'BatchJob',
+    'BatchResult',
+    'DEFAULT_BATCH_FORMAT',
+    'DEFAULT_JOURNAL_NAME',
+    'Rejected',
+    'completed_jobs',
+    'journal_record',
+    'output_path',
+    'plan_batch',
+    'run_batch',
+    'run_job',
+]
@@ -0,0 +1,527 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    midi_diff/cache.py
+
+Description:
+    On-disk memoization of diff results. Entries are keyed by the content hashes of
+    both inputs, the diff options and the library version, and hold the compact diff
+    (packed note records), its summary counts, and any output already rendered from it,
+    so a repeated comparison is answered without parsing either MIDI file.
+
+Cache layout, one group of files per key in a flat directory::
+
+    <key>.json      metadata: ticks per beat and counts per side
+    <key>.entries   diff entries as fixed-width records (see ``ENTRY_RECORD``)
+    <key>.<format>  rendered output, e.g. ``<key>.mid`` or ``<key>.jsonl``
+    <key>.notes     extracted notes of one input, keyed by its git blob id
+                    (``NOTES_HEADER`` then ``NOTE_RECORD`` records)
+    <key>.seekidx   seek index of one input, keyed by its content digest
+                    (see :mod:`midi_diff.seek_index`)
+
+Groups are evicted as a unit, oldest access first, once they exceed the age limit or
+the cache exceeds its size limit.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import json
+import os
+import struct
+import time
+from collections import Counter
+from dataclasses import dataclass
+from importlib import metadata
+from pathlib import Path
+from typing import Final, Iterable, Union
+
+from midi_diff.diff import COMPARED_ATTRIBUTES, SIDE_A, SIDE_B, SIDE_CHANGED, DiffEntry
+from midi_diff.midi_utils import NoteRecord
+from midi_diff.note_keys import KEY_LAYOUT_VERSION
+from midi_diff.outputs import write_atomic
+from midi_diff.seek_index import SEEK_INDEX_SUFFIX, SEEK_INDEX_VERSION, SeekIndex
+from midi_diff.sources import MidiSource, is_path_source, open_source
+
+CACHE_DIR_ENV_VAR: Final[str] = 'MIDI_DIFF_CACHE_DIR'
+"""Environment variable overriding the cache directory."""
+
+CACHE_FORMAT_VERSION: Final[int] = 1
+
+DEFAULT_MAX_BYTES: Final[int] = 256 * 1024 * 1024
+DEFAULT_MAX_AGE_SECONDS: Final[int] = 30 * 24 * 60 * 60
+
+ENTRY_RECORD: Final[struct.Struct] = struct.Struct('<QQHHBBBB')
+"""
+``key, before_key, track, before_track, velocity, before_velocity, side, attributes``
+per entry, where ``attributes`` has bit ``i`` set for ``COMPARED_ATTRIBUTES[i]``.
+"""
+
+STALE_TEMP_SECONDS: Final[int] = 60 * 60
+"""Age after which an abandoned temporary file is removed by eviction."""
+
+NOTES_HEADER: Final[struct.Struct] = struct.Struct('<HQ')
+"""Ticks per beat and record count of a cached note table."""
+
+NOTE_RECORD: Final[struct.Struct] = struct.Struct('<QHB')
+"""Cached note: packed key, track, velocity."""
+
+META_SUFFIX: Final[str] = '.json'
+ENTRIES_SUFFIX: Final[str] = '.entries'
+NOTES_SUFFIX: Final[str] = '.notes'
+
+_SIDE_CODES: Final[dict[str, int]] = {SIDE_A: 0, SIDE_B: 1, SIDE_CHANGED: 2}
+_SIDE_NAMES: Final[tuple[str, ...]] = (SIDE_A, SIDE_B, SIDE_CHANGED)
+
+
+def default_cache_dir() -> Path:
+    """
+    Return the directory used when no cache directory is given.
+
+    ``MIDI_DIFF_CACHE_DIR`` wins; otherwise ``$XDG_CACHE_HOME/midi-diff`` (falling back
+    to ``~/.cache/midi-diff``), or ``%LOCALAPPDATA%\\midi-diff`` on Windows.
+
+    Returns:
+        pathlib.Path:
+            The cache directory (not necessarily existing yet).
+    """
+    override = os.environ.get(CACHE_DIR_ENV_VAR)
+    if override:
+        return Path(override)
+    if os.name == 'nt' and os.environ.get('LOCALAPPDATA'):
+        return Path(os.environ['LOCALAPPDATA']) / 'midi-diff'
+    base = os.environ.get('XDG_CACHE_HOME')
+    return (Path(base) if base else Path.home() / '.cache') / 'midi-diff'
+
+
+def library_version() -> str:
+    """Return the installed MIDIDiff version, or ``'unknown'`` when running from a source tree."""
+    try:
+        return metadata.version('midi-diff')
+    except metadata.PackageNotFoundError:
+        return 'unknown'
+
+
+def is_cacheable(source: object) -> bool:
+    """
+    Return True when ``source`` can be hashed and then read again for diffing.
+
+    Standard input and file objects are consumed by reading, so they are never cached.
+
+    Parameters:
+        source (object):
+            Candidate source.
+
+    Returns:
+        bool:
+            Whether ``source`` is a path, archive reference or bytes-like object.
+    """
+    return is_path_source(source) or isinstance(source, (bytes, bytearray, memoryview))
+
+
+def content_hash(source: MidiSource) -> str:
+    """
+    Identify the contents of a MIDI source.
+
+    The (decompressed) contents are hashed in full, zip members included: a CRC-32
+    match is good enough to skip diffing a member against itself (see
+    :func:`midi_diff.sources.same_archive_member`) but too weak to key cached results.
+
+    Parameters:
+        source (MidiSource):
+            Source to hash; see :func:`is_cacheable`.
+
+    Returns:
+        str:
+            The hex BLAKE2b digest of the (decompressed) MIDI data.
+    """
+    with open_source(source) as buf:
+        return hashlib.blake2b(buf).hexdigest()
+
+
+def encode_entries(entries: Iterable[DiffEntry]) -> bytes:
+    """
+    Encode diff entries as ``ENTRY_RECORD`` records.
+
+    Parameters:
+        entries (Iterable[DiffEntry]):
+            Entries to encode.
+
+    Returns:
+        bytes:
+            The packed records.
+    """
+    pack = ENTRY_RECORD.pack
+    bits = {name: 1 << i for i, name in enumerate(COMPARED_ATTRIBUTES)}
+    out = bytearray()
+    for side, (key, velocity, track), before, names in entries:
+        before_key, before_velocity, before_track = before if before is not None else (0, 0, 0)
+        mask = sum(bits[name] for name in names)
+        out += pack(key, before_key, track, before_track, velocity, before_velocity, _SIDE_CODES[side], mask)
+    return bytes(out)
+
+
+def decode_entries(data) -> list[DiffEntry]:
+    """
+    Decode records written by :func:`encode_entries`.
+
+    Parameters:
+        data (bytes | bytearray | memoryview | mmap.mmap):
+            Packed records.
+
+    Returns:
+        list[DiffEntry]:
+            The entries, in their original order.
+    """
+    entries: list[DiffEntry] = []
+    for key, before_key, track, before_track, velocity, before_velocity, side, mask in ENTRY_RECORD.iter_unpack(data):
+        if _SIDE_NAMES[side] == SIDE_CHANGED:
+            names = tuple(name for i, name in enumerate(COMPARED_ATTRIBUTES) if mask >> i & 1)
+            entries.append((SIDE_CHANGED, (key, velocity, track), (before_key, before_velocity, before_track), names))
+        else:
+            entries.append((_SIDE_NAMES[side], (key, velocity, track), None, ()))
+    return entries
+
+
+@dataclass(frozen=True, slots=True)
+class CachedDiff:
+    """
+    A diff result loaded from the cache.
+
+    Attributes:
+        key (str):
+            Cache key.
+
+        ticks_per_beat (int):
+            Resolution of the cached records.
+
+        counts (Counter):
+            Number of entries per side.
+    """
+
+    key: str
+    ticks_per_beat: int
+    counts: Counter
+
+
+class DiffCache:
+    """
+    Size- and age-bounded on-disk cache of diff results.
+
+    All writes are atomic (temporary file plus rename), and every failure to read or
+    write the cache is treated as a miss, so a broken cache never breaks a diff.
+    """
+
+    def __init__(
+        self,
+        directory: Union[str, Path, None] = None,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        max_age: float = DEFAULT_MAX_AGE_SECONDS,
+    ) -> None:
+        """
+        Parameters:
+            directory (str | pathlib.Path | None):
+                Cache directory; defaults to :func:`default_cache_dir`.
+
+            max_bytes (int):
+                Total size the cache is trimmed to after each store.
+
+            max_age (float):
+                Seconds after their last use at which entries expire.
+        """
+        self.directory = Path(directory) if directory is not None else default_cache_dir()
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+    def key_for(self, source_a: MidiSource, source_b: MidiSource, options: dict) -> str | None:
+        """
+        Compute the cache key for a comparison.
+
+        Parameters:
+            source_a (MidiSource):
+                First input.
+
+            source_b (MidiSource):
+                Second input.
+
+            options (dict):
+                JSON-serializable diff options that affect the result.
+
+        Returns:
+            str | None:
+                The key, or None when either source is not cacheable.
+
+        Raises:
+            OSError:
+                If an input cannot be read.
+        """
+        if not (is_cacheable(source_a) and is_cacheable(source_b)):
+            return None
+        identity = {
+            'a': content_hash(source_a),
+            'b': content_hash(source_b),
+            'options': options,
+            'version': library_version(),
+            'key_layout': KEY_LAYOUT_VERSION,
+            'cache_format': CACHE_FORMAT_VERSION,
+        }
+        return hashlib.sha256(json.dumps(identity, sort_keys=True).encode()).hexdigest()
+
+    def _path(self, key: str, suffix: str) -> Path:
+        """Return the file holding one part of the group for ``key``."""
+        return self.directory / f'{key}{suffix}'
+
+    def _write(self, path: Path, data: bytes) -> None:
+        """Atomically replace ``path`` with ``data``."""
+        write_atomic(path, (data,))
+
+    def _touch(self, *paths: Path) -> None:
+        """Mark files as recently used."""
+        for path in paths:
+            with contextlib.suppress(OSError):
+                os.utime(path)
+
+    def get(self, key: str) -> CachedDiff | None:
+        """
+        Look up a cached diff's metadata.
+
+        Parameters:
+            key (str):
+                Key from :meth:`key_for`.
+
+        Returns:
+            CachedDiff | None:
+                The cached diff, or None on a miss or an expired entry.
+        """
+        meta_path = self._path(key, META_SUFFIX)
+        try:
+            if time.time() - meta_path.stat().st_mtime > self.max_age:
+                return None
+            meta = json.loads(meta_path.read_text(encoding='utf-8'))
+            if meta.get('cache_format') != CACHE_FORMAT_VERSION:
+                return None
+            cached = CachedDiff(key=key, ticks_per_beat=int(meta['ticks_per_beat']), counts=Counter(meta['counts']))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        self._touch(meta_path, self._path(key, ENTRIES_SUFFIX))
+        return cached
+
+    def entries(self, key: str) -> list[DiffEntry] | None:
+        """
+        Load the cached diff entries for ``key``.
+
+        Returns:
+            list[DiffEntry] | None:
+                The entries, or None if they are missing or unreadable.
+        """
+        try:
+            return decode_entries(self._path(key, ENTRIES_SUFFIX).read_bytes())
+        except (OSError, struct.error):
+            return None
+
+    def output(self, key: str, output_format: str) -> bytes | None:
+        """
+        Load an output previously rendered for ``key`` in ``output_format``.
+
+        Returns:
+            bytes | None:
+                The rendered output, or None if it has not been stored.
+        """
+        path = self._path(key, f'.{output_format}')
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return None
+        self._touch(path)
+        return data
+
+    def store(self, key: str, entries: list[DiffEntry], ticks_per_beat: int, counts: Counter) -> None:
+        """
+        Store a diff result, then evict old entries. Failures are ignored.
+
+        Parameters:
+            key (str):
+                Key from :meth:`key_for`.
+
+            entries (list[DiffEntry]):
+                The complete diff.
+
+            ticks_per_beat (int):
+                Resolution of the entries.
+
+            counts (Counter):
+                Number of entries per side.
+        """
+        meta = {'cache_format': CACHE_FORMAT_VERSION, 'ticks_per_beat': ticks_per_beat, 'counts': dict(counts)}
+        with contextlib.suppress(OSError, struct.error):
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._write(self._path(key, ENTRIES_SUFFIX), encode_entries(entries))
+            # Metadata last: its presence marks the group complete.
+            self._write(self._path(key, META_SUFFIX), json.dumps(meta).encode())
+        self.evict()
+
+    def store_output(self, key: str, output_format: str, data: bytes) -> None:
+        """
+        Store a rendered output for ``key``, then evict old entries. Failures are ignored.
+        """
+        with contextlib.suppress(OSError):
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._write(self._path(key, f'.{output_format}'), data)
+        self.evict()
+
+    def notes_key(self, blob_id: str) -> str:
+        """
+        Return the cache key for the notes of the input whose git blob id is ``blob_id``.
+
+        The key also covers the library version and key layout, so notes extracted by
+        another release are not reused.
+        """
+        identity = {
+            'blob': blob_id,
+            'version': library_version(),
+            'key_layout': KEY_LAYOUT_VERSION,
+            'cache_format': CACHE_FORMAT_VERSION,
+        }
+        return hashlib.sha256(json.dumps(identity, sort_keys=True).encode()).hexdigest()
+
+    def notes(self, blob_id: str) -> tuple[int, list[NoteRecord]] | None:
+        """
+        Load the notes cached for a git blob.
+
+        Parameters:
+            blob_id (str):
+                Git object id of the input's contents.
+
+        Returns:
+            tuple[int, list[NoteRecord]] | None:
+                Ticks per beat and note records, or None on a miss.
+        """
+        path = self._path(self.notes_key(blob_id), NOTES_SUFFIX)
+        try:
+            if time.time() - path.stat().st_mtime > self.max_age:
+                return None
+            data = path.read_bytes()
+            ticks_per_beat, count = NOTES_HEADER.unpack_from(data)
+            body = memoryview(data)[NOTES_HEADER.size:]
+            if len(body) != count * NOTE_RECORD.size:
+                return None
+            records = [(key, velocity, track) for key, track, velocity in NOTE_RECORD.iter_unpack(body)]
+        except (OSError, struct.error):
+            return None
+        self._touch(path)
+        return ticks_per_beat, records
+
+    def store_notes(self, blob_id: str, ticks_per_beat: int, records: list[NoteRecord]) -> None:
+        """
+        Store the notes extracted from a git blob, then evict old entries. Failures are ignored.
+        """
+        with contextlib.suppress(OSError, struct.error):
+            pack = NOTE_RECORD.pack
+            data = NOTES_HEADER.pack(ticks_per_beat, len(records)) + b''.join(
+                pack(key, track, velocity) for key, velocity, track in records
+            )
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._write(self._path(self.notes_key(blob_id), NOTES_SUFFIX), data)
+        self.evict()
+
+    def seek_index(self, buf, interval: int | None = None) -> SeekIndex:
+        """
+        Return the seek index of a MIDI file's contents, building and storing it on a miss.
+
+        Indexes are keyed by the BLAKE2b digest of the contents, so they are shared by
+        every copy of a file and never go stale. Failures to read or write the cache
+        only cost a rebuild.
+
+        Parameters:
+            buf (bytes | bytearray | memoryview | mmap.mmap):
+                The (decompressed) file contents.
+
+            interval (int | None):
+                Checkpoint spacing in ticks, or None for the default.
+
+        Returns:
+            SeekIndex:
+                The cached or newly built index.
+        """
+        identity = {
+            'content': hashlib.blake2b(buf).hexdigest(),
+            'interval': interval,
+            'seek_index': SEEK_INDEX_VERSION,
+            'cache_format': CACHE_FORMAT_VERSION,
+        }
+        path = self._path(hashlib.sha256(json.dumps(identity, sort_keys=True).encode()).hexdigest(), SEEK_INDEX_SUFFIX)
+        with contextlib.suppress(OSError, ValueError, KeyError, TypeError):
+            if time.time() - path.stat().st_mtime <= self.max_age:
+                index = SeekIndex.from_dict(json.loads(path.read_bytes()))
+                self._touch(path)
+                return index
+
+        index = SeekIndex.build(buf, interval=interval)
+        with contextlib.suppress(OSError):
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._write(path, json.dumps(index.to_dict(), separators=(',', ':')).encode())
+        self.evict()
+        return index
+
+    def evict(self) -> None:
+        """
+        Remove expired groups, then the least recently used groups until the cache fits
+        ``max_bytes``. Temporary files abandoned by interrupted writes are removed too.
+        """
+        now = time.time()
+        groups: dict[str, list[os.DirEntry]] = {}
+        try:
+            with os.scandir(self.directory) as scan:
+                for entry in scan:
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    if entry.name.startswith('.'):
+                        with contextlib.suppress(OSError):
+                            if now - entry.stat().st_mtime > STALE_TEMP_SECONDS:
+                                os.unlink(entry.path)
+                        continue
+                    groups.setdefault(entry.name.split('.')[0], []).append(entry)
+        except OSError:
+            return
+
+        usage: list[tuple[float, int, list[os.DirEntry]]] = []
+        for files in groups.values():
+            with contextlib.suppress(OSError):
+                stats = [f.stat(follow_symlinks=False) for f in files]
+                usage.append((max(s.st_mtime for s in stats), sum(s.st_size for s in stats), files))
+
+        usage.sort(key=lambda u: u[0])
+        total = sum(size for _, size, _ in usage)
+        for last_used, size, files in usage:
+            if now - last_used <= self.max_age and total <= self.max_bytes:
+                break
+            for f in files:
+                with contextlib.suppress(OSError):
+                    os.unlink(f.path)
+            total -= size
+
+
+__all__ = [
+    'CACHE_DIR_ENV_VAR',
+    'CACHE_FORMAT_VERSION',
+    'DEFAULT_MAX_AGE_SECONDS',
+    'DEFAULT_MAX_BYTES',
+    'ENTRY_RECORD',
+    'NOTES_HEADER',
+    'NOTE_RECORD',
+    'STALE_TEMP_SECONDS',
+    'CachedDiff',
+    'DiffCache',
+    'content_hash',
+    'decode_entries',
+    'default_cache_dir',
+    'encode_entries',
+    'is_cacheable',
+    'library_version',
+]
@@ -0,0 +1,111 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    midi_diff/cli/batch.py
+
+
+Description:
+    Batch diff and pre-scan commands for the MIDIDiff CLI.
+
+"""
+from pathlib import Path
+
+from midi_diff.batch import DEFAULT_JOURNAL_NAME, BatchResult, completed_jobs, plan_batch, run_batch
+from midi_diff.cli.metrics import export_metrics
+from midi_diff.journal import Journal, read_journal
+from midi_diff.metrics import enable
+from midi_diff.prescan import prescan
+
+
+def scan_command(files: list[str]) -> None:
+    """
+    Print the structure of each file and any problems found, without decoding its events.
+    """
+    for file in files:
+        try:
+            scan = prescan(file)
+        except OSError as e:
+            print(f"{file}: {e}")
+            continue
+        if scan.format is not None:
+            ppq = scan.ticks_per_beat if scan.ticks_per_beat is not None else "SMPTE"
+            print(
+                f"{scan.source}: format {scan.format}, {len(scan.track_chunks)}/{scan.ntracks} tracks, "
+                f"{ppq} ticks per beat, {scan.size} bytes, ~{scan.estimated_events} events"
+            )
+            for index, chunk in enumerate(scan.track_chunks):
+                print(f"  track {index}: {chunk.length} bytes")
+        else:
+            print(f"{scan.source}: {scan.size} bytes")
+        for problem in scan.problems:
+            print(f"  problem: {problem}")
+
+
+def batch_command(
+    dir_a: str,
+    dir_b: str,
+    out_dir: str,
+    output_format: str,
+    report_changes: bool,
+    workers: int | None,
+    journal_file: str | None = None,
+    resume: bool = False,
+    metrics_file: str | None = None,
+    metrics_json: str | None = None,
+) -> None:
+    """
+    Diff every pair of MIDI files with the same relative path in two directories.
+
+    Files that are missing from one side or fail the pre-scan are reported and
+    skipped; the others are diffed largest first. Every finished pair is recorded in
+    a journal (by default inside ``out_dir``); with ``resume``, pairs the journal
+    records with unchanged inputs are not diffed again.
+
+    With ``metrics_file`` or ``metrics_json``, metrics of the diffs run are written
+    at the end in the Prometheus text format or as a JSON summary.
+    """
+    registry = enable() if metrics_file or metrics_json else None
+    journal_path = Path(journal_file) if journal_file else Path(out_dir) / DEFAULT_JOURNAL_NAME
+    try:
+        jobs, rejected = plan_batch(dir_a, dir_b)
+    except OSError as e:
+        print(f"Failed to list inputs: {e}")
+        return
+    for item in rejected:
+        print(f"Skipping {item.name}: {item.reason}")
+
+    done = completed_jobs(jobs, read_journal(journal_path), output_format, report_changes, out_dir) if resume else []
+    if done:
+        finished = {job.name for job, _record in done}
+        jobs = [job for job in jobs if job.name not in finished]
+        print(f"Resuming: {len(done)} pairs already diffed with unchanged inputs")
+
+    def report(result: BatchResult) -> None:
+        if result.error is not None:
+            print(f"Failed {result.job.name}: {result.error}")
+            return
+        summary = ", ".join(f"{count} {side}" for side, count in sorted(result.counts.items())) or "no differences"
+        print(f"{result.job.name}: {summary} → {result.output} ({result.seconds:.2f}s)")
+
+    try:
+        with Journal(journal_path, resume=resume) as journal:
+            results = run_batch(jobs, out_dir, output_format, report_changes, workers, on_result=report, journal=journal)
+    except OSError as e:
+        print(f"Failed to write journal {journal_path}: {e}")
+        return
+    failed = sum(result.error is not None for result in results)
+    total = len(jobs) + len(done) + len(rejected)
+    print(
+        f"Diffed {len(results) - failed} of {total} pairs "
+        f"({len(done)} resumed, {len(rejected)} rejected, {failed} failed)"
+    )
+    if registry is not None:
+        export_metrics(registry, metrics_file, metrics_json)
+
+
+__all__ = ["batch_command", "scan_command"]
@@ -0,0 +1,74 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    midi_diff/cli/git.py
+
+
+Description:
+    Git textconv and external diff commands for the MIDIDiff CLI.
+
+"""
+import sys
+from typing import Iterable, Sequence
+
+from midi_diff.cache import DiffCache
+from midi_diff.gitdriver import iter_listing, iter_summary, load_blob_notes
+
+
+def _write_lines(lines: Iterable[str]) -> None:
+    """Write lines to stdout, stopping quietly if the pager exits early."""
+    try:
+        for line in lines:
+            sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+    except BrokenPipeError:
+        sys.stderr.close()
+
+
+def textconv_command(file: str, use_cache: bool) -> None:
+    """
+    Print the note listing of ``file`` for ``diff.<driver>.textconv``.
+
+    Errors go to standard error so git shows an empty listing instead of failing.
+    """
+    cache = DiffCache() if use_cache else None
+    try:
+        ticks_per_beat, records = load_blob_notes(file, cache=cache)
+    except (OSError, ValueError) as e:
+        print(f"midi-diff textconv: {file}: {e}", file=sys.stderr)
+        return
+    _write_lines(iter_listing(ticks_per_beat, records))
+
+
+def git_driver_command(args: Sequence[str], use_cache: bool) -> None:
+    """
+    Print the note-level diff of a blob pair for ``diff.<driver>.command``.
+
+    Git passes ``path old-file old-hex old-mode new-file new-hex new-mode``, followed
+    by the new path and similarity information for renames, or just the path for an
+    unmerged file.
+    """
+    if len(args) == 1:
+        print(f"* Unmerged path {args[0]}")
+        return
+    if len(args) < 7:
+        print(f"midi-diff git-driver: expected 7 arguments from git, got {len(args)}", file=sys.stderr)
+        return
+
+    path, old_file, old_hex, _old_mode, new_file, new_hex, _new_mode = args[:7]
+    cache = DiffCache() if use_cache else None
+    try:
+        old = load_blob_notes(old_file, old_hex, cache)
+        new = load_blob_notes(new_file, new_hex, cache)
+    except (OSError, ValueError) as e:
+        print(f"midi-diff git-driver: {path}: {e}", file=sys.stderr)
+        return
+    _write_lines(iter_summary(args[7] if len(args) > 7 else path, old, new))
+
+
+__all__ = ["git_driver_command", "textconv_command"]
@@ -0,0 +1,126 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    midi_diff/cli/history.py
+
+
+Description:
+    Revision chain (history) command for the MIDIDiff CLI.
+
+"""
+import argparse
+import re
+from typing import Iterator, Sequence
+
+from midi_diff.cache import DiffCache
+from midi_diff.gitdriver import git_revisions, pitch_name
+from midi_diff.history import PresenceTimeline, Version, iter_chain, load_revision, load_version
+from midi_diff.note_keys import unpack_key
+
+_PITCH_CLASSES = {"C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "B": 11}
+_NOTE = re.compile(r"(?:(\d+)|([A-Ga-g])([#b]?)(-?\d+))@(\d+)")
+
+
+def parse_note(value: str) -> tuple[int, int]:
+    """
+    Parse a ``PITCH@TICK`` note for the ``--note`` option.
+
+    The pitch is a MIDI note number or a name such as ``C4``, ``F#3`` or ``Bb2``
+    (``C4`` is 60).
+
+    Returns:
+        tuple[int, int]: ``(pitch, start tick)``.
+
+    Raises:
+        argparse.ArgumentTypeError: If the value is malformed or the pitch is out of range.
+    """
+    match = _NOTE.fullmatch(value.strip())
+    if match is None:
+        raise argparse.ArgumentTypeError(f"note must be PITCH@TICK, e.g. C4@480 or 60@480, got {value!r}")
+    number, letter, accidental, octave, tick = match.groups()
+    if number is not None:
+        pitch = int(number)
+    else:
+        offset = {"#": 1, "b": -1}.get(accidental, 0)
+        pitch = (int(octave) + 1) * 12 + _PITCH_CLASSES[letter.upper()] + offset
+    if not 0 <= pitch <= 127:
+        raise argparse.ArgumentTypeError(f"pitch out of range in {value!r}")
+    return pitch, int(tick)
+
+
+def _versions(
+    items: Sequence[str],
+    git: bool,
+    window: tuple[int, int] | None,
+    use_cache: bool,
+) -> tuple[list[str], Iterator[Version]]:
+    """Return the version labels and a lazy iterator that parses each version once."""
+    if not git:
+        return list(items), (load_version(path, window) for path in items)
+    path, revisions = items[0], list(items[1:]) or git_revisions(items[0])
+    cache = DiffCache() if use_cache else None
+    return revisions, (load_revision(path, revision, window, cache) for revision in revisions)
+
+
+def history_command(
+    items: Sequence[str],
+    git: bool,
+    window: tuple[int, int] | None,
+    notes: Sequence[tuple[int, int]],
+    use_cache: bool,
+) -> None:
+    """
+    Print the diff of every pair of consecutive versions, then when each ``--note``
+    disappeared.
+
+    Parameters:
+        items: Version files in order, or with ``git`` a repository path followed by
+            revisions (all commits that touched it, oldest first, if none are given).
+        git: Whether ``items`` names a path and revisions.
+        window: Optional ``[start, end)`` tick window.
+        notes: ``(pitch, start)`` pairs to trace.
+        use_cache: Whether git blobs' notes are cached by blob id.
+    """
+    try:
+        labels, versions = _versions(items, git, window, use_cache)
+    except (OSError, ValueError) as e:
+        print(f"Failed to list revisions: {e}")
+        return
+    if len(labels) < 2:
+        print("Need at least two versions to compare")
+        return
+
+    timeline = PresenceTimeline()
+    try:
+        for step in iter_chain(versions, timeline):
+            diff = step.diff
+            print(
+                f"{step.before} → {step.after}: "
+                f"-{len(diff.only_in_a_records)} +{len(diff.only_in_b_records)} ~{len(diff.changed_records)}"
+            )
+    except (OSError, ValueError) as e:
+        print(f"Failed to read version {labels[len(timeline.versions)]}: {e}")
+        return
+
+    for pitch, start in notes:
+        keys = timeline.matching(lambda p, _c, s, _d: p == pitch and s == start)
+        name = f"{pitch_name(pitch)}@{start}"
+        if not keys:
+            print(f"{name}: not in any version")
+        for key in keys:
+            _pitch, channel, _start, duration = unpack_key(key)
+            appeared = timeline.toggles[key][0]
+            gone = timeline.first_disappearance(key, appeared)
+            where = f"{name} ch{channel} +{duration}: first in {timeline.versions[appeared]}"
+            if gone is None:
+                print(f"{where}, never removed")
+            else:
+                print(f"{where}, removed in {timeline.versions[gone]}")
+
+
+__all__ = ["history_command", "parse_note"]
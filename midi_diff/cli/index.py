@@ -0,0 +1,153 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    midi_diff/cli/index.py
+
+
+Description:
+    Corpus index commands for the MIDIDiff CLI.
+
+"""
+from pathlib import Path
+
+from midi_diff.fragments import DEFAULT_FRAGMENT_INDEX, FragmentIndex, find_fragment
+from midi_diff.similarity import DEFAULT_INDEX_NAME, build_index, query_index
+from midi_diff.sources import iter_midi_files
+
+
+def default_index_path(directory: str) -> Path:
+    """Return the index location used for a corpus directory when none is given."""
+    return Path(directory) / DEFAULT_INDEX_NAME
+
+
+def default_fragment_index(directory: str) -> Path:
+    """Return the fragment index location used for a corpus directory when none is given."""
+    return Path(directory) / DEFAULT_FRAGMENT_INDEX
+
+
+def locate_index(index: str) -> Path:
+    """Accept either an index file or the corpus directory holding the default one."""
+    path = Path(index)
+    return default_index_path(index) if path.is_dir() else path
+
+
+def locate_fragment_index(index: str) -> Path:
+    """Accept either a fragment index directory or the corpus directory holding the default one."""
+    nested = default_fragment_index(index)
+    return nested if nested.is_dir() else Path(index)
+
+
+def index_build_command(directory: str, index: str | None, num_perm: int, bands: int, shingle: int) -> None:
+    """
+    Sketch every MIDI file below ``directory`` and write the similarity index.
+
+    Unchanged files already present in an existing index are not parsed again.
+    Unreadable files are reported and skipped.
+    """
+    index_path = Path(index) if index else default_index_path(directory)
+
+    def report_error(path: Path, error: Exception) -> None:
+        print(f"Skipping {path}: {error}")
+
+    try:
+        count = build_index(
+            iter_midi_files(directory),
+            index_path,
+            num_perm=num_perm,
+            bands=bands,
+            shingle=shingle,
+            on_error=report_error,
+        )
+    except (OSError, ValueError) as e:
+        print(f"Failed to build index: {e}")
+        return
+    print(f"Indexed {count} files → {index_path}")
+
+
+def index_query_command(file: str, index: str, top_k: int, verify: bool) -> None:
+    """
+    Print the indexed files most similar to ``file``.
+
+    Each line shows the sketch estimate and, when verified, the exact share of
+    notes the two files have in common. ``index`` may also be the corpus directory the
+    index was built in. Candidates that cannot be read for verification are reported.
+    """
+
+    def report_error(path: Path, error: Exception) -> None:
+        print(f"Cannot read {path}: {error}")
+
+    try:
+        matches = query_index(locate_index(index), file, top_k=top_k, verify=verify, on_error=report_error)
+    except Exception as e:
+        print(f"Failed to query index: {e}")
+        return
+
+    if not matches:
+        print("No similar files found")
+        return
+    for match in matches:
+        exact = f"  exact {match.similarity:.3f}" if match.similarity is not None else ""
+        print(f"{match.estimate:.3f}{exact}  {match.path}")
+
+
+def index_fragments_command(directory: str, index: str | None, ngram: int) -> None:
+    """
+    Add every MIDI file below ``directory`` to the fragment index.
+
+    Unchanged files already in the index are skipped; changed ones are re-indexed.
+    Unreadable files are reported and skipped.
+    """
+    index_dir = Path(index) if index else default_fragment_index(directory)
+
+    def report_error(path: Path, error: Exception) -> None:
+        print(f"Skipping {path}: {error}")
+
+    try:
+        count = FragmentIndex(index_dir, n=ngram).add(iter_midi_files(directory), on_error=report_error)
+    except (OSError, ValueError) as e:
+        print(f"Failed to build fragment index: {e}")
+        return
+    print(f"Indexed {count} files → {index_dir}")
+
+
+def find_command(fragment: str, index: str, min_score: float, top_k: int) -> None:
+    """
+    Print where ``fragment`` occurs in the files of a fragment index.
+
+    Each line shows the match score, the transposition applied to the fragment,
+    the start tick in the file and the file itself. Indexed files that can no longer
+    be read are reported. ``index`` may also be the corpus directory the index was
+    built in.
+    """
+
+    def report_error(path: Path, error: Exception) -> None:
+        print(f"Cannot read {path}: {error}")
+
+    try:
+        matches = find_fragment(locate_fragment_index(index), fragment, min_score=min_score, on_error=report_error)
+    except Exception as e:
+        print(f"Failed to search fragment index: {e}")
+        return
+
+    if not matches:
+        print("Fragment not found")
+        return
+    for match in matches[:top_k]:
+        print(f"{match.score:.3f}  {match.transposition:+d} st  tick {match.tick}  {match.path}")
+
+
+__all__ = [
+    "default_fragment_index",
+    "default_index_path",
+    "find_command",
+    "index_build_command",
+    "index_fragments_command",
+    "index_query_command",
+    "locate_fragment_index",
+    "locate_index",
+]
@@ -16,7 +16,18 @@ Description:
 import argparse
 import sys
 from typing import Final, Sequence
+from midi_diff.align import ALIGN_GLOBAL, ALIGN_MODES
+from midi_diff.batch import DEFAULT_BATCH_FORMAT, DEFAULT_JOURNAL_NAME
+from midi_diff.cache import CACHE_DIR_ENV_VAR, DEFAULT_MAX_BYTES, DiffCache
 from midi_diff.core import main as core_main
+from midi_diff.metrics import enable as enable_metrics
+from midi_diff.matrix import DEFAULT_BLOCK, DEFAULT_PREFILTER, MATRIX_FORMATS, METRIC_JACCARD, METRICS
+from midi_diff.report import FORMAT_MID, REPORT_FORMATS
+from midi_diff.fragments import DEFAULT_FRAGMENT_INDEX, DEFAULT_MIN_SCORE, DEFAULT_NGRAM
+from midi_diff.similarity import DEFAULT_BANDS, DEFAULT_INDEX_NAME, DEFAULT_NUM_PERM, DEFAULT_SHINGLE, DEFAULT_TOP_K
+from midi_diff.tempo import DEFAULT_RESOLUTION_US
+from midi_diff.quantize import MAX_SWING, STRAIGHT_SWING, Grid
+from midi_diff.watch import DEFAULT_DEBOUNCE
 from midi_diff.cli.version import (
     print_version_info,
     print_debug_info,
@@ -26,6 +37,13 @@ from midi_diff.cli.version import (
 )
 from midi_diff.cli.docs import open_documentation
 from midi_diff.cli.completions import emit_completion_script, SUPPORTED_SHELLS, install_completions
+from midi_diff.cli.matrix import matrix_command
+from midi_diff.cli.watch import watch_command
+from midi_diff.cli.git import git_driver_command, textconv_command
+from midi_diff.cli.history import history_command, parse_note
+from midi_diff.cli.batch import batch_command, scan_command
+from midi_diff.cli.metrics import export_metrics
+from midi_diff.cli.index import find_command, index_build_command, index_fragments_command, index_query_command
 
 
 # Subcommand names - single source of truth for CLI commands
@@ -37,6 +55,20 @@ COMMAND_UPGRADE: Final[str] = 'upgrade'
 COMMAND_DOCS: Final[str] = 'docs'
 COMMAND_COMPLETION: Final[str] = 'completion'
 COMMAND_INSTALL_COMPLETIONS: Final[str] = 'install-completions'
+COMMAND_INDEX: Final[str] = 'index'
+COMMAND_FIND: Final[str] = 'find'
+COMMAND_MATRIX: Final[str] = 'matrix'
+COMMAND_WATCH: Final[str] = 'watch'
+COMMAND_TEXTCONV: Final[str] = 'textconv'
+COMMAND_GIT_DRIVER: Final[str] = 'git-driver'
+COMMAND_HISTORY: Final[str] = 'history'
+COMMAND_SCAN: Final[str] = 'scan'
+COMMAND_BATCH: Final[str] = 'batch'
+
+# Actions of the index subcommand
+INDEX_ACTION_BUILD: Final[str] = 'build'
+INDEX_ACTION_QUERY: Final[str] = 'query'
+INDEX_ACTION_FRAGMENTS: Final[str] = 'fragments'
 
 # Flag definitions - single source of truth for CLI flags
 # These are referenced by both build_parser() and backward compatibility logic
@@ -48,16 +80,25 @@ FLAG_HELP_LONG: Final[str] = '--help'
 # Known subcommands and flags for backward compatibility.
 # These sets are derived from the constants above to ensure they stay
 # synchronized with the parser configuration in build_parser().
-KNOWN_COMMANDS: Final[frozenset[str]] = frozenset({COMMAND_DIFF, COMMAND_DEBUG_INFO, COMMAND_CHECK_UPDATES, COMMAND_UPGRADE, COMMAND_DOCS, COMMAND_COMPLETION, COMMAND_INSTALL_COMPLETIONS})
+KNOWN_COMMANDS: Final[frozenset[str]] = frozenset({COMMAND_DIFF, COMMAND_DEBUG_INFO, COMMAND_CHECK_UPDATES, COMMAND_UPGRADE, COMMAND_DOCS, COMMAND_COMPLETION, COMMAND_INSTALL_COMPLETIONS, COMMAND_INDEX, COMMAND_FIND, COMMAND_MATRIX, COMMAND_WATCH, COMMAND_TEXTCONV, COMMAND_GIT_DRIVER, COMMAND_HISTORY, COMMAND_SCAN, COMMAND_BATCH})
 KNOWN_FLAGS: Final[frozenset[str]] = frozenset({FLAG_VERSION_SHORT, FLAG_VERSION_LONG, FLAG_HELP_SHORT, FLAG_HELP_LONG})
 SUBCOMMAND_FLAGS: Final[dict[str, tuple[str, ...]]] = {
-    COMMAND_DIFF: ("--help", "-h"),
+    COMMAND_DIFF: ("--window", "--time-domain", "--resolution-us", "--quantize", "--swing", "--align", "--memory-budget", "--ppq", "--changes", "--format", "--cache", "--refresh", "--metrics-file", "--help", "-h"),
     COMMAND_UPGRADE: ("--pre", "--help", "-h"),
     COMMAND_COMPLETION: ("--help", "-h"),
     COMMAND_INSTALL_COMPLETIONS: ("--shell", "--help", "-h"),
     COMMAND_DEBUG_INFO: ("--help", "-h"),
     COMMAND_CHECK_UPDATES: ("--help", "-h"),
     COMMAND_DOCS: ("--help", "-h"),
+    COMMAND_INDEX: (INDEX_ACTION_BUILD, INDEX_ACTION_QUERY, INDEX_ACTION_FRAGMENTS, "--index", "--num-perm", "--bands", "--shingle", "--ngram", "--top", "--no-verify", "--help", "-h"),
+    COMMAND_FIND: ("--index", "--min-score", "--top", "--help", "-h"),
+    COMMAND_TEXTCONV: ("--no-cache", "--help", "-h"),
+    COMMAND_GIT_DRIVER: ("--no-cache", "--help", "-h"),
+    COMMAND_HISTORY: ("--git", "--window", "--note", "--no-cache", "--help", "-h"),
+    COMMAND_WATCH: ("--format", "--changes", "--rescale", "--debounce", "--poll", "--metrics-port", "--metrics-file", "--help", "-h"),
+    COMMAND_SCAN: ("--help", "-h"),
+    COMMAND_BATCH: ("--format", "--changes", "--workers", "--journal", "--resume", "--metrics-file", "--metrics-json", "--help", "-h"),
+    COMMAND_MATRIX: ("--metric", "--format", "--workers", "--block", "--prefilter", "--journal", "--resume", "--help", "-h"),
 }
 
 
@@ -75,6 +116,53 @@ class VersionAction(argparse.Action):
         parser.exit()
 
 
+def parse_window(value: str) -> tuple[int, int]:
+    """
+    Parse a ``START:END`` tick window for the ``--window`` option.
+
+    Parameters:
+        value: Window specification, e.g. ``"1920:3840"``.
+
+    Returns:
+        Tuple of (start_tick, end_tick), end exclusive.
+
+    Raises:
+        argparse.ArgumentTypeError: If the value is malformed or the window is empty.
+    """
+    start, sep, end = value.partition(':')
+    try:
+        if not sep:
+            raise ValueError
+        window = (int(start), int(end))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected START:END in ticks, got {value!r}") from None
+    if window[0] < 0 or window[1] <= window[0]:
+        raise argparse.ArgumentTypeError(f"window end must be greater than a non-negative start, got {value!r}")
+    return window
+
+
+def positive_int(value: str) -> int:
+    """
+    Parse a strictly positive integer option value.
+
+    Parameters:
+        value: Raw option value.
+
+    Returns:
+        The parsed integer.
+
+    Raises:
+        argparse.ArgumentTypeError: If the value is not an integer greater than zero.
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a positive integer, got {value!r}") from None
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"expected a positive integer, got {value!r}")
+    return number
+
+
 def build_parser() -> argparse.ArgumentParser:
     """
     Build and return the argument parser for MIDIDiff CLI.
@@ -108,10 +196,86 @@ def build_parser() -> argparse.ArgumentParser:
         COMMAND_DIFF,
         help='Compare two MIDI files and output their differences'
     )
-    diff_parser.add_argument("file_a", help="Path to the first MIDI file.")
-    diff_parser.add_argument("file_b", help="Path to the second MIDI file.")
-    diff_parser.add_argument("out_file", help="Path for the diff MIDI output.")
-    
+    diff_parser.add_argument("file_a", help="Path to the first MIDI file ('-' for stdin, ARCHIVE.zip::MEMBER for a zip member).")
+    diff_parser.add_argument("file_b", help="Path to the second MIDI file ('-' for stdin, ARCHIVE.zip::MEMBER for a zip member).")
+    diff_parser.add_argument("out_file", help="Path for the diff output ('-' for stdout).")
+    diff_parser.add_argument(
+        "--window",
+        type=parse_window,
+        metavar="START:END",
+        help="Only compare notes starting in this tick range (with --cache, seek indexes are kept in the result cache).",
+    )
+    diff_parser.add_argument(
+        "--time-domain",
+        action="store_true",
+        help="Match notes by absolute time using each file's tempo map and resolution.",
+    )
+    diff_parser.add_argument(
+        "--resolution-us",
+        type=positive_int,
+        default=DEFAULT_RESOLUTION_US,
+        metavar="MICROSECONDS",
+        help=f"Matching resolution for --time-domain (default: {DEFAULT_RESOLUTION_US}).",
+    )
+    diff_parser.add_argument(
+        "--quantize",
+        type=positive_int,
+        metavar="DIVISION",
+        help="Match notes on a grid of this many lines per whole note (16 for sixteenths); output keeps the original timing.",
+    )
+    diff_parser.add_argument(
+        "--swing",
+        type=int,
+        default=STRAIGHT_SWING,
+        metavar="PERCENT",
+        help=f"Delay every second --quantize grid line to this share of its pair, {STRAIGHT_SWING}-{MAX_SWING} (default: {STRAIGHT_SWING}, straight).",
+    )
+    diff_parser.add_argument(
+        "--align",
+        nargs="?",
+        const=ALIGN_GLOBAL,
+        choices=ALIGN_MODES,
+        help="Undo the second file's estimated transposition and time shift before matching, once (global, the default) or per track.",
+    )
+    diff_parser.add_argument(
+        "--memory-budget",
+        type=positive_int,
+        metavar="MIB",
+        help="Keep peak memory under this many MiB by diffing through sorted temporary files (report formats only; compressed and zip inputs are decompressed to a temporary file, standard input is not accepted).",
+    )
+    diff_parser.add_argument(
+        "--ppq",
+        type=positive_int,
+        metavar="TICKS",
+        help="Rescale the output to this many ticks per beat (default: first file's resolution).",
+    )
+    diff_parser.add_argument(
+        "--changes",
+        action="store_true",
+        help="Report matched notes whose velocity changed, on a separate 'changed' output track.",
+    )
+    diff_parser.add_argument(
+        "--format",
+        choices=REPORT_FORMATS,
+        default=FORMAT_MID,
+        help="Output format: a diff MIDI file (default), a multi-track diff MIDI file keeping each note's source track and context (tracks), or a streamed jsonl, csv or binary note report.",
+    )
+    diff_parser.add_argument(
+        "--cache",
+        action="store_true",
+        help=f"Reuse and store results in the result cache (${CACHE_DIR_ENV_VAR} or the user cache directory, at most {DEFAULT_MAX_BYTES // 2**20} MiB).",
+    )
+    diff_parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Use the result cache, but recompute the diff even if a cached result exists, and replace it.",
+    )
+    diff_parser.add_argument(
+        "--metrics-file",
+        metavar="PATH",
+        help="Write stage timings, cache lookups and counts in the Prometheus text format.",
+    )
+
     # debug-info subcommand (no additional arguments needed)
     subparsers.add_parser(
         COMMAND_DEBUG_INFO,
@@ -161,6 +325,314 @@ def build_parser() -> argparse.ArgumentParser:
         help="Override detected shell",
     )
     
+    index_parser = subparsers.add_parser(
+        COMMAND_INDEX,
+        help='Build or query a near-duplicate search index of a MIDI corpus',
+    )
+    index_actions = index_parser.add_subparsers(dest='index_action', required=True)
+    index_build_parser = index_actions.add_parser(
+        INDEX_ACTION_BUILD,
+        help='Sketch every MIDI file in a directory (incremental on re-runs)',
+    )
+    index_build_parser.add_argument("directory", help="Corpus directory, scanned recursively.")
+    index_build_parser.add_argument(
+        "--index",
+        metavar="PATH",
+        help=f"Index file to write (default: DIRECTORY/{DEFAULT_INDEX_NAME}).",
+    )
+    index_build_parser.add_argument(
+        "--num-perm",
+        type=positive_int,
+        default=DEFAULT_NUM_PERM,
+        help=f"MinHash sketch size (default: {DEFAULT_NUM_PERM}).",
+    )
+    index_build_parser.add_argument(
+        "--bands",
+        type=positive_int,
+        default=DEFAULT_BANDS,
+        help=f"LSH bands, a divisor of --num-perm; more bands find looser matches (default: {DEFAULT_BANDS}).",
+    )
+    index_build_parser.add_argument(
+        "--shingle",
+        type=positive_int,
+        default=DEFAULT_SHINGLE,
+        help=f"Consecutive notes per shingle (default: {DEFAULT_SHINGLE}).",
+    )
+    index_query_parser = index_actions.add_parser(
+        INDEX_ACTION_QUERY,
+        help='List indexed files most similar to a MIDI file',
+    )
+    index_query_parser.add_argument("file", help="MIDI file to look up ('-' for stdin).")
+    index_query_parser.add_argument(
+        "--index",
+        metavar="PATH",
+        required=True,
+        help=f"Index file to search, or the corpus directory it was built in (DIRECTORY/{DEFAULT_INDEX_NAME}).",
+    )
+    index_query_parser.add_argument(
+        "--top",
+        type=positive_int,
+        default=DEFAULT_TOP_K,
+        metavar="K",
+        help=f"Number of candidates to return (default: {DEFAULT_TOP_K}).",
+    )
+    index_query_parser.add_argument(
+        "--no-verify",
+        action="store_true",
+        help="Skip the exact diff of each candidate and rank by sketch estimate only.",
+    )
+    index_fragments_parser = index_actions.add_parser(
+        INDEX_ACTION_FRAGMENTS,
+        help='Add every MIDI file in a directory to a fragment search index (incremental)',
+    )
+    index_fragments_parser.add_argument("directory", help="Corpus directory, scanned recursively.")
+    index_fragments_parser.add_argument(
+        "--index",
+        metavar="DIR",
+        help=f"Index directory (default: DIRECTORY/{DEFAULT_FRAGMENT_INDEX}).",
+    )
+    index_fragments_parser.add_argument(
+        "--ngram",
+        type=positive_int,
+        default=DEFAULT_NGRAM,
+        metavar="N",
+        help=f"Notes per indexed pattern for a new index (default: {DEFAULT_NGRAM}).",
+    )
+
+    find_parser = subparsers.add_parser(
+        COMMAND_FIND,
+        help='Find where a musical fragment occurs in an indexed corpus, at any transposition',
+    )
+    find_parser.add_argument("fragment", help="MIDI file holding the passage ('-' for stdin).")
+    find_parser.add_argument(
+        "--index",
+        metavar="DIR",
+        required=True,
+        help=f"Fragment index directory, or the corpus directory it was built in (DIRECTORY/{DEFAULT_FRAGMENT_INDEX}).",
+    )
+    find_parser.add_argument(
+        "--min-score",
+        type=float,
+        default=DEFAULT_MIN_SCORE,
+        metavar="FRACTION",
+        help=f"Minimum share of fragment notes that must match exactly (default: {DEFAULT_MIN_SCORE}).",
+    )
+    find_parser.add_argument(
+        "--top",
+        type=positive_int,
+        default=DEFAULT_TOP_K,
+        metavar="K",
+        help=f"Maximum number of matches to list (default: {DEFAULT_TOP_K}).",
+    )
+
+    matrix_parser = subparsers.add_parser(
+        COMMAND_MATRIX,
+        help='Compare every pair of MIDI files in a directory and write the distance matrix',
+    )
+    matrix_parser.add_argument("directory", help="Corpus directory, scanned recursively.")
+    matrix_parser.add_argument("out_file", help="Path for the matrix ('-' for stdout).")
+    matrix_parser.add_argument(
+        "--metric",
+        choices=METRICS,
+        default=METRIC_JACCARD,
+        help="jaccard: distance over distinct notes; counts: notes of the row file missing from the column file (default: jaccard).",
+    )
+    matrix_parser.add_argument(
+        "--format",
+        choices=MATRIX_FORMATS,
+        help="Output format (default: npy for a .npy output path, otherwise csv).",
+    )
+    matrix_parser.add_argument(
+        "--workers",
+        type=positive_int,
+        metavar="N",
+        help="Worker processes (default: CPU count).",
+    )
+    matrix_parser.add_argument(
+        "--block",
+        type=positive_int,
+        default=DEFAULT_BLOCK,
+        metavar="FILES",
+        help=f"Files per side of a work block (default: {DEFAULT_BLOCK}).",
+    )
+    matrix_parser.add_argument(
+        "--prefilter",
+        type=float,
+        default=DEFAULT_PREFILTER,
+        metavar="SIMILARITY",
+        help=f"Estimate pairs whose sketches agree less than this instead of comparing them; 0 compares all (default: {DEFAULT_PREFILTER}).",
+    )
+    matrix_parser.add_argument(
+        "--journal",
+        metavar="PATH",
+        help="Checkpoint journal of compared blocks (default: OUT_FILE.journal; none for stdout).",
+    )
+    matrix_parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Reuse the blocks the journal records for unchanged files.",
+    )
+
+    scan_parser = subparsers.add_parser(
+        COMMAND_SCAN,
+        help='Check the structure of MIDI files without parsing their events',
+    )
+    scan_parser.add_argument("files", nargs="+", metavar="FILE", help="MIDI files to check.")
+
+    batch_parser = subparsers.add_parser(
+        COMMAND_BATCH,
+        help='Diff every pair of MIDI files with the same relative path in two directories',
+    )
+    batch_parser.add_argument("dir_a", help="Directory with the first versions, scanned recursively.")
+    batch_parser.add_argument("dir_b", help="Directory with the second versions.")
+    batch_parser.add_argument("out_dir", help="Directory for the diffs, mirroring the input layout.")
+    batch_parser.add_argument(
+        "--format",
+        choices=REPORT_FORMATS,
+        default=DEFAULT_BATCH_FORMAT,
+        help=f"Output format of every diff (default: {DEFAULT_BATCH_FORMAT}).",
+    )
+    batch_parser.add_argument(
+        "--changes",
+        action="store_true",
+        help="Also report matched notes whose velocity changed.",
+    )
+    batch_parser.add_argument(
+        "--workers",
+        type=positive_int,
+        metavar="N",
+        help="Worker processes (default: CPU count).",
+    )
+    batch_parser.add_argument(
+        "--journal",
+        metavar="PATH",
+        help=f"Checkpoint journal of finished pairs (default: OUT_DIR/{DEFAULT_JOURNAL_NAME}).",
+    )
+    batch_parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip pairs the journal records as finished whose inputs have not changed.",
+    )
+    batch_parser.add_argument(
+        "--metrics-file",
+        metavar="PATH",
+        help="Write metrics of the run in the Prometheus text format when it ends.",
+    )
+    batch_parser.add_argument(
+        "--metrics-json",
+        metavar="PATH",
+        help="Write a JSON summary of the run (throughput, latency percentiles, cache hits, failures) when it ends; '-' for stdout.",
+    )
+
+    watch_parser = subparsers.add_parser(
+        COMMAND_WATCH,
+        help='Rewrite the diff of two MIDI files every time either one is saved',
+    )
+    watch_parser.add_argument("file_a", help="Path to the first MIDI file.")
+    watch_parser.add_argument("file_b", help="Path to the second MIDI file.")
+    watch_parser.add_argument("out_file", help="Path for the diff output, replaced on every update.")
+    watch_parser.add_argument(
+        "--format",
+        choices=REPORT_FORMATS,
+        default=FORMAT_MID,
+        help="Output format: a diff MIDI file, a multi-track diff MIDI file (tracks), or a jsonl, csv or binary report (default: mid).",
+    )
+    watch_parser.add_argument(
+        "--changes",
+        action="store_true",
+        help="Also report matched notes whose velocity changed.",
+    )
+    watch_parser.add_argument(
+        "--rescale",
+        action="store_true",
+        help="Rescale the second file to the first file's resolution before matching (by default notes are matched on raw ticks, like diff).",
+    )
+    watch_parser.add_argument(
+        "--debounce",
+        type=float,
+        default=DEFAULT_DEBOUNCE,
+        metavar="SECONDS",
+        help=f"Wait this long after the last save before updating (default: {DEFAULT_DEBOUNCE}).",
+    )
+    watch_parser.add_argument(
+        "--poll",
+        action="store_true",
+        help="Poll file size and modification time instead of using inotify.",
+    )
+    watch_parser.add_argument(
+        "--metrics-port",
+        type=int,
+        metavar="PORT",
+        help="Serve metrics in the Prometheus text format at http://127.0.0.1:PORT/metrics.",
+    )
+    watch_parser.add_argument(
+        "--metrics-file",
+        metavar="PATH",
+        help="Rewrite metrics in the Prometheus text format to this file after every update.",
+    )
+
+    textconv_parser = subparsers.add_parser(
+        COMMAND_TEXTCONV,
+        help='List the notes of a MIDI file as text (for git diff.<driver>.textconv)',
+    )
+    textconv_parser.add_argument("file", help="MIDI file, usually a temporary copy of a git blob.")
+    textconv_parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Parse the file even if its notes are cached.",
+    )
+
+    git_driver_parser = subparsers.add_parser(
+        COMMAND_GIT_DRIVER,
+        help='Print a note-level diff of two blobs (for git diff.<driver>.command)',
+    )
+    git_driver_parser.add_argument(
+        "git_args",
+        nargs="+",
+        metavar="ARG",
+        help="Arguments passed by git: path old-file old-hex old-mode new-file new-hex new-mode.",
+    )
+    git_driver_parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Parse both blobs even if their notes are cached.",
+    )
+
+    history_parser = subparsers.add_parser(
+        COMMAND_HISTORY,
+        help='Diff consecutive versions of a MIDI file and trace when notes disappeared',
+    )
+    history_parser.add_argument(
+        "items",
+        nargs="+",
+        metavar="VERSION",
+        help="Version files in order, or with --git a file followed by revisions.",
+    )
+    history_parser.add_argument(
+        "--git",
+        action="store_true",
+        help="Read the first argument at each git revision (default: every commit that changed it, oldest first).",
+    )
+    history_parser.add_argument(
+        "--window",
+        type=parse_window,
+        metavar="START:END",
+        help="Only compare notes starting in this tick range.",
+    )
+    history_parser.add_argument(
+        "--note",
+        type=parse_note,
+        action="append",
+        default=[],
+        metavar="PITCH@TICK",
+        help="Report the version in which this note (e.g. C4@480 or 60@480) disappeared. Repeatable.",
+    )
+    history_parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="With --git, parse every revision even if its notes are cached.",
+    )
+
     return parser
 
 
@@ -175,6 +647,19 @@ def run_cli(argv: Sequence[str] | None = None) -> None:
     Usage:
         midi-diff fileA.mid fileB.mid output.mid  (assumes 'diff' subcommand)
         midi-diff diff fileA.mid fileB.mid output.mid
+        midi-diff index build corpus/
+        midi-diff index query new.mid --index corpus/midi-diff.mhidx
+        midi-diff index fragments corpus/
+        midi-diff find riff.mid --index corpus/midi-diff.ngidx
+        midi-diff matrix corpus/ distances.npy
+        midi-diff scan song.mid
+        midi-diff batch old/ new/ diffs/
+        midi-diff batch old/ new/ diffs/ --resume
+        midi-diff watch fileA.mid fileB.mid live-diff.mid
+        midi-diff watch fileA.mid fileB.mid live-diff.mid --metrics-port 9464
+        midi-diff textconv file.mid
+        midi-diff history v1.mid v2.mid v3.mid --note C4@480
+        midi-diff history --git song.mid
         midi-diff debug-info
         midi-diff --version
 
@@ -198,7 +683,86 @@ def run_cli(argv: Sequence[str] | None = None) -> None:
     
     # Handle subcommands
     if args.command == COMMAND_DIFF:
-        core_main(args.file_a, args.file_b, args.out_file)
+        quantize = None
+        if args.quantize is not None:
+            try:
+                quantize = Grid(args.quantize, args.swing)
+            except ValueError as e:
+                parser.error(str(e))
+        registry = enable_metrics() if args.metrics_file else None
+        core_main(
+            args.file_a,
+            args.file_b,
+            args.out_file,
+            window=args.window,
+            time_domain=args.time_domain,
+            resolution_us=args.resolution_us,
+            ppq=args.ppq,
+            report_changes=args.changes,
+            output_format=args.format,
+            cache=DiffCache() if args.cache or args.refresh else None,
+            refresh=args.refresh,
+            quantize=quantize,
+            align=args.align,
+            memory_budget=args.memory_budget * 1024 * 1024 if args.memory_budget is not None else None,
+        )
+        if registry is not None:
+            export_metrics(registry, args.metrics_file)
+    elif args.command == COMMAND_INDEX:
+        if args.index_action == INDEX_ACTION_BUILD:
+            index_build_command(args.directory, args.index, args.num_perm, args.bands, args.shingle)
+        elif args.index_action == INDEX_ACTION_QUERY:
+            index_query_command(args.file, args.index, args.top, verify=not args.no_verify)
+        elif args.index_action == INDEX_ACTION_FRAGMENTS:
+            index_fragments_command(args.directory, args.index, args.ngram)
+    elif args.command == COMMAND_FIND:
+        find_command(args.fragment, args.index, args.min_score, args.top)
+    elif args.command == COMMAND_TEXTCONV:
+        textconv_command(args.file, use_cache=not args.no_cache)
+    elif args.command == COMMAND_GIT_DRIVER:
+        git_driver_command(args.git_args, use_cache=not args.no_cache)
+    elif args.command == COMMAND_HISTORY:
+        history_command(args.items, args.git, args.window, args.note, use_cache=not args.no_cache)
+    elif args.command == COMMAND_WATCH:
+        watch_command(
+            args.file_a,
+            args.file_b,
+            args.out_file,
+            args.format,
+            args.changes,
+            args.debounce,
+            args.poll,
+            args.rescale,
+            args.metrics_port,
+            args.metrics_file,
+        )
+    elif args.command == COMMAND_SCAN:
+        scan_command(args.files)
+    elif args.command == COMMAND_BATCH:
+        batch_command(
+            args.dir_a,
+            args.dir_b,
+            args.out_dir,
+            args.format,
+            args.changes,
+            args.workers,
+            args.journal,
+            args.resume,
+            args.metrics_file,
+            args.metrics_json,
+        )
+    elif args.command == COMMAND_MATRIX:
+        matrix_command(
+            args.directory,
+            args.out_file,
+            args.metric,
+            args.format,
+            args.workers,
+            args.block,
+            args.prefilter,
+            args.journal,
+            args.resume,
+        )
     elif args.command == COMMAND_DEBUG_INFO:
         print_debug_info()
     elif args.command == COMMAND_CHECK_UPDATES:
@@ -229,4 +793,4 @@ def run_cli(argv: Sequence[str] | None = None) -> None:
         sys.exit(1)
 
 
-__all__ = ["run_cli", "build_parser"]
+__all__ = ["run_cli", "build_parser", "parse_window", "positive_int"]
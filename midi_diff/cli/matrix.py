@@ -0,0 +1,89 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    midi_diff/cli/matrix.py
+
+
+Description:
+    All-pairs distance matrix command for the MIDIDiff CLI.
+
+"""
+import contextlib
+import sys
+from pathlib import Path
+
+from midi_diff.journal import Journal, read_journal
+from midi_diff.matrix import FORMAT_CSV, FORMAT_NPY, MATRIX_SUFFIXES, distance_matrix, write_matrix
+from midi_diff.outputs import atomic_output
+from midi_diff.sources import is_stdio, iter_midi_files
+
+
+def matrix_command(
+    directory: str,
+    out_file: str,
+    metric: str,
+    output_format: str | None,
+    workers: int | None,
+    block: int,
+    prefilter: float,
+    journal_file: str | None = None,
+    resume: bool = False,
+) -> None:
+    """
+    Compare every pair of MIDI files below ``directory`` and write the matrix.
+
+    The format follows ``output_format`` or, when not given, the output suffix
+    (``.npy`` for NumPy, CSV otherwise). With ``.npy`` output the row order is also
+    written to a ``.paths.txt`` file next to the matrix.
+
+    Compared blocks are recorded in a journal (``<out_file>.journal`` unless given;
+    none when writing to stdout); with ``resume``, blocks it already holds for
+    unchanged files are not compared again.
+    """
+    to_stdout = is_stdio(out_file)
+    if output_format is None:
+        output_format = FORMAT_NPY if Path(out_file).suffix == MATRIX_SUFFIXES[FORMAT_NPY] else FORMAT_CSV
+    status = sys.stderr if to_stdout else sys.stdout
+
+    def report_error(path: Path, error: Exception) -> None:
+        print(f"Skipping {path}: {error}", file=status)
+
+    if journal_file is None and not to_stdout:
+        journal_file = f"{out_file}.journal"
+
+    try:
+        with contextlib.ExitStack() as stack:
+            journal = stack.enter_context(Journal(journal_file, resume=resume)) if journal_file else None
+            matrix = distance_matrix(
+                iter_midi_files(directory),
+                metric=metric,
+                workers=workers,
+                block=block,
+                prefilter=prefilter,
+                on_error=report_error,
+                journal=journal,
+                resume_from=read_journal(journal_file) if resume and journal_file else (),
+            )
+        if to_stdout:
+            write_matrix(matrix, output_format, sys.stdout.buffer)
+            sys.stdout.flush()
+            label = '<stdout>'
+        else:
+            with atomic_output(out_file, MATRIX_SUFFIXES[output_format]) as (fh, out_path):
+                write_matrix(matrix, output_format, fh)
+            label = str(out_path)
+            if output_format == FORMAT_NPY:
+                out_path.with_suffix('.paths.txt').write_text(''.join(f"{path}\n" for path in matrix.paths), encoding='utf-8')
+    except (OSError, ValueError) as e:
+        print(f"Failed to build matrix: {e}", file=status)
+        return
+
+    print(f"Compared {len(matrix)} files ({matrix.estimated} pairs estimated by prefilter) → {label}", file=status)
+
+
+__all__ = ["matrix_command"]
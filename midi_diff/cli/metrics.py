@@ -0,0 +1,41 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    midi_diff/cli/metrics.py
+
+
+Description:
+    Metrics export shared by the MIDIDiff CLI commands.
+
+"""
+import sys
+
+from midi_diff.metrics import Registry
+from midi_diff.sources import is_stdio
+
+
+def export_metrics(registry: Registry, prometheus_file: str | None = None, json_file: str | None = None) -> None:
+    """
+    Write the Prometheus text format and/or the JSON summary of ``registry``.
+
+    ``json_file`` may be ``-`` for standard output. Failures are reported, not raised.
+    """
+    try:
+        if prometheus_file:
+            registry.write_prometheus(prometheus_file)
+        if json_file and is_stdio(json_file):
+            registry.write_summary(sys.stdout.buffer)
+            sys.stdout.flush()
+        elif json_file:
+            with open(json_file, "wb") as fh:
+                registry.write_summary(fh)
+    except OSError as e:
+        print(f"Failed to write metrics: {e}", file=sys.stderr)
+
+
+__all__ = ["export_metrics"]
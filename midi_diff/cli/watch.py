@@ -0,0 +1,94 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    midi_diff/cli/watch.py
+
+
+Description:
+    Live diff (watch mode) command for the MIDIDiff CLI.
+
+"""
+import time
+from collections import Counter
+
+from midi_diff.cli.metrics import export_metrics
+from midi_diff.diff import SIDE_A, SIDE_B, SIDE_CHANGED
+from midi_diff.metrics import enable
+from midi_diff.watch import watch
+
+
+def watch_command(
+    file_a: str,
+    file_b: str,
+    out_file: str,
+    output_format: str,
+    report_changes: bool,
+    debounce: float,
+    poll: bool,
+    rescale: bool = False,
+    metrics_port: int | None = None,
+    metrics_file: str | None = None,
+) -> None:
+    """
+    Keep ``out_file`` up to date with the diff of two files until interrupted.
+
+    A status line is printed after every update with the counts and the time taken.
+    With ``metrics_port``, metrics are served in the Prometheus text format at
+    ``http://127.0.0.1:PORT/metrics``; with ``metrics_file``, they are rewritten to
+    that file after every update.
+    """
+    registry = enable() if metrics_port is not None or metrics_file else None
+    server = None
+
+    def report_update(counts: Counter, seconds: float) -> None:
+        changed = f", changed {counts[SIDE_CHANGED]}" if report_changes else ""
+        print(
+            f"[{time.strftime('%H:%M:%S')}] only in A {counts[SIDE_A]}, only in B {counts[SIDE_B]}{changed}"
+            f" → {out_file} ({seconds * 1000:.0f} ms)"
+        )
+        if metrics_file:
+            export_metrics(registry, metrics_file)
+
+    def report_error(error: Exception) -> None:
+        print(f"[{time.strftime('%H:%M:%S')}] Skipped update: {error}")
+        if metrics_file:
+            export_metrics(registry, metrics_file)
+
+    if metrics_port is not None:
+        try:
+            server = registry.serve(metrics_port)
+        except OSError as e:
+            print(f"Failed to serve metrics on port {metrics_port}: {e}")
+            return
+        host, port = server.server_address[:2]
+        print(f"Serving metrics at http://{host}:{port}/metrics")
+
+    print(f"Watching {file_a} and {file_b} (Ctrl+C to stop)")
+    try:
+        watch(
+            file_a,
+            file_b,
+            out_file,
+            output_format=output_format,
+            report_changes=report_changes,
+            rescale=rescale,
+            debounce=debounce,
+            poll=poll,
+            on_update=report_update,
+            on_error=report_error,
+        )
+    except KeyboardInterrupt:
+        print("Stopped watching")
+    except (OSError, ValueError) as e:
+        print(f"Failed to watch MIDI files: {e}")
+    finally:
+        if server is not None:
+            server.shutdown()
+
+
+__all__ = ["watch_command"]
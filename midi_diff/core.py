@@ -15,95 +15,744 @@ Description:
 """
 from __future__ import annotations
 
-import contextlib
+import io
+import sys
+import time
+from collections import Counter
+from functools import partial
 from pathlib import Path
-from typing import Union
+from typing import BinaryIO, Callable, Iterable, Iterator, Union
 
 import mido
 
-from midi_diff.midi_utils import NoteEvent, extract_notes, notes_to_midi
+from midi_diff.align import ALIGN_MODES, ALIGN_TRACKS, Offset, align_records, estimate_offset, estimate_track_offsets
+from midi_diff.cache import DiffCache
+from midi_diff.diff import COMPARED_ATTRIBUTES, SIDE_A, SIDE_B, SIDE_CHANGED, DiffEntry, NoteDiff, collect_diff, iter_diff
+from midi_diff.external import iter_external_diff, working_memory
+from midi_diff.metrics import STAGE_EXTRACT, STAGE_LOAD, STAGE_WRITE, count_notes, laps, observe_diff, stage, timed_entries
+from midi_diff.midi_utils import (
+    DEFAULT_TICKS_PER_BEAT,
+    NoteRecord,
+    iter_buffer_note_records,
+    notes_to_midi,
+    notes_to_track,
+)
+from midi_diff.note_keys import pack_key, rescale_record, unpack_key
+from midi_diff.outputs import atomic_output
+from midi_diff.quantize import Grid, quantize_records
+from midi_diff.provenance import read_context, write_provenance_midi
+from midi_diff.report import FORMAT_MID, FORMAT_TRACKS, MIDI_FORMATS, REPORT_FORMATS, REPORT_SUFFIXES, write_report
+from midi_diff.seek_index import iter_window_records
+from midi_diff.smf import read_header
+from midi_diff.sources import (
+    MidiSource,
+    describe_source,
+    is_stdio,
+    open_source,
+    same_archive_member,
+    source_exists,
+)
+from midi_diff.tempo import DEFAULT_RESOLUTION_US, TempoMap, micros_to_ticks
 
 
-def _determine_out_path(out_file: Union[str, Path]) -> Path:
+def _to_time_records(
+    records: list[NoteRecord],
+    tempo_map: TempoMap,
+    resolution_us: int,
+) -> tuple[list[NoteRecord], dict[int, int]]:
     """
-    Determine the final output path for a MIDI diff file. Ensure the path does not overwrite existing files.
+    Re-key note records by absolute time instead of ticks.
 
     Parameters:
-        out_file (str | pathlib.Path):
-            Desired output location for the MIDI diff file.
+        records (list[NoteRecord]):
+            Records in the file's tick domain.
+
+        tempo_map (TempoMap):
+            Tempo map of the file the records came from.
+
+        resolution_us (int):
+            Matching resolution in microseconds.
+
+    Returns:
+        tuple[list[NoteRecord], dict[int, int]]:
+            Records whose keys pack start and duration as ``resolution_us`` buckets, and
+            a map from each time key back to the first tick key that produced it.
+    """
+    half = resolution_us // 2
+    timed: list[NoteRecord] = []
+    origin: dict[int, int] = {}
+    for key, velocity, track in records:
+        pitch, channel, start, duration = unpack_key(key)
+        start_us, duration_us = tempo_map.note_times(start, duration)
+        time_key = pack_key(pitch, channel, (start_us + half) // resolution_us, (duration_us + half) // resolution_us)
+        origin.setdefault(time_key, key)
+        timed.append((time_key, velocity, track))
+    return timed, origin
+
+
+def _render_time_record(
+    origin: dict[int, int],
+    tempo_map: TempoMap,
+    ticks_per_beat: int,
+    record: NoteRecord,
+) -> NoteRecord:
+    """
+    Place a time-keyed record on a constant-tempo timeline (``DEFAULT_TEMPO``).
+
+    Parameters:
+        origin (dict[int, int]):
+            Time key to original tick key, from :func:`_to_time_records`.
+
+        tempo_map (TempoMap):
+            Tempo map of the record's source file.
+
+        ticks_per_beat (int):
+            Resolution of the rendered timeline.
+
+        record (NoteRecord):
+            Time-keyed record.
+
+    Returns:
+        NoteRecord:
+            Record keyed by ticks of the rendered timeline.
+    """
+    pitch, channel, start, duration = unpack_key(origin[record[0]])
+    start_us, duration_us = tempo_map.note_times(start, duration)
+    new_start = micros_to_ticks(start_us, ticks_per_beat)
+    new_end = micros_to_ticks(start_us + duration_us, ticks_per_beat)
+    return pack_key(pitch, channel, new_start, max(1, new_end - new_start)), record[1], record[2]
+
+
+def _restore_record(
+    origin: dict[int, int],
+    from_ppq: int,
+    to_ppq: int,
+    record: NoteRecord,
+) -> NoteRecord:
+    """
+    Replace a grid-keyed record's key with the unsnapped key it came from.
+
+    Parameters:
+        origin (dict[int, int]):
+            Grid key to original tick key, from :func:`midi_diff.quantize.quantize_records`.
+
+        from_ppq (int):
+            Resolution of the record's source file.
+
+        to_ppq (int):
+            Resolution of the output.
+
+        record (NoteRecord):
+            Grid-keyed record.
 
     Returns:
-        pathlib.Path:
-            A filesystem path that is safe to write to without overwriting an existing file.
+        NoteRecord:
+            The original record, rescaled to ``to_ppq``.
     """
-    out_path = Path(out_file)
-    parent = out_path.parent or Path(".")
+    record = origin[record[0]], record[1], record[2]
+    return record if from_ppq == to_ppq else rescale_record(from_ppq, to_ppq, record)
 
-    with contextlib.suppress(Exception):
-        parent.mkdir(parents=True, exist_ok=True)
 
-    stem = out_path.stem
-    suffix = out_path.suffix or ".mid"
-    candidate = out_path
+def _transform_entries(
+    entries: Iterable[DiffEntry],
+    transform_a: Callable[[NoteRecord], NoteRecord],
+    transform_b: Callable[[NoteRecord], NoteRecord],
+) -> Iterator[DiffEntry]:
+    """
+    Apply per-side record transforms to streamed diff entries.
+
+    Parameters:
+        entries (Iterable[DiffEntry]):
+            Entries to transform.
 
-    i = 1
+        transform_a (Callable[[NoteRecord], NoteRecord]):
+            Transform for records from the first input.
 
-    while candidate.exists():
-        candidate = parent / f"{stem}_{i}{suffix}"
-        i += 1
+        transform_b (Callable[[NoteRecord], NoteRecord]):
+            Transform for records from the second input.
 
-    return candidate
+    Yields:
+        DiffEntry:
+            The entries with transformed records.
+    """
+    for side, record, before, names in entries:
+        if side == SIDE_A:
+            yield side, transform_a(record), None, names
+        elif side == SIDE_B:
+            yield side, transform_b(record), None, names
+        else:
+            yield side, transform_b(record), transform_a(before), names
 
 
-def main(file_a: Union[str, Path], file_b: Union[str, Path], out_file: Union[str, Path]) -> None:
+def load_records(
+    buf,
+    window: tuple[int, int] | None = None,
+    cache: DiffCache | None = None,
+) -> list[NoteRecord]:
+    """
+    Extract note records from a file's contents, optionally restricted to a tick window.
+
+    Parameters:
+        buf (bytes | bytearray | memoryview | mmap.mmap):
+            The file contents.
+
+        window (tuple[int, int] | None):
+            ``(start_tick, end_tick)`` window, end exclusive, or None for the whole file.
+
+        cache (DiffCache | None):
+            Cache keeping the file's seek index, so later windows resume decoding from
+            the nearest checkpoint. Without one, each track is decoded from its start
+            up to the end of the window.
+
+    Returns:
+        list[NoteRecord]:
+            The extracted records.
+    """
+    if window is None:
+        return list(iter_buffer_note_records(buf))
+    index = cache.seek_index(buf) if cache is not None else None
+    return list(iter_window_records(buf, window[0], window[1], index=index))
+
+
+def _check_inputs(
+    file_a: MidiSource,
+    file_b: MidiSource,
+    window: tuple[int, int] | None,
+    time_domain: bool,
+    quantize: Grid | None = None,
+    align: str | None = None,
+    memory_budget: int | None = None,
+) -> None:
+    """
+    Reject option combinations and inputs that cannot be diffed, before any file is read.
+
+    Raises:
+        ValueError:
+            If a window or a quantization grid is combined with time-domain comparison,
+            alignment is combined with either of those, the alignment mode is unknown,
+            a memory budget is combined with any of them or with a streamed input, or
+            both inputs are standard input.
+
+        FileNotFoundError:
+            If an input file or archive member does not exist.
+    """
+    if window is not None and time_domain:
+        raise ValueError("Tick windows cannot be combined with time-domain comparison")
+    if quantize is not None and time_domain:
+        raise ValueError("Quantization cannot be combined with time-domain comparison")
+    if align is not None:
+        if align not in ALIGN_MODES:
+            raise ValueError(f"Unknown alignment mode: {align}")
+        if time_domain or quantize is not None:
+            raise ValueError("Alignment cannot be combined with time-domain comparison or quantization")
+    if memory_budget is not None and (window is not None or time_domain or quantize is not None or align is not None):
+        raise ValueError("A memory budget cannot be combined with windows, time-domain comparison, quantization or alignment")
+    if memory_budget is not None and any(is_stdio(source) or hasattr(source, 'read') for source in (file_a, file_b)):
+        raise ValueError("A memory budget needs inputs that can be read twice; standard input and streams cannot be used")
+    if is_stdio(file_a) and is_stdio(file_b):
+        raise ValueError("Standard input can only be used for one of the inputs")
+    for source in (file_a, file_b):
+        if not source_exists(source):
+            raise FileNotFoundError(f"Input file missing: {describe_source(source)}")
+
+
+def stream_diff_files(
+    file_a: MidiSource,
+    file_b: MidiSource,
+    window: tuple[int, int] | None = None,
+    time_domain: bool = False,
+    resolution_us: int = DEFAULT_RESOLUTION_US,
+    ppq: int | None = None,
+    report_changes: bool = False,
+    quantize: Grid | None = None,
+    align: str | None = None,
+    on_align: Callable[[Offset, dict[int, Offset]], None] | None = None,
+    memory_budget: int | None = None,
+    cache: DiffCache | None = None,
+) -> tuple[Iterator[DiffEntry], int]:
+    """
+    Load two MIDI inputs and return a lazy stream of their differences.
+
+    Both inputs are read and decoded before this function returns; the returned
+    iterator then produces each differing note as the matching pass finds it, already
+    converted to the output resolution.
+
+    Inputs may be gzip, bzip2 or xz compressed, or ``archive.zip::member`` references.
+    When both inputs are zip members whose directory entries carry the same CRC-32 and
+    size, the files are taken to be identical and neither is decompressed.
+
+    Parameters:
+        file_a (MidiSource):
+            The first MIDI input.
+
+        file_b (MidiSource):
+            The second MIDI input.
+
+        window (tuple[int, int] | None):
+            Optional ``(start_tick, end_tick)`` range, as for :func:`main`.
+
+        time_domain (bool):
+            Compare notes by absolute time instead of raw ticks.
+
+        resolution_us (int):
+            Matching resolution in microseconds for time-domain comparison.
+
+        ppq (int | None):
+            Ticks per beat of the streamed records. Defaults to the first file's resolution.
+
+        report_changes (bool):
+            Also stream matched notes whose velocity differs.
+
+        quantize (Grid | None):
+            Match notes by their position on this grid instead of by exact ticks. Each
+            file is snapped using its own resolution; streamed records keep their
+            original, unsnapped timing.
+
+        align (str | None):
+            ``'global'`` or ``'tracks'``: estimate how far the second input is
+            transposed and shifted (once, or per track) and match its notes after
+            undoing that offset (see :mod:`midi_diff.align`). Streamed records keep
+            their original pitch and timing.
+
+        on_align (Callable[[Offset, dict[int, Offset]], None] | None):
+            Called with the global and per-track offsets once they are estimated.
+
+        memory_budget (int | None):
+            Peak resident memory, in bytes, the process may use. When given, the inputs
+            are not loaded: their notes are spilled to sorted temporary runs that are
+            merge-joined as the stream is consumed (see :mod:`midi_diff.external`), and
+            entries come in key order.
+
+        cache (DiffCache | None):
+            Cache keeping the inputs' seek indexes in window mode (see
+            :func:`load_records`).
+
+    Returns:
+        tuple[Iterator[DiffEntry], int]:
+            The entry stream and the ticks per beat its records are expressed in.
+
+    Raises:
+        ValueError:
+            If the options conflict, or an input cannot be parsed.
+
+        FileNotFoundError:
+            If an input file or archive member does not exist.
+    """
+    _check_inputs(file_a, file_b, window, time_domain, quantize, align, memory_budget)
+
+    if same_archive_member(file_a, file_b):
+        return iter(()), ppq or DEFAULT_TICKS_PER_BEAT
+
+    attributes = COMPARED_ATTRIBUTES if report_changes else ()
+
+    stages = laps()
+    if memory_budget is not None:
+        working_memory(memory_budget)
+        with open_source(file_a, spool_limit=0) as buf_a:
+            ticks_per_beat = read_header(buf_a).ticks_per_beat
+        stages.mark(STAGE_LOAD)
+        out_ppq = ppq or ticks_per_beat
+        # Notes are extracted while the stream is consumed, so that time counts as diffing.
+        entries = iter_external_diff(file_a, file_b, memory_budget, attributes)
+        if out_ppq != ticks_per_beat:
+            rescale = partial(rescale_record, ticks_per_beat, out_ppq)
+            entries = _transform_entries(entries, rescale, rescale)
+        return timed_entries(entries), out_ppq
+
+    with open_source(file_a) as buf_a, open_source(file_b) as buf_b:
+        ticks_per_beat = read_header(buf_a).ticks_per_beat
+        own_resolution = quantize is not None or align is not None
+        ticks_per_beat_b = read_header(buf_b).ticks_per_beat if own_resolution else ticks_per_beat
+        stages.mark(STAGE_LOAD)
+        records_a = load_records(buf_a, window, cache)
+        records_b = load_records(buf_b, window, cache)
+        if time_domain:
+            map_a = TempoMap.from_buffer(buf_a)
+            map_b = TempoMap.from_buffer(buf_b)
+    stages.mark(STAGE_EXTRACT)
+    count_notes(len(records_a) + len(records_b))
+
+    out_ppq = ppq or ticks_per_beat
+
+    if time_domain:
+        timed_a, origin_a = _to_time_records(records_a, map_a, resolution_us)
+        timed_b, origin_b = _to_time_records(records_b, map_b, resolution_us)
+        entries = _transform_entries(
+            iter_diff(timed_a, timed_b, attributes),
+            partial(_render_time_record, origin_a, map_a, out_ppq),
+            partial(_render_time_record, origin_b, map_b, out_ppq),
+        )
+    elif quantize is not None:
+        snapped_a, origin_a = quantize_records(records_a, ticks_per_beat, quantize)
+        snapped_b, origin_b = quantize_records(records_b, ticks_per_beat_b, quantize)
+        entries = _transform_entries(
+            iter_diff(snapped_a, snapped_b, attributes),
+            partial(_restore_record, origin_a, ticks_per_beat, out_ppq),
+            partial(_restore_record, origin_b, ticks_per_beat_b, out_ppq),
+        )
+    elif align is not None:
+        if ticks_per_beat_b != ticks_per_beat:
+            records_b = [rescale_record(ticks_per_beat_b, ticks_per_beat, record) for record in records_b]
+        if align == ALIGN_TRACKS:
+            offset, track_offsets = estimate_track_offsets(records_a, records_b, ticks_per_beat)
+        else:
+            offset, track_offsets = estimate_offset(records_a, records_b, ticks_per_beat), {}
+        if on_align is not None:
+            on_align(offset, track_offsets)
+        aligned_b, origin_b = align_records(records_b, offset, track_offsets)
+        rescale = partial(rescale_record, ticks_per_beat, out_ppq) if out_ppq != ticks_per_beat else lambda record: record
+        entries = _transform_entries(
+            iter_diff(records_a, aligned_b, attributes),
+            rescale,
+            partial(_restore_record, origin_b, ticks_per_beat, out_ppq),
+        )
+    else:
+        entries = iter_diff(records_a, records_b, attributes)
+        if out_ppq != ticks_per_beat:
+            rescale = partial(rescale_record, ticks_per_beat, out_ppq)
+            entries = _transform_entries(entries, rescale, rescale)
+
+    return timed_entries(entries), out_ppq
+
+
+def diff_files(
+    file_a: MidiSource,
+    file_b: MidiSource,
+    window: tuple[int, int] | None = None,
+    time_domain: bool = False,
+    resolution_us: int = DEFAULT_RESOLUTION_US,
+    ppq: int | None = None,
+    report_changes: bool = False,
+    quantize: Grid | None = None,
+    align: str | None = None,
+) -> tuple[NoteDiff, int]:
+    """
+    Compare two MIDI inputs and return the collected diff without writing anything.
+
+    Accepts the same arguments as :func:`stream_diff_files`.
+
+    Returns:
+        tuple[NoteDiff, int]:
+            The diff, with records expressed in the returned ticks per beat.
+
+    Raises:
+        ValueError:
+            If the options conflict, or an input cannot be parsed.
+
+        FileNotFoundError:
+            If an input file or archive member does not exist.
+    """
+    entries, out_ppq = stream_diff_files(
+        file_a,
+        file_b,
+        window=window,
+        time_domain=time_domain,
+        resolution_us=resolution_us,
+        ppq=ppq,
+        report_changes=report_changes,
+        quantize=quantize,
+        align=align,
+    )
+    return collect_diff(entries), out_ppq
+
+
+def render_diff(
+    entries: Iterable[DiffEntry],
+    output_format: str,
+    ticks_per_beat: int,
+    report_changes: bool,
+    fh: BinaryIO,
+    sources: tuple[MidiSource, MidiSource] | None = None,
+    keep_tempo: bool = True,
+) -> Counter:
+    """
+    Write diff entries to ``fh`` in ``output_format`` and count them per side.
+
+    Structured reports consume ``entries`` as a stream; the MIDI outputs collect them
+    first, since every note must be known before the file can be encoded.
+
+    Parameters:
+        entries (Iterable[DiffEntry]):
+            Diff entries, e.g. from :func:`stream_diff_files`.
+
+        output_format (str):
+            ``'mid'``, ``'tracks'`` or one of the report formats of :mod:`midi_diff.report`.
+
+        ticks_per_beat (int):
+            Resolution of the entries' ticks.
+
+        report_changes (bool):
+            Write changed notes to a separate ``changed`` track of MIDI output.
+
+        fh (BinaryIO):
+            Destination stream.
+
+        sources (tuple[MidiSource, MidiSource] | None):
+            The two inputs, whose meta and program-change events the ``'tracks'``
+            output copies (see :mod:`midi_diff.provenance`).
+
+        keep_tempo (bool):
+            Copy the first input's tempo events into ``'tracks'`` output. False when the
+            entries come from a time-domain comparison.
+
+    Returns:
+        Counter:
+            Number of entries per side.
+
+    Raises:
+        ValueError:
+            If ``'tracks'`` output is requested without ``sources``.
+    """
+    with stage(STAGE_WRITE):
+        if output_format == FORMAT_TRACKS:
+            if sources is None:
+                raise ValueError("The tracks format needs both input files")
+            context_a, context_b = read_context(sources[0]), read_context(sources[1])
+            return write_provenance_midi(entries, ticks_per_beat, context_a, context_b, fh, keep_tempo)
+        if output_format != FORMAT_MID:
+            return write_report(entries, output_format, fh, ticks_per_beat)
+        return _write_diff_midi(entries, ticks_per_beat, report_changes, fh)
+
+
+def _write_diff_midi(entries: Iterable[DiffEntry], ticks_per_beat: int, report_changes: bool, fh: BinaryIO) -> Counter:
+    """Write diff entries as a single-track diff MIDI file (plus a ``changed`` track)."""
+    result = collect_diff(entries)
+    diff_mid: mido.MidiFile = notes_to_midi(result.only_in_a + result.only_in_b, ticks_per_beat=ticks_per_beat)
+    if report_changes:
+        diff_mid.tracks.append(notes_to_track([change.after for change in result.changed], name='changed'))
+    diff_mid.save(file=fh)
+    return Counter({
+        SIDE_A: len(result.only_in_a_records),
+        SIDE_B: len(result.only_in_b_records),
+        SIDE_CHANGED: len(result.changed_records),
+    })
+
+
+def _emit(
+    out_file: Union[str, Path, BinaryIO],
+    output_format: str,
+    write: Callable[[BinaryIO], Counter],
+) -> tuple[str, Counter]:
+    """
+    Open the destination for :func:`main` and call ``write`` with it.
+
+    Returns a label for the destination and whatever ``write`` returned.
+    """
+    if is_stdio(out_file):
+        counts = write(sys.stdout.buffer)
+        sys.stdout.flush()
+        return '<stdout>', counts
+    if hasattr(out_file, 'write'):
+        return describe_source(out_file), write(out_file)
+    with atomic_output(out_file, REPORT_SUFFIXES[output_format]) as (fh, out_path):
+        counts = write(fh)
+    return str(out_path), counts
+
+
+def _log_offsets(log: Callable[..., None], offset: Offset, track_offsets: dict[int, Offset]) -> None:
+    """Print the offsets estimated for the second file."""
+    log(f"Aligned B by {offset.pitch:+d} semitones, {offset.ticks:+d} ticks ({offset.votes} votes)")
+    for track, moved in sorted(track_offsets.items()):
+        if (moved.pitch, moved.ticks) != (offset.pitch, offset.ticks):
+            log(f"  track {track}: {moved.pitch:+d} semitones, {moved.ticks:+d} ticks ({moved.votes} votes)")
+
+
+def main(
+    file_a: MidiSource,
+    file_b: MidiSource,
+    out_file: Union[str, Path, BinaryIO],
+    window: tuple[int, int] | None = None,
+    time_domain: bool = False,
+    resolution_us: int = DEFAULT_RESOLUTION_US,
+    ppq: int | None = None,
+    report_changes: bool = False,
+    output_format: str = FORMAT_MID,
+    cache: DiffCache | None = None,
+    refresh: bool = False,
+    quantize: Grid | None = None,
+    align: str | None = None,
+    memory_budget: int | None = None,
+) -> None:
     """
     Main function to compute the diff between two MIDI files and save the result.
 
     Parameters:
-        file_a (str | pathlib.Path):
-            Path to the first MIDI file.
+        file_a (MidiSource):
+            The first MIDI file: a path, ``'-'`` for standard input, a bytes-like object
+            or a binary file object. On-disk files are memory-mapped; gzip, bzip2 and xz
+            compressed files and ``archive.zip::member`` references are also accepted.
 
-        file_b (str | pathlib.Path):
-            Path to the second MIDI file.
+        file_b (MidiSource):
+            The second MIDI file, accepted in the same forms as ``file_a``.
 
-        out_file (str | pathlib.Path):
+        out_file (str | pathlib.Path | BinaryIO):
             Path to save the output diff MIDI file. Existing files will be
-            avoided by incrementing the filename.
-    """
-    file_a = Path(file_a)
-    file_b = Path(file_b)
+            avoided by incrementing the filename. ``'-'`` writes to standard output
+            (status messages then go to standard error), and a binary file object is
+            written to directly.
 
-    if not file_a.exists():
-        print(f"Input file missing: {file_a}")
-        return
-    if not file_b.exists():
-        print(f"Input file missing: {file_b}")
-        return
+        window (tuple[int, int] | None):
+            Optional ``(start_tick, end_tick)`` range. When given, only notes starting
+            inside the window are compared. With a ``cache``, each file's seek index is
+            kept there (built on first use) and decoding resumes from its nearest
+            checkpoint; otherwise each track is decoded up to the end of the window.
+
+        time_domain (bool):
+            Compare notes by absolute time, honouring each file's ``ticks_per_beat`` and
+            ``set_tempo`` map, instead of by raw ticks.
+
+        resolution_us (int):
+            Matching resolution in microseconds for time-domain comparison.
+
+        ppq (int | None):
+            Ticks per beat of the output file. Defaults to the first file's resolution.
+
+        report_changes (bool):
+            Report matched notes whose velocity differs. Their second-file versions are
+            written to a separate ``changed`` track of the output.
+
+        output_format (str):
+            ``'mid'`` (default) writes a diff MIDI file. ``'jsonl'``, ``'csv'`` and
+            ``'bin'`` stream a structured report with one row per differing note instead
+            (see :mod:`midi_diff.report`).
+
+        cache (DiffCache | None):
+            Result cache. When given, a comparison of the same input contents with the
+            same options is answered from the cache: a previously rendered output is
+            copied as-is, and other formats are rendered from the cached diff, without
+            parsing either input. Standard input and file-object inputs are not cached.
+            In window mode the inputs' seek indexes are kept there too.
+
+        refresh (bool):
+            Recompute the diff even on a cache hit, replacing the cached result.
+
+        quantize (Grid | None):
+            Match notes on this grid (see :mod:`midi_diff.quantize`) so that a played
+            take and a quantized score line up. Output notes keep their original timing.
+
+        align (str | None):
+            ``'global'`` or ``'tracks'``: match the second file's notes after undoing
+            its estimated transposition and time shift (see :mod:`midi_diff.align`).
+            The estimated offsets are printed.
+
+        memory_budget (int | None):
+            Keep the process's peak resident memory under this many bytes, however large
+            the inputs, by diffing through sorted temporary runs (see
+            :mod:`midi_diff.external`). Requires a streamed report format, and
+            bypasses the result cache.
+    """
+    started = time.perf_counter()
+    to_stdout = is_stdio(out_file)
+    log = partial(print, file=sys.stderr) if to_stdout else print
 
     try:
-        mid_a: mido.MidiFile = mido.MidiFile(str(file_a))
-        mid_b: mido.MidiFile = mido.MidiFile(str(file_b))
-    except Exception as e:
-        print(f"Failed to load MIDI files: {e}")
+        _check_inputs(file_a, file_b, window, time_domain, quantize, align, memory_budget)
+    except (ValueError, FileNotFoundError) as e:
+        log(e)
         return
+    if output_format not in REPORT_FORMATS:
+        log(f"Unsupported output format: {output_format}")
+        return
+    if memory_budget is not None:
+        if output_format in MIDI_FORMATS:
+            log("A memory budget needs a streamed report format (jsonl, csv or bin)")
+            return
+        # Cached results are held in memory whole.
+        cache = None
+    if output_format == FORMAT_TRACKS:
+        # The inputs are read again for their context events; streams can only be read once.
+        try:
+            file_a, file_b = (
+                sys.stdin.buffer.read() if is_stdio(source) else source.read() if hasattr(source, 'read') else source
+                for source in (file_a, file_b)
+            )
+        except OSError as e:
+            log(f"Failed to load MIDI files: {e}")
+            observe_diff(time.perf_counter() - started, failed=True)
+            return
 
-    notes_a: set[NoteEvent] = set(extract_notes(mid_a))
-    notes_b: set[NoteEvent] = set(extract_notes(mid_b))
-
-    only_in_a: set[NoteEvent] = notes_a - notes_b
-    only_in_b: set[NoteEvent] = notes_b - notes_a
+    options = {
+        'window': list(window) if window is not None else None,
+        'time_domain': time_domain,
+        'resolution_us': resolution_us if time_domain else None,
+        'ppq': ppq,
+        'report_changes': report_changes,
+        'quantize': [quantize.division, quantize.swing] if quantize is not None else None,
+        'align': align,
+    }
+    key = None
+    if cache is not None:
+        try:
+            key = cache.key_for(file_a, file_b, options)
+        except Exception as e:
+            log(f"Failed to load MIDI files: {e}")
+            observe_diff(time.perf_counter() - started, failed=True)
+            return
 
-    print(f"Notes only in A: {len(only_in_a)}")
-    print(f"Notes only in B: {len(only_in_b)}")
+    cached = cache.get(key) if key is not None and not refresh else None
+    data = cache.output(key, output_format) if cached is not None else None
+    entries = cache.entries(key) if cached is not None and data is None else None
+    reused = data is not None or entries is not None
 
-    diff_notes: list[NoteEvent] = list(only_in_a.union(only_in_b))
+    if reused:
+        counts, out_ppq = cached.counts, cached.ticks_per_beat
+    else:
+        try:
+            entries, out_ppq = stream_diff_files(
+                file_a,
+                file_b,
+                window=window,
+                time_domain=time_domain,
+                resolution_us=resolution_us,
+                ppq=ppq,
+                report_changes=report_changes,
+                quantize=quantize,
+                align=align,
+                on_align=partial(_log_offsets, log),
+                memory_budget=memory_budget,
+                cache=cache,
+            )
+        except Exception as e:
+            log(f"Failed to load MIDI files: {e}")
+            observe_diff(time.perf_counter() - started, failed=True)
+            return
+        if key is not None:
+            entries = list(entries)
+            counts = Counter(entry[0] for entry in entries)
+            cache.store(key, entries, out_ppq, counts)
 
-    out_path = _determine_out_path(out_file)
-    diff_mid: mido.MidiFile = notes_to_midi(diff_notes, ticks_per_beat=mid_a.ticks_per_beat)
+    kind = "MIDI" if output_format in MIDI_FORMATS else "report"
+    render = partial(
+        render_diff,
+        output_format=output_format,
+        ticks_per_beat=out_ppq,
+        report_changes=report_changes,
+        sources=(file_a, file_b),
+        keep_tempo=not time_domain,
+    )
     try:
-        diff_mid.save(str(out_path))
+        if data is None and key is not None:
+            # Render once into memory so the same bytes can be cached and written.
+            rendered = io.BytesIO()
+            render(entries, fh=rendered)
+            data = rendered.getvalue()
+            cache.store_output(key, output_format, data)
+        if data is not None:
+            out_label, _ = _emit(out_file, output_format, lambda fh: fh.write(data))
+        else:
+            out_label, counts = _emit(
+                out_file,
+                output_format,
+                lambda fh: render(entries, fh=fh),
+            )
     except Exception as e:
-        print(f"Failed to save diff MIDI: {e}")
+        log(f"Failed to save diff {kind}: {e}")
+        observe_diff(time.perf_counter() - started, failed=True)
         return
+    observe_diff(time.perf_counter() - started, counts, cache_hit=reused if key is not None else None)
 
-    print(f"Saved diff MIDI → {out_path}")
+    log(f"Notes only in A: {counts[SIDE_A]}")
+    log(f"Notes only in B: {counts[SIDE_B]}")
+    if report_changes:
+        log(f"Notes with changed attributes: {counts[SIDE_CHANGED]}")
+    log(f"Saved diff {kind} → {out_label}" + (" (cached)" if reused else ""))
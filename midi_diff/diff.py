@@ -0,0 +1,300 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    midi_diff/diff.py
+
+Description:
+    Single-pass note matching that separates notes present in only one input from
+    notes present in both whose non-identity attributes (such as velocity) changed.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Final, Iterable, Iterator, TypeAlias
+
+from midi_diff.midi_utils import NoteEvent, NoteRecord, note_to_record, record_to_note
+
+COMPARED_ATTRIBUTES: Final[tuple[str, ...]] = ('velocity',)
+"""Attributes that are compared on matched notes. Identity fields are never listed here."""
+
+# Position of each comparable attribute within a NoteRecord.
+_RECORD_FIELDS: Final[dict[str, int]] = {'velocity': 1}
+
+SIDE_A: Final[str] = 'a'
+SIDE_B: Final[str] = 'b'
+SIDE_CHANGED: Final[str] = 'changed'
+
+DiffEntry: TypeAlias = tuple[str, NoteRecord, 'NoteRecord | None', tuple[str, ...]]
+"""
+One streamed diff result: ``(side, record, before, attributes)``.
+
+``side`` is :data:`SIDE_A`, :data:`SIDE_B` or :data:`SIDE_CHANGED`. For changed notes
+``record`` is the second input's version, ``before`` the first input's and
+``attributes`` the names that differ; otherwise ``before`` is None and ``attributes``
+is empty.
+"""
+
+
+@dataclass(frozen=True, slots=True)
+class AttributeChange:
+    """
+    A note present in both inputs whose compared attributes differ.
+
+    Attributes:
+        before (NoteEvent):
+            The note as it appears in the first input.
+
+        after (NoteEvent):
+            The note as it appears in the second input.
+
+        attributes (tuple[str, ...]):
+            Names of the attributes that differ.
+    """
+
+    before: NoteEvent
+    after: NoteEvent
+    attributes: tuple[str, ...]
+
+
+@dataclass(slots=True)
+class NoteDiff:
+    """
+    Result of comparing two note collections.
+
+    The diff itself only holds raw note records; the :class:`NoteEvent` views are
+    materialized on access, so object creation scales with the size of the diff rather
+    than the size of the inputs.
+
+    Attributes:
+        only_in_a_records (list[NoteRecord]):
+            Records whose identity key appears only in the first input.
+
+        only_in_b_records (list[NoteRecord]):
+            Records whose identity key appears only in the second input.
+
+        changed_records (list[tuple[NoteRecord, NoteRecord, tuple[str, ...]]]):
+            Matched ``(record_a, record_b, differing_attributes)`` triples.
+    """
+
+    only_in_a_records: list[NoteRecord] = field(default_factory=list)
+    only_in_b_records: list[NoteRecord] = field(default_factory=list)
+    changed_records: list[tuple[NoteRecord, NoteRecord, tuple[str, ...]]] = field(default_factory=list)
+
+    @property
+    def only_in_a(self) -> list[NoteEvent]:
+        """Notes only in the first input, materialized on each access."""
+        return [record_to_note(record) for record in self.only_in_a_records]
+
+    @property
+    def only_in_b(self) -> list[NoteEvent]:
+        """Notes only in the second input, materialized on each access."""
+        return [record_to_note(record) for record in self.only_in_b_records]
+
+    @property
+    def changed(self) -> list[AttributeChange]:
+        """Matched notes with differing attributes, materialized on each access."""
+        return [
+            AttributeChange(before=record_to_note(a), after=record_to_note(b), attributes=names)
+            for a, b, names in self.changed_records
+        ]
+
+
+def index_records(records: Iterable[NoteRecord]) -> dict[int, NoteRecord]:
+    """
+    Map each packed identity key to the first record carrying it.
+
+    Parameters:
+        records (Iterable[NoteRecord]):
+            Records to index.
+
+    Returns:
+        dict[int, NoteRecord]:
+            Records keyed by packed identity, in first-seen order.
+    """
+    keyed: dict[int, NoteRecord] = {}
+    for record in records:
+        keyed.setdefault(record[0], record)
+    return keyed
+
+
+def attribute_positions(attributes: Iterable[str]) -> tuple[tuple[str, int], ...]:
+    """
+    Resolve attribute names to their positions within a NoteRecord.
+
+    Parameters:
+        attributes (Iterable[str]):
+            Names from ``COMPARED_ATTRIBUTES``.
+
+    Returns:
+        tuple[tuple[str, int], ...]:
+            ``(name, index)`` pairs, in the given order.
+
+    Raises:
+        ValueError:
+            If an attribute cannot be compared.
+    """
+    try:
+        return tuple((name, _RECORD_FIELDS[name]) for name in attributes)
+    except KeyError as e:
+        raise ValueError(f'cannot compare attribute {e.args[0]!r}') from None
+
+
+def iter_diff(
+    records_a: Iterable[NoteRecord],
+    records_b: Iterable[NoteRecord],
+    attributes: Iterable[str] = COMPARED_ATTRIBUTES,
+) -> Iterator[DiffEntry]:
+    """
+    Stream the classified records of a diff as they are found.
+
+    Both inputs are indexed up front; entries are then yielded while walking the
+    indexes, without collecting the result. Only-in-A entries come first, in input
+    order, followed by only-in-B and changed entries interleaved in the second input's
+    order.
+
+    Parameters:
+        records_a (Iterable[NoteRecord]):
+            Records from the first input.
+
+        records_b (Iterable[NoteRecord]):
+            Records from the second input.
+
+        attributes (Iterable[str]):
+            Attributes compared on matched notes.
+
+    Yields:
+        DiffEntry:
+            ``(side, record, before, attributes)`` for each differing note.
+
+    Raises:
+        ValueError:
+            If an attribute cannot be compared.
+    """
+    positions = attribute_positions(attributes)
+    keyed_a = index_records(records_a)
+    keyed_b = index_records(records_b)
+
+    for key, record in keyed_a.items():
+        if key not in keyed_b:
+            yield SIDE_A, record, None, ()
+
+    for key, after in keyed_b.items():
+        before = keyed_a.get(key)
+        if before is None:
+            yield SIDE_B, after, None, ()
+            continue
+        if positions:
+            differing = tuple(name for name, i in positions if before[i] != after[i])
+            if differing:
+                yield SIDE_CHANGED, after, before, differing
+
+
+def collect_diff(entries: Iterable[DiffEntry]) -> NoteDiff:
+    """
+    Gather streamed diff entries into a :class:`NoteDiff`.
+
+    Parameters:
+        entries (Iterable[DiffEntry]):
+            Entries from :func:`iter_diff`.
+
+    Returns:
+        NoteDiff:
+            The collected result, each list in stream order.
+    """
+    result = NoteDiff()
+    for side, record, before, names in entries:
+        if side == SIDE_A:
+            result.only_in_a_records.append(record)
+        elif side == SIDE_B:
+            result.only_in_b_records.append(record)
+        else:
+            result.changed_records.append((before, record, names))
+    return result
+
+
+def diff_records(
+    records_a: Iterable[NoteRecord],
+    records_b: Iterable[NoteRecord],
+    attributes: Iterable[str] = COMPARED_ATTRIBUTES,
+) -> NoteDiff:
+    """
+    Classify note records as only-in-A, only-in-B or matched-with-changed-attributes in one pass.
+
+    Records are matched on their packed identity key (see :mod:`midi_diff.note_keys`),
+    the integer form of :meth:`NoteEvent.channel_identity_key`. Each input is indexed once;
+    every record then needs a single integer lookup, so the cost is the same as a plain
+    set difference. When several records share an identity key within one input, the
+    first occurrence is used. Any iterable of records is accepted, including the
+    zero-copy shared-memory views of :mod:`midi_diff.shared`.
+
+    Parameters:
+        records_a (Iterable[NoteRecord]):
+            Records from the first input.
+
+        records_b (Iterable[NoteRecord]):
+            Records from the second input.
+
+        attributes (Iterable[str]):
+            Attributes compared on matched notes. Pass an empty iterable for a plain
+            only-in-A/only-in-B diff.
+
+    Returns:
+        NoteDiff:
+            The classified records, each list in input order.
+
+    Raises:
+        ValueError:
+            If an attribute cannot be compared.
+    """
+    return collect_diff(iter_diff(records_a, records_b, attributes))
+
+
+def diff_notes(
+    notes_a: Iterable[NoteEvent],
+    notes_b: Iterable[NoteEvent],
+    attributes: Iterable[str] = COMPARED_ATTRIBUTES,
+) -> NoteDiff:
+    """
+    Compare two collections of :class:`NoteEvent` objects.
+
+    Convenience wrapper around :func:`diff_records` for callers that already hold
+    notes rather than records.
+
+    Parameters:
+        notes_a (Iterable[NoteEvent]):
+            Notes from the first input.
+
+        notes_b (Iterable[NoteEvent]):
+            Notes from the second input.
+
+        attributes (Iterable[str]):
+            Attributes compared on matched notes.
+
+    Returns:
+        NoteDiff:
+            The classified notes.
+    """
+    return diff_records(map(note_to_record, notes_a), map(note_to_record, notes_b), attributes)
+
+
+__all__ = [
+    'COMPARED_ATTRIBUTES',
+    'SIDE_A',
+    'SIDE_B',
+    'SIDE_CHANGED',
+    'AttributeChange',
+    'DiffEntry',
+    'NoteDiff',
+    'attribute_positions',
+    'collect_diff',
+    'diff_notes',
+    'diff_records',
+    'index_records',
+    'iter_diff',
+]
@@ -0,0 +1,311 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    midi_diff/external.py
+
+Description:
+    Memory-bounded diff of inputs whose notes do not fit in memory.
+
+    Instead of indexing both note populations in dictionaries, each input's notes are
+    read in batches that fit the memory budget; every batch is sorted by packed key
+    and spilled to a temporary file as a run. The runs of each input are then merged
+    (in several passes if there are too many to merge at once) and the two merged,
+    key-ordered streams are merge-joined, so differences stream straight into the
+    output writer. Only one batch, plus a small read buffer per run, is in memory at
+    any time, however large the inputs are.
+
+    Matching follows :func:`midi_diff.diff.iter_diff`: notes are matched on their
+    packed key and, when a key occurs more than once in an input, its first occurrence
+    is used. Entries are produced in key order (start tick first) rather than in input
+    order.
+
+Run file layout, little-endian, one record per distinct key in ascending key order::
+
+    record (11 bytes): key u64 | velocity u8 | track u16
+"""
+
+from __future__ import annotations
+
+import heapq
+import mmap
+import os
+import struct
+import tempfile
+from operator import itemgetter
+from pathlib import Path
+from typing import Final, Iterable, Iterator, Union
+
+from midi_diff.diff import COMPARED_ATTRIBUTES, SIDE_A, SIDE_B, SIDE_CHANGED, DiffEntry, attribute_positions
+from midi_diff.midi_utils import NoteRecord, iter_buffer_note_records
+from midi_diff.sources import MidiSource, open_source
+
+RUN_RECORD: Final[struct.Struct] = struct.Struct('<QBH')
+
+RECORD_MEMORY: Final[int] = 128
+"""Estimated bytes of memory held per buffered note record (tuple, key and list slot)."""
+
+READ_BUFFER: Final[int] = RUN_RECORD.size * 4096
+"""Bytes read at a time from each run while merging."""
+
+MIN_WORKING_MEMORY: Final[int] = 4 * 1024 * 1024
+"""Smallest share of the budget, beyond the process's own footprint, that is accepted."""
+
+_WRITE_BATCH: Final[int] = 8192
+
+
+def current_rss() -> int:
+    """
+    Return the resident set size of this process in bytes, or 0 if it cannot be read.
+
+    Reads ``/proc/self/statm`` where available and falls back to the peak RSS reported
+    by :mod:`resource`.
+    """
+    try:
+        with open('/proc/self/statm', 'rb') as fh:
+            return int(fh.read().split()[1]) * mmap.PAGESIZE
+    except (OSError, IndexError, ValueError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak if peak > 1 << 32 else peak * 1024
+
+
+def working_memory(memory_budget: int) -> int:
+    """
+    Return how much of ``memory_budget`` is left for note buffers.
+
+    Parameters:
+        memory_budget (int):
+            Peak resident memory allowed for the whole process, in bytes.
+
+    Returns:
+        int:
+            The budget minus what the process already uses.
+
+    Raises:
+        ValueError:
+            If less than :data:`MIN_WORKING_MEMORY` would be left.
+    """
+    available = memory_budget - current_rss()
+    if available < MIN_WORKING_MEMORY:
+        mib = 1024 * 1024
+        raise ValueError(
+            f'memory budget of {memory_budget // mib} MiB leaves less than {MIN_WORKING_MEMORY // mib} MiB '
+            f'beyond the {current_rss() // mib} MiB this process already uses'
+        )
+    return available
+
+
+def _write_run(records: Iterable[NoteRecord], path: Path) -> None:
+    """Write key-ordered records to a run file."""
+    pack = RUN_RECORD.pack
+    batch: list[bytes] = []
+    with open(path, 'wb') as fh:
+        for key, velocity, track in records:
+            batch.append(pack(key, velocity, track))
+            if len(batch) >= _WRITE_BATCH:
+                fh.write(b''.join(batch))
+                batch.clear()
+        fh.write(b''.join(batch))
+
+
+def _iter_run(path: Path) -> Iterator[NoteRecord]:
+    """Read back the records of a run file."""
+    with open(path, 'rb') as fh:
+        while chunk := fh.read(READ_BUFFER):
+            yield from RUN_RECORD.iter_unpack(chunk)
+
+
+def _first_per_key(records: Iterable[NoteRecord]) -> Iterator[NoteRecord]:
+    """Drop records whose key equals the previous record's (input must be key-ordered)."""
+    last = None
+    for record in records:
+        if record[0] != last:
+            last = record[0]
+            yield record
+
+
+def _merge(paths: list[Path]) -> Iterator[NoteRecord]:
+    """
+    Merge runs into one key-ordered stream with one record per key.
+
+    ``heapq.merge`` is stable, so for a key found in several runs the record from the
+    earliest run, i.e. the first occurrence in the input, wins.
+    """
+    return _first_per_key(heapq.merge(*(_iter_run(path) for path in paths), key=itemgetter(0)))
+
+
+def _release(buf) -> None:
+    """Drop the pages of a memory-mapped input that have been read, so they stop counting as resident."""
+    if isinstance(buf, mmap.mmap) and hasattr(mmap, 'MADV_DONTNEED'):
+        buf.madvise(mmap.MADV_DONTNEED)
+
+
+def sorted_runs(
+    source: MidiSource,
+    directory: Union[str, Path],
+    batch_records: int,
+    fan_in: int,
+    prefix: str = 'run',
+) -> list[Path]:
+    """
+    Spill the notes of one input to sorted run files.
+
+    Parameters:
+        source (MidiSource):
+            The input.
+
+        directory (str | pathlib.Path):
+            Where run files are written.
+
+        batch_records (int):
+            Records buffered before a run is written.
+
+        fan_in (int):
+            Most runs merged at once. If there are more runs, they are merged in
+            groups into longer runs until at most ``fan_in`` are left.
+
+        prefix (str):
+            File name prefix of the runs.
+
+    Returns:
+        list[pathlib.Path]:
+            Run files in input order.
+
+    Raises:
+        OSError, ValueError:
+            If the input cannot be read or parsed.
+    """
+    directory = Path(directory)
+    runs: list[Path] = []
+
+    def spill(records: list[NoteRecord]) -> None:
+        records.sort(key=itemgetter(0))  # stable: equal keys stay in input order
+        path = directory / f'{prefix}-{len(runs):06d}'
+        _write_run(_first_per_key(records), path)
+        runs.append(path)
+        records.clear()
+
+    batch: list[NoteRecord] = []
+    with open_source(source, spool_limit=0) as buf:
+        if isinstance(buf, mmap.mmap) and hasattr(mmap, 'MADV_SEQUENTIAL'):
+            buf.madvise(mmap.MADV_SEQUENTIAL)
+        for record in iter_buffer_note_records(buf):
+            batch.append(record)
+            if len(batch) >= batch_records:
+                spill(batch)
+                _release(buf)
+    if batch or not runs:
+        spill(batch)
+
+    generation = 0
+    while len(runs) > fan_in:
+        generation += 1
+        merged: list[Path] = []
+        for group in range(0, len(runs), fan_in):
+            members = runs[group:group + fan_in]
+            path = directory / f'{prefix}-m{generation}-{len(merged):06d}'
+            _write_run(_merge(members), path)
+            for member in members:
+                os.unlink(member)
+            merged.append(path)
+        runs = merged
+    return runs
+
+
+def iter_external_diff(
+    source_a: MidiSource,
+    source_b: MidiSource,
+    memory_budget: int,
+    attributes: Iterable[str] = COMPARED_ATTRIBUTES,
+    temp_dir: Union[str, Path, None] = None,
+) -> Iterator[DiffEntry]:
+    """
+    Stream the diff of two inputs while keeping the process under a memory budget.
+
+    Both inputs are spilled to sorted runs when iteration starts; entries are then
+    produced by merge-joining the runs. Temporary files are removed once the iterator
+    is exhausted or closed.
+
+    Parameters:
+        source_a (MidiSource):
+            The first input. Files on disk are memory-mapped and their pages released
+            as they are read; compressed files, zip members and streams are first
+            copied to a memory-mapped temporary file so they are released the same way.
+            Streams can only be read once.
+
+        source_b (MidiSource):
+            The second input, at the same resolution.
+
+        memory_budget (int):
+            Peak resident memory allowed for the process, in bytes.
+
+        attributes (Iterable[str]):
+            Attributes compared on matched notes; pass an empty iterable to only
+            report notes missing from one side.
+
+        temp_dir (str | pathlib.Path | None):
+            Directory for the runs. Defaults to the system temporary directory.
+
+    Yields:
+        DiffEntry:
+            ``(side, record, before, attributes)`` for each differing note, in key order.
+
+    Raises:
+        ValueError:
+            If the budget is too small, an attribute cannot be compared, or an input
+            cannot be parsed.
+    """
+    positions = attribute_positions(attributes)
+    available = working_memory(memory_budget)
+    # Half for the batch being sorted, half for merge buffers of both inputs.
+    batch_records = max(1024, available // 2 // RECORD_MEMORY)
+    fan_in = max(2, available // 4 // READ_BUFFER)
+
+    with tempfile.TemporaryDirectory(prefix='midi-diff-', dir=temp_dir) as directory:
+        runs_a = sorted_runs(source_a, directory, batch_records, fan_in, prefix='a')
+        runs_b = sorted_runs(source_b, directory, batch_records, fan_in, prefix='b')
+        stream_a, stream_b = _merge(runs_a), _merge(runs_b)
+
+        a = next(stream_a, None)
+        b = next(stream_b, None)
+        while a is not None and b is not None:
+            if a[0] < b[0]:
+                yield SIDE_A, a, None, ()
+                a = next(stream_a, None)
+            elif b[0] < a[0]:
+                yield SIDE_B, b, None, ()
+                b = next(stream_b, None)
+            else:
+                differing = tuple(name for name, i in positions if a[i] != b[i])
+                if differing:
+                    yield SIDE_CHANGED, b, a, differing
+                a = next(stream_a, None)
+                b = next(stream_b, None)
+        while a is not None:
+            yield SIDE_A, a, None, ()
+            a = next(stream_a, None)
+        while b is not None:
+            yield SIDE_B, b, None, ()
+            b = next(stream_b, None)
+
+
+__all__ = [
+    'MIN_WORKING_MEMORY',
+    'READ_BUFFER',
+    'RECORD_MEMORY',
+    'RUN_RECORD',
+    'current_rss',
+    'iter_external_diff',
+    'sorted_runs',
+    'working_memory',
+]
@@ -0,0 +1,549 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    midi_diff/fragments.py
+
+Description:
+    Inverted n-gram index for finding where a musical passage occurs in a corpus.
+
+    Each file's notes are ordered by start tick (then pitch) and every run of
+    ``n`` onsets becomes a term made of its pitch intervals and inter-onset gaps, so
+    terms are unchanged by transposition and by shifting the passage in time. Gaps are
+    normalized to ``DEFAULT_TICKS_PER_BEAT`` so files of different resolutions agree.
+    Terms are hashed with :func:`midi_diff.note_keys.stable_hash`, so an index reads the
+    same under every Python build, and map to ``(file, tick)`` postings. A search votes on alignments between the
+    fragment and each file, then checks every candidate with the exact diff engine over
+    the candidate's tick window only, decoded via the file's seek index. Seek indexes
+    are kept inside the index directory, so searching never writes into the corpus.
+
+Index directory layout::
+
+    manifest.json       indexed files (path relative to this directory, size, mtime,
+                        resolution, deleted flag)
+    seg-NNNNNN.ngx      immutable posting segments
+    seek/               seek indexes of verified files, a :class:`midi_diff.cache.DiffCache`
+
+Segment layout (version 3), little-endian, each section 8-byte aligned::
+
+    header    magic b'MIDINGIX' | version u16 | n u16 | reserved u32 | count u64
+    terms     u64[count]      ascending
+    file_ids  u32[count]
+    ticks     u32[count]      start tick of the term's first onset
+
+New files are added as new segments, changed files are re-added under a new id with
+the old one marked deleted, and segments are merged once there are more than
+``MAX_SEGMENTS``.
+"""
+
+from __future__ import annotations
+
+import array
+import bisect
+import contextlib
+import heapq
+import json
+import mmap
+import os
+import struct
+import sys
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Final, Iterable, Iterator, Union
+
+from midi_diff.cache import DiffCache
+from midi_diff.diff import diff_records
+from midi_diff.midi_utils import DEFAULT_TICKS_PER_BEAT, NoteRecord, iter_buffer_note_records
+from midi_diff.note_keys import pack_key, stable_hash, unpack_key
+from midi_diff.outputs import write_atomic
+from midi_diff.seek_index import iter_window_records
+from midi_diff.smf import read_header
+from midi_diff.sources import MidiSource, index_entry_path, open_source, resolve_index_entry
+
+FRAGMENT_INDEX_VERSION: Final[int] = 3
+DEFAULT_FRAGMENT_INDEX: Final[str] = 'midi-diff.ngidx'
+
+SEGMENT_MAGIC: Final[bytes] = b'MIDINGIX'
+SEGMENT_HEADER: Final[struct.Struct] = struct.Struct('<8sHHIQ')
+SEGMENT_SUFFIX: Final[str] = '.ngx'
+MANIFEST_NAME: Final[str] = 'manifest.json'
+SEEK_CACHE_NAME: Final[str] = 'seek'
+
+DEFAULT_NGRAM: Final[int] = 4
+"""Onsets per term (giving ``n - 1`` intervals and gaps)."""
+
+MAX_SEGMENTS: Final[int] = 8
+SEGMENT_POSTINGS: Final[int] = 4_000_000
+"""Postings buffered in memory before a segment is written."""
+
+DEFAULT_MIN_SCORE: Final[float] = 0.9
+DEFAULT_MAX_TERMS: Final[int] = 16
+"""Rarest fragment terms used for voting."""
+
+TICK_MAX: Final[int] = 0xFFFFFFFF
+
+
+def onsets(records: Iterable[NoteRecord]) -> list[tuple[int, int]]:
+    """
+    Return the distinct ``(start, pitch)`` pairs of a file, in start-then-pitch order.
+
+    Parameters:
+        records (Iterable[NoteRecord]):
+            Note records.
+
+    Returns:
+        list[tuple[int, int]]:
+            The ordered note stream terms are built from.
+    """
+    pairs = set()
+    for key, _velocity, _track in records:
+        pitch, _channel, start, _duration = unpack_key(key)
+        pairs.add((start, pitch))
+    return sorted(pairs)
+
+
+def iter_terms(
+    stream: list[tuple[int, int]],
+    ticks_per_beat: int,
+    n: int = DEFAULT_NGRAM,
+) -> Iterator[tuple[int, int, int]]:
+    """
+    Yield the interval/rhythm term starting at each position of a note stream.
+
+    Parameters:
+        stream (list[tuple[int, int]]):
+            ``(start, pitch)`` pairs from :func:`onsets`.
+
+        ticks_per_beat (int):
+            Resolution of the stream, used to normalize gaps.
+
+        n (int):
+            Onsets per term.
+
+    Yields:
+        tuple[int, int, int]:
+            ``(term, position, start_tick)``.
+    """
+    scale = DEFAULT_TICKS_PER_BEAT
+    for i in range(len(stream) - n + 1):
+        run = stream[i:i + n]
+        shape = [
+            part
+            for (start, pitch), (next_start, next_pitch) in zip(run, run[1:])
+            for part in (next_pitch - pitch, (next_start - start) * scale // ticks_per_beat)
+        ]
+        yield stable_hash(shape), i, run[0][0]
+
+
+@dataclass(frozen=True, slots=True)
+class FragmentMatch:
+    """
+    A verified occurrence of a fragment.
+
+    Attributes:
+        path (str):
+            File containing the passage, relative to the working directory.
+
+        tick (int):
+            Tick in that file where the fragment's first note starts.
+
+        transposition (int):
+            Semitones added to the fragment's pitches to match the file.
+
+        score (float):
+            Fraction of the fragment's notes found exactly (pitch, start and duration,
+            ignoring channel) in the file's window.
+    """
+
+    path: str
+    tick: int
+    transposition: int
+    score: float
+
+
+class _Segment:
+    """Memory-mapped posting segment."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        with open(path, 'rb') as fh:
+            self._map = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n, _reserved, count = SEGMENT_HEADER.unpack_from(self._map)
+        if magic != SEGMENT_MAGIC or version != FRAGMENT_INDEX_VERSION:
+            self._map.close()
+            raise ValueError(f'not a supported fragment segment: {path}')
+        self.n, self.count = n, count
+        view = memoryview(self._map)
+        offset = SEGMENT_HEADER.size
+        sections = []
+        for code in ('Q', 'I', 'I'):
+            size = struct.calcsize(code) * count
+            if sys.byteorder == 'big':
+                words = array.array(code, view[offset:offset + size].tobytes())
+                words.byteswap()
+                sections.append(words)
+            else:
+                sections.append(view[offset:offset + size].cast(code))
+            offset = (offset + size + 7) & ~7
+        self.terms, self.file_ids, self.ticks = sections
+        self._view = view
+
+    def postings(self, term: int) -> range:
+        """Return the positions holding ``term``."""
+        lo = bisect.bisect_left(self.terms, term)
+        hi = bisect.bisect_right(self.terms, term, lo)
+        return range(lo, hi)
+
+    def __iter__(self) -> Iterator[tuple[int, int, int]]:
+        return zip(self.terms, self.file_ids, self.ticks)
+
+    def close(self) -> None:
+        for section in (self.terms, self.file_ids, self.ticks, self._view):
+            if isinstance(section, memoryview):
+                section.release()
+        with contextlib.suppress(BufferError):
+            self._map.close()
+
+
+def _segment_chunks(postings: Iterable[tuple[int, int, int]], count: int, n: int) -> Iterator[bytes]:
+    """Encode sorted postings as a segment file."""
+    terms, file_ids, ticks = array.array('Q'), array.array('I'), array.array('I')
+    for term, file_id, tick in postings:
+        terms.append(term)
+        file_ids.append(file_id)
+        ticks.append(tick)
+    yield SEGMENT_HEADER.pack(SEGMENT_MAGIC, FRAGMENT_INDEX_VERSION, n, 0, count)
+    for words in (terms, file_ids, ticks):
+        if sys.byteorder == 'big':
+            words.byteswap()
+        data = words.tobytes()
+        yield data + b'\0' * (-len(data) % 8)
+
+
+class FragmentIndex:
+    """
+    On-disk inverted n-gram index over a MIDI corpus.
+
+    Parameters:
+        directory (str | pathlib.Path):
+            Index directory; created on the first :meth:`add`.
+
+        n (int):
+            Onsets per term for a new index. An existing index keeps its own value.
+    """
+
+    def __init__(self, directory: Union[str, Path], n: int = DEFAULT_NGRAM) -> None:
+        self.directory = Path(directory)
+        self.n = n
+        self.files: list[dict] = []
+        manifest = self.directory / MANIFEST_NAME
+        if manifest.exists():
+            data = json.loads(manifest.read_text(encoding='utf-8'))
+            if data.get('version') != FRAGMENT_INDEX_VERSION:
+                raise ValueError(f"unsupported fragment index version: {data.get('version')!r}")
+            self.n = int(data['n'])
+            self.files = list(data['files'])
+            self.segments = list(data['segments'])
+        else:
+            self.segments = []
+
+    def _save_manifest(self) -> None:
+        data = {'version': FRAGMENT_INDEX_VERSION, 'n': self.n, 'files': self.files, 'segments': self.segments}
+        write_atomic(self.directory / MANIFEST_NAME, [json.dumps(data).encode()])
+
+    def _flush(self, postings: list[tuple[int, int, int]]) -> None:
+        """Write buffered postings as a new segment."""
+        if not postings:
+            return
+        postings.sort()
+        # Number past every segment on disk, including ones a compaction is replacing.
+        existing = (path.name for path in self.directory.glob(f'seg-*{SEGMENT_SUFFIX}'))
+        number = max((int(name[4:10]) for name in existing), default=0) + 1
+        name = f'seg-{number:06d}{SEGMENT_SUFFIX}'
+        write_atomic(self.directory / name, _segment_chunks(postings, len(postings), self.n))
+        self.segments.append(name)
+        postings.clear()
+
+    def add(self, paths: Iterable[Union[str, Path]], on_error: Callable[[Path, Exception], None] | None = None) -> int:
+        """
+        Index new or changed files.
+
+        Files already indexed with the same size and modification time are skipped.
+
+        Parameters:
+            paths (Iterable[str | pathlib.Path]):
+                Files to add.
+
+            on_error (Callable[[pathlib.Path, Exception], None] | None):
+                Called for each file that cannot be read; such files are skipped.
+
+        Returns:
+            int:
+                Number of files added or re-indexed.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Entries are keyed by their path relative to the index directory.
+        live = {entry['path']: i for i, entry in enumerate(self.files) if not entry['deleted']}
+        postings: list[tuple[int, int, int]] = []
+        added = 0
+        for path in paths:
+            path = Path(path)
+            stored = index_entry_path(path, self.directory)
+            try:
+                stat = path.stat()
+                previous = live.get(stored)
+                if previous is not None:
+                    entry = self.files[previous]
+                    if (entry['size'], entry['mtime_ns']) == (stat.st_size, stat.st_mtime_ns):
+                        continue
+                with open_source(path) as buf:
+                    ticks_per_beat = read_header(buf).ticks_per_beat
+                    stream = onsets(iter_buffer_note_records(buf))
+            except Exception as e:
+                if on_error is not None:
+                    on_error(path, e)
+                continue
+
+            if previous is not None:
+                self.files[previous]['deleted'] = True
+            file_id = len(self.files)
+            self.files.append({
+                'path': stored,
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'ticks_per_beat': ticks_per_beat,
+                'deleted': False,
+            })
+            live[stored] = file_id
+            postings.extend(
+                (term, file_id, tick)
+                for term, _position, tick in iter_terms(stream, ticks_per_beat, self.n)
+                if tick <= TICK_MAX
+            )
+            added += 1
+            if len(postings) >= SEGMENT_POSTINGS:
+                self._flush(postings)
+
+        self._flush(postings)
+        self._save_manifest()
+        if len(self.segments) > MAX_SEGMENTS:
+            self.compact()
+        return added
+
+    def compact(self) -> None:
+        """Merge all segments into one, dropping postings of deleted files."""
+        if not self.segments:
+            return
+        deleted = {i for i, entry in enumerate(self.files) if entry['deleted']}
+        opened = [_Segment(self.directory / name) for name in self.segments]
+        try:
+            merged = [
+                posting
+                for posting in heapq.merge(*opened)
+                if posting[1] not in deleted
+            ]
+            old = list(self.segments)
+            self.segments = []
+            self._flush(merged)
+        finally:
+            for segment in opened:
+                segment.close()
+        self._save_manifest()
+        for name in old:
+            with contextlib.suppress(OSError):
+                (self.directory / name).unlink()
+
+    def search(
+        self,
+        fragment: MidiSource,
+        min_score: float = DEFAULT_MIN_SCORE,
+        max_terms: int = DEFAULT_MAX_TERMS,
+        on_error: Callable[[Path, Exception], None] | None = None,
+    ) -> list[FragmentMatch]:
+        """
+        Find where ``fragment`` occurs in the indexed files.
+
+        The rarest fragment terms vote for ``(file, start tick)`` alignments; each
+        alignment backed by at least half of those terms is verified by decoding the
+        file's window around it and diffing it against the transposed fragment.
+
+        Parameters:
+            fragment (MidiSource):
+                The passage to look for.
+
+            min_score (float):
+                Minimum fraction of fragment notes that must match exactly.
+
+            max_terms (int):
+                Number of (rarest) fragment terms used for voting.
+
+            on_error (Callable[[pathlib.Path, Exception], None] | None):
+                Called once for each candidate file that cannot be read; its
+                candidates are skipped.
+
+        Returns:
+            list[FragmentMatch]:
+                Verified matches, best first.
+
+        Raises:
+            ValueError:
+                If the fragment has fewer notes than the index's n-gram length.
+        """
+        with open_source(fragment) as buf:
+            fragment_ppq = read_header(buf).ticks_per_beat
+            records = list(iter_buffer_note_records(buf))
+        stream = onsets(records)
+        terms = list(iter_terms(stream, fragment_ppq, self.n))
+        if not terms:
+            raise ValueError(f'fragment needs at least {self.n} distinct onsets')
+
+        segments = [_Segment(self.directory / name) for name in self.segments]
+        try:
+            frequency: Counter = Counter()
+            for term, _position, _tick in terms:
+                if term not in frequency:
+                    frequency[term] = sum(len(s.postings(term)) for s in segments)
+            # One occurrence per distinct term, rarest first; absent terms cannot vote.
+            distinct = {term: (term, tick) for term, _position, tick in reversed(terms)}
+            chosen = sorted(distinct.values(), key=lambda t: frequency[t[0]])
+            chosen = [t for t in chosen if frequency[t[0]]][:max_terms]
+
+            votes: Counter = Counter()
+            for term, frag_tick in chosen:
+                offset = frag_tick - stream[0][0]
+                for segment in segments:
+                    for i in segment.postings(term):
+                        file_id = segment.file_ids[i]
+                        entry = self.files[file_id]
+                        if entry['deleted']:
+                            continue
+                        scaled = offset * entry['ticks_per_beat'] // fragment_ppq
+                        votes[(file_id, segment.ticks[i] - scaled)] += 1
+        finally:
+            for segment in segments:
+                segment.close()
+
+        needed = max(1, (len(chosen) + 1) // 2)
+        matches: list[FragmentMatch] = []
+        unreadable: set[int] = set()
+        for (file_id, tick), count in votes.most_common():
+            if count < needed:
+                break
+            if tick < 0 or file_id in unreadable:
+                continue
+            path = resolve_index_entry(self.files[file_id]['path'], self.directory)
+            try:
+                match = self._verify(path, self.files[file_id], tick, records, stream, fragment_ppq)
+            except (OSError, ValueError) as e:
+                unreadable.add(file_id)
+                if on_error is not None:
+                    on_error(path, e)
+                continue
+            if match is not None and match.score >= min_score:
+                matches.append(match)
+        matches.sort(key=lambda m: (-m.score, m.path, m.tick))
+        return matches
+
+    def _verify(
+        self,
+        path: Path,
+        entry: dict,
+        tick: int,
+        records: list[NoteRecord],
+        stream: list[tuple[int, int]],
+        fragment_ppq: int,
+    ) -> FragmentMatch | None:
+        """
+        Diff the fragment, placed at ``tick`` in the file, against that window of the file.
+
+        Raises:
+            OSError, ValueError:
+                If the file cannot be read.
+        """
+        file_ppq = entry['ticks_per_beat']
+        origin = stream[0][0]
+
+        def place(transposition: int) -> list[NoteRecord]:
+            placed = []
+            for key, velocity, _track in records:
+                pitch, _channel, start, duration = unpack_key(key)
+                new_start = tick + (start - origin) * file_ppq // fragment_ppq
+                new_end = tick + (start + duration - origin) * file_ppq // fragment_ppq
+                if 0 <= pitch + transposition <= 127:
+                    placed.append((pack_key(pitch + transposition, 0, new_start, max(1, new_end - new_start)), velocity, 0))
+            return placed
+
+        span = (stream[-1][0] - origin) * file_ppq // fragment_ppq + 1
+        with open_source(path) as buf:
+            index = DiffCache(self.directory / SEEK_CACHE_NAME).seek_index(buf)
+            window = []
+            transpositions = set()
+            for key, velocity, track in iter_window_records(buf, tick, tick + span, index=index):
+                pitch, _channel, start, duration = unpack_key(key)
+                window.append((pack_key(pitch, 0, start, duration), velocity, track))
+                if start == tick:
+                    transpositions.add(pitch - stream[0][1])
+
+        best: FragmentMatch | None = None
+        for transposition in sorted(transpositions):
+            placed = place(transposition)
+            if not placed:
+                continue
+            missing = len(diff_records(placed, window, ()).only_in_a_records)
+            score = 1 - missing / len({r[0] for r in placed})
+            if best is None or score > best.score:
+                best = FragmentMatch(path=str(path), tick=tick, transposition=transposition, score=score)
+        return best
+
+
+def find_fragment(
+    index_dir: Union[str, Path],
+    fragment: MidiSource,
+    min_score: float = DEFAULT_MIN_SCORE,
+    on_error: Callable[[Path, Exception], None] | None = None,
+) -> list[FragmentMatch]:
+    """
+    Convenience wrapper: open the index in ``index_dir`` and search it for ``fragment``.
+
+    Parameters:
+        index_dir (str | pathlib.Path):
+            Fragment index directory.
+
+        fragment (MidiSource):
+            The passage to look for.
+
+        min_score (float):
+            Minimum fraction of fragment notes that must match exactly.
+
+        on_error (Callable[[pathlib.Path, Exception], None] | None):
+            Called once for each candidate file that cannot be read.
+
+    Returns:
+        list[FragmentMatch]:
+            Verified matches, best first.
+
+    Raises:
+        FileNotFoundError:
+            If ``index_dir`` holds no fragment index.
+    """
+    if not (Path(index_dir) / MANIFEST_NAME).exists():
+        raise FileNotFoundError(f'no fragment index in {index_dir}')
+    return FragmentIndex(index_dir).search(fragment, min_score=min_score, on_error=on_error)
+
+
+__all__ = [
+    'DEFAULT_FRAGMENT_INDEX',
+    'DEFAULT_MIN_SCORE',
+    'DEFAULT_NGRAM',
+    'FRAGMENT_INDEX_VERSION',
+    'FragmentIndex',
+    'FragmentMatch',
+    'find_fragment',
+    'iter_terms',
+    'onsets',
+]
@@ -0,0 +1,291 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    midi_diff/gitdriver.py
+
+Description:
+    Git integration: a ``textconv`` filter that lists a MIDI file's notes as text, and
+    an external diff driver that prints a compact note-level diff.
+
+    Git runs these once per blob (textconv) or blob pair (external diff), so a history
+    walk such as ``git log -p`` sees the same blobs over and over. Extracted notes are
+    therefore cached by git blob id in the diff cache (see
+    :meth:`midi_diff.cache.DiffCache.notes`), and every blob is parsed at most once. The
+    id is computed the way git computes it (SHA-1 of ``blob <size>\\0`` and the
+    contents) when git does not pass it, which costs far less than parsing.
+
+Setup::
+
+    # .gitattributes
+    *.mid diff=midi
+
+    git config diff.midi.textconv "midi-diff textconv"
+    # or, for the note-level summary instead of a line diff of listings:
+    git config diff.midi.command "midi-diff git-driver"
+"""
+
+from __future__ import annotations
+
+import hashlib
+import re
+import subprocess
+from pathlib import Path
+from typing import Callable, Final, Iterable, Iterator, Union
+
+from midi_diff.cache import DiffCache
+from midi_diff.diff import COMPARED_ATTRIBUTES, diff_records
+from midi_diff.midi_utils import NoteRecord, iter_buffer_note_records
+from midi_diff.note_keys import rescale_record, unpack_key
+from midi_diff.smf import read_header
+from midi_diff.sources import open_source
+
+NULL_PATH: Final[str] = '/dev/null'
+"""Path git passes for the missing side of an added or deleted file."""
+
+_NOTE_NAMES: Final[tuple[str, ...]] = ('C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B')
+_OBJECT_ID: Final[re.Pattern] = re.compile(r'[0-9a-f]{40}|[0-9a-f]{64}')
+
+
+def git_blob_id(data: bytes) -> str:
+    """
+    Return the git (SHA-1) object id of a blob with contents ``data``.
+
+    Parameters:
+        data (bytes):
+            Blob contents.
+
+    Returns:
+        str:
+            40-character hexadecimal id, as printed by ``git hash-object``.
+    """
+    digest = hashlib.sha1(f'blob {len(data)}\0'.encode(), usedforsecurity=False)
+    digest.update(data)
+    return digest.hexdigest()
+
+
+def pitch_name(pitch: int) -> str:
+    """Return the scientific pitch name of a MIDI note number (60 is ``C4``)."""
+    return f'{_NOTE_NAMES[pitch % 12]}{pitch // 12 - 1}'
+
+
+def _cached_notes(
+    blob_id: str,
+    read: Callable[[], bytes],
+    cache: DiffCache | None,
+) -> tuple[int, list[NoteRecord]]:
+    """Return the notes of blob ``blob_id``, calling ``read`` for its contents on a cache miss."""
+    if cache is not None:
+        cached = cache.notes(blob_id)
+        if cached is not None:
+            return cached
+    with open_source(read()) as buf:
+        ticks_per_beat = read_header(buf).ticks_per_beat
+        records = list(iter_buffer_note_records(buf))
+    if cache is not None:
+        cache.store_notes(blob_id, ticks_per_beat, records)
+    return ticks_per_beat, records
+
+
+def load_blob_notes(
+    path: Union[str, Path],
+    blob_id: str | None = None,
+    cache: DiffCache | None = None,
+) -> tuple[int, list[NoteRecord]]:
+    """
+    Return the notes of a file git handed over, parsing it only on a cache miss.
+
+    Parameters:
+        path (str | pathlib.Path):
+            File holding the blob (``/dev/null`` for a missing side).
+
+        blob_id (str | None):
+            The blob's object id if git passed one; otherwise it is computed.
+
+        cache (DiffCache | None):
+            Note cache. Without one the file is always parsed.
+
+    Returns:
+        tuple[int, list[NoteRecord]]:
+            Ticks per beat (0 for a missing side) and note records.
+
+    Raises:
+        OSError, ValueError:
+            If the file cannot be read or is not a MIDI file.
+    """
+    if str(path) == NULL_PATH:
+        return 0, []
+    if blob_id is None or not _OBJECT_ID.fullmatch(blob_id) or not blob_id.strip('0'):
+        data = Path(path).read_bytes()
+        return _cached_notes(git_blob_id(data), lambda: data, cache)
+    return _cached_notes(blob_id, Path(path).read_bytes, cache)
+
+
+def _git(*args: str) -> bytes:
+    """
+    Run a git command and return its standard output.
+
+    Raises:
+        OSError:
+            If git is not installed.
+
+        ValueError:
+            If the command fails.
+    """
+    result = subprocess.run(['git', *args], capture_output=True)
+    if result.returncode != 0:
+        message = result.stderr.decode(errors='replace').strip() or f'git {args[0]} failed'
+        raise ValueError(message)
+    return result.stdout
+
+
+def git_revisions(path: Union[str, Path]) -> list[str]:
+    """
+    Return the commits that changed ``path``, oldest first.
+
+    Parameters:
+        path (str | pathlib.Path):
+            File in the current repository.
+
+    Returns:
+        list[str]:
+            Abbreviated commit ids.
+
+    Raises:
+        OSError, ValueError:
+            If git is unavailable or the command fails.
+    """
+    return _git('log', '--format=%h', '--reverse', '--', str(path)).decode().split()
+
+
+def load_revision_notes(
+    path: Union[str, Path],
+    revision: str,
+    cache: DiffCache | None = None,
+) -> tuple[int, list[NoteRecord]]:
+    """
+    Return the notes of ``path`` as of ``revision``, parsing the blob only on a cache miss.
+
+    Parameters:
+        path (str | pathlib.Path):
+            File in the current repository, relative to the working directory.
+
+        revision (str):
+            Any revision git understands (commit id, tag, ``HEAD~3``, ...).
+
+        cache (DiffCache | None):
+            Note cache shared with :func:`load_blob_notes`.
+
+    Returns:
+        tuple[int, list[NoteRecord]]:
+            Ticks per beat and note records.
+
+    Raises:
+        OSError, ValueError:
+            If git fails (for instance, the file does not exist at that revision) or
+            the blob is not a MIDI file.
+    """
+    spec = f'{revision}:./{Path(path).as_posix()}'
+    blob_id = _git('rev-parse', '--verify', spec).decode().strip()
+    return _cached_notes(blob_id, lambda: _git('cat-file', 'blob', blob_id), cache)
+
+
+def _sort_key(record: NoteRecord) -> tuple[int, int, int, int]:
+    pitch, channel, start, duration = unpack_key(record[0])
+    return start, pitch, channel, duration
+
+
+def format_note(record: NoteRecord, before: NoteRecord | None = None) -> str:
+    """
+    Format a note as ``start +duration name chN vVELOCITY tTRACK``.
+
+    With ``before``, the velocity is shown as ``vOLD→NEW``.
+    """
+    key, velocity, track = record
+    pitch, channel, start, duration = unpack_key(key)
+    shown = f'{before[1]}→{velocity}' if before is not None else velocity
+    return f'{start} +{duration} {pitch_name(pitch)} ch{channel} v{shown} t{track}'
+
+
+def iter_listing(ticks_per_beat: int, records: Iterable[NoteRecord]) -> Iterator[str]:
+    """
+    Yield the textconv listing of a file: a header line, then one line per note in
+    start, pitch and channel order, so a textual diff of two listings lines up notes.
+
+    Parameters:
+        ticks_per_beat (int):
+            Resolution of the file.
+
+        records (Iterable[NoteRecord]):
+            Its notes.
+
+    Yields:
+        str:
+            Lines without trailing newlines.
+    """
+    records = sorted(records, key=_sort_key)
+    yield f'MIDI {ticks_per_beat} ticks/beat, {len(records)} notes'
+    for record in records:
+        yield format_note(record)
+
+
+def iter_summary(
+    path: str,
+    old: tuple[int, list[NoteRecord]],
+    new: tuple[int, list[NoteRecord]],
+) -> Iterator[str]:
+    """
+    Yield the external-diff summary of two versions of a file.
+
+    The new version is rescaled to the old one's resolution if they differ. Lines
+    start with ``-`` (only in the old version), ``+`` (only in the new one) or ``~``
+    (same note, velocity changed), in start order.
+
+    Parameters:
+        path (str):
+            Path of the file in the repository.
+
+        old (tuple[int, list[NoteRecord]]):
+            Ticks per beat and notes of the old version.
+
+        new (tuple[int, list[NoteRecord]]):
+            Ticks per beat and notes of the new version.
+
+    Yields:
+        str:
+            Lines without trailing newlines.
+    """
+    (old_ppq, old_records), (new_ppq, new_records) = old, new
+    if old_ppq and new_ppq and old_ppq != new_ppq:
+        new_records = [rescale_record(new_ppq, old_ppq, record) for record in new_records]
+    result = diff_records(old_records, new_records, COMPARED_ATTRIBUTES)
+
+    lines = [(_sort_key(r), '-', format_note(r)) for r in result.only_in_a_records]
+    lines += [(_sort_key(r), '+', format_note(r)) for r in result.only_in_b_records]
+    lines += [(_sort_key(after), '~', format_note(after, before)) for before, after, _names in result.changed_records]
+    lines.sort(key=lambda line: line[0])
+
+    yield f'diff --midi a/{path} b/{path}'
+    yield (
+        f'notes: {len(old_records)} → {len(new_records)} '
+        f'(-{len(result.only_in_a_records)} +{len(result.only_in_b_records)} ~{len(result.changed_records)})'
+    )
+    for _key, marker, text in lines:
+        yield f'{marker} {text}'
+
+
+__all__ = [
+    'NULL_PATH',
+    'format_note',
+    'git_blob_id',
+    'git_revisions',
+    'iter_listing',
+    'iter_summary',
+    'load_blob_notes',
+    'load_revision_notes',
+    'pitch_name',
+]
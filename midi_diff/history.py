@@ -0,0 +1,258 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    midi_diff/history.py
+
+Description:
+    Diff a sequence of versions of a piece in one pass.
+
+    Each version is parsed exactly once, with the same note extraction as the
+    two-file diff, and every consecutive pair is compared with the same diff engine.
+    The consecutive diffs also feed a presence timeline that records, for every note,
+    the versions in which it appears and disappears, so questions such as "in which
+    version did this note vanish?" are answered from the timeline without diffing or
+    parsing anything again.
+
+    Versions with different resolutions are rescaled to the first version's, so ticks
+    in the chain and in timeline queries are always in that resolution.
+"""
+
+from __future__ import annotations
+
+import bisect
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Iterator
+
+from midi_diff.cache import DiffCache
+from midi_diff.core import load_records
+from midi_diff.diff import COMPARED_ATTRIBUTES, NoteDiff, diff_records
+from midi_diff.gitdriver import load_revision_notes
+from midi_diff.midi_utils import NoteRecord
+from midi_diff.note_keys import rescale_record, unpack_key
+from midi_diff.smf import read_header
+from midi_diff.sources import MidiSource, describe_source, open_source
+
+
+@dataclass(frozen=True, slots=True)
+class Version:
+    """
+    One parsed version of a piece.
+
+    Attributes:
+        label (str):
+            Name shown for the version (a path or a revision).
+
+        ticks_per_beat (int):
+            Resolution of ``records``.
+
+        records (list[NoteRecord]):
+            Its notes.
+    """
+
+    label: str
+    ticks_per_beat: int
+    records: list[NoteRecord] = field(repr=False)
+
+
+@dataclass(frozen=True, slots=True)
+class ChainStep:
+    """
+    The diff between two consecutive versions.
+
+    Attributes:
+        index (int):
+            Position of the newer version in the chain (the older one is ``index - 1``).
+
+        before (str):
+            Label of the older version.
+
+        after (str):
+            Label of the newer version.
+
+        diff (NoteDiff):
+            Notes removed (only in ``before``), added (only in ``after``) and changed.
+    """
+
+    index: int
+    before: str
+    after: str
+    diff: NoteDiff = field(repr=False)
+
+
+class PresenceTimeline:
+    """
+    For every note key, the versions at which it appears and disappears.
+
+    Each key maps to an ascending list of version indexes at which its presence
+    toggles: the note is present from the first entry up to (excluding) the second,
+    from the third up to the fourth, and so on. An odd-length list means the note is
+    still present in the last version.
+    """
+
+    def __init__(self) -> None:
+        self.toggles: dict[int, list[int]] = {}
+        self.versions: list[str] = []
+
+    def start(self, label: str, keys: Iterable[int]) -> None:
+        """Record the first version; a key held by several records toggles once, as it is diffed once."""
+        self.versions.append(label)
+        for key in set(keys):
+            self.toggles.setdefault(key, []).append(0)
+
+    def advance(self, label: str, removed: Iterable[int], added: Iterable[int]) -> None:
+        """Record the next version from its diff against the previous one."""
+        index = len(self.versions)
+        self.versions.append(label)
+        for key in removed:
+            self.toggles[key].append(index)
+        for key in added:
+            self.toggles.setdefault(key, []).append(index)
+
+    def present(self, key: int, index: int) -> bool:
+        """Return whether note ``key`` is in version ``index``."""
+        toggles = self.toggles.get(key, ())
+        return bisect.bisect_right(toggles, index) % 2 == 1
+
+    def first_disappearance(self, key: int, after: int = 0) -> int | None:
+        """
+        Return the first version index, later than ``after``, that lacks a note that
+        the previous version had.
+
+        Returns:
+            int | None:
+                The version index, or None if the note never disappears after ``after``.
+        """
+        toggles = self.toggles.get(key, ())
+        # Removals are the entries at odd positions.
+        for position in range(bisect.bisect_right(toggles, after), len(toggles)):
+            if position % 2 == 1:
+                return toggles[position]
+        return None
+
+    def matching(self, predicate: Callable[[int, int, int, int], bool]) -> list[int]:
+        """
+        Return the keys whose ``(pitch, channel, start, duration)`` satisfy ``predicate``.
+        """
+        return sorted(key for key in self.toggles if predicate(*unpack_key(key)))
+
+
+def load_version(
+    source: MidiSource,
+    window: tuple[int, int] | None = None,
+    label: str | None = None,
+    cache: DiffCache | None = None,
+) -> Version:
+    """
+    Parse one version from a file or any other MIDI source.
+
+    Parameters:
+        source (MidiSource):
+            The version's contents.
+
+        window (tuple[int, int] | None):
+            Only keep notes starting in this ``[start, end)`` tick range, as in
+            ``diff --window``.
+
+        label (str | None):
+            Name of the version; defaults to a description of ``source``.
+
+        cache (DiffCache | None):
+            Cache keeping the file's seek index in window mode.
+
+    Returns:
+        Version:
+            The parsed version.
+    """
+    with open_source(source) as buf:
+        ticks_per_beat = read_header(buf).ticks_per_beat
+        records = load_records(buf, window, cache)
+    return Version(label or describe_source(source), ticks_per_beat, records)
+
+
+def load_revision(
+    path: str,
+    revision: str,
+    window: tuple[int, int] | None = None,
+    cache: DiffCache | None = None,
+) -> Version:
+    """
+    Parse ``path`` as of a git revision, reusing notes cached by blob id.
+
+    Parameters:
+        path (str):
+            File in the current repository.
+
+        revision (str):
+            Revision to read it at; also used as the label.
+
+        window (tuple[int, int] | None):
+            Only keep notes starting in this ``[start, end)`` tick range.
+
+        cache (DiffCache | None):
+            Note cache (see :func:`midi_diff.gitdriver.load_revision_notes`).
+
+    Returns:
+        Version:
+            The parsed version.
+    """
+    ticks_per_beat, records = load_revision_notes(path, revision, cache)
+    if window is not None:
+        records = [record for record in records if window[0] <= unpack_key(record[0])[2] < window[1]]
+    return Version(revision, ticks_per_beat, records)
+
+
+def iter_chain(versions: Iterable[Version], timeline: PresenceTimeline | None = None) -> Iterator[ChainStep]:
+    """
+    Diff each version against the previous one.
+
+    Versions are consumed lazily, so each one only has to be held in memory while it
+    is being compared with its neighbours.
+
+    Parameters:
+        versions (Iterable[Version]):
+            Versions in order.
+
+        timeline (PresenceTimeline | None):
+            Updated with every step when given.
+
+    Yields:
+        ChainStep:
+            One step per consecutive pair.
+    """
+    previous: Version | None = None
+    ticks_per_beat = 0
+    for index, version in enumerate(versions):
+        records = version.records
+        if previous is None:
+            ticks_per_beat = version.ticks_per_beat
+            if timeline is not None:
+                timeline.start(version.label, (record[0] for record in records))
+            previous = version
+            continue
+        if version.ticks_per_beat != ticks_per_beat:
+            records = [rescale_record(version.ticks_per_beat, ticks_per_beat, record) for record in records]
+            version = Version(version.label, ticks_per_beat, records)
+        diff = diff_records(previous.records, records, COMPARED_ATTRIBUTES)
+        if timeline is not None:
+            timeline.advance(
+                version.label,
+                {record[0] for record in diff.only_in_a_records},
+                {record[0] for record in diff.only_in_b_records},
+            )
+        yield ChainStep(index=index, before=previous.label, after=version.label, diff=diff)
+        previous = version
+
+
+__all__ = [
+    'ChainStep',
+    'PresenceTimeline',
+    'Version',
+    'iter_chain',
+    'load_revision',
+    'load_version',
+]
@@ -0,0 +1,142 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    midi_diff/journal.py
+
+Description:
+    Append-only checkpoint journal for long batch and matrix runs.
+
+    Every completed unit of work is appended as one JSON line and flushed to disk with
+    ``fsync`` before the run moves on, so a run killed at any point loses at most the
+    work in flight. A restarted run reads the journal back and skips the work it
+    records. A line cut short by the kill is dropped (and cut off the file) on resume.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Final, Union
+
+JOURNAL_VERSION: Final[int] = 1
+
+
+def read_journal(path: Union[str, Path]) -> list[dict[str, Any]]:
+    """
+    Read the records of a journal.
+
+    Parameters:
+        path (str | pathlib.Path):
+            The journal. A missing file has no records.
+
+    Returns:
+        list[dict[str, Any]]:
+            Records in the order they were written. A torn or unreadable trailing
+            line, or records of another journal version, are left out.
+    """
+    records: list[dict[str, Any]] = []
+    try:
+        with open(path, 'rb') as fh:
+            for line in fh:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(record, dict) and record.get('v') == JOURNAL_VERSION:
+                    records.append(record)
+    except FileNotFoundError:
+        pass
+    return records
+
+
+class Journal:
+    """
+    Writer for a checkpoint journal; use as a context manager.
+    """
+
+    __slots__ = ('path', '_fh')
+
+    def __init__(self, path: Union[str, Path], resume: bool = False) -> None:
+        """
+        Open a journal for appending.
+
+        Parameters:
+            path (str | pathlib.Path):
+                The journal file; its parent directory is created if needed.
+
+            resume (bool):
+                Keep existing records, cutting off a torn last line. Otherwise the
+                journal is started empty.
+
+        Raises:
+            OSError:
+                If the journal cannot be opened.
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        created = not self.path.exists()
+        self._fh = open(self.path, 'ab' if resume else 'wb')
+        if resume:
+            self._drop_torn_tail()
+        if created:
+            self._sync_directory()
+
+    def _drop_torn_tail(self) -> None:
+        """Truncate the file after its last complete line."""
+        with open(self.path, 'rb') as fh:
+            data = fh.read()
+        end = data.rfind(b'\n') + 1
+        if end != len(data):
+            self._fh.truncate(end)
+            os.fsync(self._fh.fileno())
+
+    def _sync_directory(self) -> None:
+        """Make the journal's directory entry durable (where directories can be opened)."""
+        try:
+            fd = os.open(self.path.parent, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def append(self, record: dict[str, Any]) -> None:
+        """
+        Durably append one record.
+
+        Parameters:
+            record (dict[str, Any]):
+                JSON-serializable record; a ``v`` (version) field is added.
+        """
+        line = json.dumps({'v': JOURNAL_VERSION, **record}, separators=(',', ':')) + '\n'
+        self._fh.write(line.encode('utf-8'))
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+
+    def close(self) -> None:
+        """Close the journal."""
+        self._fh.close()
+
+    def __enter__(self) -> Journal:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+__all__ = [
+    'JOURNAL_VERSION',
+    'Journal',
+    'read_journal',
+]
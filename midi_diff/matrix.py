@@ -0,0 +1,560 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    midi_diff/matrix.py
+
+Description:
+    All-pairs comparison of a MIDI corpus.
+
+    Every file is parsed once, in parallel, into a sorted table of its distinct notes.
+    The tables are copied into one shared-memory block (:mod:`midi_diff.shared`) that
+    worker processes attach to without copying; the upper triangle of the matrix is
+    split into square blocks of files so each task reuses the same few tables for many
+    pairs. A MinHash sketch of each table is shared the same way and used to skip pairs
+    that clearly have nothing in common.
+
+Two metrics are available:
+
+``jaccard``
+    ``1 - |A ∩ B| / |A ∪ B|`` over distinct note keys; symmetric, 0 on the diagonal.
+
+``counts``
+    Entry ``[i][j]`` is the number of notes of file ``i`` missing from file ``j``, so
+    ``[i][j]`` and ``[j][i]`` are the only-in-A and only-in-B counts of that pair.
+
+Pairs skipped by the prefilter hold values derived from the sketch estimate instead of
+an exact intersection.
+
+With a :class:`midi_diff.journal.Journal`, every compared block is recorded with the
+content hashes of its files, so an interrupted run can be resumed without comparing
+those pairs again.
+"""
+
+from __future__ import annotations
+
+import array
+import ast
+import contextlib
+import csv
+import io
+import itertools
+import multiprocessing
+import struct
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from multiprocessing import shared_memory
+from pathlib import Path
+from functools import partial
+from typing import Any, BinaryIO, Callable, Final, Iterable, Iterator, TextIO, Union
+
+from midi_diff.cache import content_hash
+from midi_diff.journal import Journal
+from midi_diff.midi_utils import NoteRecord, extract_note_records
+from midi_diff.note_keys import MASK64, mix64
+from midi_diff.shared import SharedNoteTables
+from midi_diff.similarity import DEFAULT_NUM_PERM, estimate_similarity, sketch
+
+METRIC_JACCARD: Final[str] = 'jaccard'
+METRIC_COUNTS: Final[str] = 'counts'
+METRICS: Final[tuple[str, ...]] = (METRIC_JACCARD, METRIC_COUNTS)
+
+FORMAT_CSV: Final[str] = 'csv'
+FORMAT_NPY: Final[str] = 'npy'
+MATRIX_FORMATS: Final[tuple[str, ...]] = (FORMAT_CSV, FORMAT_NPY)
+MATRIX_SUFFIXES: Final[dict[str, str]] = {FORMAT_CSV: '.csv', FORMAT_NPY: '.npy'}
+
+DEFAULT_BLOCK: Final[int] = 64
+"""Files per side of a work block."""
+
+DEFAULT_PREFILTER: Final[float] = 0.05
+"""Pairs whose estimated Jaccard similarity is below this are not compared exactly."""
+
+NPY_MAGIC: Final[bytes] = b'\x93NUMPY\x01\x00'
+
+
+def note_table(source) -> list[NoteRecord]:
+    """
+    Return the notes of a MIDI source with distinct keys, in ascending key order.
+
+    Parameters:
+        source (MidiSource):
+            File to read.
+
+    Returns:
+        list[NoteRecord]:
+            The first record for each distinct note key.
+    """
+    keyed: dict[int, NoteRecord] = {}
+    for record in extract_note_records(source):
+        keyed.setdefault(record[0], record)
+    return [keyed[key] for key in sorted(keyed)]
+
+
+def table_sketch(keys: Iterable[int], num_perm: int = DEFAULT_NUM_PERM) -> array.array:
+    """
+    MinHash sketch of a note table, estimating the Jaccard similarity of note keys.
+
+    Parameters:
+        keys (Iterable[int]):
+            Distinct note keys.
+
+        num_perm (int):
+            Sketch size in bins.
+
+    Returns:
+        array.array:
+            The sketch (see :func:`midi_diff.similarity.sketch`).
+    """
+    return sketch((mix64(key & MASK64) for key in keys), num_perm)
+
+
+@dataclass(slots=True)
+class DistanceMatrix:
+    """
+    Pairwise comparison of a list of files.
+
+    Attributes:
+        paths (list[str]):
+            Files in row/column order.
+
+        metric (str):
+            ``'jaccard'`` or ``'counts'``.
+
+        values (array.array):
+            Row-major ``len(paths) ** 2`` values: doubles for ``jaccard``, signed 64-bit
+            integers for ``counts``.
+
+        estimated (int):
+            Number of unordered pairs whose value comes from the sketch prefilter.
+    """
+
+    paths: list[str]
+    metric: str
+    values: array.array = field(repr=False)
+    estimated: int = 0
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def value(self, row: int, column: int) -> float | int:
+        """Return the entry at ``row``, ``column``."""
+        return self.values[row * len(self.paths) + column]
+
+    def rows(self) -> Iterator[array.array]:
+        """Yield each row as an array slice."""
+        n = len(self.paths)
+        for row in range(n):
+            yield self.values[row * n:(row + 1) * n]
+
+
+# Worker state, set once per process by _init_worker.
+_tables: SharedNoteTables | None = None
+_sketches: memoryview | None = None
+_num_perm = 0
+_shm: list[shared_memory.SharedMemory] = []
+
+
+def _init_worker(tables_name: str, sketches_name: str, num_perm: int) -> None:
+    """Attach a worker process to the shared note tables and sketches."""
+    global _tables, _sketches, _num_perm
+    _tables = SharedNoteTables.attach(tables_name)
+    sketches_shm = shared_memory.SharedMemory(name=sketches_name)
+    _shm[:] = [sketches_shm]
+    _sketches = sketches_shm.buf[:len(_tables) * num_perm * 4].cast('I')
+    _num_perm = num_perm
+
+
+def _parse(path: str, hashed: bool = False) -> tuple[array.array, array.array, array.array, str | None, str | None]:
+    """
+    Worker task: parse one file into key, velocity and track columns, or report the
+    error; with ``hashed``, also return its content hash.
+    """
+    keys, velocities, tracks = array.array('Q'), array.array('B'), array.array('H')
+    try:
+        for key, velocity, track in note_table(path):
+            keys.append(key)
+            velocities.append(velocity)
+            tracks.append(track)
+        digest = content_hash(path) if hashed else None
+    except Exception as e:
+        return keys, velocities, tracks, str(e), None
+    return keys, velocities, tracks, None, digest
+
+
+def _compare_block(
+    rows: range,
+    columns: range,
+    prefilter: float,
+) -> tuple[array.array, array.array, array.array]:
+    """
+    Worker task: intersect every pair ``(i, j)``, ``i < j``, of a block.
+
+    Returns parallel arrays of row indexes, column indexes and intersection sizes;
+    intersections of prefiltered pairs are estimated from the sketches and stored as
+    ``-1 - estimate``.
+    """
+    tables, sketches, num_perm = _tables, _sketches, _num_perm
+    keys = tables.keys
+    sets: dict[int, frozenset[int]] = {}
+
+    def table(i: int) -> frozenset[int]:
+        if i not in sets:
+            start, end = tables.bounds(i)
+            sets[i] = frozenset(keys[start:end])
+        return sets[i]
+
+    out_rows, out_columns, out_inter = array.array('I'), array.array('I'), array.array('d')
+    for i in rows:
+        start_i, end_i = tables.bounds(i)
+        size_i = end_i - start_i
+        sketch_i = sketches[i * num_perm:(i + 1) * num_perm]
+        for j in columns:
+            if j <= i:
+                continue
+            start_j, end_j = tables.bounds(j)
+            size_j = end_j - start_j
+            # Small tables intersect faster than two sketches compare.
+            if prefilter > 0 and min(size_i, size_j) > num_perm:
+                estimate = estimate_similarity(sketch_i, sketches[j * num_perm:(j + 1) * num_perm])
+                if estimate < prefilter:
+                    out_rows.append(i)
+                    out_columns.append(j)
+                    out_inter.append(-1 - estimate * (size_i + size_j) / (1 + estimate))
+                    continue
+            out_rows.append(i)
+            out_columns.append(j)
+            out_inter.append(len(table(i) & table(j)))
+    return out_rows, out_columns, out_inter
+
+
+def _blocks(count: int, block: int) -> Iterator[tuple[range, range]]:
+    """Yield the blocks covering the upper triangle of a ``count`` × ``count`` matrix."""
+    for start_i in range(0, count, block):
+        for start_j in range(start_i, count, block):
+            yield range(start_i, min(start_i + block, count)), range(start_j, min(start_j + block, count))
+
+
+def _journaled_pairs(
+    records: Iterable[dict[str, Any]],
+    prefilter: float,
+    num_perm: int,
+) -> dict[tuple[str, str], float]:
+    """Map ``(hash_i, hash_j)`` to the recorded intersection of every journaled pair compared the same way."""
+    shared: dict[tuple[str, str], float] = {}
+    for record in records:
+        if record.get('prefilter') != prefilter or record.get('num_perm') != num_perm:
+            continue
+        hashes = record.get('hashes', ())
+        for i, j, value in record.get('pairs', ()):
+            shared[hashes[i], hashes[j]] = value
+    return shared
+
+
+def _block_record(
+    rows: array.array,
+    columns: array.array,
+    inter: array.array,
+    digests: list[str],
+    prefilter: float,
+    num_perm: int,
+) -> dict[str, Any]:
+    """Return the journal record of a compared block, indexing its files' hashes."""
+    hashes: list[str] = []
+    index: dict[str, int] = {}
+    for i in (*rows, *columns):
+        digest = digests[i]
+        if digest not in index:
+            index[digest] = len(hashes)
+            hashes.append(digest)
+    pairs = [[index[digests[i]], index[digests[j]], shared] for i, j, shared in zip(rows, columns, inter)]
+    return {'prefilter': prefilter, 'num_perm': num_perm, 'hashes': hashes, 'pairs': pairs}
+
+
+def _recorded_block(
+    block_rows: range,
+    block_columns: range,
+    digests: list[str],
+    journaled: dict[tuple[str, str], float],
+) -> tuple[array.array, array.array, array.array] | None:
+    """Rebuild a block's result from the journal, or return None if any of its pairs is missing."""
+    out_rows, out_columns, out_inter = array.array('I'), array.array('I'), array.array('d')
+    for i in block_rows:
+        for j in block_columns:
+            if j <= i:
+                continue
+            shared = journaled.get((digests[i], digests[j]))
+            if shared is None:
+                shared = journaled.get((digests[j], digests[i]))
+            if shared is None:
+                return None
+            out_rows.append(i)
+            out_columns.append(j)
+            out_inter.append(shared)
+    return out_rows, out_columns, out_inter
+
+
+def _journal_results(
+    results: Iterable[tuple[array.array, array.array, array.array]],
+    journal: Journal,
+    digests: list[str],
+    prefilter: float,
+    num_perm: int,
+) -> Iterator[tuple[array.array, array.array, array.array]]:
+    """Append each block result to the journal as it is consumed."""
+    for result in results:
+        journal.append(_block_record(*result, digests, prefilter, num_perm))
+        yield result
+
+
+def distance_matrix(
+    paths: Iterable[Union[str, Path]],
+    metric: str = METRIC_JACCARD,
+    workers: int | None = None,
+    block: int = DEFAULT_BLOCK,
+    prefilter: float = DEFAULT_PREFILTER,
+    num_perm: int = DEFAULT_NUM_PERM,
+    on_error: Callable[[Path, Exception], None] | None = None,
+    journal: Journal | None = None,
+    resume_from: Iterable[dict[str, Any]] = (),
+) -> DistanceMatrix:
+    """
+    Compare every pair of files.
+
+    Parameters:
+        paths (Iterable[str | pathlib.Path]):
+            Files to compare.
+
+        metric (str):
+            ``'jaccard'`` or ``'counts'``.
+
+        workers (int | None):
+            Worker processes (default: CPU count).
+
+        block (int):
+            Files per side of a work block.
+
+        prefilter (float):
+            Pairs whose sketches estimate a Jaccard similarity below this are not
+            intersected; ``0`` compares every pair exactly.
+
+        num_perm (int):
+            Sketch size for the prefilter.
+
+        on_error (Callable[[pathlib.Path, Exception], None] | None):
+            Called for each file that cannot be read; such files are left out.
+
+        journal (Journal | None):
+            Journal each compared block is appended to, with its files' content
+            hashes and intersections.
+
+        resume_from (Iterable[dict[str, Any]]):
+            Records of an earlier run's journal. Blocks whose pairs are all recorded,
+            for files with the same contents and the same prefilter settings, are
+            filled in from the records instead of being compared.
+
+    Returns:
+        DistanceMatrix:
+            The matrix over the readable files.
+
+    Raises:
+        ValueError:
+            If ``metric`` is unknown or ``block`` is not positive.
+    """
+    if metric not in METRICS:
+        raise ValueError(f'unknown metric {metric!r}; expected one of {", ".join(METRICS)}')
+    if block <= 0:
+        raise ValueError(f'block must be positive, got {block}')
+
+    journaled = _journaled_pairs(resume_from, prefilter, num_perm)
+    hashed = journal is not None or bool(journaled)
+    paths = [str(path) for path in paths]
+    kept: list[str] = []
+    digests: list[str] = []
+    columns: list[tuple[array.array, array.array, array.array]] = []
+    context = multiprocessing.get_context()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        parsed = pool.map(partial(_parse, hashed=hashed), paths, chunksize=8)
+        for path, (keys, velocities, tracks, error, digest) in zip(paths, parsed):
+            if error is not None:
+                if on_error is not None:
+                    on_error(Path(path), ValueError(error))
+                continue
+            kept.append(path)
+            digests.append(digest)
+            columns.append((keys, velocities, tracks))
+
+    count = len(kept)
+    sizes = [len(keys) for keys, _velocities, _tracks in columns]
+    tables = SharedNoteTables.create(zip(*column) for column in columns)
+    sketches_shm = shared_memory.SharedMemory(create=True, size=max(1, count * num_perm * 4))
+    try:
+        sketches_view = sketches_shm.buf[:count * num_perm * 4].cast('I')
+        try:
+            for i, (keys, _velocities, _tracks) in enumerate(columns):
+                sketches_view[i * num_perm:(i + 1) * num_perm] = table_sketch(keys, num_perm)
+        finally:
+            sketches_view.release()
+        del columns
+
+        jaccard = metric == METRIC_JACCARD
+        values = array.array('d' if jaccard else 'q', bytes(8 * count * count))
+        estimated = 0
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(tables.name, sketches_shm.name, num_perm),
+        ) as pool:
+            recorded: list[tuple[array.array, array.array, array.array]] = []
+            blocks: list[tuple[range, range]] = []
+            for block_rows, block_columns in _blocks(count, block):
+                done = _recorded_block(block_rows, block_columns, digests, journaled) if journaled else None
+                if done is not None:
+                    recorded.append(done)
+                else:
+                    blocks.append((block_rows, block_columns))
+            results = pool.map(_compare_block, *zip(*blocks), [prefilter] * len(blocks)) if blocks else ()
+            if journal is not None:
+                results = _journal_results(results, journal, digests, prefilter, num_perm)
+            for rows, columns, inter in itertools.chain(recorded, results):
+                for i, j, shared in zip(rows, columns, inter):
+                    if shared < 0:
+                        estimated += 1
+                        shared = -1 - shared
+                    if jaccard:
+                        union = sizes[i] + sizes[j] - shared
+                        values[i * count + j] = values[j * count + i] = 1 - shared / union if union else 0.0
+                    else:
+                        shared = round(shared)
+                        values[i * count + j] = sizes[i] - shared
+                        values[j * count + i] = sizes[j] - shared
+    finally:
+        with tables:
+            sketches_shm.close()
+            sketches_shm.unlink()
+
+    return DistanceMatrix(paths=kept, metric=metric, values=values, estimated=estimated)
+
+
+def write_csv(matrix: DistanceMatrix, fh: TextIO) -> None:
+    """
+    Write a matrix as CSV: a header row of paths, then one row per file led by its path.
+
+    Parameters:
+        matrix (DistanceMatrix):
+            Matrix to write.
+
+        fh (TextIO):
+            Text stream opened with ``newline=''``.
+    """
+    writer = csv.writer(fh)
+    writer.writerow(['path', *matrix.paths])
+    float_values = matrix.values.typecode == 'd'
+    for path, row in zip(matrix.paths, matrix.rows()):
+        writer.writerow([path, *(f'{value:.6f}' if float_values else value for value in row)])
+
+
+def write_npy(matrix: DistanceMatrix, fh: BinaryIO) -> None:
+    """
+    Write a matrix in NumPy ``.npy`` format (version 1.0), loadable with ``numpy.load``.
+
+    The paths are not stored; write them separately to label rows.
+
+    Parameters:
+        matrix (DistanceMatrix):
+            Matrix to write.
+
+        fh (BinaryIO):
+            Binary stream.
+    """
+    descr = '<f8' if matrix.values.typecode == 'd' else '<i8'
+    n = len(matrix)
+    header = repr({'descr': descr, 'fortran_order': False, 'shape': (n, n)})
+    # Pad with spaces so the data starts on a 64-byte boundary; the header ends in a newline.
+    padding = -(len(NPY_MAGIC) + 2 + len(header) + 1) % 64
+    header = (header + ' ' * padding + '\n').encode('latin1')
+    fh.write(NPY_MAGIC + struct.pack('<H', len(header)) + header)
+    values = matrix.values
+    if sys.byteorder == 'big':
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    fh.write(values.tobytes())
+
+
+def read_npy(fh: BinaryIO) -> tuple[tuple[int, ...], array.array]:
+    """
+    Read a matrix written by :func:`write_npy` without NumPy.
+
+    Parameters:
+        fh (BinaryIO):
+            Binary stream positioned at the start of the file.
+
+    Returns:
+        tuple[tuple[int, ...], array.array]:
+            The shape and the row-major values.
+
+    Raises:
+        ValueError:
+            If the stream is not a little-endian ``float64``/``int64`` ``.npy`` file.
+    """
+    if fh.read(len(NPY_MAGIC)) != NPY_MAGIC:
+        raise ValueError('not a version 1.0 .npy file')
+    (length,) = struct.unpack('<H', fh.read(2))
+    header = ast.literal_eval(fh.read(length).decode('latin1'))
+    typecode = {'<f8': 'd', '<i8': 'q'}.get(header.get('descr'))
+    if typecode is None or header.get('fortran_order'):
+        raise ValueError(f'unsupported .npy layout: {header!r}')
+    values = array.array(typecode)
+    values.frombytes(fh.read())
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return tuple(header['shape']), values
+
+
+def write_matrix(matrix: DistanceMatrix, fmt: str, fh: BinaryIO) -> None:
+    """
+    Write a matrix in ``fmt`` (``'csv'`` or ``'npy'``) to a binary stream.
+
+    Raises:
+        ValueError:
+            If ``fmt`` is unknown.
+    """
+    if fmt == FORMAT_NPY:
+        write_npy(matrix, fh)
+    elif fmt == FORMAT_CSV:
+        text = io.TextIOWrapper(fh, encoding='utf-8', newline='')
+        try:
+            write_csv(matrix, text)
+        finally:
+            text.flush()
+            with contextlib.suppress(ValueError):
+                text.detach()
+    else:
+        raise ValueError(f'unknown matrix format {fmt!r}; expected one of {", ".join(MATRIX_FORMATS)}')
+
+
+__all__ = [
+    'DEFAULT_BLOCK',
+    'DEFAULT_PREFILTER',
+    'DistanceMatrix',
+    'FORMAT_CSV',
+    'FORMAT_NPY',
+    'MATRIX_FORMATS',
+    'MATRIX_SUFFIXES',
+    'METRICS',
+    'METRIC_COUNTS',
+    'METRIC_JACCARD',
+    'distance_matrix',
+    'note_table',
+    'read_npy',
+    'table_sketch',
+    'write_csv',
+    'write_matrix',
+    'write_npy',
+]
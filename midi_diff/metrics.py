@@ -0,0 +1,614 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    midi_diff/metrics.py
+
+Description:
+    Counters and histograms for monitoring diffs run at scale.
+
+    A :class:`Registry` collects how long each stage of a diff takes (loading the
+    inputs, extracting their notes, matching them and writing the output), end-to-end
+    latency, diff outcomes, result cache hits, and note and difference counts. It
+    renders them in the Prometheus text format, as a file or from a local HTTP
+    endpoint, and as a JSON summary with throughput and latency percentiles.
+
+    Metrics are off unless a registry is enabled with :func:`enable` (or
+    :func:`collecting`). The instrumentation helpers used by the diff pipeline check
+    for an active registry once per stage, never per note, and do nothing when there
+    is none.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import json
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, BinaryIO, Final, Iterable, Iterator, Mapping, Union
+
+from midi_diff.outputs import replace_output
+
+STAGE_LOAD: Final[str] = 'load'
+STAGE_EXTRACT: Final[str] = 'extract'
+STAGE_DIFF: Final[str] = 'diff'
+STAGE_WRITE: Final[str] = 'write'
+STAGES: Final[tuple[str, ...]] = (STAGE_LOAD, STAGE_EXTRACT, STAGE_DIFF, STAGE_WRITE)
+
+DEFAULT_BUCKETS: Final[tuple[float, ...]] = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+    30.0, 60.0,
+)
+"""Upper bounds, in seconds, of the latency histogram buckets."""
+
+SUMMARY_QUANTILES: Final[tuple[float, ...]] = (0.5, 0.9, 0.99)
+
+PROMETHEUS_CONTENT_TYPE: Final[str] = 'text/plain; version=0.0.4; charset=utf-8'
+
+_DONE: Final[object] = object()
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """
+    A monotonically increasing count, optionally split by labels.
+
+    Attributes:
+        name (str):
+            Metric name.
+
+        help (str):
+            Description shown in the Prometheus output.
+
+        label_names (tuple[str, ...]):
+            Names of the labels, in the order their values are passed.
+
+        values (dict[tuple[str, ...], float]):
+            Count per tuple of label values.
+    """
+
+    __slots__ = ('name', 'help', 'label_names', 'values', '_lock')
+
+    def __init__(self, name: str, help: str, label_names: tuple[str, ...], lock: threading.Lock) -> None:
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.values: dict[tuple[str, ...], float] = {}
+        self._lock = lock
+
+    def inc(self, amount: float = 1, labels: tuple[str, ...] = ()) -> None:
+        """Add ``amount`` to the count for ``labels``."""
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def total(self) -> float:
+        """Return the count summed over all labels."""
+        with self._lock:
+            return sum(self.values.values())
+
+    def get(self, labels: tuple[str, ...] = ()) -> float:
+        """Return the count for ``labels``."""
+        with self._lock:
+            return self.values.get(labels, 0)
+
+    def render(self) -> list[str]:
+        """Return the metric's lines in the Prometheus text format."""
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = dict(self.values) or ({(): 0} if not self.label_names else {})
+        for labels, value in sorted(values.items()):
+            lines.append(f'{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    """
+    Distribution of observed values, in cumulative buckets, optionally split by labels.
+
+    Attributes:
+        name (str):
+            Metric name.
+
+        help (str):
+            Description shown in the Prometheus output.
+
+        label_names (tuple[str, ...]):
+            Names of the labels, in the order their values are passed.
+
+        buckets (tuple[float, ...]):
+            Ascending bucket upper bounds; an implicit ``+Inf`` bucket follows.
+
+        values (dict[tuple[str, ...], list]):
+            ``[bucket_counts, sum, count]`` per tuple of label values, where
+            ``bucket_counts`` holds non-cumulative counts, the last one for ``+Inf``.
+    """
+
+    __slots__ = ('name', 'help', 'label_names', 'buckets', 'values', '_lock')
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        label_names: tuple[str, ...],
+        lock: threading.Lock,
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.buckets = buckets
+        self.values: dict[tuple[str, ...], list] = {}
+        self._lock = lock
+
+    def observe(self, value: float, labels: tuple[str, ...] = ()) -> None:
+        """Record one observation of ``value`` for ``labels``."""
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self.values.get(labels)
+            if state is None:
+                state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _combined(self, labels: tuple[str, ...] | None) -> tuple[list[int], float, int]:
+        """Return the counts, sum and count for ``labels``, or for all labels together."""
+        with self._lock:
+            states = list(self.values.values()) if labels is None else [self.values.get(labels)]
+            counts, total, count = [0] * (len(self.buckets) + 1), 0.0, 0
+            for state in states:
+                if state is None:
+                    continue
+                counts = [a + b for a, b in zip(counts, state[0])]
+                total += state[1]
+                count += state[2]
+        return counts, total, count
+
+    def quantile(self, q: float, labels: tuple[str, ...] | None = None) -> float | None:
+        """
+        Estimate a quantile by interpolating within its bucket, like Prometheus'
+        ``histogram_quantile``.
+
+        Parameters:
+            q (float):
+                Quantile between 0 and 1.
+
+            labels (tuple[str, ...] | None):
+                Label values to estimate for; None combines every label.
+
+        Returns:
+            float | None:
+                The estimate, or None without observations. Values in the ``+Inf``
+                bucket are reported as the largest finite bound.
+        """
+        counts, _total, count = self._combined(labels)
+        if not count:
+            return None
+        rank = q * count
+        cumulative = 0
+        for index, bucket_count in enumerate(counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+    def describe(self, labels: tuple[str, ...] | None = None) -> dict[str, Any]:
+        """Return the count, total, mean and estimated quantiles for ``labels`` (or all labels)."""
+        _counts, total, count = self._combined(labels)
+        summary: dict[str, Any] = {'count': count, 'total': total, 'mean': total / count if count else None}
+        for q in SUMMARY_QUANTILES:
+            summary[f'p{round(q * 100)}'] = self.quantile(q, labels)
+        return summary
+
+    def render(self) -> list[str]:
+        """Return the metric's lines in the Prometheus text format."""
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            values = {labels: (list(state[0]), state[1], state[2]) for labels, state in self.values.items()}
+        for labels, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, None), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound is None else f'le="{_format_value(bound)}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.label_names, labels)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(self.label_names, labels)} {count}')
+        return lines
+
+
+class Registry:
+    """
+    The metrics of the diff pipeline.
+
+    Attributes:
+        stage_seconds (Histogram):
+            Time spent per stage (``stage`` label: load, extract, diff, write).
+
+        diff_seconds (Histogram):
+            End-to-end time of each diff.
+
+        diffs (Counter):
+            Diffs by ``result`` (ok, failed).
+
+        cache_lookups (Counter):
+            Result cache lookups by ``result`` (hit, miss).
+
+        notes (Counter):
+            Notes extracted from inputs.
+
+        differences (Counter):
+            Differing notes reported, by ``side`` (a, b, changed).
+
+        started (float):
+            Wall-clock time the registry was created.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self._started_monotonic = time.perf_counter()
+        # Seconds spent producing lazily streamed diff entries, so the write stage,
+        # which consumes them, can leave that time out.
+        self.diff_clock = 0.0
+        self.stage_seconds = Histogram('midi_diff_stage_seconds', 'Time spent per diff stage.', ('stage',), self._lock)
+        self.diff_seconds = Histogram('midi_diff_diff_seconds', 'End-to-end time per diff.', (), self._lock)
+        self.diffs = Counter('midi_diff_diffs_total', 'Diffs by result.', ('result',), self._lock)
+        self.cache_lookups = Counter('midi_diff_cache_lookups_total', 'Result cache lookups by result.', ('result',), self._lock)
+        self.notes = Counter('midi_diff_notes_total', 'Notes extracted from inputs.', (), self._lock)
+        self.differences = Counter('midi_diff_differences_total', 'Differing notes reported, by side.', ('side',), self._lock)
+
+    @property
+    def metrics(self) -> tuple[Counter | Histogram, ...]:
+        """Every metric of the registry, in output order."""
+        return (self.diffs, self.diff_seconds, self.stage_seconds, self.cache_lookups, self.notes, self.differences)
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds since the registry was created."""
+        return time.perf_counter() - self._started_monotonic
+
+    def render_prometheus(self) -> str:
+        """Return every metric in the Prometheus text exposition format."""
+        lines: list[str] = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> dict[str, Any]:
+        """
+        Summarize the metrics for a report at the end of a run.
+
+        Returns:
+            dict[str, Any]:
+                Diff outcomes, throughput (successful diffs per second since the
+                registry was created), latency and per-stage timings with estimated
+                percentiles, the cache hit ratio, notes extracted per second of
+                extraction, and differences per side.
+        """
+        elapsed = self.elapsed
+        ok, failed = self.diffs.get(('ok',)), self.diffs.get(('failed',))
+        hits, misses = self.cache_lookups.get(('hit',)), self.cache_lookups.get(('miss',))
+        notes = self.notes.total()
+        extract_seconds = self.stage_seconds.describe((STAGE_EXTRACT,))['total']
+        with self._lock:
+            differences = {labels[0]: value for labels, value in self.differences.values.items()}
+        return {
+            'elapsed_seconds': elapsed,
+            'diffs': {'ok': ok, 'failed': failed},
+            'throughput_per_second': ok / elapsed if elapsed else None,
+            'latency_seconds': self.diff_seconds.describe(),
+            'stages': {stage: self.stage_seconds.describe((stage,)) for stage in STAGES},
+            'cache': {
+                'hits': hits,
+                'misses': misses,
+                'hit_ratio': hits / (hits + misses) if hits + misses else None,
+            },
+            'notes': notes,
+            'notes_per_second': notes / extract_seconds if extract_seconds else None,
+            'differences': differences,
+        }
+
+    def snapshot(self) -> dict[str, Any]:
+        """Return a picklable copy of every metric's values, for :meth:`merge`."""
+        with self._lock:
+            return {
+                metric.name: {
+                    labels: [list(value[0]), value[1], value[2]] if isinstance(metric, Histogram) else value
+                    for labels, value in metric.values.items()
+                }
+                for metric in self.metrics
+            }
+
+    def merge(self, snapshot: Mapping[str, Any]) -> None:
+        """
+        Add the values of another registry's :meth:`snapshot`, e.g. from a worker process.
+        """
+        by_name = {metric.name: metric for metric in self.metrics}
+        with self._lock:
+            for name, values in snapshot.items():
+                metric = by_name.get(name)
+                if metric is None:
+                    continue
+                for labels, value in values.items():
+                    if isinstance(metric, Histogram):
+                        state = metric.values.setdefault(labels, [[0] * (len(metric.buckets) + 1), 0.0, 0])
+                        state[0] = [a + b for a, b in zip(state[0], value[0])]
+                        state[1] += value[1]
+                        state[2] += value[2]
+                    else:
+                        metric.values[labels] = metric.values.get(labels, 0) + value
+
+    def write_prometheus(self, path: Union[str, Path]) -> None:
+        """
+        Atomically replace ``path`` with the Prometheus text format, e.g. for the node
+        exporter's textfile collector.
+        """
+        with replace_output(path) as fh:
+            fh.write(self.render_prometheus().encode('utf-8'))
+
+    def write_summary(self, fh: BinaryIO) -> None:
+        """Write :meth:`summary` as indented JSON."""
+        fh.write(json.dumps(self.summary(), indent=2).encode('utf-8') + b'\n')
+
+    def serve(self, port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+        """
+        Serve the Prometheus text format at ``/metrics`` from a background thread.
+
+        Parameters:
+            port (int):
+                Port to listen on; 0 picks a free one (see ``server.server_address``).
+
+            host (str):
+                Address to bind, local only by default.
+
+        Returns:
+            ThreadingHTTPServer:
+                The running server; call ``shutdown()`` to stop it.
+
+        Raises:
+            OSError:
+                If the address cannot be bound.
+        """
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.render_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', PROMETHEUS_CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name='midi-diff-metrics', daemon=True).start()
+        return server
+
+
+_active: Registry | None = None
+
+
+def active() -> Registry | None:
+    """Return the registry metrics are recorded in, or None when metrics are off."""
+    return _active
+
+
+def enable(registry: Registry | None = None) -> Registry:
+    """
+    Start recording metrics.
+
+    Parameters:
+        registry (Registry | None):
+            Registry to record in; a new one by default.
+
+    Returns:
+        Registry:
+            The active registry.
+    """
+    global _active
+    _active = registry if registry is not None else Registry()
+    return _active
+
+
+def disable() -> None:
+    """Stop recording metrics."""
+    global _active
+    _active = None
+
+
+@contextlib.contextmanager
+def collecting() -> Iterator[Registry]:
+    """
+    Record into a fresh registry for the duration of the block, then restore the
+    previously active one (if any), e.g. to ship a job's metrics back from a worker.
+
+    Yields:
+        Registry:
+            The fresh registry.
+    """
+    global _active
+    previous, _active = _active, Registry()
+    try:
+        yield _active
+    finally:
+        _active = previous
+
+
+class Laps:
+    """Times consecutive stages of one diff: each :meth:`mark` closes a stage."""
+
+    __slots__ = ('_registry', '_last')
+
+    def __init__(self, registry: Registry) -> None:
+        self._registry = registry
+        self._last = time.perf_counter()
+
+    def mark(self, stage: str) -> None:
+        """Record the time since the previous mark (or creation) for ``stage``."""
+        now = time.perf_counter()
+        self._registry.stage_seconds.observe(now - self._last, (stage,))
+        self._last = now
+
+
+class _NoLaps:
+    __slots__ = ()
+
+    def mark(self, stage: str) -> None:
+        pass
+
+
+_NO_LAPS: Final[_NoLaps] = _NoLaps()
+
+
+def laps() -> Laps | _NoLaps:
+    """Return a stage timer, or a no-op one when metrics are off."""
+    return _NO_LAPS if _active is None else Laps(_active)
+
+
+class _WriteStage:
+    """Times a block as one stage, leaving out time spent producing streamed entries."""
+
+    __slots__ = ('_registry', '_stage', '_started', '_diff_clock')
+
+    def __init__(self, registry: Registry, stage: str) -> None:
+        self._registry = registry
+        self._stage = stage
+
+    def __enter__(self) -> None:
+        self._diff_clock = self._registry.diff_clock
+        self._started = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        streamed = self._registry.diff_clock - self._diff_clock
+        self._registry.stage_seconds.observe(time.perf_counter() - self._started - streamed, (self._stage,))
+
+
+_NO_STAGE: Final[contextlib.nullcontext] = contextlib.nullcontext()
+
+
+def stage(name: str) -> _WriteStage | contextlib.nullcontext:
+    """
+    Return a context manager timing its block as stage ``name``, excluding time
+    spent inside entry streams wrapped by :func:`timed_entries`; a no-op when metrics
+    are off.
+    """
+    return _NO_STAGE if _active is None else _WriteStage(_active, name)
+
+
+def _timed(entries: Iterable, registry: Registry) -> Iterator:
+    clock = time.perf_counter
+    iterator = iter(entries)
+    spent = 0.0
+    try:
+        while True:
+            started = clock()
+            entry = next(iterator, _DONE)
+            elapsed = clock() - started
+            spent += elapsed
+            registry.diff_clock += elapsed
+            if entry is _DONE:
+                return
+            yield entry
+    finally:
+        registry.stage_seconds.observe(spent, (STAGE_DIFF,))
+
+
+def timed_entries(entries: Iterable) -> Iterable:
+    """
+    Attribute the time spent producing a lazy entry stream to the diff stage.
+
+    Returns ``entries`` itself when metrics are off.
+    """
+    return entries if _active is None else _timed(entries, _active)
+
+
+def count_notes(count: int) -> None:
+    """Add ``count`` extracted notes."""
+    if _active is not None:
+        _active.notes.inc(count)
+
+
+def observe_diff(
+    seconds: float,
+    counts: Mapping[str, int] | None = None,
+    cache_hit: bool | None = None,
+    failed: bool = False,
+) -> None:
+    """
+    Record the outcome of one diff.
+
+    Parameters:
+        seconds (float):
+            End-to-end time it took.
+
+        counts (Mapping[str, int] | None):
+            Differing notes per side.
+
+        cache_hit (bool | None):
+            Whether it was answered from the result cache; None if no cache was used.
+
+        failed (bool):
+            Whether it failed.
+    """
+    registry = _active
+    if registry is None:
+        return
+    registry.diff_seconds.observe(seconds)
+    registry.diffs.inc(labels=('failed' if failed else 'ok',))
+    if cache_hit is not None:
+        registry.cache_lookups.inc(labels=('hit' if cache_hit else 'miss',))
+    for side, count in (counts or {}).items():
+        registry.differences.inc(count, (side,))
+
+
+__all__ = [
+    'Counter',
+    'DEFAULT_BUCKETS',
+    'Histogram',
+    'Laps',
+    'PROMETHEUS_CONTENT_TYPE',
+    'Registry',
+    'STAGES',
+    'STAGE_DIFF',
+    'STAGE_EXTRACT',
+    'STAGE_LOAD',
+    'STAGE_WRITE',
+    'SUMMARY_QUANTILES',
+    'active',
+    'collecting',
+    'count_notes',
+    'disable',
+    'enable',
+    'laps',
+    'observe_diff',
+    'stage',
+    'timed_entries',
+]
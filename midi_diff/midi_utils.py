@@ -11,34 +11,51 @@ File:
 Description:
     Utilities for parsing MIDI files into NoteEvent objects and constructing MIDI files
     from NoteEvent sequences.
+
+    Extraction runs on lightweight note records, ``(key, velocity, track)`` tuples where
+    ``key`` is the packed identity from :mod:`midi_diff.note_keys`. Validated
+    :class:`NoteEvent` objects are only built when a caller asks for them.
 """
 
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Iterable
+from typing import Final, Iterable, Iterator, TypeAlias, Union
 
 import mido
 
+from midi_diff.note_keys import START_SHIFT, pack_key, unpack_key
+from midi_diff.smf import STATUS_NOTE_OFF, STATUS_NOTE_ON, Chunk, iter_events, track_chunks
+from midi_diff.sources import MidiSource, open_source
+
+NoteRecord: TypeAlias = tuple[int, int, int]
+"""Raw extracted note: ``(packed_key, velocity, track_index)``."""
+
+DEFAULT_TICKS_PER_BEAT: Final[int] = 480
+"""Resolution used for generated MIDI files when none is specified."""
+
 
 @dataclass(frozen=True, slots=True)
 class NoteEvent:
     """
     Immutable representation of a MIDI note event.
 
-    Stores pitch, start tick, duration (ticks), and velocity. Values are validated on
-    construction to ensure they are within MIDI/logical bounds.
+    Stores pitch, start tick, duration (ticks), velocity and channel. Values are validated
+    on construction to ensure they are within MIDI/logical bounds.
     """
 
     pitch: int
     start: int
     duration: int
     velocity: int
+    channel: int = 0
 
     PITCH_MIN: int = 0
     PITCH_MAX: int = 127
     VELOCITY_MIN: int = 0
     VELOCITY_MAX: int = 127
+    CHANNEL_MIN: int = 0
+    CHANNEL_MAX: int = 15
 
     def __post_init__(self) -> None:
         """
@@ -55,6 +72,7 @@ class NoteEvent:
         self._validate_int('start', self.start, 0, None)
         self._validate_int('duration', self.duration, 1, None)
         self._validate_int('velocity', self.velocity, self.VELOCITY_MIN, self.VELOCITY_MAX)
+        self._validate_int('channel', self.channel, self.CHANNEL_MIN, self.CHANNEL_MAX)
 
     @staticmethod
     def _validate_int(name: str, value: int, min_value: int | None, max_value: int | None) -> None:
@@ -95,6 +113,7 @@ class NoteEvent:
         Returns the identity tuple used for diff-style comparisons.
 
         By design, velocity is excluded so notes match by musical placement rather than loudness.
+        The channel is not part of this tuple; see :meth:`channel_identity_key`.
 
         Returns:
             tuple[int, int, int]:
@@ -102,59 +121,247 @@ class NoteEvent:
         """
         return self.pitch, self.start, self.duration
 
+    def channel_identity_key(self) -> tuple[int, int, int, int]:
+        """
+        Returns the identity tuple the diff engine matches notes on, including the channel.
+
+        The diff engine uses the equivalent packed form from :mod:`midi_diff.note_keys`.
+
+        Returns:
+            tuple[int, int, int, int]:
+                (pitch, start, duration, channel)
+        """
+        return self.pitch, self.start, self.duration, self.channel
 
-def extract_notes(mid: mido.MidiFile) -> list[NoteEvent]:
+
+class NotePairer:
     """
-    Parse a MIDI file into NoteEvent objects.
+    Pairs note-on and note-off events within a single track.
 
-    Notes are collected across all tracks, then sorted by start tick for stable ordering.
+    Open notes are kept on a stack per ``(channel, pitch)`` so overlapping notes of the
+    same pitch close in last-in, first-out order. A note-on with velocity 0 counts as a
+    note-off.
+    """
+
+    __slots__ = ('ongoing',)
+
+    def __init__(self, sounding: Iterable[tuple[int, int, int, int]] = ()) -> None:
+        """
+        Parameters:
+            sounding (Iterable[tuple[int, int, int, int]]):
+                Notes already open, as produced by :meth:`sounding`.
+        """
+        # (channel, pitch) -> stack of (start_tick, velocity).
+        self.ongoing: dict[tuple[int, int], list[tuple[int, int]]] = {}
+        for channel, pitch, start, velocity in sounding:
+            self.ongoing.setdefault((channel, pitch), []).append((start, velocity))
+
+    def note_on(self, channel: int, pitch: int, velocity: int, tick: int) -> None:
+        """Open a note."""
+        self.ongoing.setdefault((channel, pitch), []).append((tick, velocity))
+
+    def note_off(self, channel: int, pitch: int) -> tuple[int, int] | None:
+        """
+        Close the most recently opened note on ``(channel, pitch)``.
+
+        Returns:
+            tuple[int, int] | None:
+                ``(start_tick, velocity)`` of the closed note, or None when no note was open.
+        """
+        slot = (channel, pitch)
+        stack = self.ongoing.get(slot)
+        if not stack:
+            return None
+        opened = stack.pop()
+        if not stack:
+            del self.ongoing[slot]
+        return opened
+
+    def sounding(self) -> tuple[tuple[int, int, int, int], ...]:
+        """
+        Snapshot the open notes as ``(channel, pitch, start_tick, velocity)`` in stack order.
+        """
+        return tuple(
+            (channel, pitch, start, velocity)
+            for (channel, pitch), stack in self.ongoing.items()
+            for start, velocity in stack
+        )
+
+
+def iter_note_records(mid: mido.MidiFile) -> Iterator[NoteRecord]:
+    """
+    Yield note records from an already parsed MIDI file, track by track.
+
+    Notes with a non-positive duration are skipped.
 
     Parameters:
         mid (mido.MidiFile):
-            MIDI file to parse.
+            MIDI file to scan.
 
-    Returns:
-        list[NoteEvent]:
-            Note events extracted from the MIDI file.
+    Yields:
+        NoteRecord:
+            ``(packed_key, velocity, track_index)`` in note-off order within each track.
     """
-    notes: list[NoteEvent] = []
-
-    for track in mid.tracks:
-        # pitch -> stack of (start_tick, velocity). Stack supports overlapping same-pitch notes.
-        ongoing: dict[int, list[tuple[int, int]]] = {}
+    for track_index, track in enumerate(mid.tracks):
+        pairer = NotePairer()
         tick = 0
 
         for msg in track:
             tick += int(msg.time)
 
             if msg.type == 'note_on' and msg.velocity > 0:
-                ongoing.setdefault(msg.note, []).append((tick, int(msg.velocity)))
+                pairer.note_on(msg.channel, msg.note, int(msg.velocity), tick)
                 continue
 
             is_note_off = (msg.type == 'note_off') or (msg.type == 'note_on' and msg.velocity == 0)
             if not is_note_off:
                 continue
 
-            stack = ongoing.get(msg.note)
-            if not stack:
+            opened = pairer.note_off(msg.channel, msg.note)
+            if opened is None:
                 continue
 
-            start, vel = stack.pop()
-            if not stack:
-                ongoing.pop(msg.note, None)
-
-            duration = tick - start
-            if duration <= 0:
+            start, vel = opened
+            if tick <= start:
                 # Defensive: ignore pathological/invalid durations rather than create broken notes.
                 continue
 
-            notes.append(NoteEvent(pitch=int(msg.note), start=start, duration=duration, velocity=vel))
+            yield pack_key(msg.note, msg.channel, start, tick - start), vel, track_index
+
+
+def iter_track_note_records(buf, chunk: Chunk, track_index: int) -> Iterator[NoteRecord]:
+    """
+    Yield the note records of one track chunk of a raw Standard MIDI File.
+
+    Parameters:
+        buf (bytes | bytearray | memoryview | mmap.mmap):
+            Buffer holding the MIDI file contents.
 
-    notes.sort(key=lambda n: n.start)
-    return notes
+        chunk (Chunk):
+            The ``MTrk`` chunk to decode, from :func:`midi_diff.smf.track_chunks`.
 
+        track_index (int):
+            Track number stored in each record.
 
-def notes_to_midi(notes: Iterable[NoteEvent], ticks_per_beat: int = 480) -> mido.MidiFile:
+    Yields:
+        NoteRecord:
+            ``(packed_key, velocity, track_index)`` in note-off order.
+    """
+    pairer = NotePairer()
+    for _offset, _body, _next, tick, status, data1, data2 in iter_events(buf, chunk.offset, chunk.end):
+        kind = status & 0xF0
+        if kind == STATUS_NOTE_ON and data2 > 0:
+            pairer.note_on(status & 0x0F, data1, data2, tick)
+            continue
+        if kind != STATUS_NOTE_OFF and kind != STATUS_NOTE_ON:
+            continue
+
+        opened = pairer.note_off(status & 0x0F, data1)
+        if opened is None:
+            continue
+
+        start, vel = opened
+        if tick <= start:
+            continue
+
+        yield pack_key(data1, status & 0x0F, start, tick - start), vel, track_index
+
+
+def iter_buffer_note_records(buf) -> Iterator[NoteRecord]:
+    """
+    Yield note records straight from raw Standard MIDI File bytes, without mido.
+
+    Equivalent to :func:`iter_note_records` on the parsed file, but decodes events in
+    place over the buffer, so no message objects are created.
+
+    Parameters:
+        buf (bytes | bytearray | memoryview | mmap.mmap):
+            Buffer holding the MIDI file contents.
+
+    Yields:
+        NoteRecord:
+            ``(packed_key, velocity, track_index)`` in note-off order within each track.
+    """
+    for track_index, chunk in enumerate(track_chunks(buf)):
+        yield from iter_track_note_records(buf, chunk, track_index)
+
+
+def extract_note_records(source: Union[mido.MidiFile, MidiSource]) -> list[NoteRecord]:
+    """
+    Extract note records from a parsed MIDI file or from any raw MIDI source.
+
+    Raw sources (paths, ``'-'`` for stdin, bytes-like objects, binary file objects) are
+    decoded in place; on-disk files are memory-mapped rather than read into memory.
+
+    Parameters:
+        source (mido.MidiFile | MidiSource):
+            Parsed file, or a source accepted by :func:`midi_diff.sources.open_source`.
+
+    Returns:
+        list[NoteRecord]:
+            Records in the same order :func:`extract_notes` would return notes.
+    """
+    if isinstance(source, mido.MidiFile):
+        records = list(iter_note_records(source))
+    else:
+        with open_source(source) as buf:
+            records = list(iter_buffer_note_records(buf))
+    records.sort(key=lambda r: r[0] >> START_SHIFT)
+    return records
+
+
+def record_to_note(record: NoteRecord) -> NoteEvent:
+    """
+    Materialize a validated :class:`NoteEvent` from a note record.
+
+    Parameters:
+        record (NoteRecord):
+            ``(packed_key, velocity, track_index)``.
+
+    Returns:
+        NoteEvent:
+            The corresponding note.
+    """
+    pitch, channel, start, duration = unpack_key(record[0])
+    return NoteEvent(pitch=pitch, start=start, duration=duration, velocity=record[1], channel=channel)
+
+
+def note_to_record(note: NoteEvent, track: int = 0) -> NoteRecord:
+    """
+    Convert a :class:`NoteEvent` into a note record.
+
+    Parameters:
+        note (NoteEvent):
+            Note to convert.
+
+        track (int):
+            Track index to record.
+
+    Returns:
+        NoteRecord:
+            ``(packed_key, velocity, track)``.
+    """
+    return pack_key(note.pitch, note.channel, note.start, note.duration), note.velocity, track
+
+
+def extract_notes(mid: Union[mido.MidiFile, MidiSource]) -> list[NoteEvent]:
+    """
+    Parse a MIDI file into NoteEvent objects.
+
+    Notes are collected across all tracks, then sorted by start tick for stable ordering.
+
+    Parameters:
+        mid (mido.MidiFile | MidiSource):
+            Parsed MIDI file, or any raw source accepted by :func:`extract_note_records`.
+
+    Returns:
+        list[NoteEvent]:
+            Note events extracted from the MIDI file.
+    """
+    return [record_to_note(record) for record in extract_note_records(mid)]
+
+
+def notes_to_midi(notes: Iterable[NoteEvent], ticks_per_beat: int = DEFAULT_TICKS_PER_BEAT) -> mido.MidiFile:
     """
     Construct a minimal MIDI file containing the given notes.
 
@@ -170,8 +377,28 @@ def notes_to_midi(notes: Iterable[NoteEvent], ticks_per_beat: int = 480) -> mido
             A MIDI file containing the specified notes on a single track.
     """
     mid = mido.MidiFile(ticks_per_beat=int(ticks_per_beat))
+    mid.tracks.append(notes_to_track(notes))
+    return mid
+
+
+def notes_to_track(notes: Iterable[NoteEvent], name: str | None = None) -> mido.MidiTrack:
+    """
+    Encode notes as a single MIDI track with delta times.
+
+    Parameters:
+        notes (Iterable[NoteEvent]):
+            Notes to encode.
+
+        name (str | None):
+            Optional track name, written as a ``track_name`` meta message.
+
+    Returns:
+        mido.MidiTrack:
+            The encoded track, terminated by ``end_of_track``.
+    """
     track = mido.MidiTrack()
-    mid.tracks.append(track)
+    if name is not None:
+        track.append(mido.MetaMessage('track_name', name=name, time=0))
 
     events = _note_events_to_messages(notes)
 
@@ -183,7 +410,7 @@ def notes_to_midi(notes: Iterable[NoteEvent], ticks_per_beat: int = 480) -> mido
         last_tick = tick
 
     track.append(mido.MetaMessage('end_of_track', time=0))
-    return mid
+    return track
 
 
 def _note_events_to_messages(notes: Iterable[NoteEvent]) -> list[tuple[int, mido.Message]]:
@@ -212,13 +439,13 @@ def _note_events_to_messages(notes: Iterable[NoteEvent]) -> list[tuple[int, mido
                     on_tick,
                     1,
                     mido.Message(
-                        'note_on', note=note.pitch, velocity=note.velocity
+                        'note_on', note=note.pitch, velocity=note.velocity, channel=note.channel
                     ),
                 ),
                 (
                     off_tick,
                     0,
-                    mido.Message('note_off', note=note.pitch, velocity=0),
+                    mido.Message('note_off', note=note.pitch, velocity=0, channel=note.channel),
                 ),
             )
         )
@@ -226,4 +453,18 @@ def _note_events_to_messages(notes: Iterable[NoteEvent]) -> list[tuple[int, mido
     return [(tick, msg) for tick, _, msg in events]
 
 
-__all__ = ['NoteEvent', 'extract_notes', 'notes_to_midi']
+__all__ = [
+    'DEFAULT_TICKS_PER_BEAT',
+    'NoteEvent',
+    'NotePairer',
+    'NoteRecord',
+    'extract_note_records',
+    'extract_notes',
+    'iter_buffer_note_records',
+    'iter_track_note_records',
+    'iter_note_records',
+    'note_to_record',
+    'notes_to_midi',
+    'notes_to_track',
+    'record_to_note',
+]
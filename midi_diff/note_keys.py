@@ -0,0 +1,270 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    midi_diff/note_keys.py
+
+Description:
+    Packed-integer note identity keys. A note's identity (pitch, channel, start and
+    duration) is folded into a single int so hashing and comparison cost one machine
+    word instead of a tuple of fields.
+
+Key layout (version 1), most significant bits first::
+
+    | start (29 bits) | duration (24 bits) | channel (4 bits) | pitch (7 bits) |
+      bits 63..35       bits 34..11          bits 10..7         bits 6..0
+
+Keys therefore sort by start tick, then duration, channel and pitch, and every key
+fits the on-disk encoding, an unsigned little-endian 64-bit word, because
+:func:`pack_key` rejects fields outside their widths (starts beyond ``START_MAX``).
+Any change to the layout must bump ``KEY_LAYOUT_VERSION`` so persisted caches and
+indexes written with an older layout are rejected rather than misread.
+
+Hashes persisted in indexes are computed with :func:`mix64` and :func:`stable_hash`,
+never with the builtin ``hash()``, whose values for tuples depend on the Python
+version and build.
+"""
+
+from __future__ import annotations
+
+import array
+import hashlib
+import struct
+import sys
+from typing import TYPE_CHECKING, Final, Iterable, Sequence
+
+if TYPE_CHECKING:
+    from midi_diff.midi_utils import NoteEvent, NoteRecord
+
+KEY_LAYOUT_VERSION: Final[int] = 1
+
+PITCH_BITS: Final[int] = 7
+CHANNEL_BITS: Final[int] = 4
+DURATION_BITS: Final[int] = 24
+START_BITS: Final[int] = 29
+
+CHANNEL_SHIFT: Final[int] = PITCH_BITS
+DURATION_SHIFT: Final[int] = CHANNEL_SHIFT + CHANNEL_BITS
+START_SHIFT: Final[int] = DURATION_SHIFT + DURATION_BITS
+
+PITCH_MASK: Final[int] = (1 << PITCH_BITS) - 1
+CHANNEL_MASK: Final[int] = (1 << CHANNEL_BITS) - 1
+DURATION_MAX: Final[int] = (1 << DURATION_BITS) - 1
+START_MAX: Final[int] = (1 << START_BITS) - 1
+"""Largest start tick that fits the 64-bit on-disk encoding."""
+
+KEY_BYTES: Final[int] = 8
+
+MASK64: Final[int] = (1 << 64) - 1
+
+
+def pack_key(pitch: int, channel: int, start: int, duration: int) -> int:
+    """
+    Pack note identity fields into a single integer key.
+
+    Every field is checked against its width, so a key always unpacks to the fields
+    it was packed from and fits the 64-bit on-disk encoding.
+
+    Parameters:
+        pitch (int):
+            MIDI note number (0-127).
+
+        channel (int):
+            MIDI channel (0-15).
+
+        start (int):
+            Start tick (0 to ``START_MAX``).
+
+        duration (int):
+            Duration in ticks (0 to ``DURATION_MAX``).
+
+    Returns:
+        int:
+            The packed key.
+
+    Raises:
+        ValueError:
+            If a field is negative or too wide for key layout v1.
+    """
+    # One mask test per field also catches negative values.
+    if pitch & ~PITCH_MASK or channel & ~CHANNEL_MASK or start & ~START_MAX or duration & ~DURATION_MAX:
+        for name, value, limit in (
+            ('pitch', pitch, PITCH_MASK),
+            ('channel', channel, CHANNEL_MASK),
+            ('start', start, START_MAX),
+            ('duration', duration, DURATION_MAX),
+        ):
+            if not 0 <= value <= limit:
+                raise ValueError(
+                    f'{name} must be in 0..{limit} to fit key layout v{KEY_LAYOUT_VERSION}, got {value}'
+                )
+    return (start << START_SHIFT) | (duration << DURATION_SHIFT) | (channel << CHANNEL_SHIFT) | pitch
+
+
+def unpack_key(key: int) -> tuple[int, int, int, int]:
+    """
+    Split a packed key back into its fields.
+
+    Parameters:
+        key (int):
+            Key produced by :func:`pack_key`.
+
+    Returns:
+        tuple[int, int, int, int]:
+            ``(pitch, channel, start, duration)``.
+    """
+    return (
+        key & PITCH_MASK,
+        (key >> CHANNEL_SHIFT) & CHANNEL_MASK,
+        key >> START_SHIFT,
+        (key >> DURATION_SHIFT) & DURATION_MAX,
+    )
+
+
+def note_key(note: NoteEvent) -> int:
+    """
+    Return the packed identity key of a note.
+
+    Parameters:
+        note (NoteEvent):
+            Note to key.
+
+    Returns:
+        int:
+            The packed key; equal keys mean equal :meth:`NoteEvent.channel_identity_key`.
+    """
+    return pack_key(note.pitch, note.channel, note.start, note.duration)
+
+
+def rescale_record(from_ppq: int, to_ppq: int, record: NoteRecord) -> NoteRecord:
+    """
+    Rescale a note record from one resolution to another, keeping it at least one tick long.
+
+    Parameters:
+        from_ppq (int):
+            Current ticks per beat.
+
+        to_ppq (int):
+            Target ticks per beat.
+
+        record (NoteRecord):
+            Record to rescale.
+
+    Returns:
+        NoteRecord:
+            The rescaled record.
+    """
+    pitch, channel, start, duration = unpack_key(record[0])
+    new_start = round(start * to_ppq / from_ppq)
+    new_end = round((start + duration) * to_ppq / from_ppq)
+    return pack_key(pitch, channel, new_start, max(1, new_end - new_start)), record[1], record[2]
+
+
+def mix64(value: int) -> int:
+    """
+    SplitMix64 finalizer: spread the bits of a 64-bit integer over all 64 bits.
+
+    Parameters:
+        value (int):
+            Integer in ``0..MASK64``.
+
+    Returns:
+        int:
+            The mixed value, also in ``0..MASK64``.
+    """
+    value = (value + 0x9E3779B97F4A7C15) & MASK64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & MASK64
+    return value ^ (value >> 31)
+
+
+def stable_hash(values: Sequence[int]) -> int:
+    """
+    Hash a sequence of integers to 64 bits, identically on every interpreter and platform.
+
+    Each value is taken modulo 2**64 (so negative deltas are allowed), packed as an
+    unsigned little-endian word, and the bytes are hashed with BLAKE2b.
+
+    Parameters:
+        values (Sequence[int]):
+            The integers to hash.
+
+    Returns:
+        int:
+            A 64-bit hash.
+    """
+    try:
+        # Signed words have the same bytes as values taken modulo 2**64, without the masking.
+        data = struct.pack(f'<{len(values)}q', *values)
+    except struct.error:
+        data = struct.pack(f'<{len(values)}Q', *[value & MASK64 for value in values])
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+
+def keys_to_bytes(keys: Iterable[int]) -> bytes:
+    """
+    Encode keys as consecutive unsigned little-endian 64-bit words.
+
+    Parameters:
+        keys (Iterable[int]):
+            Packed keys.
+
+    Returns:
+        bytes:
+            ``KEY_BYTES`` bytes per key.
+
+    Raises:
+        OverflowError:
+            If a value is negative or wider than 64 bits, i.e. not a key from
+            :func:`pack_key`.
+    """
+    words = array.array('Q', keys)
+    if sys.byteorder == 'big':
+        words.byteswap()
+    return words.tobytes()
+
+
+def keys_from_bytes(data) -> array.array:
+    """
+    Decode keys written by :func:`keys_to_bytes`.
+
+    Parameters:
+        data (bytes | bytearray | memoryview | mmap.mmap):
+            Encoded keys.
+
+    Returns:
+        array.array:
+            Array of type ``'Q'`` holding the keys.
+
+    Raises:
+        ValueError:
+            If the data length is not a multiple of ``KEY_BYTES``.
+    """
+    if len(data) % KEY_BYTES:
+        raise ValueError(f'key data length {len(data)} is not a multiple of {KEY_BYTES}')
+    words = array.array('Q')
+    words.frombytes(data)
+    if sys.byteorder == 'big':
+        words.byteswap()
+    return words
+
+
+__all__ = [
+    'DURATION_MAX',
+    'KEY_BYTES',
+    'KEY_LAYOUT_VERSION',
+    'MASK64',
+    'START_MAX',
+    'keys_from_bytes',
+    'keys_to_bytes',
+    'mix64',
+    'note_key',
+    'pack_key',
+    'rescale_record',
+    'stable_hash',
+    'unpack_key',
+]
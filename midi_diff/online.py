@@ -0,0 +1,275 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    midi_diff/online.py
+
+Description:
+    Incremental diff of two message streams, for comparing a performance against a
+    reference while it is being played.
+
+    Messages are fed in chunks of ``(tick, message)`` pairs for either side, with
+    absolute ticks or deltas. Each side pairs its note-ons and note-offs with a
+    :class:`midi_diff.midi_utils.NotePairer`, exactly as file extraction does, and
+    completed notes wait in a pending table until the diff can be sure about them.
+
+    A note starting at tick ``t`` is final once neither side can still produce a note
+    starting at or before ``t``: each side's clock has moved past ``t`` and no note
+    opened at or before ``t`` is still sounding. Finalized notes are matched on their
+    packed key like :func:`midi_diff.diff.iter_diff` and emitted as
+    :data:`midi_diff.diff.DiffEntry` tuples, in key order.
+
+    With a ``window``, a side that lags more than ``window`` ticks behind the other is
+    not waited for: notes older than that are finalized anyway, and a note the lagging
+    side completes afterwards is reported at once as present only on that side. State
+    is then bounded by the notes started in the last ``window`` ticks plus the notes
+    still sounding.
+"""
+
+from __future__ import annotations
+
+import heapq
+from typing import Any, Final, Iterable
+
+from midi_diff.diff import COMPARED_ATTRIBUTES, SIDE_A, SIDE_B, SIDE_CHANGED, DiffEntry, attribute_positions
+from midi_diff.midi_utils import NotePairer, NoteRecord
+from midi_diff.note_keys import START_SHIFT, pack_key
+
+SIDES: Final[tuple[str, str]] = (SIDE_A, SIDE_B)
+
+_ENDED: Final[float] = float('inf')
+
+
+class _Stream:
+    """Pairing state and completed, not yet finalized notes of one side."""
+
+    __slots__ = ('pairer', 'tick', 'ended', 'pending', 'heap')
+
+    def __init__(self) -> None:
+        self.pairer = NotePairer()
+        self.tick = 0
+        self.ended = False
+        # key -> first record completed with that key, and a heap of those keys.
+        self.pending: dict[int, NoteRecord] = {}
+        self.heap: list[int] = []
+
+    def horizon(self) -> float:
+        """Earliest start tick a note completed later on this side can have."""
+        if self.ended:
+            return _ENDED
+        ongoing = self.pairer.ongoing
+        if not ongoing:
+            return self.tick
+        return min(self.tick, min(stack[0][0] for stack in ongoing.values()))
+
+
+class OnlineDiff:
+    """
+    Diff two message streams incrementally.
+
+    Every call that moves a side forward returns the entries finalized by it, so a
+    caller can print or render differences while the performance is still going.
+
+    Example::
+
+        online = OnlineDiff(window=1920)
+        online.feed(SIDE_A, reference_pairs)
+        for chunk in live_chunks:
+            for entry in online.feed(SIDE_B, chunk, relative=True):
+                ...
+        remaining = online.close()
+    """
+
+    __slots__ = ('window', '_positions', '_streams', '_finalized')
+
+    def __init__(self, window: int | None = None, attributes: Iterable[str] = COMPARED_ATTRIBUTES) -> None:
+        """
+        Parameters:
+            window (int | None):
+                Most ticks one side is waited for once the other has moved past a
+                note. None waits for as long as it takes.
+
+            attributes (Iterable[str]):
+                Attributes compared on matched notes; pass an empty iterable to only
+                report notes missing from one side.
+
+        Raises:
+            ValueError:
+                If ``window`` is negative or an attribute cannot be compared.
+        """
+        if window is not None and window < 0:
+            raise ValueError(f'window must not be negative, got {window}')
+        self.window = window
+        self._positions = attribute_positions(attributes)
+        self._streams: dict[str, _Stream] = {side: _Stream() for side in SIDES}
+        # Notes starting before this tick have been finalized on both sides.
+        self._finalized = 0
+
+    def _stream(self, side: str) -> _Stream:
+        stream = self._streams.get(side)
+        if stream is None:
+            raise ValueError(f'side must be one of {", ".join(SIDES)}, got {side!r}')
+        if stream.ended:
+            raise ValueError(f'side {side!r} has already ended')
+        return stream
+
+    def tick(self, side: str) -> int:
+        """Return the tick ``side`` has reached."""
+        return self._streams[side].tick
+
+    @property
+    def pending(self) -> int:
+        """Number of completed notes not finalized yet, on both sides."""
+        return sum(len(stream.pending) for stream in self._streams.values())
+
+    @property
+    def sounding(self) -> int:
+        """Number of notes opened but not closed yet, on both sides."""
+        return sum(len(stream.pairer.sounding()) for stream in self._streams.values())
+
+    def feed(self, side: str, messages: Iterable[tuple[int, Any]], relative: bool = False) -> list[DiffEntry]:
+        """
+        Add a chunk of messages to one side.
+
+        Parameters:
+            side (str):
+                :data:`midi_diff.diff.SIDE_A` or :data:`midi_diff.diff.SIDE_B`.
+
+            messages (Iterable[tuple[int, Any]]):
+                ``(tick, message)`` pairs in playing order. Messages are
+                :class:`mido.Message` objects, or anything with the same ``type``,
+                ``channel``, ``note`` and ``velocity`` attributes; only note-ons and
+                note-offs are used.
+
+            relative (bool):
+                Ticks are deltas from the side's previous message instead of
+                absolute ticks.
+
+        Returns:
+            list[DiffEntry]:
+                Entries finalized by this chunk.
+
+        Raises:
+            ValueError:
+                If the side is unknown or has ended, or an absolute tick goes back in time.
+        """
+        stream = self._stream(side)
+        pairer = stream.pairer
+        late: list[DiffEntry] = []
+        tick = stream.tick
+        for time, msg in messages:
+            if relative:
+                tick += int(time)
+            elif time < tick:
+                raise ValueError(f'tick {time} on side {side!r} is before the previous message at {tick}')
+            else:
+                tick = int(time)
+
+            if msg.type == 'note_on' and msg.velocity > 0:
+                pairer.note_on(msg.channel, msg.note, int(msg.velocity), tick)
+                continue
+            if msg.type != 'note_off' and msg.type != 'note_on':
+                continue
+            opened = pairer.note_off(msg.channel, msg.note)
+            if opened is None:
+                continue
+            start, velocity = opened
+            if tick <= start:
+                continue
+
+            key = pack_key(msg.note, msg.channel, start, tick - start)
+            record = (key, velocity, 0)
+            if start < self._finalized:
+                late.append((side, record, None, ()))
+            elif key not in stream.pending:
+                stream.pending[key] = record
+                heapq.heappush(stream.heap, key)
+        stream.tick = tick
+        return late + self._finalize()
+
+    def advance(self, side: str, tick: int) -> list[DiffEntry]:
+        """
+        Move a side's clock forward without messages, e.g. during a rest.
+
+        Parameters:
+            side (str):
+                The side.
+
+            tick (int):
+                Absolute tick reached; earlier ticks are ignored.
+
+        Returns:
+            list[DiffEntry]:
+                Entries finalized by the move.
+        """
+        stream = self._stream(side)
+        stream.tick = max(stream.tick, int(tick))
+        return self._finalize()
+
+    def end(self, side: str) -> list[DiffEntry]:
+        """
+        Mark a side as finished; notes still sounding on it are dropped, as in a file.
+
+        Returns:
+            list[DiffEntry]:
+                Entries finalized because the side will not produce more notes.
+        """
+        stream = self._stream(side)
+        stream.ended = True
+        stream.pairer = NotePairer()
+        return self._finalize()
+
+    def close(self) -> list[DiffEntry]:
+        """
+        End both sides and return every remaining entry.
+        """
+        entries: list[DiffEntry] = []
+        for side, stream in self._streams.items():
+            if not stream.ended:
+                entries.extend(self.end(side))
+        return entries
+
+    def _finalize(self) -> list[DiffEntry]:
+        """Emit the pending notes that can no longer be matched differently."""
+        stream_a, stream_b = self._streams[SIDE_A], self._streams[SIDE_B]
+        limit = min(stream_a.horizon(), stream_b.horizon())
+        if self.window is not None:
+            limit = max(limit, max(stream_a.tick, stream_b.tick) - self.window)
+        if limit <= self._finalized:
+            return []
+        if limit != _ENDED:
+            self._finalized = int(limit)
+
+        keys: list[int] = []
+        for stream in (stream_a, stream_b):
+            heap = stream.heap
+            while heap and heap[0] >> START_SHIFT < limit:
+                keys.append(heapq.heappop(heap))
+        keys.sort()
+
+        entries: list[DiffEntry] = []
+        positions = self._positions
+        for key in keys:
+            a = stream_a.pending.pop(key, None)
+            b = stream_b.pending.pop(key, None)
+            if a is None and b is None:
+                continue  # second heap entry of a key found on both sides
+            if b is None:
+                entries.append((SIDE_A, a, None, ()))
+            elif a is None:
+                entries.append((SIDE_B, b, None, ()))
+            else:
+                differing = tuple(name for name, i in positions if a[i] != b[i])
+                if differing:
+                    entries.append((SIDE_CHANGED, b, a, differing))
+        return entries
+
+
+__all__ = [
+    'OnlineDiff',
+    'SIDES',
+]
@@ -0,0 +1,223 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    midi_diff/outputs.py
+
+Description:
+    Collision-free allocation of output files. A requested name that is already taken
+    becomes ``stem_N`` with ``N`` one past the highest suffix in use; the directory is
+    listed at most once per name per process, the chosen name is claimed atomically with
+    ``O_CREAT | O_EXCL`` so concurrent writers never share a file, and contents are
+    written to a temporary file that is renamed over the claim when complete.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import os
+import re
+import stat
+import tempfile
+import threading
+from pathlib import Path
+from typing import BinaryIO, Final, Iterable, Iterator, Union
+
+DEFAULT_SUFFIX: Final[str] = '.mid'
+
+# Highest index handed out per (directory, stem, suffix); 0 is the unsuffixed name.
+_last_index: dict[tuple[str, str, str], int] = {}
+_lock = threading.Lock()
+
+
+def _candidate(parent: Path, stem: str, suffix: str, index: int) -> Path:
+    """Return the path for allocation ``index`` (0 is the requested name itself)."""
+    return parent / (f'{stem}{suffix}' if index == 0 else f'{stem}_{index}{suffix}')
+
+
+def _scan_next_index(parent: Path, stem: str, suffix: str) -> int:
+    """
+    List ``parent`` once and return the first allocation index worth trying.
+
+    Returns 0 when the requested name is free, otherwise one past the highest
+    ``stem_N`` suffix present.
+    """
+    pattern = re.compile(rf'{re.escape(stem)}(?:_([1-9][0-9]*))?{re.escape(suffix)}')
+    base_taken = False
+    highest = 0
+    with contextlib.suppress(FileNotFoundError), os.scandir(parent) as entries:
+        for entry in entries:
+            match = pattern.fullmatch(entry.name)
+            if match is None:
+                continue
+            if match.group(1) is None:
+                base_taken = True
+            else:
+                highest = max(highest, int(match.group(1)))
+    return highest + 1 if base_taken else 0
+
+
+def allocate_output_path(out_file: Union[str, Path], default_suffix: str = DEFAULT_SUFFIX) -> Path:
+    """
+    Claim a fresh output path without overwriting an existing file.
+
+    The returned path exists as an empty file owned by the caller; write the real
+    contents elsewhere and rename them over it (see :func:`atomic_output`). Indexes are
+    remembered per process, so repeated allocations of the same name cost a single
+    ``open`` call; the directory is listed again only when another writer got there first.
+
+    Parameters:
+        out_file (str | pathlib.Path):
+            Desired output location.
+
+        default_suffix (str):
+            Suffix used when ``out_file`` has none.
+
+    Returns:
+        pathlib.Path:
+            The claimed path: ``out_file`` itself if it was free, otherwise ``stem_N``
+            with ``N`` greater than every suffix already present.
+
+    Raises:
+        OSError:
+            If the directory cannot be created or written to.
+    """
+    out_path = Path(out_file)
+    parent = out_path.parent
+    parent.mkdir(parents=True, exist_ok=True)
+    stem = out_path.stem
+    suffix = out_path.suffix or default_suffix
+    key = (os.path.abspath(parent), stem, suffix)
+
+    with _lock:
+        index = _last_index[key] + 1 if key in _last_index else _scan_next_index(parent, stem, suffix)
+        while True:
+            candidate = _candidate(parent, stem, suffix, index)
+            try:
+                fd = os.open(candidate, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666)
+            except FileExistsError:
+                # Another writer claimed it: resynchronise with the directory once.
+                index = max(index + 1, _scan_next_index(parent, stem, suffix))
+                continue
+            os.close(fd)
+            _last_index[key] = index
+            return candidate
+
+
+@contextlib.contextmanager
+def atomic_output(out_file: Union[str, Path], default_suffix: str = DEFAULT_SUFFIX) -> Iterator[tuple[BinaryIO, Path]]:
+    """
+    Allocate an output path and write it atomically.
+
+    The body writes to a temporary file in the destination directory; on success it
+    is renamed over the claimed name, so the final path only ever holds an empty claim
+    or the complete output. If the body raises, both files are removed.
+
+    Parameters:
+        out_file (str | pathlib.Path):
+            Desired output location.
+
+        default_suffix (str):
+            Suffix used when ``out_file`` has none.
+
+    Yields:
+        tuple[BinaryIO, pathlib.Path]:
+            The temporary file opened for binary writing, and the final path.
+    """
+    final = allocate_output_path(out_file, default_suffix)
+    try:
+        fd, tmp = tempfile.mkstemp(prefix=f'.{final.name}.', suffix='.tmp', dir=final.parent)
+    except BaseException:
+        final.unlink(missing_ok=True)
+        raise
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            yield fh, final
+        # mkstemp creates the file owner-only; take the claim's umask-derived mode.
+        os.chmod(tmp, stat.S_IMODE(os.stat(final).st_mode))
+        os.replace(tmp, final)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp)
+        final.unlink(missing_ok=True)
+        raise
+
+
+@contextlib.contextmanager
+def replace_output(out_file: Union[str, Path]) -> Iterator[BinaryIO]:
+    """
+    Atomically overwrite ``out_file`` in place.
+
+    Unlike :func:`atomic_output` the name is used as given, replacing any existing
+    file, for outputs that are deliberately rewritten (such as watch mode's live diff).
+    Readers see either the previous contents or the complete new ones.
+
+    Parameters:
+        out_file (str | pathlib.Path):
+            File to replace.
+
+    Yields:
+        BinaryIO:
+            A temporary file in the same directory, opened for binary writing.
+    """
+    final = Path(out_file)
+    final.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=f'.{final.name}.', suffix='.tmp', dir=final.parent)
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            yield fh
+        # Keep the existing file's mode; a new file gets the umask-derived default.
+        os.close(os.open(final, os.O_CREAT | os.O_WRONLY, 0o666))
+        os.chmod(tmp, stat.S_IMODE(os.stat(final).st_mode))
+        os.replace(tmp, final)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp)
+        raise
+
+
+def write_atomic(path: Union[str, Path], chunks: Iterable[bytes]) -> None:
+    """
+    Atomically replace ``path`` with the concatenation of ``chunks``.
+
+    The data goes to a temporary file beside ``path`` that is renamed over it once
+    complete. Unlike :func:`tempfile.mkstemp`, which creates files owner-only, the
+    temporary file is created with the umask-derived mode of any new file, so caches
+    and indexes built for shared use stay readable by others.
+
+    Parameters:
+        path (str | pathlib.Path):
+            File to write; its directory must exist.
+
+        chunks (Iterable[bytes]):
+            Data to write, in order.
+
+    Raises:
+        OSError:
+            If the file cannot be written; the temporary file is removed.
+    """
+    path = Path(path)
+    flags = os.O_CREAT | os.O_EXCL | os.O_WRONLY | getattr(os, 'O_BINARY', 0)
+    while True:
+        tmp = path.with_name(f'.{path.name}.{os.urandom(4).hex()}.tmp')
+        try:
+            fd = os.open(tmp, flags, 0o666)
+            break
+        except FileExistsError:
+            continue
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            for chunk in chunks:
+                fh.write(chunk)
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp)
+        raise
+
+
+__all__ = ['allocate_output_path', 'atomic_output', 'replace_output', 'write_atomic']
@@ -0,0 +1,186 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    midi_diff/prescan.py
+
+Description:
+    Cheap structural checks of MIDI files, run before any events are decoded.
+
+    A pre-scan reads the ``MThd`` header and walks the chunk headers by their declared
+    lengths, touching only a few bytes per chunk. It reports the file's format, track
+    count, resolution and chunk sizes, estimates the number of events from the track
+    data size, and lists structural problems: a missing header, SMPTE timing, chunks
+    running past the end of the file, fewer tracks than announced, or tracks that do
+    not end with an ``end_of_track`` event. These are the failures that would otherwise
+    only surface once a full parse is well under way.
+"""
+
+from __future__ import annotations
+
+import struct
+from dataclasses import dataclass
+from typing import Final
+
+from midi_diff.smf import CHUNK_HEADER_SIZE, HEADER_CHUNK, STATUS_META, META_END_OF_TRACK, TRACK_CHUNK, Chunk
+from midi_diff.sources import MidiSource, describe_source, open_source
+
+EVENT_BYTES_ESTIMATE: Final[int] = 3
+"""Assumed average size of an encoded event (a delta byte and two data bytes under running status)."""
+
+_END_OF_TRACK_TAIL: Final[bytes] = bytes((STATUS_META, META_END_OF_TRACK, 0))
+
+
+@dataclass(frozen=True, slots=True)
+class FileScan:
+    """
+    Structure of a MIDI file, as found by :func:`prescan`.
+
+    Attributes:
+        source (str):
+            Description of the scanned input.
+
+        size (int):
+            Size of the (decompressed) file in bytes.
+
+        format (int | None):
+            SMF format, or None if the header could not be read.
+
+        ntracks (int | None):
+            Number of tracks the header announces.
+
+        ticks_per_beat (int | None):
+            Resolution, or None if the header is missing or uses SMPTE timing.
+
+        chunks (tuple[Chunk, ...]):
+            Every chunk found after the header, with its declared length.
+
+        problems (tuple[str, ...]):
+            Structural problems; empty for a file that looks sound.
+
+        truncated (bool):
+            Whether the file appears to be cut short.
+    """
+
+    source: str
+    size: int
+    format: int | None = None
+    ntracks: int | None = None
+    ticks_per_beat: int | None = None
+    chunks: tuple[Chunk, ...] = ()
+    problems: tuple[str, ...] = ()
+    truncated: bool = False
+
+    @property
+    def ok(self) -> bool:
+        """Whether no problems were found."""
+        return not self.problems
+
+    @property
+    def track_chunks(self) -> tuple[Chunk, ...]:
+        """The ``MTrk`` chunks."""
+        return tuple(chunk for chunk in self.chunks if chunk.kind == TRACK_CHUNK)
+
+    @property
+    def track_bytes(self) -> int:
+        """Total size of the track data."""
+        return sum(chunk.length for chunk in self.track_chunks)
+
+    @property
+    def estimated_events(self) -> int:
+        """Rough number of events in the file, from the track data size."""
+        return self.track_bytes // EVENT_BYTES_ESTIMATE
+
+
+def prescan(source: MidiSource) -> FileScan:
+    """
+    Check the structure of a MIDI input without decoding its events.
+
+    Problems are reported in the result rather than raised, so many files can be
+    triaged in one pass.
+
+    Parameters:
+        source (MidiSource):
+            The input. Files on disk are memory-mapped, so only the pages holding
+            chunk headers are read.
+
+    Returns:
+        FileScan:
+            The file's structure and any problems found.
+
+    Raises:
+        OSError:
+            If the input cannot be opened at all.
+    """
+    label = describe_source(source)
+    with open_source(source) as buf:
+        size = len(buf)
+        if bytes(buf[:len(HEADER_CHUNK)]) != HEADER_CHUNK[:size]:
+            return FileScan(label, size, problems=('MThd not found; probably not a MIDI file',))
+        if size < CHUNK_HEADER_SIZE + 6:
+            return FileScan(label, size, problems=('file too short for an MThd header',), truncated=size > 0)
+        length = struct.unpack_from('>L', buf, len(HEADER_CHUNK))[0]
+        fmt, ntracks, division = struct.unpack_from('>HHH', buf, CHUNK_HEADER_SIZE)
+
+        problems: list[str] = []
+        if length < 6:
+            problems.append(f'MThd chunk declares {length} bytes, at least 6 expected')
+        ticks_per_beat = None if division & 0x8000 else division
+        if ticks_per_beat is None:
+            problems.append('SMPTE time division is not supported')
+        elif ticks_per_beat == 0:
+            problems.append('header declares 0 ticks per beat')
+
+        chunks: list[Chunk] = []
+        truncated = False
+        found = 0
+        pos = CHUNK_HEADER_SIZE + max(length, 6)
+        # Like the parser, stop after the announced tracks and ignore trailing bytes.
+        while found < ntracks and pos < size:
+            if pos + CHUNK_HEADER_SIZE > size:
+                problems.append(f'truncated chunk header at offset {pos}')
+                truncated = True
+                break
+            kind, length = struct.unpack_from('>4sL', buf, pos)
+            chunk = Chunk(kind=bytes(kind), offset=pos + CHUNK_HEADER_SIZE, length=length)
+            if chunk.end > size and chunk.kind != TRACK_CHUNK:
+                break  # a trailing unknown chunk cut short is ignored, as by the parser
+            chunks.append(chunk)
+            if chunk.end > size:
+                problems.append(
+                    f'{chunk.kind.decode("latin-1")} chunk at offset {pos} declares {length} bytes, '
+                    f'only {size - chunk.offset} available'
+                )
+                truncated = True
+                break
+            if chunk.kind == TRACK_CHUNK:
+                if buf[chunk.end - 3:chunk.end] != _END_OF_TRACK_TAIL:
+                    problems.append(f'track {found} does not end with end_of_track')
+                found += 1
+            pos = chunk.end
+
+        if found < ntracks and not truncated:
+            problems.append(f'header announces {ntracks} tracks, found {found}')
+            truncated = True
+
+    return FileScan(
+        source=label,
+        size=size,
+        format=fmt,
+        ntracks=ntracks,
+        ticks_per_beat=ticks_per_beat,
+        chunks=tuple(chunks),
+        problems=tuple(problems),
+        truncated=truncated,
+    )
+
+
+__all__ = [
+    'EVENT_BYTES_ESTIMATE',
+    'FileScan',
+    'prescan',
+]
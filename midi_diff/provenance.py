@@ -0,0 +1,263 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    midi_diff/provenance.py
+
+Description:
+    Multi-track diff MIDI output that keeps every note in its musical context.
+
+    The plain diff file puts every differing note on one track. This writer instead
+    produces a format 1 file with one track per source track and side (only in A,
+    only in B, changed), so notes keep the track they came from as well as their
+    channel, plus a conductor track with the first input's tempo, time signature and
+    other conductor meta events.
+
+    Context events are not decoded into messages and re-encoded: the meta and
+    program-change bytes found while scanning the input track chunks are copied into
+    the output verbatim, and only their delta times are rewritten (rescaled when the
+    output resolution differs from the source's). Each output track carries the
+    program changes and meta events (instrument and marker names, lyrics, ...) of the
+    source track its notes came from, so it plays with the right sounds.
+
+    A standard MIDI file has one tempo map, so the output follows the first input's.
+    The second input's conductor events are added as their own track only if they
+    differ from the first's, without its tempo and SMPTE offset events.
+"""
+
+from __future__ import annotations
+
+import struct
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import BinaryIO, Final, Iterable
+
+from midi_diff.diff import SIDE_A, SIDE_B, SIDE_CHANGED, DiffEntry
+from midi_diff.note_keys import unpack_key
+from midi_diff.smf import META_END_OF_TRACK, STATUS_META, iter_events, read_header, track_chunks
+from midi_diff.sources import MidiSource, open_source
+
+STATUS_PROGRAM_CHANGE: Final[int] = 0xC0
+
+META_TRACK_NAME: Final[int] = 0x03
+META_SET_TEMPO: Final[int] = 0x51
+META_SMPTE_OFFSET: Final[int] = 0x54
+META_TIME_SIGNATURE: Final[int] = 0x58
+META_KEY_SIGNATURE: Final[int] = 0x59
+
+CONDUCTOR_META_TYPES: Final[frozenset[int]] = frozenset({
+    META_SET_TEMPO,
+    META_SMPTE_OFFSET,
+    META_TIME_SIGNATURE,
+    META_KEY_SIGNATURE,
+})
+"""Meta events that apply to the whole file, wherever they appear."""
+
+TEMPO_META_TYPES: Final[frozenset[int]] = frozenset({META_SET_TEMPO, META_SMPTE_OFFSET})
+
+SIDE_LABELS: Final[dict[str, str]] = {SIDE_A: 'only in A', SIDE_B: 'only in B', SIDE_CHANGED: 'changed'}
+
+_END_OF_TRACK: Final[bytes] = b'\x00\xff\x2f\x00'
+# Events at the same tick: note-offs, then copied context, then note-ons.
+_ORDER_OFF, _ORDER_CONTEXT, _ORDER_ON = 0, 1, 2
+
+
+@dataclass(frozen=True, slots=True)
+class SourceContext:
+    """
+    Raw context events of one input, as found in its track chunks.
+
+    Every event is ``(tick, meta_type, data)`` where ``data`` holds the event's bytes
+    from its status byte on (a running status is made explicit) and ``meta_type`` is
+    -1 for program changes.
+
+    Attributes:
+        ticks_per_beat (int):
+            Resolution of the input.
+
+        conductor (list[tuple[int, int, bytes]]):
+            Meta events of the first track, and file-wide meta events (tempo, time
+            and key signature) of any track.
+
+        tracks (dict[int, list[tuple[int, int, bytes]]]):
+            Program changes of every track, and the other meta events of tracks after
+            the first, by track index.
+
+        names (dict[int, str]):
+            Track names, by track index.
+    """
+
+    ticks_per_beat: int
+    conductor: list[tuple[int, int, bytes]] = field(default_factory=list)
+    tracks: dict[int, list[tuple[int, int, bytes]]] = field(default_factory=dict)
+    names: dict[int, str] = field(default_factory=dict)
+
+
+def read_context(source: MidiSource) -> SourceContext:
+    """
+    Collect the meta and program-change bytes of an input without decoding them.
+
+    Parameters:
+        source (MidiSource):
+            The input.
+
+    Returns:
+        SourceContext:
+            Its context events.
+
+    Raises:
+        OSError, ValueError:
+            If the input cannot be read or is not a MIDI file.
+    """
+    with open_source(source) as buf:
+        context = SourceContext(read_header(buf).ticks_per_beat)
+        for index, chunk in enumerate(track_chunks(buf)):
+            events = context.tracks.setdefault(index, [])
+            for _offset, body, end, tick, status, data1, data2 in iter_events(buf, chunk.offset, chunk.end):
+                if status == STATUS_META:
+                    if data1 == META_END_OF_TRACK:
+                        continue
+                    if data1 == META_TRACK_NAME:
+                        context.names.setdefault(index, bytes(buf[data2:end]).decode('latin-1'))
+                    event = tick, data1, bytes(buf[body:end])
+                    if index == 0 or data1 in CONDUCTOR_META_TYPES:
+                        context.conductor.append(event)
+                    else:
+                        events.append(event)
+                elif status & 0xF0 == STATUS_PROGRAM_CHANGE:
+                    data = bytes(buf[body:end])
+                    events.append((tick, -1, data if data[0] & 0x80 else bytes((status,)) + data))
+    return context
+
+
+def _vlq(value: int) -> bytes:
+    """Encode a MIDI variable-length quantity."""
+    out = bytearray([value & 0x7F])
+    value >>= 7
+    while value:
+        out.append(0x80 | (value & 0x7F))
+        value >>= 7
+    out.reverse()
+    return bytes(out)
+
+
+def _meta(meta_type: int, payload: bytes) -> bytes:
+    return bytes((STATUS_META, meta_type)) + _vlq(len(payload)) + payload
+
+
+def _chunk(events: list[tuple[int, int, bytes]]) -> bytes:
+    """Encode ``(tick, order, data)`` events as an ``MTrk`` chunk, sorting them by tick and order."""
+    events.sort(key=lambda event: (event[0], event[1]))
+    body = bytearray()
+    last = 0
+    for tick, _order, data in events:
+        body += _vlq(tick - last)
+        body += data
+        last = tick
+    body += _END_OF_TRACK
+    return b'MTrk' + struct.pack('>L', len(body)) + bytes(body)
+
+
+def _rescaled(
+    events: Iterable[tuple[int, int, bytes]],
+    from_ppq: int,
+    to_ppq: int,
+    skip: frozenset[int] = frozenset(),
+) -> list[tuple[int, int, bytes]]:
+    """Return context events as ``(tick, order, data)`` at ``to_ppq``, leaving out meta types in ``skip``."""
+    if from_ppq == to_ppq:
+        return [(tick, _ORDER_CONTEXT, data) for tick, meta_type, data in events if meta_type not in skip]
+    return [
+        (round(tick * to_ppq / from_ppq), _ORDER_CONTEXT, data)
+        for tick, meta_type, data in events
+        if meta_type not in skip
+    ]
+
+
+def write_provenance_midi(
+    entries: Iterable[DiffEntry],
+    ticks_per_beat: int,
+    context_a: SourceContext,
+    context_b: SourceContext,
+    fh: BinaryIO,
+    keep_tempo: bool = True,
+) -> Counter:
+    """
+    Write diff entries as a multi-track MIDI file with each source's context.
+
+    Parameters:
+        entries (Iterable[DiffEntry]):
+            Diff entries. Only-in-A notes are placed in tracks of the first input,
+            only-in-B and changed notes (their second-input version) in tracks of the
+            second.
+
+        ticks_per_beat (int):
+            Resolution of the entries' ticks and of the output.
+
+        context_a (SourceContext):
+            Context of the first input, from :func:`read_context`.
+
+        context_b (SourceContext):
+            Context of the second input.
+
+        fh (BinaryIO):
+            Destination stream.
+
+        keep_tempo (bool):
+            Copy the first input's tempo events. Pass False when the entries were
+            placed on a constant-tempo timeline (time-domain comparison).
+
+    Returns:
+        Counter:
+            Number of entries per side.
+    """
+    counts: Counter = Counter()
+    notes: dict[tuple[str, int], list[tuple[int, int, bytes]]] = defaultdict(list)
+    for side, (key, velocity, track), _before, _names in entries:
+        counts[side] += 1
+        pitch, channel, start, duration = unpack_key(key)
+        events = notes[side, track]
+        events.append((start, _ORDER_ON, bytes((0x90 | channel, pitch, velocity or 1))))
+        events.append((start + duration, _ORDER_OFF, bytes((0x80 | channel, pitch, 0))))
+
+    chunks: list[bytes] = []
+    skip_tempo = frozenset() if keep_tempo else TEMPO_META_TYPES
+    conductor_a = _rescaled(context_a.conductor, context_a.ticks_per_beat, ticks_per_beat, skip_tempo)
+    chunks.append(_chunk(conductor_a))
+    conductor_b = _rescaled(context_b.conductor, context_b.ticks_per_beat, ticks_per_beat, TEMPO_META_TYPES)
+    if conductor_b != _rescaled(context_a.conductor, context_a.ticks_per_beat, ticks_per_beat, TEMPO_META_TYPES):
+        conductor_b.append((0, _ORDER_CONTEXT, _meta(META_TRACK_NAME, b'B conductor')))
+        chunks.append(_chunk(conductor_b))
+
+    sides = (SIDE_A, SIDE_B, SIDE_CHANGED)
+    for side, track in sorted(notes, key=lambda group: (sides.index(group[0]), group[1])):
+        context = context_a if side == SIDE_A else context_b
+        source_name = context.names.get(track, f'track {track}')
+        label = f'{SIDE_LABELS[side]}: {source_name}'.encode('latin-1', errors='replace')
+        events = _rescaled(
+            context.tracks.get(track, ()),
+            context.ticks_per_beat,
+            ticks_per_beat,
+            frozenset({META_TRACK_NAME}),
+        )
+        events.append((0, _ORDER_OFF - 1, _meta(META_TRACK_NAME, label)))
+        events.extend(notes[side, track])
+        chunks.append(_chunk(events))
+
+    fh.write(b'MThd' + struct.pack('>LHHH', 6, 1, len(chunks), ticks_per_beat))
+    for chunk in chunks:
+        fh.write(chunk)
+    return counts
+
+
+__all__ = [
+    'CONDUCTOR_META_TYPES',
+    'SIDE_LABELS',
+    'SourceContext',
+    'read_context',
+    'write_provenance_midi',
+]
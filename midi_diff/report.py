@@ -0,0 +1,302 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    midi_diff/report.py
+
+Description:
+    Structured diff reports. Each differing note is written as it is streamed out of
+    the matching pass, as JSON Lines, CSV or fixed-width binary records, so downstream
+    tools never have to re-parse a MIDI file to learn what changed.
+
+Binary layout (version 1), all fields little-endian::
+
+    header (16 bytes): magic b'MIDIDIFF' | version u16 | ticks_per_beat u16 | record_size u16 | reserved u16
+    record (24 bytes): start u64 | duration u32 | track u16 | side u8 | pitch u8 |
+                       channel u8 | velocity u8 | velocity_before u8 | 5 padding bytes
+
+``side`` is 0 (only in A), 1 (only in B) or 2 (changed); ``velocity_before`` is
+``0xFF`` unless the note is a changed note. A report file can be memory-mapped and
+decoded with :data:`BINARY_RECORD` at ``BINARY_HEADER.size + i * BINARY_RECORD.size``.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import struct
+from collections import Counter
+from typing import BinaryIO, Final, Iterable, Iterator
+
+from midi_diff.diff import SIDE_A, SIDE_B, SIDE_CHANGED, DiffEntry
+from midi_diff.note_keys import unpack_key
+
+FORMAT_MID: Final[str] = 'mid'
+FORMAT_JSONL: Final[str] = 'jsonl'
+FORMAT_CSV: Final[str] = 'csv'
+FORMAT_BIN: Final[str] = 'bin'
+FORMAT_TRACKS: Final[str] = 'tracks'
+
+REPORT_FORMATS: Final[tuple[str, ...]] = (FORMAT_MID, FORMAT_JSONL, FORMAT_CSV, FORMAT_BIN, FORMAT_TRACKS)
+"""
+Output formats accepted by ``diff --format``; ``mid`` is the diff MIDI file and
+``tracks`` the multi-track diff MIDI file of :mod:`midi_diff.provenance`.
+"""
+
+MIDI_FORMATS: Final[frozenset[str]] = frozenset({FORMAT_MID, FORMAT_TRACKS})
+
+REPORT_SUFFIXES: Final[dict[str, str]] = {
+    FORMAT_MID: '.mid',
+    FORMAT_JSONL: '.jsonl',
+    FORMAT_CSV: '.csv',
+    FORMAT_BIN: '.bin',
+    FORMAT_TRACKS: '.mid',
+}
+
+REPORT_FIELDS: Final[tuple[str, ...]] = (
+    'side',
+    'pitch',
+    'start',
+    'duration',
+    'velocity',
+    'channel',
+    'track',
+    'velocity_before',
+)
+"""Column order of text reports."""
+
+BINARY_MAGIC: Final[bytes] = b'MIDIDIFF'
+BINARY_VERSION: Final[int] = 1
+BINARY_HEADER: Final[struct.Struct] = struct.Struct('<8sHHHH')
+BINARY_RECORD: Final[struct.Struct] = struct.Struct('<QIHBBBBB5x')
+BINARY_SIDE_CODES: Final[dict[str, int]] = {SIDE_A: 0, SIDE_B: 1, SIDE_CHANGED: 2}
+NO_VELOCITY: Final[int] = 0xFF
+
+_SIDE_NAMES: Final[tuple[str, ...]] = (SIDE_A, SIDE_B, SIDE_CHANGED)
+
+
+def _iter_rows(entries: Iterable[DiffEntry], counts: Counter) -> Iterator[tuple]:
+    """
+    Flatten diff entries into report rows in :data:`REPORT_FIELDS` order, counting sides.
+
+    ``velocity_before`` is None for notes that are not changed notes.
+    """
+    for side, (key, velocity, track), before, _names in entries:
+        counts[side] += 1
+        pitch, channel, start, duration = unpack_key(key)
+        yield side, pitch, start, duration, velocity, channel, track, None if before is None else before[1]
+
+
+def write_jsonl(entries: Iterable[DiffEntry], fh: BinaryIO) -> Counter:
+    """
+    Write one JSON object per differing note.
+
+    Parameters:
+        entries (Iterable[DiffEntry]):
+            Diff entries, consumed lazily.
+
+        fh (BinaryIO):
+            Destination opened for binary writing. Lines are UTF-8 encoded.
+
+    Returns:
+        collections.Counter:
+            Number of notes written per side.
+    """
+    counts: Counter = Counter()
+    fh.writelines(
+        (
+            f'{{"side":"{side}","pitch":{pitch},"start":{start},"duration":{duration},'
+            f'"velocity":{velocity},"channel":{channel},"track":{track},'
+            f'"velocity_before":{"null" if before is None else before}}}\n'
+        ).encode()
+        for side, pitch, start, duration, velocity, channel, track, before in _iter_rows(entries, counts)
+    )
+    return counts
+
+
+def write_csv(entries: Iterable[DiffEntry], fh: BinaryIO) -> Counter:
+    """
+    Write a CSV report with a header row of :data:`REPORT_FIELDS`.
+
+    Parameters:
+        entries (Iterable[DiffEntry]):
+            Diff entries, consumed lazily.
+
+        fh (BinaryIO):
+            Destination opened for binary writing. Text is UTF-8 encoded.
+
+    Returns:
+        collections.Counter:
+            Number of notes written per side.
+    """
+    counts: Counter = Counter()
+    text = io.TextIOWrapper(fh, encoding='utf-8', newline='', write_through=True)
+    try:
+        writer = csv.writer(text)
+        writer.writerow(REPORT_FIELDS)
+        # None is written as an empty field.
+        writer.writerows(_iter_rows(entries, counts))
+        text.flush()
+    finally:
+        text.detach()
+    return counts
+
+
+def write_binary(entries: Iterable[DiffEntry], fh: BinaryIO, ticks_per_beat: int) -> Counter:
+    """
+    Write a fixed-width binary report (see the module docstring for the layout).
+
+    Parameters:
+        entries (Iterable[DiffEntry]):
+            Diff entries, consumed lazily.
+
+        fh (BinaryIO):
+            Destination opened for binary writing.
+
+        ticks_per_beat (int):
+            Resolution of the entries' start and duration fields, stored in the header.
+
+    Returns:
+        collections.Counter:
+            Number of notes written per side.
+    """
+    counts: Counter = Counter()
+    pack = BINARY_RECORD.pack
+    fh.write(BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, ticks_per_beat, BINARY_RECORD.size, 0))
+    fh.writelines(
+        pack(
+            start,
+            duration,
+            track,
+            BINARY_SIDE_CODES[side],
+            pitch,
+            channel,
+            velocity,
+            NO_VELOCITY if before is None else before,
+        )
+        for side, pitch, start, duration, velocity, channel, track, before in _iter_rows(entries, counts)
+    )
+    return counts
+
+
+def write_report(entries: Iterable[DiffEntry], output_format: str, fh: BinaryIO, ticks_per_beat: int) -> Counter:
+    """
+    Stream diff entries to ``fh`` in one of the structured report formats.
+
+    Parameters:
+        entries (Iterable[DiffEntry]):
+            Diff entries, consumed lazily.
+
+        output_format (str):
+            ``'jsonl'``, ``'csv'`` or ``'bin'``.
+
+        fh (BinaryIO):
+            Destination opened for binary writing.
+
+        ticks_per_beat (int):
+            Resolution of the entries (recorded by the binary format).
+
+    Returns:
+        collections.Counter:
+            Number of notes written per side.
+
+    Raises:
+        ValueError:
+            If ``output_format`` is not a structured report format.
+    """
+    if output_format == FORMAT_JSONL:
+        return write_jsonl(entries, fh)
+    if output_format == FORMAT_CSV:
+        return write_csv(entries, fh)
+    if output_format == FORMAT_BIN:
+        return write_binary(entries, fh, ticks_per_beat)
+    raise ValueError(f'unsupported report format: {output_format!r}')
+
+
+def read_binary_header(buf) -> int:
+    """
+    Validate the header of a binary report.
+
+    Parameters:
+        buf (bytes | bytearray | memoryview | mmap.mmap):
+            Report contents.
+
+    Returns:
+        int:
+            The report's ticks per beat.
+
+    Raises:
+        ValueError:
+            If the header is missing, has the wrong magic, or an unsupported version or
+            record size.
+    """
+    if len(buf) < BINARY_HEADER.size:
+        raise ValueError('binary report is shorter than its header')
+    magic, version, ticks_per_beat, record_size, _reserved = BINARY_HEADER.unpack_from(buf)
+    if magic != BINARY_MAGIC:
+        raise ValueError('not a MIDIDiff binary report')
+    if version != BINARY_VERSION or record_size != BINARY_RECORD.size:
+        raise ValueError(f'unsupported binary report version {version} (record size {record_size})')
+    return ticks_per_beat
+
+
+def iter_binary_report(buf) -> Iterator[tuple]:
+    """
+    Decode the records of a binary report without copying the buffer.
+
+    Parameters:
+        buf (bytes | bytearray | memoryview | mmap.mmap):
+            Report contents, for example a memory-mapped report file.
+
+    Yields:
+        tuple:
+            Rows in :data:`REPORT_FIELDS` order; ``velocity_before`` is None for notes
+            that are not changed notes.
+
+    Raises:
+        ValueError:
+            If the header is invalid or the data is not a whole number of records.
+    """
+    read_binary_header(buf)
+    body = memoryview(buf)[BINARY_HEADER.size:]
+    if len(body) % BINARY_RECORD.size:
+        raise ValueError('binary report ends with a partial record')
+    for start, duration, track, side, pitch, channel, velocity, before in BINARY_RECORD.iter_unpack(body):
+        yield (
+            _SIDE_NAMES[side],
+            pitch,
+            start,
+            duration,
+            velocity,
+            channel,
+            track,
+            None if before == NO_VELOCITY else before,
+        )
+
+
+__all__ = [
+    'BINARY_HEADER',
+    'BINARY_MAGIC',
+    'BINARY_RECORD',
+    'BINARY_VERSION',
+    'FORMAT_BIN',
+    'FORMAT_CSV',
+    'FORMAT_JSONL',
+    'FORMAT_MID',
+    'FORMAT_TRACKS',
+    'MIDI_FORMATS',
+    'NO_VELOCITY',
+    'REPORT_FIELDS',
+    'REPORT_FORMATS',
+    'REPORT_SUFFIXES',
+    'iter_binary_report',
+    'read_binary_header',
+    'write_binary',
+    'write_csv',
+    'write_jsonl',
+    'write_report',
+]
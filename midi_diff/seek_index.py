@@ -0,0 +1,474 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    midi_diff/seek_index.py
+
+Description:
+    Optional seek index for random access into large MIDI files. The index records
+    decoder checkpoints at regular tick intervals per track, so extracting the notes
+    of a small tick window can resume decoding mid-track instead of replaying every
+    delta time from the start of each track.
+
+    The command-line tools keep indexes in a :class:`midi_diff.cache.DiffCache`, keyed
+    by file contents; :meth:`SeekIndex.for_file` only writes a sidecar next to the
+    MIDI file when asked to.
+"""
+
+from __future__ import annotations
+
+import bisect
+import contextlib
+import json
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Final, Iterator, Union
+
+from midi_diff.midi_utils import NoteEvent, NotePairer, NoteRecord, record_to_note
+from midi_diff.note_keys import START_SHIFT, pack_key
+from midi_diff.smf import (
+    STATUS_META,
+    STATUS_NOTE_OFF,
+    STATUS_NOTE_ON,
+    Chunk,
+    iter_events,
+    read_header,
+    track_chunks,
+)
+from midi_diff.sources import open_source
+
+SEEK_INDEX_VERSION: Final[int] = 2
+SEEK_INDEX_SUFFIX: Final[str] = '.seekidx'
+
+# Default checkpoint spacing, in beats (four bars of 4/4).
+DEFAULT_INTERVAL_BEATS: Final[int] = 16
+
+
+@dataclass(frozen=True, slots=True)
+class SeekPoint:
+    """
+    Decoder state captured at an event boundary inside a track.
+
+    Attributes:
+        offset (int):
+            Byte offset of the next event to decode (start of its delta-time).
+
+        tick (int):
+            Absolute tick reached before that event.
+
+        running_status (int | None):
+            Running-status byte in effect at ``offset``.
+
+        sounding (tuple[tuple[int, int, int, int], ...]):
+            Notes still sounding, as ``(channel, pitch, start_tick, velocity)`` in the
+            order they were pushed onto their per-note stacks.
+    """
+
+    offset: int
+    tick: int
+    running_status: int | None
+    sounding: tuple[tuple[int, int, int, int], ...] = ()
+
+
+@dataclass(slots=True)
+class TrackSeekTable:
+    """
+    Seek points for a single ``MTrk`` chunk.
+
+    Attributes:
+        offset (int):
+            Offset of the first event in the track.
+
+        end (int):
+            Offset one past the track's last byte.
+
+        points (list[SeekPoint]):
+            Checkpoints in ascending tick order.
+    """
+
+    offset: int
+    end: int
+    points: list[SeekPoint] = field(default_factory=list)
+    _ticks: list[int] = field(default_factory=list, repr=False)
+
+    def seek(self, tick: int) -> SeekPoint:
+        """
+        Return the latest checkpoint from which every event at or after ``tick`` is still ahead.
+
+        Parameters:
+            tick (int):
+                Target absolute tick.
+
+        Returns:
+            SeekPoint:
+                A checkpoint with ``point.tick < tick``, or the start of the track.
+        """
+        if len(self._ticks) != len(self.points):
+            self._ticks = [point.tick for point in self.points]
+        i = bisect.bisect_left(self._ticks, tick)
+        if i == 0:
+            return SeekPoint(offset=self.offset, tick=0, running_status=None)
+        return self.points[i - 1]
+
+
+@dataclass(slots=True)
+class SeekIndex:
+    """
+    Per-track seek tables for one MIDI file.
+
+    Attributes:
+        interval (int):
+            Checkpoint spacing in ticks.
+
+        ticks_per_beat (int):
+            Resolution of the indexed file.
+
+        tracks (list[TrackSeekTable]):
+            One table per track chunk, in file order.
+
+        source_size (int):
+            Size in bytes of the indexed file as stored on disk, used to detect stale sidecars.
+
+        source_mtime_ns (int):
+            Modification time of the indexed file, used to detect stale sidecars.
+    """
+
+    interval: int
+    ticks_per_beat: int
+    tracks: list[TrackSeekTable]
+    source_size: int = 0
+    source_mtime_ns: int = 0
+
+    @classmethod
+    def build(cls, buf, interval: int | None = None) -> SeekIndex:
+        """
+        Build a seek index with a single decoding pass over every track.
+
+        Parameters:
+            buf (bytes | bytearray | memoryview | mmap.mmap):
+                Buffer holding the MIDI file contents.
+
+            interval (int | None):
+                Checkpoint spacing in ticks. Defaults to ``DEFAULT_INTERVAL_BEATS``
+                beats at the file's resolution.
+
+        Returns:
+            SeekIndex:
+                The constructed index.
+
+        Raises:
+            ValueError:
+                If ``interval`` is not positive.
+        """
+        header = read_header(buf)
+        ticks_per_beat = header.ticks_per_beat
+        if interval is None:
+            interval = DEFAULT_INTERVAL_BEATS * ticks_per_beat
+        if interval <= 0:
+            raise ValueError(f'interval must be > 0, got {interval}')
+
+        tracks = [_build_track_table(buf, chunk, interval) for chunk in track_chunks(buf)]
+        return cls(interval=interval, ticks_per_beat=ticks_per_beat, tracks=tracks, source_size=len(buf))
+
+    @classmethod
+    def for_file(cls, path: Union[str, Path], interval: int | None = None, persist: bool = False) -> SeekIndex:
+        """
+        Load the sidecar index for ``path``, or build it (and optionally persist it).
+
+        A sidecar is reused only when it matches the file's current size and
+        modification time and the requested interval.
+
+        Parameters:
+            path (str | pathlib.Path):
+                MIDI file to index.
+
+            interval (int | None):
+                Checkpoint spacing in ticks, or None for the default.
+
+            persist (bool):
+                Write a freshly built index next to the file. Write failures are ignored.
+
+        Returns:
+            SeekIndex:
+                The loaded or newly built index.
+        """
+        path = Path(path)
+        stat = path.stat()
+        sidecar = sidecar_path(path)
+
+        with contextlib.suppress(OSError, ValueError, KeyError, TypeError):
+            index = cls.load(sidecar)
+            if (
+                index.source_size == stat.st_size
+                and index.source_mtime_ns == stat.st_mtime_ns
+                and (interval is None or index.interval == interval)
+            ):
+                return index
+
+        with open_source(path) as buf:
+            index = cls.build(buf, interval=interval)
+        # Compressed files are indexed by their decompressed offsets but validated
+        # against the on-disk file.
+        index.source_size = stat.st_size
+        index.source_mtime_ns = stat.st_mtime_ns
+
+        if persist:
+            with contextlib.suppress(OSError):
+                index.save(sidecar)
+        return index
+
+    def to_dict(self) -> dict:
+        """Return a JSON-serializable representation of the index."""
+        return {
+            'version': SEEK_INDEX_VERSION,
+            'interval': self.interval,
+            'ticks_per_beat': self.ticks_per_beat,
+            'source_size': self.source_size,
+            'source_mtime_ns': self.source_mtime_ns,
+            'tracks': [
+                {
+                    'offset': table.offset,
+                    'end': table.end,
+                    'points': [
+                        [p.offset, p.tick, p.running_status, [list(n) for n in p.sounding]]
+                        for p in table.points
+                    ],
+                }
+                for table in self.tracks
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> SeekIndex:
+        """
+        Rebuild an index from :meth:`to_dict` output.
+
+        Raises:
+            ValueError:
+                If the data was written by an incompatible index version.
+        """
+        if data.get('version') != SEEK_INDEX_VERSION:
+            raise ValueError(f"unsupported seek index version: {data.get('version')!r}")
+        tracks = [
+            TrackSeekTable(
+                offset=int(t['offset']),
+                end=int(t['end']),
+                points=[
+                    SeekPoint(
+                        offset=int(offset),
+                        tick=int(tick),
+                        running_status=status,
+                        sounding=tuple(tuple(n) for n in sounding),
+                    )
+                    for offset, tick, status, sounding in t['points']
+                ],
+            )
+            for t in data['tracks']
+        ]
+        return cls(
+            interval=int(data['interval']),
+            ticks_per_beat=int(data['ticks_per_beat']),
+            tracks=tracks,
+            source_size=int(data['source_size']),
+            source_mtime_ns=int(data['source_mtime_ns']),
+        )
+
+    def save(self, path: Union[str, Path]) -> None:
+        """Write the index to ``path`` as compact JSON, replacing any previous file atomically."""
+        path = Path(path)
+        tmp = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+        try:
+            tmp.write_text(json.dumps(self.to_dict(), separators=(',', ':')), encoding='utf-8')
+            os.replace(tmp, path)
+        finally:
+            with contextlib.suppress(OSError):
+                tmp.unlink()
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> SeekIndex:
+        """Read an index previously written by :meth:`save`."""
+        return cls.from_dict(json.loads(Path(path).read_text(encoding='utf-8')))
+
+
+def sidecar_path(path: Union[str, Path]) -> Path:
+    """
+    Return the sidecar location used to persist the seek index for ``path``.
+
+    Parameters:
+        path (str | pathlib.Path):
+            MIDI file path.
+
+    Returns:
+        pathlib.Path:
+            ``path`` with ``SEEK_INDEX_SUFFIX`` appended to its name.
+    """
+    path = Path(path)
+    return path.with_name(path.name + SEEK_INDEX_SUFFIX)
+
+
+def _build_track_table(buf, chunk: Chunk, interval: int) -> TrackSeekTable:
+    """
+    Decode one track chunk and capture a checkpoint each time a tick boundary is crossed.
+
+    Parameters:
+        buf (bytes | bytearray | memoryview | mmap.mmap):
+            Buffer holding the MIDI file contents.
+
+        chunk (Chunk):
+            Track chunk to index.
+
+        interval (int):
+            Checkpoint spacing in ticks.
+
+    Returns:
+        TrackSeekTable:
+            The track's seek points.
+    """
+    table = TrackSeekTable(offset=chunk.offset, end=chunk.end)
+    pairer = NotePairer()
+    running: int | None = None
+    last_tick = 0
+    boundary = interval
+
+    for offset, _body, _next, tick, status, data1, data2 in iter_events(buf, chunk.offset, chunk.end):
+        if tick >= boundary:
+            table.points.append(
+                SeekPoint(offset=offset, tick=last_tick, running_status=running, sounding=pairer.sounding())
+            )
+            boundary = (tick // interval + 1) * interval
+        last_tick = tick
+
+        if status >= 0xF0:
+            if status != STATUS_META:
+                running = None
+            continue
+
+        running = status
+        kind = status & 0xF0
+        if kind == STATUS_NOTE_ON and data2 > 0:
+            pairer.note_on(status & 0x0F, data1, data2, tick)
+        elif kind == STATUS_NOTE_OFF or kind == STATUS_NOTE_ON:
+            pairer.note_off(status & 0x0F, data1)
+
+    return table
+
+
+def iter_window_records(
+    buf,
+    start_tick: int,
+    end_tick: int,
+    index: SeekIndex | None = None,
+) -> Iterator[NoteRecord]:
+    """
+    Yield note records whose start tick lies in ``[start_tick, end_tick)``.
+
+    With an index, each track is decoded from its last checkpoint before the window
+    and only until every note started inside the window has been closed.
+
+    Parameters:
+        buf (bytes | bytearray | memoryview | mmap.mmap):
+            Buffer holding the MIDI file contents.
+
+        start_tick (int):
+            First tick of the window (inclusive).
+
+        end_tick (int):
+            End of the window (exclusive).
+
+        index (SeekIndex | None):
+            Seek index for ``buf``. Without one, each track is decoded from its start.
+
+    Yields:
+        NoteRecord:
+            ``(packed_key, velocity, track_index)`` in note-off order within each track.
+
+    Raises:
+        ValueError:
+            If the window is empty or negative.
+    """
+    if start_tick < 0 or end_tick <= start_tick:
+        raise ValueError(f'invalid tick window [{start_tick}, {end_tick})')
+
+    if index is None:
+        tables = [TrackSeekTable(offset=c.offset, end=c.end) for c in track_chunks(buf)]
+    else:
+        tables = index.tracks
+
+    for track_index, table in enumerate(tables):
+        point = table.seek(start_tick)
+        pairer = NotePairer(point.sounding)
+        open_in_window = 0
+
+        events = iter_events(buf, point.offset, table.end, tick=point.tick, running_status=point.running_status)
+        for _offset, _body, _next, tick, status, data1, data2 in events:
+            if tick >= end_tick and open_in_window == 0:
+                break
+
+            kind = status & 0xF0
+            if kind == STATUS_NOTE_ON and data2 > 0:
+                pairer.note_on(status & 0x0F, data1, data2, tick)
+                if start_tick <= tick < end_tick:
+                    open_in_window += 1
+                continue
+            if kind != STATUS_NOTE_OFF and kind != STATUS_NOTE_ON:
+                continue
+
+            opened = pairer.note_off(status & 0x0F, data1)
+            if opened is None:
+                continue
+            start, vel = opened
+            if not start_tick <= start < end_tick:
+                continue
+            open_in_window -= 1
+            if tick <= start:
+                continue
+            yield pack_key(data1, status & 0x0F, start, tick - start), vel, track_index
+
+
+def extract_notes_window(
+    buf,
+    start_tick: int,
+    end_tick: int,
+    index: SeekIndex | None = None,
+) -> list[NoteEvent]:
+    """
+    Extract the notes whose start tick lies in ``[start_tick, end_tick)``.
+
+    The result is identical to filtering :func:`midi_diff.midi_utils.extract_notes` by
+    start tick. See :func:`iter_window_records` for how the index is used.
+
+    Parameters:
+        buf (bytes | bytearray | memoryview | mmap.mmap):
+            Buffer holding the MIDI file contents.
+
+        start_tick (int):
+            First tick of the window (inclusive).
+
+        end_tick (int):
+            End of the window (exclusive).
+
+        index (SeekIndex | None):
+            Seek index for ``buf``.
+
+    Returns:
+        list[NoteEvent]:
+            Notes starting in the window, sorted by start tick.
+    """
+    records = sorted(iter_window_records(buf, start_tick, end_tick, index), key=lambda r: r[0] >> START_SHIFT)
+    return [record_to_note(record) for record in records]
+
+
+__all__ = [
+    'SEEK_INDEX_VERSION',
+    'SeekIndex',
+    'SeekPoint',
+    'TrackSeekTable',
+    'extract_notes_window',
+    'iter_window_records',
+    'sidecar_path',
+]
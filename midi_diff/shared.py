@@ -0,0 +1,298 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    midi_diff/shared.py
+
+Description:
+    Note records in ``multiprocessing.shared_memory``, so worker processes can read
+    note collections without pickling them.
+
+    One block holds any number of tables, each a list of :data:`NoteRecord` values,
+    stored column by column with fixed-width fields. The creating process owns the
+    block; workers attach by name and get read-only memoryviews over it, and every
+    table view iterates as ordinary records, so it can be passed straight to
+    :func:`midi_diff.diff.diff_records` or :func:`midi_diff.diff.iter_diff`.
+
+Block layout (version 1), native byte order, every section 8-byte aligned::
+
+    header      magic b'MIDINTBL' | version u16 | reserved 6 bytes | tables u64 | records u64
+    offsets     u64[tables + 1]   first record of each table
+    keys        u64[records]      packed note keys (see midi_diff.note_keys)
+    tracks      u16[records]
+    velocities  u8[records]
+"""
+
+from __future__ import annotations
+
+import array
+import contextlib
+import struct
+import sys
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Final, Iterable, Iterator
+
+from midi_diff.midi_utils import NoteRecord
+
+SHARED_MAGIC: Final[bytes] = b'MIDINTBL'
+SHARED_VERSION: Final[int] = 1
+SHARED_HEADER: Final[struct.Struct] = struct.Struct('=8sH6xQQ')
+
+MAX_TRACKS: Final[int] = 0xFFFF
+
+
+def _aligned(size: int) -> int:
+    return (size + 7) & ~7
+
+
+def _layout(tables: int, records: int) -> tuple[int, int, int, int, int]:
+    """Return the offsets of the offsets, keys, tracks and velocities sections, and the total size."""
+    offsets_at = SHARED_HEADER.size
+    keys_at = offsets_at + _aligned(8 * (tables + 1))
+    tracks_at = keys_at + 8 * records
+    velocities_at = tracks_at + _aligned(2 * records)
+    return offsets_at, keys_at, tracks_at, velocities_at, velocities_at + _aligned(records)
+
+
+@dataclass(frozen=True, slots=True)
+class NoteTableView:
+    """
+    Read-only, zero-copy view of one shared note table.
+
+    Iterating yields ``(key, velocity, track)`` records in stored order.
+
+    Attributes:
+        keys (memoryview):
+            Packed note keys (format ``'Q'``).
+
+        velocities (memoryview):
+            Velocities (format ``'B'``).
+
+        tracks (memoryview):
+            Track indexes (format ``'H'``).
+    """
+
+    keys: memoryview
+    velocities: memoryview
+    tracks: memoryview
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __iter__(self) -> Iterator[NoteRecord]:
+        return zip(self.keys, self.velocities, self.tracks)
+
+    def __getitem__(self, index: int) -> NoteRecord:
+        return self.keys[index], self.velocities[index], self.tracks[index]
+
+
+class SharedNoteTables:
+    """
+    A shared-memory block of note tables.
+
+    Create one with :meth:`create` in the parent process, pass :attr:`name` to workers
+    and :meth:`attach` there. Attached handles are read-only. The creator should call
+    :meth:`unlink` once every worker is done (the context manager does this for it).
+
+    Parameters:
+        block (multiprocessing.shared_memory.SharedMemory):
+            The underlying block.
+
+        owner (bool):
+            Whether this handle created the block and unlinks it on exit.
+
+    Raises:
+        ValueError:
+            If the block does not hold note tables.
+    """
+
+    def __init__(self, block: shared_memory.SharedMemory, owner: bool = False) -> None:
+        self._block = block
+        self.owner = owner
+        magic, version, tables, records = SHARED_HEADER.unpack_from(block.buf)
+        if magic != SHARED_MAGIC or version != SHARED_VERSION:
+            raise ValueError(f'shared memory block {block.name!r} does not hold note tables')
+        offsets_at, keys_at, tracks_at, velocities_at, _size = _layout(tables, records)
+        buf = block.buf if owner else block.buf.toreadonly()
+        self._buf = buf
+        self._offsets = buf[offsets_at:offsets_at + 8 * (tables + 1)].cast('Q')
+        self._keys = buf[keys_at:keys_at + 8 * records].cast('Q')
+        self._tracks = buf[tracks_at:tracks_at + 2 * records].cast('H')
+        self._velocities = buf[velocities_at:velocities_at + records].cast('B')
+
+    @classmethod
+    def create(cls, tables: Iterable[Iterable[NoteRecord]]) -> SharedNoteTables:
+        """
+        Copy note collections into a new shared-memory block.
+
+        Parameters:
+            tables (Iterable[Iterable[NoteRecord]]):
+                Note collections, e.g. from
+                :func:`midi_diff.midi_utils.extract_note_records`, one table each.
+
+        Returns:
+            SharedNoteTables:
+                The owning handle.
+
+        Raises:
+            ValueError:
+                If a record's track index does not fit in 16 bits.
+        """
+        keys, velocities, tracks = array.array('Q'), array.array('B'), array.array('H')
+        offsets = array.array('Q', [0])
+        for table in tables:
+            for key, velocity, track in table:
+                if track > MAX_TRACKS:
+                    raise ValueError(f'track index {track} exceeds {MAX_TRACKS}')
+                keys.append(key)
+                velocities.append(velocity)
+                tracks.append(track)
+            offsets.append(len(keys))
+
+        count, records = len(offsets) - 1, len(keys)
+        offsets_at, keys_at, tracks_at, velocities_at, size = _layout(count, records)
+        block = shared_memory.SharedMemory(create=True, size=size)
+        try:
+            buf = block.buf
+            SHARED_HEADER.pack_into(buf, 0, SHARED_MAGIC, SHARED_VERSION, count, records)
+            for at, column in ((offsets_at, offsets), (keys_at, keys), (tracks_at, tracks), (velocities_at, velocities)):
+                data = memoryview(column).cast('B')
+                buf[at:at + len(data)] = data
+            return cls(block, owner=True)
+        except BaseException:
+            block.close()
+            block.unlink()
+            raise
+
+    @classmethod
+    def attach(cls, name: str) -> SharedNoteTables:
+        """
+        Attach to a block created by another process.
+
+        Parameters:
+            name (str):
+                :attr:`name` of the creating handle.
+
+        Returns:
+            SharedNoteTables:
+                A read-only handle.
+        """
+        if sys.version_info >= (3, 13):
+            # Only the creator should unlink the block; keep the tracker out of it.
+            block = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            block = shared_memory.SharedMemory(name=name)
+        try:
+            return cls(block)
+        except BaseException:
+            block.close()
+            raise
+
+    @property
+    def name(self) -> str:
+        """Name other processes use to :meth:`attach`."""
+        return self._block.name
+
+    @property
+    def total(self) -> int:
+        """Number of records across all tables."""
+        return len(self._keys)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index: int) -> NoteTableView:
+        if not -len(self) <= index < len(self):
+            raise IndexError(f'table index {index} out of range')
+        index %= len(self)
+        lo, hi = self._offsets[index], self._offsets[index + 1]
+        return NoteTableView(keys=self._keys[lo:hi], velocities=self._velocities[lo:hi], tracks=self._tracks[lo:hi])
+
+    def bounds(self, index: int) -> tuple[int, int]:
+        """Return the ``[start, end)`` record range of table ``index`` within the block."""
+        return self._offsets[index], self._offsets[index + 1]
+
+    @property
+    def keys(self) -> memoryview:
+        """Keys of every table, concatenated in table order."""
+        return self._keys
+
+    def close(self) -> None:
+        """
+        Release this handle's views and mapping.
+
+        Views obtained from :meth:`__getitem__` must no longer be used.
+        """
+        for view in (self._offsets, self._keys, self._tracks, self._velocities):
+            view.release()
+        if self._buf is not self._block.buf:
+            self._buf.release()
+        # Views handed out by __getitem__ that are still referenced keep the mapping alive.
+        with contextlib.suppress(BufferError):
+            self._block.close()
+
+    def unlink(self) -> None:
+        """Destroy the block. Only the creating process should call this."""
+        self._block.unlink()
+
+    def __enter__(self) -> SharedNoteTables:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+        if self.owner:
+            self.unlink()
+
+
+def share_notes(records: Iterable[NoteRecord]) -> SharedNoteTables:
+    """
+    Copy one note collection into a new shared-memory block.
+
+    Parameters:
+        records (Iterable[NoteRecord]):
+            The notes to share.
+
+    Returns:
+        SharedNoteTables:
+            The owning handle; ``handle[0]`` is the table.
+    """
+    return SharedNoteTables.create([records])
+
+
+def attach_notes(name: str) -> NoteTableView:
+    """
+    Attach to a single-table block from :func:`share_notes` and return its view.
+
+    The mapping stays open for the life of the process.
+
+    Parameters:
+        name (str):
+            Block name.
+
+    Returns:
+        NoteTableView:
+            The shared notes.
+    """
+    handle = SharedNoteTables.attach(name)
+    _attached.append(handle)
+    return handle[0]
+
+
+# Handles opened by attach_notes, kept alive so their views remain valid.
+_attached: list[SharedNoteTables] = []
+
+
+__all__ = [
+    'MAX_TRACKS',
+    'NoteTableView',
+    'SHARED_MAGIC',
+    'SHARED_VERSION',
+    'SharedNoteTables',
+    'attach_notes',
+    'share_notes',
+]
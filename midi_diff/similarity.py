@@ -0,0 +1,627 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    midi_diff/similarity.py
+
+Description:
+    Near-duplicate search over a MIDI corpus. Each file is reduced to a MinHash sketch
+    of its note-key shingles; sketches are banded into an LSH table stored in a single
+    memory-mapped index file, so a query only touches the few files that share a band
+    with it. Candidates are ranked by estimated similarity and can then be confirmed
+    with the exact diff engine.
+
+Sketches use one-permutation hashing: every shingle is hashed once and assigned to one
+of ``num_perm`` bins, each bin keeping its minimum, and empty bins are filled from the
+next non-empty bin. The fraction of equal bins between two sketches estimates the
+Jaccard similarity of their shingle sets. Shingles are hashed with
+:func:`midi_diff.note_keys.stable_hash`, so an index built by one Python build answers
+queries made with any other.
+
+Index layout (version 3), little-endian, every section 8-byte aligned::
+
+    header        magic b'MIDIMHIX' | version u16 | num_perm u16 | bands u16 | shingle u16 | count u64
+    sizes         u64[count]             file size at indexing time
+    mtimes        i64[count]             file mtime (ns) at indexing time
+    notes         u32[count]             distinct notes per file
+    path_offsets  u64[count + 1]         offsets into the path blob
+    signatures    u32[count * num_perm]
+    band_hashes   u64[bands * count]     per band, sorted ascending
+    band_ids      u32[bands * count]     file id of each band hash
+    paths         UTF-8 path blob, each relative to the index's directory
+"""
+
+from __future__ import annotations
+
+import array
+import bisect
+import contextlib
+import hashlib
+import mmap
+import os
+import struct
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Final, Iterable, Iterator, Sequence, Union
+
+from midi_diff.diff import diff_records
+from midi_diff.midi_utils import NoteRecord, extract_note_records
+from midi_diff.note_keys import START_SHIFT, stable_hash
+from midi_diff.outputs import write_atomic
+from midi_diff.sources import MidiSource, index_entry_path, resolve_index_entry
+
+INDEX_MAGIC: Final[bytes] = b'MIDIMHIX'
+INDEX_VERSION: Final[int] = 3
+INDEX_HEADER: Final[struct.Struct] = struct.Struct('<8sHHHHQ')
+DEFAULT_INDEX_NAME: Final[str] = 'midi-diff.mhidx'
+
+DEFAULT_NUM_PERM: Final[int] = 128
+DEFAULT_BANDS: Final[int] = 32
+DEFAULT_SHINGLE: Final[int] = 4
+"""Consecutive notes per shingle."""
+
+DEFAULT_TOP_K: Final[int] = 10
+
+EMPTY_BIN: Final[int] = 0xFFFFFFFF
+
+def iter_shingles(records: Iterable[NoteRecord], size: int = DEFAULT_SHINGLE) -> Iterator[int]:
+    """
+    Hash every run of ``size`` consecutive distinct notes, with starts made relative
+    to the run's first note, so a shingle survives the whole piece being shifted.
+
+    Parameters:
+        records (Iterable[NoteRecord]):
+            Note records of one file.
+
+        size (int):
+            Notes per shingle. Files with fewer notes yield a single shingle.
+
+    Yields:
+        int:
+            64-bit shingle hashes.
+    """
+    keys = sorted({record[0] for record in records})
+    if not keys:
+        return
+    if len(keys) < size:
+        size = len(keys)
+    for i in range(len(keys) - size + 1):
+        origin = (keys[i] >> START_SHIFT) << START_SHIFT
+        yield stable_hash([key - origin for key in keys[i:i + size]])
+
+
+def sketch(shingles: Iterable[int], num_perm: int = DEFAULT_NUM_PERM) -> array.array:
+    """
+    Compute a one-permutation MinHash sketch.
+
+    Parameters:
+        shingles (Iterable[int]):
+            64-bit shingle hashes, e.g. from :func:`iter_shingles`.
+
+        num_perm (int):
+            Number of bins.
+
+    Returns:
+        array.array:
+            ``num_perm`` unsigned 32-bit values (type ``'I'``). A file without notes
+            gets all ``EMPTY_BIN``.
+    """
+    bins = [EMPTY_BIN] * num_perm
+    for h in shingles:
+        i = h % num_perm
+        value = (h >> 32) & 0xFFFFFFFE  # even, so it never equals EMPTY_BIN
+        if value < bins[i]:
+            bins[i] = value
+
+    filled = [i for i, value in enumerate(bins) if value != EMPTY_BIN]
+    if filled and len(filled) < num_perm:
+        # Rotation densification: borrow from the next filled bin, offset by distance.
+        out = list(bins)
+        for i in range(num_perm):
+            if bins[i] != EMPTY_BIN:
+                continue
+            j = filled[bisect.bisect_left(filled, i) % len(filled)]
+            distance = (j - i) % num_perm
+            out[i] = (bins[j] + distance * 0x9E3779B9) & 0xFFFFFFFE
+        bins = out
+    return array.array('I', bins)
+
+
+def estimate_similarity(sig_a: Sequence[int], sig_b: Sequence[int]) -> float:
+    """
+    Estimate the Jaccard similarity of two sketches.
+
+    Parameters:
+        sig_a (Sequence[int]):
+            First sketch.
+
+        sig_b (Sequence[int]):
+            Second sketch, of the same length.
+
+    Returns:
+        float:
+            Fraction of equal bins, between 0 and 1.
+    """
+    if not len(sig_a):
+        return 0.0
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / len(sig_a)
+
+
+def band_hash(signature: Sequence[int], band: int, rows: int) -> int:
+    """
+    Hash one band of a sketch for the LSH table.
+
+    Parameters:
+        signature (Sequence[int]):
+            Sketch.
+
+        band (int):
+            Band number.
+
+        rows (int):
+            Bins per band.
+
+    Returns:
+        int:
+            64-bit band hash.
+    """
+    chunk = array.array('I', signature[band * rows:(band + 1) * rows])
+    if sys.byteorder == 'big':
+        chunk.byteswap()
+    digest = hashlib.blake2b(chunk.tobytes(), digest_size=8, person=band.to_bytes(2, 'little')).digest()
+    return int.from_bytes(digest, 'little')
+
+
+def exact_similarity(records_a: list[NoteRecord], records_b: list[NoteRecord]) -> float:
+    """
+    Jaccard similarity of two files' distinct note keys, computed with the diff engine.
+
+    Parameters:
+        records_a (list[NoteRecord]):
+            Records of the first file.
+
+        records_b (list[NoteRecord]):
+            Records of the second file.
+
+    Returns:
+        float:
+            Shared notes divided by the notes in either file (1.0 for two empty files).
+    """
+    result = diff_records(records_a, records_b, ())
+    distinct_a = len({record[0] for record in records_a})
+    shared = distinct_a - len(result.only_in_a_records)
+    union = distinct_a + len(result.only_in_b_records)
+    return shared / union if union else 1.0
+
+
+@dataclass(frozen=True, slots=True)
+class IndexedFile:
+    """
+    One file recorded in a :class:`SimilarityIndex`.
+
+    Attributes:
+        path (str):
+            Path of the file relative to the index's directory (see
+            :func:`midi_diff.sources.index_entry_path`).
+
+        size (int):
+            File size at indexing time.
+
+        mtime_ns (int):
+            Modification time at indexing time.
+
+        notes (int):
+            Number of distinct notes in the file.
+    """
+
+    path: str
+    size: int
+    mtime_ns: int
+    notes: int
+
+
+@dataclass(frozen=True, slots=True)
+class SimilarityMatch:
+    """
+    A query result.
+
+    Attributes:
+        path (str):
+            Matching corpus file, relative to the working directory.
+
+        estimate (float):
+            Similarity estimated from the sketches.
+
+        similarity (float | None):
+            Exact Jaccard similarity of the distinct notes, when verified.
+    """
+
+    path: str
+    estimate: float
+    similarity: float | None = None
+
+
+def _aligned(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+class SimilarityIndex:
+    """
+    Read-only view of a MinHash/LSH index file.
+
+    Sections are decoded in place from a memory map, so opening an index and running a
+    query only touches the pages it needs. Use as a context manager, or call
+    :meth:`close`, to release the mapping.
+    """
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        """
+        Open an index file.
+
+        Parameters:
+            path (str | pathlib.Path):
+                Index written by :func:`build_index`.
+
+        Raises:
+            ValueError:
+                If the file is not a supported index.
+        """
+        self.path = Path(path)
+        with open(self.path, 'rb') as fh:
+            self._map = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._open_sections()
+        except Exception:
+            self._map.close()
+            raise
+
+    def _open_sections(self) -> None:
+        if len(self._map) < INDEX_HEADER.size:
+            raise ValueError('similarity index is truncated')
+        magic, version, num_perm, bands, shingle, count = INDEX_HEADER.unpack_from(self._map)
+        if magic != INDEX_MAGIC:
+            raise ValueError('not a MIDIDiff similarity index')
+        if version != INDEX_VERSION:
+            raise ValueError(f'unsupported similarity index version: {version}')
+        self.num_perm, self.bands, self.shingle, self.count = num_perm, bands, shingle, count
+        self.rows = num_perm // bands
+
+        view = memoryview(self._map)
+        offset = INDEX_HEADER.size
+
+        def section(code: str, length: int):
+            nonlocal offset
+            size = struct.calcsize(code) * length
+            start = offset
+            offset = _aligned(offset + size)
+            if start + size > len(view):
+                raise ValueError('similarity index is truncated')
+            if sys.byteorder == 'big':
+                words = array.array(code, view[start:start + size].tobytes())
+                words.byteswap()
+                return words
+            return view[start:start + size].cast(code)
+
+        self._sizes = section('Q', count)
+        self._mtimes = section('q', count)
+        self._notes = section('I', count)
+        self._path_offsets = section('Q', count + 1)
+        self._signatures = section('I', count * num_perm)
+        self._band_hashes = section('Q', bands * count)
+        self._band_ids = section('I', bands * count)
+        self._paths = view[offset:]
+        self._view = view
+
+    def close(self) -> None:
+        """Release the memory map."""
+        for name in ('_sizes', '_mtimes', '_notes', '_path_offsets', '_signatures', '_band_hashes', '_band_ids', '_paths', '_view'):
+            section = getattr(self, name, None)
+            if isinstance(section, memoryview):
+                section.release()
+        with contextlib.suppress(BufferError):
+            # Views still held by callers keep the mapping alive until collected.
+            self._map.close()
+
+    def __enter__(self) -> SimilarityIndex:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def file(self, file_id: int) -> IndexedFile:
+        """
+        Return the metadata of one indexed file.
+
+        Parameters:
+            file_id (int):
+                Position of the file in the index.
+
+        Returns:
+            IndexedFile:
+                The file's path, size, mtime and note count.
+        """
+        start, end = self._path_offsets[file_id], self._path_offsets[file_id + 1]
+        return IndexedFile(
+            path=bytes(self._paths[start:end]).decode('utf-8'),
+            size=self._sizes[file_id],
+            mtime_ns=self._mtimes[file_id],
+            notes=self._notes[file_id],
+        )
+
+    def signature(self, file_id: int) -> Sequence[int]:
+        """Return the sketch of one indexed file."""
+        return self._signatures[file_id * self.num_perm:(file_id + 1) * self.num_perm]
+
+    def candidates(self, signature: Sequence[int]) -> set[int]:
+        """
+        Return the ids of files sharing at least one LSH band with ``signature``.
+
+        Parameters:
+            signature (Sequence[int]):
+                Sketch built with this index's parameters.
+
+        Returns:
+            set[int]:
+                Candidate file ids.
+        """
+        found: set[int] = set()
+        count = self.count
+        for band in range(self.bands):
+            hashes = self._band_hashes[band * count:(band + 1) * count]
+            target = band_hash(signature, band, self.rows)
+            i = bisect.bisect_left(hashes, target)
+            while i < count and hashes[i] == target:
+                found.add(self._band_ids[band * count + i])
+                i += 1
+        return found
+
+    def query(self, signature: Sequence[int], top_k: int = DEFAULT_TOP_K) -> list[tuple[int, float]]:
+        """
+        Rank LSH candidates by estimated similarity.
+
+        Parameters:
+            signature (Sequence[int]):
+                Sketch of the query file.
+
+            top_k (int):
+                Maximum number of results.
+
+        Returns:
+            list[tuple[int, float]]:
+                ``(file_id, estimate)`` pairs, most similar first.
+        """
+        scored = [(file_id, estimate_similarity(signature, self.signature(file_id))) for file_id in self.candidates(signature)]
+        scored.sort(key=lambda item: (-item[1], item[0]))
+        return scored[:top_k]
+
+
+def _file_sketch(path: Path, num_perm: int, shingle: int) -> tuple[array.array, int]:
+    """Extract one file's notes and return its sketch and distinct note count."""
+    records = extract_note_records(path)
+    return sketch(iter_shingles(records, shingle), num_perm), len({record[0] for record in records})
+
+
+def build_index(
+    paths: Iterable[Union[str, Path]],
+    index_path: Union[str, Path],
+    num_perm: int = DEFAULT_NUM_PERM,
+    bands: int = DEFAULT_BANDS,
+    shingle: int = DEFAULT_SHINGLE,
+    on_error: Callable[[Path, Exception], None] | None = None,
+) -> int:
+    """
+    Sketch MIDI files and write a similarity index.
+
+    If ``index_path`` already holds an index with the same parameters, sketches of
+    files whose size and modification time are unchanged are reused, so re-running a
+    build over a growing corpus only parses new or modified files. The index is written
+    to a temporary file and renamed into place.
+
+    Parameters:
+        paths (Iterable[str | pathlib.Path]):
+            Files to index.
+
+        index_path (str | pathlib.Path):
+            Destination index file.
+
+        num_perm (int):
+            Sketch size in bins.
+
+        bands (int):
+            LSH bands; must divide ``num_perm``. More bands find less similar files.
+
+        shingle (int):
+            Consecutive notes per shingle.
+
+        on_error (Callable[[pathlib.Path, Exception], None] | None):
+            Called for each file that cannot be read; such files are left out.
+
+    Returns:
+        int:
+            Number of files in the written index.
+
+    Raises:
+        ValueError:
+            If the parameters are invalid.
+    """
+    if num_perm <= 0 or bands <= 0 or num_perm % bands:
+        raise ValueError(f'bands ({bands}) must be a positive divisor of num_perm ({num_perm})')
+    if not 0 < shingle <= 0xFFFF or num_perm > 0xFFFF:
+        raise ValueError('shingle and num_perm must fit in 16 bits')
+    index_path = Path(index_path)
+
+    previous: dict[str, tuple[int, int, int, array.array]] = {}
+    with contextlib.suppress(OSError, ValueError):
+        with SimilarityIndex(index_path) as old:
+            if (old.num_perm, old.shingle) == (num_perm, shingle):
+                for file_id in range(len(old)):
+                    info = old.file(file_id)
+                    previous[info.path] = (info.size, info.mtime_ns, info.notes, array.array('I', old.signature(file_id)))
+
+    files: list[IndexedFile] = []
+    signatures = array.array('I')
+    for path in paths:
+        path = Path(path)
+        try:
+            stat = path.stat()
+            key = index_entry_path(path, index_path.parent)
+            reused = previous.get(key)
+            if reused is not None and reused[:2] == (stat.st_size, stat.st_mtime_ns):
+                notes, signature = reused[2], reused[3]
+            else:
+                signature, notes = _file_sketch(path, num_perm, shingle)
+        except Exception as e:
+            if on_error is not None:
+                on_error(path, e)
+            continue
+        files.append(IndexedFile(path=key, size=stat.st_size, mtime_ns=stat.st_mtime_ns, notes=notes))
+        signatures.extend(signature)
+
+    _write_index(index_path, files, signatures, num_perm, bands, shingle)
+    return len(files)
+
+
+def _write_index(
+    index_path: Path,
+    files: list[IndexedFile],
+    signatures: array.array,
+    num_perm: int,
+    bands: int,
+    shingle: int,
+) -> None:
+    """Encode and atomically write an index file."""
+    count = len(files)
+    rows = num_perm // bands
+    band_hashes = array.array('Q')
+    band_ids = array.array('I')
+    for band in range(bands):
+        table = sorted(
+            (band_hash(signatures[i * num_perm:(i + 1) * num_perm], band, rows), i) for i in range(count)
+        )
+        band_hashes.extend(h for h, _ in table)
+        band_ids.extend(i for _, i in table)
+
+    encoded = [path.encode('utf-8') for path in (f.path for f in files)]
+    offsets = array.array('Q', [0])
+    for blob in encoded:
+        offsets.append(offsets[-1] + len(blob))
+
+    sections = [
+        array.array('Q', (f.size for f in files)),
+        array.array('q', (f.mtime_ns for f in files)),
+        array.array('I', (f.notes for f in files)),
+        offsets,
+        signatures,
+        band_hashes,
+        band_ids,
+    ]
+
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    write_atomic(index_path, _index_chunks(files, sections, encoded, num_perm, bands, shingle))
+
+
+def _index_chunks(
+    files: list[IndexedFile],
+    sections: list[array.array],
+    encoded: list[bytes],
+    num_perm: int,
+    bands: int,
+    shingle: int,
+) -> Iterator[bytes]:
+    """Yield the encoded index file: header, 8-byte aligned sections, then the path blob."""
+    yield INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, num_perm, bands, shingle, len(files))
+    written = INDEX_HEADER.size
+    for words in sections:
+        if sys.byteorder == 'big':
+            words = array.array(words.typecode, words)
+            words.byteswap()
+        data = words.tobytes()
+        padding = _aligned(written + len(data)) - written - len(data)
+        yield data + b'\0' * padding
+        written += len(data) + padding
+    yield b''.join(encoded)
+
+
+def query_index(
+    index_path: Union[str, Path],
+    source: MidiSource,
+    top_k: int = DEFAULT_TOP_K,
+    verify: bool = True,
+    on_error: Callable[[Path, Exception], None] | None = None,
+) -> list[SimilarityMatch]:
+    """
+    Find the corpus files most similar to ``source``.
+
+    Parameters:
+        index_path (str | pathlib.Path):
+            Index written by :func:`build_index`.
+
+        source (MidiSource):
+            Query MIDI file.
+
+        top_k (int):
+            Maximum number of results.
+
+        verify (bool):
+            Diff the query against each candidate with the exact engine and order the
+            results by exact similarity. Candidates that can no longer be read keep
+            ``similarity=None``.
+
+        on_error (Callable[[pathlib.Path, Exception], None] | None):
+            Called for each candidate that cannot be read for verification.
+
+    Returns:
+        list[SimilarityMatch]:
+            Matches, most similar first.
+    """
+    records = extract_note_records(source)
+    index_dir = Path(index_path).parent
+    with SimilarityIndex(index_path) as index:
+        signature = sketch(iter_shingles(records, index.shingle), index.num_perm)
+        matches = [
+            SimilarityMatch(path=str(resolve_index_entry(index.file(file_id).path, index_dir)), estimate=estimate)
+            for file_id, estimate in index.query(signature, top_k)
+        ]
+
+    if not verify:
+        return matches
+
+    verified: list[SimilarityMatch] = []
+    for match in matches:
+        similarity = None
+        try:
+            similarity = exact_similarity(records, extract_note_records(match.path))
+        except Exception as e:
+            if on_error is not None:
+                on_error(Path(match.path), e)
+        verified.append(SimilarityMatch(path=match.path, estimate=match.estimate, similarity=similarity))
+    verified.sort(key=lambda m: (-(m.similarity if m.similarity is not None else -1.0), -m.estimate))
+    return verified
+
+
+__all__ = [
+    'DEFAULT_BANDS',
+    'DEFAULT_INDEX_NAME',
+    'DEFAULT_NUM_PERM',
+    'DEFAULT_SHINGLE',
+    'DEFAULT_TOP_K',
+    'INDEX_VERSION',
+    'IndexedFile',
+    'SimilarityIndex',
+    'SimilarityMatch',
+    'band_hash',
+    'build_index',
+    'estimate_similarity',
+    'exact_similarity',
+    'iter_shingles',
+    'query_index',
+    'sketch',
+]
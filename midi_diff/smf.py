@@ -0,0 +1,354 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    midi_diff/smf.py
+
+Description:
+    Low-level Standard MIDI File (SMF) reader that walks chunks and track events
+    directly over a bytes-like buffer, exposing byte offsets and running status.
+"""
+
+from __future__ import annotations
+
+import struct
+from dataclasses import dataclass
+from typing import Final, Iterator
+
+HEADER_CHUNK: Final[bytes] = b'MThd'
+TRACK_CHUNK: Final[bytes] = b'MTrk'
+CHUNK_HEADER_SIZE: Final[int] = 8
+
+STATUS_NOTE_OFF: Final[int] = 0x80
+STATUS_NOTE_ON: Final[int] = 0x90
+STATUS_SYSEX: Final[int] = 0xF0
+STATUS_ESCAPE: Final[int] = 0xF7
+STATUS_META: Final[int] = 0xFF
+
+META_END_OF_TRACK: Final[int] = 0x2F
+
+# Number of data bytes following a status byte, for statuses that are not sysex/meta.
+_DATA_LENGTHS: Final[dict[int, int]] = {
+    0x80: 2, 0x90: 2, 0xA0: 2, 0xB0: 2, 0xC0: 1, 0xD0: 1, 0xE0: 2,
+    0xF1: 1, 0xF2: 2, 0xF3: 1, 0xF6: 0, 0xF8: 0, 0xFA: 0, 0xFB: 0, 0xFC: 0, 0xFE: 0,
+}
+
+
+class MidiFormatError(ValueError):
+    """
+    Raised when SMF data ends early, inside a chunk or an event.
+
+    A :class:`ValueError`, so callers that already report unparseable input (as they
+    do for mido's errors) handle a half-written file the same way.
+    """
+
+
+@dataclass(frozen=True, slots=True)
+class SMFHeader:
+    """
+    Parsed contents of an ``MThd`` chunk.
+
+    Attributes:
+        format (int):
+            SMF format (0, 1 or 2).
+
+        ntracks (int):
+            Number of track chunks announced by the header.
+
+        division (int):
+            Raw division word; ticks per beat when the top bit is clear.
+    """
+
+    format: int
+    ntracks: int
+    division: int
+
+    @property
+    def ticks_per_beat(self) -> int:
+        """
+        Ticks per beat for metrical-time files.
+
+        Raises:
+            ValueError:
+                If the file uses SMPTE time division.
+        """
+        if self.division & 0x8000:
+            raise ValueError('SMPTE time division is not supported')
+        return self.division
+
+
+@dataclass(frozen=True, slots=True)
+class Chunk:
+    """
+    Location of a chunk within an SMF buffer.
+
+    Attributes:
+        kind (bytes):
+            Four-byte chunk type (for example ``b'MTrk'``).
+
+        offset (int):
+            Offset of the first data byte (just past the 8-byte chunk header).
+
+        length (int):
+            Declared data length in bytes.
+    """
+
+    kind: bytes
+    offset: int
+    length: int
+
+    @property
+    def end(self) -> int:
+        """Offset one past the last data byte."""
+        return self.offset + self.length
+
+
+def read_vlq(buf, pos: int) -> tuple[int, int]:
+    """
+    Decode a MIDI variable-length quantity.
+
+    Parameters:
+        buf (bytes | bytearray | memoryview | mmap.mmap):
+            Buffer to read from.
+
+        pos (int):
+            Offset of the first VLQ byte.
+
+    Returns:
+        tuple[int, int]:
+            The decoded value and the offset just past it.
+
+    Raises:
+        MidiFormatError:
+            If the buffer ends inside the quantity.
+    """
+    value = 0
+    try:
+        while True:
+            byte = buf[pos]
+            pos += 1
+            value = (value << 7) | (byte & 0x7F)
+            if byte < 0x80:
+                return value, pos
+    except IndexError:
+        raise MidiFormatError('variable-length quantity runs past end of data') from None
+
+
+def read_header(buf) -> SMFHeader:
+    """
+    Parse the ``MThd`` chunk at the start of an SMF buffer.
+
+    Parameters:
+        buf (bytes | bytearray | memoryview | mmap.mmap):
+            Buffer holding the file contents.
+
+    Returns:
+        SMFHeader:
+            The decoded header.
+
+    Raises:
+        OSError:
+            If the buffer does not start with ``MThd``.
+
+        MidiFormatError:
+            If the header is truncated.
+    """
+    if len(buf) < CHUNK_HEADER_SIZE + 6:
+        raise MidiFormatError('file too short for an MThd header')
+    kind, length = struct.unpack_from('>4sL', buf, 0)
+    if kind != HEADER_CHUNK:
+        raise OSError('MThd not found. Probably not a MIDI file')
+    if length < 6:
+        raise MidiFormatError('MThd chunk shorter than 6 bytes')
+    fmt, ntracks, division = struct.unpack_from('>HHH', buf, CHUNK_HEADER_SIZE)
+    return SMFHeader(format=fmt, ntracks=ntracks, division=division)
+
+
+def iter_chunks(buf) -> Iterator[Chunk]:
+    """
+    Walk the chunks of an SMF buffer by header length, without decoding contents.
+
+    The walk stops once the number of ``MTrk`` chunks announced by the header has
+    been seen, so trailing bytes after the last track are ignored, as ``mido`` does.
+    An unknown chunk running past the end of the buffer also ends the walk.
+
+    Parameters:
+        buf (bytes | bytearray | memoryview | mmap.mmap):
+            Buffer holding the file contents.
+
+    Yields:
+        Chunk:
+            Each chunk in file order, starting with ``MThd``.
+
+    Raises:
+        OSError:
+            If the buffer does not start with ``MThd``.
+
+        MidiFormatError:
+            If the header is truncated, or the buffer ends inside an announced
+            ``MTrk`` chunk or its chunk header.
+    """
+    tracks_left = read_header(buf).ntracks
+    size = len(buf)
+    length = struct.unpack_from('>L', buf, len(HEADER_CHUNK))[0]
+    pos = CHUNK_HEADER_SIZE + length
+    if pos > size:
+        raise MidiFormatError(f'MThd chunk declares {length} bytes, only {size - CHUNK_HEADER_SIZE} available')
+    yield Chunk(kind=HEADER_CHUNK, offset=CHUNK_HEADER_SIZE, length=length)
+    while tracks_left and pos < size:
+        if pos + CHUNK_HEADER_SIZE > size:
+            raise MidiFormatError(f'truncated chunk header at offset {pos}')
+        kind, length = struct.unpack_from('>4sL', buf, pos)
+        chunk = Chunk(kind=bytes(kind), offset=pos + CHUNK_HEADER_SIZE, length=length)
+        if chunk.end > size:
+            if chunk.kind != TRACK_CHUNK:
+                return
+            raise MidiFormatError(
+                f'MTrk chunk at offset {pos} declares {length} bytes, '
+                f'only {size - chunk.offset} available'
+            )
+        if chunk.kind == TRACK_CHUNK:
+            tracks_left -= 1
+        yield chunk
+        pos = chunk.end
+
+
+def track_chunks(buf) -> list[Chunk]:
+    """
+    Return the ``MTrk`` chunks of an SMF buffer in order, skipping unknown chunk types.
+
+    Parameters:
+        buf (bytes | bytearray | memoryview | mmap.mmap):
+            Buffer holding the file contents.
+
+    Returns:
+        list[Chunk]:
+            Track chunks in file order.
+    """
+    return [chunk for chunk in iter_chunks(buf) if chunk.kind == TRACK_CHUNK]
+
+
+def iter_events(
+    buf,
+    start: int,
+    end: int,
+    tick: int = 0,
+    running_status: int | None = None,
+) -> Iterator[tuple[int, int, int, int, int, int, int]]:
+    """
+    Decode track events from ``buf[start:end]`` without building message objects.
+
+    Each event is yielded as a tuple ``(offset, body, next_offset, tick, status, data1, data2)``:
+
+    - ``offset`` is where the event's delta-time begins, ``body`` where its status
+      (or first data byte, under running status) begins, and ``next_offset`` is one
+      past its last byte.
+    - ``tick`` is the absolute tick of the event.
+    - For channel and system-common messages, ``data1``/``data2`` are the data
+      bytes (``-1`` when absent).
+    - For meta events, ``status`` is ``0xFF``, ``data1`` is the meta type and
+      ``data2`` is the offset of the payload (payload is ``buf[data2:next_offset]``).
+    - For sysex events, ``data1`` is ``-1`` and ``data2`` is the offset of the payload.
+
+    Decoding can resume mid-track by passing the offset, tick and running status
+    captured at an earlier event boundary.
+
+    Parameters:
+        buf (bytes | bytearray | memoryview | mmap.mmap):
+            Buffer holding the file contents.
+
+        start (int):
+            Offset of the first event to decode.
+
+        end (int):
+            Offset one past the end of the track data.
+
+        tick (int):
+            Absolute tick reached before the event at ``start``.
+
+        running_status (int | None):
+            Running status in effect at ``start``.
+
+    Yields:
+        tuple[int, int, int, int, int, int, int]:
+            Decoded events in track order.
+
+    Raises:
+        OSError:
+            If the data is malformed.
+
+        MidiFormatError:
+            If an event runs past ``end``.
+    """
+    pos = start
+    status = running_status
+    while pos < end:
+        offset = pos
+        delta, pos = read_vlq(buf, pos)
+        tick += delta
+        if pos >= end:
+            raise MidiFormatError(f'event at offset {offset} truncated')
+        body = pos
+        byte = buf[pos]
+
+        if byte == STATUS_META:
+            if pos + 1 >= end:
+                raise MidiFormatError(f'meta event at offset {offset} truncated')
+            meta_type = buf[pos + 1]
+            length, payload = read_vlq(buf, pos + 2)
+            pos = payload + length
+            if pos > end:
+                raise MidiFormatError(f'meta event at offset {offset} truncated')
+            yield offset, body, pos, tick, STATUS_META, meta_type, payload
+            continue
+
+        if byte == STATUS_SYSEX or byte == STATUS_ESCAPE:
+            length, payload = read_vlq(buf, pos + 1)
+            pos = payload + length
+            if pos > end:
+                raise MidiFormatError(f'sysex event at offset {offset} truncated')
+            status = None
+            yield offset, body, pos, tick, byte, -1, payload
+            continue
+
+        if byte >= 0x80:
+            status = byte
+            pos += 1
+        elif status is None:
+            raise OSError(f'running status without last_status at offset {offset}')
+
+        key = status & 0xF0 if status < 0xF0 else status
+        try:
+            nbytes = _DATA_LENGTHS[key]
+        except KeyError:
+            raise OSError(f'undefined status byte 0x{status:02x} at offset {offset}') from None
+        if pos + nbytes > end:
+            raise MidiFormatError(f'event at offset {offset} truncated')
+
+        data1 = buf[pos] if nbytes > 0 else -1
+        data2 = buf[pos + 1] if nbytes > 1 else -1
+        if data1 > 0x7F or data2 > 0x7F:
+            raise OSError(f'data byte must be in range 0..127 at offset {offset}')
+        pos += nbytes
+
+        status_out = status
+        if status >= 0xF0:
+            # System common messages cancel running status.
+            status = None
+        yield offset, body, pos, tick, status_out, data1, data2
+
+
+__all__ = [
+    'Chunk',
+    'MidiFormatError',
+    'SMFHeader',
+    'iter_chunks',
+    'iter_events',
+    'read_header',
+    'read_vlq',
+    'track_chunks',
+]
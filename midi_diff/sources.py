@@ -0,0 +1,473 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    midi_diff/sources.py
+
+Description:
+    Resolution of MIDI inputs (paths, in-memory buffers, binary file objects and
+    standard input) into read-only buffers that the raw SMF reader can decode in place.
+    On-disk files are memory-mapped so their bytes are never copied into Python objects.
+
+    gzip, bzip2 and xz compressed inputs are detected by their magic bytes and
+    decompressed chunk by chunk, and ``archive.zip::path/inside.mid`` references read a
+    single zip member without extracting the archive. Decompressed data and inputs
+    that cannot be mapped stay in memory up to ``SPOOL_LIMIT`` and are spooled to an
+    anonymous, memory-mapped temporary file beyond it.
+"""
+
+from __future__ import annotations
+
+import bz2
+import contextlib
+import gzip
+import io
+import lzma
+import mmap
+import os
+import stat
+import sys
+import tempfile
+import zipfile
+from pathlib import Path
+from typing import BinaryIO, Callable, Final, Iterator, Union
+
+STDIO_PATH: Final[str] = '-'
+"""Path placeholder for standard input (when reading) or standard output (when writing)."""
+
+ARCHIVE_SEPARATOR: Final[str] = '::'
+"""Separates a zip archive path from the member path in ``archive.zip::inside.mid``."""
+
+MIDI_SUFFIXES: Final[tuple[str, ...]] = ('.mid', '.midi', '.kar', '.smf')
+"""File suffixes treated as MIDI files when scanning directories."""
+
+COMPRESSED_SUFFIXES: Final[tuple[str, ...]] = ('.gz', '.bz2', '.xz')
+
+SPOOL_LIMIT: Final[int] = 16 * 1024 * 1024
+"""Read or decompressed inputs larger than this are spooled to a temporary file instead of memory."""
+
+_COPY_CHUNK: Final[int] = 1024 * 1024
+
+# Leading magic bytes of supported compression formats, mapped to a streaming reader.
+_COMPRESSION_MAGIC: Final[tuple[tuple[bytes, Callable[[BinaryIO], BinaryIO]], ...]] = (
+    (b'\x1f\x8b', lambda fh: gzip.GzipFile(fileobj=fh)),
+    (b'BZh', bz2.BZ2File),
+    (b'\xfd7zXZ\x00', lzma.LZMAFile),
+)
+
+MidiSource = Union[str, Path, bytes, bytearray, memoryview, mmap.mmap, BinaryIO]
+"""Anything :func:`open_source` can turn into a buffer."""
+
+
+def is_stdio(source: object) -> bool:
+    """
+    Return True when ``source`` is the ``-`` placeholder for standard input/output.
+
+    Parameters:
+        source (object):
+            Candidate source or destination.
+
+    Returns:
+        bool:
+            Whether ``source`` is the string ``'-'``.
+    """
+    return isinstance(source, str) and source == STDIO_PATH
+
+
+def is_path_source(source: object) -> bool:
+    """
+    Return True when ``source`` names a file on disk (and is not ``-``).
+
+    Parameters:
+        source (object):
+            Candidate source.
+
+    Returns:
+        bool:
+            Whether ``source`` is a filesystem path.
+    """
+    return isinstance(source, (str, Path, os.PathLike)) and not is_stdio(source)
+
+
+def split_archive_ref(source: object) -> tuple[str, str] | None:
+    """
+    Split an ``archive.zip::member`` reference into its archive path and member name.
+
+    Parameters:
+        source (object):
+            Candidate source.
+
+    Returns:
+        tuple[str, str] | None:
+            ``(archive_path, member_name)``, or None when ``source`` is not an archive
+            reference.
+    """
+    if not is_path_source(source):
+        return None
+    archive, sep, member = os.fspath(source).partition(ARCHIVE_SEPARATOR)
+    if not sep or not archive or not member:
+        return None
+    return archive, member
+
+
+def archive_member_info(source: object) -> zipfile.ZipInfo | None:
+    """
+    Look up the zip directory entry for an archive reference without reading its data.
+
+    Parameters:
+        source (object):
+            Candidate source.
+
+    Returns:
+        zipfile.ZipInfo | None:
+            The member's entry (with ``CRC`` and ``file_size``), or None when ``source``
+            is not an archive reference or the member does not exist.
+    """
+    ref = split_archive_ref(source)
+    if ref is None:
+        return None
+    try:
+        with zipfile.ZipFile(ref[0]) as archive:
+            return archive.getinfo(ref[1])
+    except (OSError, KeyError, zipfile.BadZipFile):
+        return None
+
+
+def same_archive_member(source_a: object, source_b: object) -> bool:
+    """
+    Return True when two archive references point at entries with identical CRC and size.
+
+    Only the zip central directories are read; no member data is decompressed.
+
+    Parameters:
+        source_a (object):
+            First source.
+
+        source_b (object):
+            Second source.
+
+    Returns:
+        bool:
+            Whether both sources are archive members with matching ``CRC`` and ``file_size``.
+    """
+    info_a = archive_member_info(source_a)
+    if info_a is None:
+        return False
+    info_b = archive_member_info(source_b)
+    return info_b is not None and (info_a.CRC, info_a.file_size) == (info_b.CRC, info_b.file_size)
+
+
+def source_exists(source: object) -> bool:
+    """
+    Return True unless ``source`` names a file or archive member that does not exist.
+
+    Non-path sources (buffers, file objects, ``-``) always count as existing.
+
+    Parameters:
+        source (object):
+            Source to check.
+
+    Returns:
+        bool:
+            Whether the source can be opened.
+    """
+    if split_archive_ref(source) is not None:
+        return archive_member_info(source) is not None
+    if is_path_source(source):
+        return Path(source).exists()
+    return True
+
+
+def is_midi_filename(name: str) -> bool:
+    """
+    Return True when ``name`` looks like a (possibly compressed) MIDI file.
+
+    Parameters:
+        name (str):
+            File name.
+
+    Returns:
+        bool:
+            Whether ``name`` ends in a MIDI suffix, optionally followed by a compression suffix.
+    """
+    lowered = name.lower()
+    for suffix in COMPRESSED_SUFFIXES:
+        if lowered.endswith(suffix):
+            lowered = lowered[:-len(suffix)]
+            break
+    return lowered.endswith(MIDI_SUFFIXES)
+
+
+def iter_midi_files(directory: Union[str, Path]) -> Iterator[Path]:
+    """
+    Recursively list the MIDI files below ``directory`` in a stable (sorted) order.
+
+    Hidden files and directories are skipped.
+
+    Parameters:
+        directory (str | pathlib.Path):
+            Directory to scan.
+
+    Yields:
+        pathlib.Path:
+            Each MIDI file, including gzip, bzip2 and xz compressed ones.
+    """
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for name in sorted(files):
+            if not name.startswith('.') and is_midi_filename(name):
+                yield Path(root) / name
+
+
+def index_entry_path(path: Union[str, Path], index_dir: Union[str, Path]) -> str:
+    """
+    Return the form of ``path`` stored in an index kept in ``index_dir``.
+
+    Paths are stored relative to the index directory, with ``/`` separators, so an
+    index can be read from any working directory and moved together with its corpus.
+    A path on another drive than the index is stored absolute.
+
+    Parameters:
+        path (str | pathlib.Path):
+            Indexed file.
+
+        index_dir (str | pathlib.Path):
+            Directory holding the index.
+
+    Returns:
+        str:
+            The stored path.
+    """
+    target = os.path.realpath(path)
+    try:
+        stored = os.path.relpath(target, os.path.realpath(index_dir))
+    except ValueError:
+        stored = target
+    return Path(stored).as_posix()
+
+
+def resolve_index_entry(stored: str, index_dir: Union[str, Path]) -> Path:
+    """
+    Turn a path stored by :func:`index_entry_path` back into one usable from the working directory.
+
+    Parameters:
+        stored (str):
+            Path read from the index.
+
+        index_dir (str | pathlib.Path):
+            Directory holding the index.
+
+    Returns:
+        pathlib.Path:
+            The file's path relative to the working directory, or absolute when it is
+            on another drive.
+    """
+    target = os.path.normpath(os.path.join(os.path.realpath(index_dir), stored))
+    try:
+        return Path(os.path.relpath(target))
+    except ValueError:
+        return Path(target)
+
+
+def describe_source(source: object) -> str:
+    """
+    Return a short human-readable label for a source, for messages.
+
+    Parameters:
+        source (object):
+            Source to describe.
+
+    Returns:
+        str:
+            The path, ``<stdin>``, or a description of the in-memory object.
+    """
+    if is_stdio(source):
+        return '<stdin>'
+    if is_path_source(source):
+        return str(source)
+    name = getattr(source, 'name', None)
+    if isinstance(name, str):
+        return name
+    return f'<{type(source).__name__}>'
+
+
+def _map_file(fh: BinaryIO) -> mmap.mmap | None:
+    """
+    Memory-map an open regular file read-only.
+
+    Returns:
+        mmap.mmap | None:
+            The mapping, or None when the file cannot be mapped (pipes, sockets,
+            empty files, files not positioned at their start, objects without a
+            file descriptor).
+    """
+    try:
+        fd = fh.fileno()
+        if not stat.S_ISREG(os.fstat(fd).st_mode) or fh.tell() != 0:
+            return None
+        return mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError, AttributeError):
+        # ValueError: empty file; AttributeError/OSError: no usable descriptor.
+        return None
+
+
+@contextlib.contextmanager
+def _spooled(stream: BinaryIO, limit: int) -> Iterator[Union[bytes, mmap.mmap]]:
+    """
+    Copy ``stream`` into a buffer chunk by chunk.
+
+    Data up to ``limit`` bytes is kept in memory; anything longer is written to an
+    anonymous temporary file that is then memory-mapped, so its pages are backed by
+    the file and can be dropped again instead of staying resident.
+    """
+    head = stream.read(limit + 1)
+    if len(head) <= limit:
+        yield head
+        return
+    with tempfile.TemporaryFile(prefix='midi-diff-') as spool:
+        spool.write(head)
+        del head
+        while chunk := stream.read(_COPY_CHUNK):
+            spool.write(chunk)
+        spool.flush()
+        with mmap.mmap(spool.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
+
+
+@contextlib.contextmanager
+def _decompressed(buf, spool_limit: int) -> Iterator[Union[bytes, bytearray, memoryview, mmap.mmap]]:
+    """
+    Decompress ``buf`` if it starts with a gzip, bzip2 or xz signature.
+
+    The compressed bytes are read in place and decompressed chunk by chunk; output
+    beyond ``spool_limit`` bytes goes to a memory-mapped temporary file (see
+    :func:`_spooled`) rather than into memory.
+
+    Parameters:
+        buf (bytes | bytearray | memoryview | mmap.mmap):
+            Possibly compressed MIDI data.
+
+        spool_limit (int):
+            Largest decompressed size held in memory.
+
+    Yields:
+        bytes | bytearray | memoryview | mmap.mmap:
+            The decompressed data, or ``buf`` itself when it is not compressed.
+    """
+    head = bytes(buf[:6])
+    for magic, opener in _COMPRESSION_MAGIC:
+        if head.startswith(magic):
+            fileobj = buf if isinstance(buf, mmap.mmap) else io.BytesIO(buf)
+            with opener(fileobj) as stream, _spooled(stream, spool_limit) as data:
+                yield data
+            return
+    yield buf
+
+
+@contextlib.contextmanager
+def _file_buffer(fh: BinaryIO, spool_limit: int) -> Iterator[Union[bytes, mmap.mmap]]:
+    """
+    Expose an open binary file as a buffer, mapping it when possible and spooling it otherwise.
+    """
+    mapped = _map_file(fh)
+    with (_spooled(fh, spool_limit) if mapped is None else mapped) as raw, _decompressed(raw, spool_limit) as buf:
+        yield buf
+
+
+@contextlib.contextmanager
+def open_source(source: MidiSource, spool_limit: int = SPOOL_LIMIT) -> Iterator[Union[bytes, bytearray, memoryview, mmap.mmap]]:
+    """
+    Expose a MIDI source as a read-only buffer for the duration of a ``with`` block.
+
+    - ``bytes``, ``bytearray``, ``memoryview`` and ``mmap`` objects are used as-is.
+    - Paths and seekable binary files are memory-mapped.
+    - ``'-'`` reads standard input (mapped when it is redirected from a regular file).
+    - ``archive.zip::member`` reads a single zip member.
+    - Other binary file objects are read.
+    - gzip, bzip2 and xz compressed data is decompressed transparently.
+
+    Data that has to be read or decompressed is copied in chunks, and spooled to a
+    memory-mapped temporary file once it exceeds ``spool_limit`` bytes.
+
+    The buffer must not be used after the block exits.
+
+    Parameters:
+        source (MidiSource):
+            Input to open.
+
+        spool_limit (int):
+            Largest read or decompressed input held in memory; ``0`` spools every such
+            input to disk.
+
+    Yields:
+        bytes | bytearray | memoryview | mmap.mmap:
+            Buffer holding the MIDI file contents.
+
+    Raises:
+        FileNotFoundError:
+            If a path source does not exist.
+
+        KeyError:
+            If an archive reference names a missing member.
+
+        TypeError:
+            If the source type is not supported.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+        with _decompressed(source, spool_limit) as buf:
+            yield buf
+        return
+
+    ref = split_archive_ref(source)
+    if ref is not None:
+        with (
+            zipfile.ZipFile(ref[0]) as archive,
+            archive.open(ref[1]) as member,
+            _spooled(member, spool_limit) as raw,
+            _decompressed(raw, spool_limit) as buf,
+        ):
+            yield buf
+        return
+
+    if is_stdio(source):
+        with _file_buffer(sys.stdin.buffer, spool_limit) as buf:
+            yield buf
+        return
+
+    if is_path_source(source):
+        with open(source, 'rb') as fh, _file_buffer(fh, spool_limit) as buf:
+            yield buf
+        return
+
+    if hasattr(source, 'read'):
+        with _file_buffer(source, spool_limit) as buf:
+            yield buf
+        return
+
+    raise TypeError(f'unsupported MIDI source type: {type(source).__name__}')
+
+
+__all__ = [
+    'ARCHIVE_SEPARATOR',
+    'COMPRESSED_SUFFIXES',
+    'MIDI_SUFFIXES',
+    'MidiSource',
+    'SPOOL_LIMIT',
+    'STDIO_PATH',
+    'archive_member_info',
+    'describe_source',
+    'index_entry_path',
+    'is_midi_filename',
+    'is_path_source',
+    'is_stdio',
+    'iter_midi_files',
+    'open_source',
+    'resolve_index_entry',
+    'same_archive_member',
+    'source_exists',
+    'split_archive_ref',
+]
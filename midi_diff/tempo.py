@@ -0,0 +1,215 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    midi_diff/tempo.py
+
+Description:
+    Tempo maps for converting tick positions into absolute time, so files with
+    different resolutions or tempo changes can be compared in the time domain.
+"""
+
+from __future__ import annotations
+
+import bisect
+from dataclasses import dataclass
+from typing import Final, Iterable
+
+import mido
+
+from midi_diff.smf import STATUS_META, iter_events, read_header, track_chunks
+
+DEFAULT_TEMPO: Final[int] = 500000
+"""Microseconds per beat assumed before the first ``set_tempo`` event (120 BPM)."""
+
+META_SET_TEMPO: Final[int] = 0x51
+
+DEFAULT_RESOLUTION_US: Final[int] = 1000
+"""Default matching resolution for time-domain comparison (one millisecond)."""
+
+
+@dataclass(frozen=True, slots=True)
+class TempoMap:
+    """
+    Compact, precomputed tick-to-time lookup for one MIDI file.
+
+    Each segment starts at a tempo change. ``scaled`` holds the cumulative elapsed
+    time at each segment start multiplied by ``ticks_per_beat`` (i.e. the exact sum of
+    ``delta_ticks * tempo``), so conversions stay in integer arithmetic and never
+    accumulate rounding error.
+
+    Attributes:
+        ticks_per_beat (int):
+            Resolution of the source file.
+
+        ticks (tuple[int, ...]):
+            Start tick of each tempo segment, ascending. Always begins with 0.
+
+        tempos (tuple[int, ...]):
+            Tempo (microseconds per beat) of each segment.
+
+        scaled (tuple[int, ...]):
+            Cumulative ``tick * tempo`` sum at the start of each segment.
+    """
+
+    ticks_per_beat: int
+    ticks: tuple[int, ...]
+    tempos: tuple[int, ...]
+    scaled: tuple[int, ...]
+
+    @classmethod
+    def from_changes(cls, ticks_per_beat: int, changes: Iterable[tuple[int, int]]) -> TempoMap:
+        """
+        Build a tempo map from ``(tick, tempo)`` pairs.
+
+        Changes may arrive in any order. When several changes share a tick, the last
+        one given wins, matching playback order within a merged track.
+
+        Parameters:
+            ticks_per_beat (int):
+                Resolution of the source file.
+
+            changes (Iterable[tuple[int, int]]):
+                Absolute tick and microseconds-per-beat of each ``set_tempo`` event.
+
+        Returns:
+            TempoMap:
+                The compiled map.
+
+        Raises:
+            ValueError:
+                If ``ticks_per_beat`` is not positive.
+        """
+        if ticks_per_beat <= 0:
+            raise ValueError(f'ticks_per_beat must be > 0, got {ticks_per_beat}')
+
+        by_tick: dict[int, int] = {0: DEFAULT_TEMPO}
+        for tick, tempo in sorted(changes, key=lambda c: c[0]):
+            by_tick[int(tick)] = int(tempo)
+
+        ticks: list[int] = []
+        tempos: list[int] = []
+        scaled: list[int] = []
+        total = 0
+        last_tick = 0
+        for tick in sorted(by_tick):
+            tempo = by_tick[tick]
+            if tempos:
+                total += (tick - last_tick) * tempos[-1]
+            last_tick = tick
+            if tempos and tempos[-1] == tempo:
+                # Redundant change: the current segment simply continues.
+                continue
+            ticks.append(tick)
+            tempos.append(tempo)
+            scaled.append(total)
+
+        return cls(ticks_per_beat=ticks_per_beat, ticks=tuple(ticks), tempos=tuple(tempos), scaled=tuple(scaled))
+
+    @classmethod
+    def from_midi(cls, mid: mido.MidiFile) -> TempoMap:
+        """
+        Collect every ``set_tempo`` event of a MIDI file into a tempo map.
+
+        Parameters:
+            mid (mido.MidiFile):
+                Parsed MIDI file.
+
+        Returns:
+            TempoMap:
+                The file's tempo map.
+        """
+        changes: list[tuple[int, int]] = []
+        for track in mid.tracks:
+            tick = 0
+            for msg in track:
+                tick += int(msg.time)
+                if msg.type == 'set_tempo':
+                    changes.append((tick, int(msg.tempo)))
+        return cls.from_changes(mid.ticks_per_beat, changes)
+
+    @classmethod
+    def from_buffer(cls, buf) -> TempoMap:
+        """
+        Collect every ``set_tempo`` event directly from raw Standard MIDI File bytes.
+
+        Parameters:
+            buf (bytes | bytearray | memoryview | mmap.mmap):
+                Buffer holding the MIDI file contents.
+
+        Returns:
+            TempoMap:
+                The file's tempo map.
+        """
+        ticks_per_beat = read_header(buf).ticks_per_beat
+        changes: list[tuple[int, int]] = []
+        for chunk in track_chunks(buf):
+            for _offset, _body, end, tick, status, data1, data2 in iter_events(buf, chunk.offset, chunk.end):
+                if status == STATUS_META and data1 == META_SET_TEMPO and end - data2 == 3:
+                    changes.append((tick, int.from_bytes(buf[data2:end], 'big')))
+        return cls.from_changes(ticks_per_beat, changes)
+
+    def to_micros(self, tick: int) -> int:
+        """
+        Convert an absolute tick to microseconds from the start of the file.
+
+        Parameters:
+            tick (int):
+                Absolute tick.
+
+        Returns:
+            int:
+                Elapsed time in microseconds, rounded to the nearest microsecond.
+        """
+        i = bisect.bisect_right(self.ticks, tick) - 1
+        scaled = self.scaled[i] + (tick - self.ticks[i]) * self.tempos[i]
+        return (2 * scaled + self.ticks_per_beat) // (2 * self.ticks_per_beat)
+
+    def note_times(self, start: int, duration: int) -> tuple[int, int]:
+        """
+        Return a note's start and duration in microseconds.
+
+        The duration is measured between the converted start and end, so it reflects
+        any tempo changes the note spans.
+
+        Parameters:
+            start (int):
+                Start tick.
+
+            duration (int):
+                Duration in ticks.
+
+        Returns:
+            tuple[int, int]:
+                ``(start_us, duration_us)``.
+        """
+        start_us = self.to_micros(start)
+        return start_us, self.to_micros(start + duration) - start_us
+
+
+def micros_to_ticks(micros: int, ticks_per_beat: int, tempo: int = DEFAULT_TEMPO) -> int:
+    """
+    Convert microseconds to ticks on a constant-tempo timeline.
+
+    Parameters:
+        micros (int):
+            Time in microseconds.
+
+        ticks_per_beat (int):
+            Target resolution.
+
+        tempo (int):
+            Microseconds per beat of the target timeline.
+
+    Returns:
+        int:
+            The nearest tick.
+    """
+    return (2 * micros * ticks_per_beat + tempo) // (2 * tempo)
+
+
+__all__ = ['DEFAULT_RESOLUTION_US', 'DEFAULT_TEMPO', 'TempoMap', 'micros_to_ticks']
@@ -0,0 +1,524 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    midi_diff/watch.py
+
+Description:
+    Live diff of two MIDI files that are being edited.
+
+    Both inputs stay parsed in memory, one note table per track, each tagged with a
+    digest of the track chunk's raw bytes. When a file is saved, only tracks whose
+    digest changed are decoded again, and only the note keys those tracks held before
+    or after are re-classified, so an update costs time in proportion to the edit
+    rather than to the files. The output is rewritten in place after every update.
+
+    Changes are detected with inotify on Linux (through ``ctypes``, watching the
+    parent directories so editors that save by renaming are caught) and by polling
+    file size and modification time elsewhere. Bursts of events are debounced.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import ctypes
+import ctypes.util
+import hashlib
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Final, Iterator, Union
+
+from midi_diff.core import render_diff
+from midi_diff.diff import COMPARED_ATTRIBUTES, SIDE_A, SIDE_B, SIDE_CHANGED, DiffEntry
+from midi_diff.metrics import STAGE_EXTRACT, laps, observe_diff
+from midi_diff.midi_utils import NoteRecord, iter_track_note_records
+from midi_diff.note_keys import rescale_record
+from midi_diff.outputs import replace_output
+from midi_diff.report import FORMAT_MID
+from midi_diff.smf import read_header, track_chunks
+from midi_diff.sources import open_source
+
+DEFAULT_DEBOUNCE: Final[float] = 0.2
+"""Seconds without further events before a change is processed."""
+
+DEFAULT_POLL_INTERVAL: Final[float] = 0.5
+"""Seconds between checks when polling."""
+
+TRACK_DIGEST_SIZE: Final[int] = 16
+
+# inotify(7) event masks.
+_IN_MODIFY: Final[int] = 0x00000002
+_IN_CLOSE_WRITE: Final[int] = 0x00000008
+_IN_MOVED_TO: Final[int] = 0x00000080
+_IN_CREATE: Final[int] = 0x00000100
+_IN_DELETE: Final[int] = 0x00000200
+_INOTIFY_EVENT: Final[struct.Struct] = struct.Struct('iIII')
+
+
+def file_signature(path: Union[str, Path]) -> tuple[int, int] | None:
+    """
+    Return ``(mtime_ns, size)`` of a file, or None if it does not exist.
+
+    Parameters:
+        path (str | pathlib.Path):
+            File to check.
+
+    Returns:
+        tuple[int, int] | None:
+            The signature used to decide whether a file changed.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class PollingWatcher:
+    """
+    Detect changes by comparing file signatures at a fixed interval.
+
+    Parameters:
+        paths (list[pathlib.Path]):
+            Files to watch.
+
+        interval (float):
+            Seconds between checks.
+    """
+
+    def __init__(self, paths: list[Path], interval: float = DEFAULT_POLL_INTERVAL) -> None:
+        self.paths = paths
+        self.interval = interval
+        self._signatures = {path: file_signature(path) for path in paths}
+
+    def wait(self, timeout: float | None) -> set[Path]:
+        """
+        Block until a file changes or ``timeout`` seconds pass.
+
+        Returns:
+            set[pathlib.Path]:
+                Files whose signature changed (empty on timeout).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changed = set()
+            for path in self.paths:
+                signature = file_signature(path)
+                if signature != self._signatures[path]:
+                    self._signatures[path] = signature
+                    changed.add(path)
+            if changed:
+                return changed
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return set()
+            time.sleep(self.interval if remaining is None else min(self.interval, remaining))
+
+    def close(self) -> None:
+        pass
+
+
+class InotifyWatcher:
+    """
+    Detect changes with Linux inotify, watching each file's directory.
+
+    Parameters:
+        paths (list[pathlib.Path]):
+            Files to watch.
+
+    Raises:
+        OSError:
+            If inotify is unavailable.
+    """
+
+    def __init__(self, paths: list[Path]) -> None:
+        if not sys.platform.startswith('linux'):
+            raise OSError('inotify is only available on Linux')
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._names: dict[int, dict[bytes, Path]] = {}
+        mask = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+        try:
+            directories: dict[Path, dict[bytes, Path]] = {}
+            for path in paths:
+                directories.setdefault(path.resolve().parent, {})[os.fsencode(path.name)] = path
+            for directory, names in directories.items():
+                wd = libc.inotify_add_watch(self._fd, os.fsencode(directory), mask)
+                if wd < 0:
+                    raise OSError(ctypes.get_errno(), f'cannot watch {directory}')
+                self._names[wd] = names
+        except BaseException:
+            os.close(self._fd)
+            raise
+
+    def wait(self, timeout: float | None) -> set[Path]:
+        """
+        Block until a watched file is touched or ``timeout`` seconds pass.
+
+        Returns:
+            set[pathlib.Path]:
+                Watched files named in the events read (empty on timeout).
+        """
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        changed = set()
+        with contextlib.suppress(BlockingIOError):
+            while True:
+                data = os.read(self._fd, 64 * 1024)
+                pos = 0
+                while pos < len(data):
+                    wd, _mask, _cookie, length = _INOTIFY_EVENT.unpack_from(data, pos)
+                    name = data[pos + _INOTIFY_EVENT.size:pos + _INOTIFY_EVENT.size + length].rstrip(b'\0')
+                    pos += _INOTIFY_EVENT.size + length
+                    path = self._names.get(wd, {}).get(name)
+                    if path is not None:
+                        changed.add(path)
+        return changed
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+def open_watcher(paths: list[Path], poll: bool = False, interval: float = DEFAULT_POLL_INTERVAL) -> InotifyWatcher | PollingWatcher:
+    """
+    Return an inotify watcher when available, otherwise a polling one.
+
+    Parameters:
+        paths (list[pathlib.Path]):
+            Files to watch.
+
+        poll (bool):
+            Always poll.
+
+        interval (float):
+            Polling interval in seconds.
+    """
+    if not poll:
+        with contextlib.suppress(OSError, AttributeError):
+            return InotifyWatcher(paths)
+    return PollingWatcher(paths, interval)
+
+
+class TrackedFile:
+    """
+    A MIDI file held as per-track note tables that can be refreshed incrementally.
+
+    Parameters:
+        path (pathlib.Path):
+            File to track.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.signature: tuple[int, int] | None = None
+        self.ticks_per_beat = 0
+        self.scale_to: int | None = None
+        self._scaled_to: int | None = None
+        self.digests: list[bytes] = []
+        self.tracks: list[dict[int, NoteRecord]] = []
+        self.counts: Counter = Counter()
+
+    def reload(self) -> set[int]:
+        """
+        Re-read the file, decoding only tracks whose contents changed.
+
+        Returns:
+            set[int]:
+                Keys held before or after by every track that changed.
+
+        Raises:
+            OSError, ValueError:
+                If the file cannot be read or parsed; the previous state is kept.
+        """
+        signature = file_signature(self.path)
+        with open_source(self.path) as buf:
+            ticks_per_beat = read_header(buf).ticks_per_beat
+            chunks = track_chunks(buf)
+            rescale = self.scale_to not in (None, ticks_per_beat)
+            if ticks_per_beat != self.ticks_per_beat or self.scale_to != self._scaled_to:
+                # A resolution change moves every note: decode everything again.
+                self.digests = []
+            digests, tracks = [], []
+            for index, chunk in enumerate(chunks):
+                digest = hashlib.blake2b(buf[chunk.offset:chunk.end], digest_size=TRACK_DIGEST_SIZE).digest()
+                if index < len(self.digests) and self.digests[index] == digest:
+                    tracks.append(self.tracks[index])
+                else:
+                    table: dict[int, NoteRecord] = {}
+                    for record in iter_track_note_records(buf, chunk, index):
+                        if rescale:
+                            record = rescale_record(ticks_per_beat, self.scale_to, record)
+                        table.setdefault(record[0], record)
+                    tracks.append(table)
+                digests.append(digest)
+
+        affected: set[int] = set()
+        for index in range(max(len(tracks), len(self.tracks))):
+            old = self.tracks[index] if index < len(self.tracks) else {}
+            new = tracks[index] if index < len(tracks) else {}
+            if old is new:
+                continue
+            self.counts.subtract(old.keys())
+            self.counts.update(new.keys())
+            affected.update(old.keys())
+            affected.update(new.keys())
+        for key in affected:
+            if self.counts[key] <= 0:
+                del self.counts[key]
+        self.tracks, self.digests = tracks, digests
+        self.ticks_per_beat = ticks_per_beat
+        self._scaled_to = self.scale_to
+        self.signature = signature
+        return affected
+
+    def record(self, key: int) -> NoteRecord | None:
+        """Return the first record carrying ``key``, in track order."""
+        if key not in self.counts:
+            return None
+        for table in self.tracks:
+            record = table.get(key)
+            if record is not None:
+                return record
+        return None
+
+
+class WatchSession:
+    """
+    Incrementally maintained diff of two tracked files.
+
+    Parameters:
+        file_a (str | pathlib.Path):
+            First file.
+
+        file_b (str | pathlib.Path):
+            Second file.
+
+        report_changes (bool):
+            Also track matched notes whose velocity differs.
+
+        rescale (bool):
+            Rescale the second file's notes to the first file's resolution before
+            matching. By default notes are matched on raw ticks, as by ``diff``.
+    """
+
+    def __init__(
+        self,
+        file_a: Union[str, Path],
+        file_b: Union[str, Path],
+        report_changes: bool = False,
+        rescale: bool = False,
+    ) -> None:
+        self.a = TrackedFile(Path(file_a))
+        self.b = TrackedFile(Path(file_b))
+        self.report_changes = report_changes
+        self.rescale = rescale
+        self.only_a: set[int] = set()
+        self.only_b: set[int] = set()
+        self.changed: set[int] = set()
+        self._classify(self.a.reload())
+        if rescale:
+            self.b.scale_to = self.a.ticks_per_beat
+        self._classify(self.b.reload())
+
+    @property
+    def ticks_per_beat(self) -> int:
+        """Resolution of the diff (the first file's)."""
+        return self.a.ticks_per_beat
+
+    def _classify(self, keys: set[int]) -> None:
+        """Re-evaluate the diff status of ``keys``."""
+        for key in keys:
+            in_a, in_b = key in self.a.counts, key in self.b.counts
+            self.only_a.discard(key)
+            self.only_b.discard(key)
+            self.changed.discard(key)
+            if in_a and not in_b:
+                self.only_a.add(key)
+            elif in_b and not in_a:
+                self.only_b.add(key)
+            elif in_a and self.report_changes:
+                if self.a.record(key)[1] != self.b.record(key)[1]:
+                    self.changed.add(key)
+
+    def refresh(self, paths: set[Path]) -> bool:
+        """
+        Reload whichever of ``paths`` actually changed and update the diff.
+
+        Parameters:
+            paths (set[pathlib.Path]):
+                Files reported by a watcher.
+
+        Returns:
+            bool:
+                True if the diff may have changed.
+
+        Raises:
+            OSError, ValueError:
+                If a changed file cannot be parsed (for instance while it is still
+                being written); the previous state is kept and a later event retries.
+        """
+        updated = False
+        for tracked in (self.a, self.b):
+            if tracked.path not in paths or file_signature(tracked.path) == tracked.signature:
+                continue
+            self._classify(tracked.reload())
+            updated = True
+            if tracked is self.a and self.rescale and self.b.scale_to != self.a.ticks_per_beat:
+                self.b.scale_to = self.a.ticks_per_beat
+                self._classify(self.b.reload())
+        return updated
+
+    def entries(self) -> Iterator[DiffEntry]:
+        """Yield the current diff: only-in-A, then only-in-B and changed, in key order."""
+        for key in sorted(self.only_a):
+            yield SIDE_A, self.a.record(key), None, ()
+        for key in sorted(self.only_b | self.changed):
+            if key in self.changed:
+                yield SIDE_CHANGED, self.b.record(key), self.a.record(key), COMPARED_ATTRIBUTES
+            else:
+                yield SIDE_B, self.b.record(key), None, ()
+
+    def write(self, out_file: Union[str, Path], output_format: str = FORMAT_MID) -> Counter:
+        """
+        Rewrite ``out_file`` with the current diff.
+
+        Returns:
+            Counter:
+                Number of entries per side.
+        """
+        with replace_output(out_file) as fh:
+            return render_diff(
+                self.entries(),
+                output_format,
+                self.ticks_per_beat,
+                self.report_changes,
+                fh,
+                sources=(self.a.path, self.b.path),
+            )
+
+
+def watch(
+    file_a: Union[str, Path],
+    file_b: Union[str, Path],
+    out_file: Union[str, Path],
+    output_format: str = FORMAT_MID,
+    report_changes: bool = False,
+    rescale: bool = False,
+    debounce: float = DEFAULT_DEBOUNCE,
+    poll: bool = False,
+    poll_interval: float = DEFAULT_POLL_INTERVAL,
+    on_update: Callable[[Counter, float], None] | None = None,
+    on_error: Callable[[Exception], None] | None = None,
+    stop: threading.Event | None = None,
+) -> None:
+    """
+    Write the diff of two files, then rewrite it every time either file is saved.
+
+    Runs until ``stop`` is set or the process is interrupted.
+
+    Parameters:
+        file_a (str | pathlib.Path):
+            First file.
+
+        file_b (str | pathlib.Path):
+            Second file.
+
+        out_file (str | pathlib.Path):
+            Output file, replaced in place on every update.
+
+        output_format (str):
+            ``'mid'`` or a report format (see :mod:`midi_diff.report`).
+
+        report_changes (bool):
+            Report matched notes whose velocity changed.
+
+        rescale (bool):
+            Rescale the second file to the first file's resolution before matching
+            (see :class:`WatchSession`).
+
+        debounce (float):
+            Seconds of quiet after the last event before updating.
+
+        poll (bool):
+            Poll file signatures instead of using inotify.
+
+        poll_interval (float):
+            Polling interval in seconds.
+
+        on_update (Callable[[Counter, float], None] | None):
+            Called after each write with the per-side counts and the seconds spent.
+
+        on_error (Callable[[Exception], None] | None):
+            Called when a saved file cannot be parsed; watching continues.
+
+        stop (threading.Event | None):
+            Set to end the loop.
+
+    Raises:
+        OSError, ValueError:
+            If the initial parse or write fails.
+    """
+    started = time.perf_counter()
+    stages = laps()
+    session = WatchSession(file_a, file_b, report_changes, rescale)
+    stages.mark(STAGE_EXTRACT)
+    counts = session.write(out_file, output_format)
+    observe_diff(time.perf_counter() - started, counts)
+    if on_update is not None:
+        on_update(counts, time.perf_counter() - started)
+
+    paths = [session.a.path, session.b.path]
+    watcher = open_watcher(paths, poll=poll, interval=poll_interval)
+    # Check often enough to notice ``stop`` while idle.
+    idle_timeout = 0.5 if stop is not None else None
+    try:
+        while stop is None or not stop.is_set():
+            pending = watcher.wait(idle_timeout)
+            if not pending:
+                continue
+            # Debounce: keep collecting until the files have been quiet for a while.
+            while more := watcher.wait(debounce):
+                pending |= more
+            started = time.perf_counter()
+            stages = laps()
+            try:
+                if not session.refresh(pending):
+                    continue
+                stages.mark(STAGE_EXTRACT)
+                counts = session.write(out_file, output_format)
+            except (OSError, ValueError) as e:
+                observe_diff(time.perf_counter() - started, failed=True)
+                if on_error is not None:
+                    on_error(e)
+                continue
+            observe_diff(time.perf_counter() - started, counts)
+            if on_update is not None:
+                on_update(counts, time.perf_counter() - started)
+    finally:
+        watcher.close()
+
+
+__all__ = [
+    'DEFAULT_DEBOUNCE',
+    'DEFAULT_POLL_INTERVAL',
+    'InotifyWatcher',
+    'PollingWatcher',
+    'TrackedFile',
+    'WatchSession',
+    'file_signature',
+    'open_watcher',
+    'watch',
+]
@@ -0,0 +1,116 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    tests/conftest.py
+
+Description:
+    Shared fixtures: small, deterministic MIDI files generated with mido, so the suite
+    needs no binary test data.
+"""
+
+from __future__ import annotations
+
+import random
+from pathlib import Path
+
+import mido
+import pytest
+
+TICKS_PER_BEAT = 480
+NOTES_PER_TRACK = 300
+
+
+def random_notes(rng: random.Random, count: int, channels: tuple[int, ...]) -> list[tuple[int, int, int, int, int]]:
+    """Return ``(start, duration, channel, pitch, velocity)`` notes, overlapping and out of order."""
+    return [
+        (
+            rng.randrange(0, 200 * TICKS_PER_BEAT),
+            rng.randrange(1, 4 * TICKS_PER_BEAT),
+            rng.choice(channels),
+            rng.randrange(24, 108),
+            rng.randrange(1, 128),
+        )
+        for _ in range(count)
+    ]
+
+
+def build_track(notes, name: str | None = None) -> mido.MidiTrack:
+    """Render notes into a track with delta times, mixing note-off and zero-velocity note-on."""
+    events = []
+    for i, (start, duration, channel, pitch, velocity) in enumerate(notes):
+        events.append((start, 1, mido.Message('note_on', channel=channel, note=pitch, velocity=velocity)))
+        off = (
+            mido.Message('note_off', channel=channel, note=pitch, velocity=64)
+            if i % 2
+            else mido.Message('note_on', channel=channel, note=pitch, velocity=0)
+        )
+        # Offs sort before ons at the same tick so back-to-back notes pair correctly.
+        events.append((start + duration, 0, off))
+    events.sort(key=lambda event: (event[0], event[1]))
+
+    track = mido.MidiTrack()
+    if name is not None:
+        track.append(mido.MetaMessage('track_name', name=name, time=0))
+    tick = 0
+    for at, _order, msg in events:
+        track.append(msg.copy(time=at - tick))
+        tick = at
+    track.append(mido.MetaMessage('end_of_track', time=0))
+    return track
+
+
+def write_midi(path: Path, tracks: list[list], midi_type: int = 1) -> Path:
+    """Write note lists as a MIDI file, one track each, and return ``path``."""
+    mid = mido.MidiFile(type=midi_type, ticks_per_beat=TICKS_PER_BEAT)
+    if midi_type == 1:
+        conductor = mido.MidiTrack()
+        conductor.append(mido.MetaMessage('set_tempo', tempo=500000, time=0))
+        conductor.append(mido.MetaMessage('set_tempo', tempo=400000, time=16 * TICKS_PER_BEAT))
+        conductor.append(mido.MetaMessage('end_of_track', time=0))
+        mid.tracks.append(conductor)
+    for i, notes in enumerate(tracks):
+        mid.tracks.append(build_track(notes, name=f'track {i}' if midi_type == 1 else None))
+    mid.save(path)
+    return path
+
+
+def edit_notes(rng: random.Random, notes: list) -> list:
+    """Return a copy of ``notes`` with some removed, some added and some velocities changed."""
+    edited = []
+    for start, duration, channel, pitch, velocity in notes:
+        roll = rng.random()
+        if roll < 0.1:
+            continue
+        if roll < 0.2:
+            velocity = velocity % 127 + 1
+        edited.append((start, duration, channel, pitch, velocity))
+    edited.extend(random_notes(rng, len(notes) // 10, tuple(sorted({note[2] for note in notes}))))
+    return edited
+
+
+@pytest.fixture(scope='session')
+def midi_pair(tmp_path_factory) -> tuple[Path, Path]:
+    """Two related multi-track type-1 files: the second is an edited copy of the first."""
+    rng = random.Random(1234)
+    directory = tmp_path_factory.mktemp('pair')
+    tracks_a = [random_notes(rng, NOTES_PER_TRACK, (0, 1)), random_notes(rng, NOTES_PER_TRACK, (9,))]
+    tracks_b = [edit_notes(rng, notes) for notes in tracks_a]
+    return write_midi(directory / 'a.mid', tracks_a), write_midi(directory / 'b.mid', tracks_b)
+
+
+@pytest.fixture(scope='session')
+def single_track_pair(tmp_path_factory) -> tuple[Path, Path]:
+    """Two related type-0 files, for comparisons against a single merged message stream."""
+    rng = random.Random(5678)
+    directory = tmp_path_factory.mktemp('single')
+    notes_a = random_notes(rng, NOTES_PER_TRACK, (0, 1, 2))
+    notes_b = edit_notes(rng, notes_a)
+    return (
+        write_midi(directory / 'a.mid', [notes_a], midi_type=0),
+        write_midi(directory / 'b.mid', [notes_b], midi_type=0),
+    )
@@ -0,0 +1,84 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    tests/test_align.py
+
+Description:
+    Transposition- and shift-invariant comparison: offsets are estimated globally and
+    per track, and a moved copy of a file diffs as equal once aligned.
+"""
+
+from __future__ import annotations
+
+import random
+
+from midi_diff.align import Offset, align_records, estimate_offset, estimate_track_offsets
+from midi_diff.core import diff_files, stream_diff_files
+from midi_diff.note_keys import pack_key
+
+from conftest import TICKS_PER_BEAT, random_notes, write_midi
+
+SHIFT = 8 * TICKS_PER_BEAT
+
+
+def to_records(notes, track: int = 0) -> list:
+    return [(pack_key(pitch, channel, start, duration), velocity, track) for start, duration, channel, pitch, velocity in notes]
+
+
+def moved(notes, pitch: int, ticks: int) -> list:
+    return [(start + ticks, duration, channel, note + pitch, velocity) for start, duration, channel, note, velocity in notes]
+
+
+def melody(seed: int) -> list:
+    return random_notes(random.Random(seed), 200, (0,))
+
+
+def test_estimates_global_offset():
+    notes = melody(44)
+    offset = estimate_offset(to_records(notes), to_records(moved(notes, 5, SHIFT)), TICKS_PER_BEAT)
+    assert (offset.pitch, offset.ticks) == (5, SHIFT)
+    assert offset.votes > 100
+
+
+def test_unrelated_inputs_have_no_strong_offset():
+    offset = estimate_offset(to_records(melody(1)), to_records(melody(2)), TICKS_PER_BEAT)
+    assert offset.votes < 5
+
+
+def test_estimates_offsets_per_track():
+    lead, bass = melody(3), melody(4)
+    records_a = to_records(lead, 1) + to_records(bass, 2)
+    records_b = to_records(moved(lead, 12, 0), 1) + to_records(moved(bass, 0, SHIFT), 2)
+
+    _overall, per_track = estimate_track_offsets(records_a, records_b, TICKS_PER_BEAT)
+
+    assert (per_track[1].pitch, per_track[1].ticks) == (12, 0)
+    assert (per_track[2].pitch, per_track[2].ticks) == (0, SHIFT)
+
+
+def test_notes_moved_out_of_range_cannot_match():
+    records = to_records([(100, 480, 0, 125, 90), (2000, 480, 0, 60, 90)])
+    aligned, origin = align_records(records, Offset(pitch=-5, ticks=1000))
+    assert aligned[0][0] == ~records[0][0]
+    assert aligned[1][0] == pack_key(65, 0, 1000, 480)
+    assert origin == {aligned[0][0]: records[0][0], aligned[1][0]: records[1][0]}
+
+
+def test_moved_copy_diffs_as_equal(tmp_path):
+    notes = melody(45)
+    a = write_midi(tmp_path / 'a.mid', [notes])
+    b = write_midi(tmp_path / 'b.mid', [moved(notes, -7, SHIFT)])
+    offsets = []
+
+    plain, _ppq = diff_files(a, b)
+    entries, _ppq = stream_diff_files(a, b, align='global', on_align=lambda offset, _tracks: offsets.append(offset))
+    entries = list(entries)
+
+    assert len(plain.only_in_a_records) == len(notes)
+    assert entries == []
+    assert (offsets[0].pitch, offsets[0].ticks) == (-7, SHIFT)
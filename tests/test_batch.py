@@ -0,0 +1,100 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    tests/test_batch.py
+
+Description:
+    Pre-scan and batch planning: structural problems are found without a full parse,
+    broken and unpaired files are rejected up front, and the remaining pairs run
+    largest first and produce the same diffs as a single comparison.
+"""
+
+from __future__ import annotations
+
+import json
+import random
+
+import pytest
+
+from midi_diff.batch import output_path, plan_batch, run_batch
+from midi_diff.core import diff_files
+from midi_diff.prescan import prescan
+
+from conftest import edit_notes, random_notes, write_midi
+
+
+def without_end_of_track(data: bytes) -> bytes:
+    """Drop the last track's ``end_of_track`` event and shorten its chunk to match."""
+    last = data.rfind(b'MTrk')
+    length = int.from_bytes(data[last + 4:last + 8], 'big')
+    return data[:last + 4] + (length - 4).to_bytes(4, 'big') + data[last + 8:-4]
+
+
+@pytest.fixture(scope='module')
+def song(tmp_path_factory):
+    path = tmp_path_factory.mktemp('scan') / 'song.mid'
+    return write_midi(path, [random_notes(random.Random(47), 100, (0,))]).read_bytes()
+
+
+def test_sound_file(song):
+    scan = prescan(song)
+    assert scan.ok and not scan.truncated
+    assert (scan.format, scan.ntracks, scan.ticks_per_beat) == (1, 2, 480)
+    assert len(scan.track_chunks) == 2
+    assert scan.estimated_events == scan.track_bytes // 3
+
+
+@pytest.mark.parametrize(
+    'mutate, problem, truncated',
+    [
+        (lambda data: data[:-10], 'declares', True),
+        (lambda data: data[:30], 'declares', True),
+        (without_end_of_track, 'does not end with end_of_track', False),
+        (lambda data: data[:11] + b'\3' + data[12:], 'announces 3 tracks, found 2', True),
+        (lambda data: b'RIFF' + data[4:], 'not a MIDI file', False),
+        (lambda data: data[:12] + b'\xe7\x28' + data[14:], 'SMPTE', False),
+    ],
+)
+def test_structural_problems(song, mutate, problem, truncated):
+    scan = prescan(mutate(song))
+    assert not scan.ok
+    assert problem in '; '.join(scan.problems)
+    assert scan.truncated == truncated
+
+
+def test_plan_rejects_and_orders(tmp_path):
+    rng = random.Random(7)
+    dir_a, dir_b = tmp_path / 'a', tmp_path / 'b'
+    dir_a.mkdir()
+    dir_b.mkdir()
+    for name, count in (('small.mid', 20), ('large.mid', 400), ('medium.mid', 100)):
+        notes = random_notes(rng, count, (0,))
+        write_midi(dir_a / name, [notes])
+        write_midi(dir_b / name, [edit_notes(rng, notes)])
+    write_midi(dir_a / 'only-a.mid', [random_notes(rng, 10, (0,))])
+    data = (dir_b / 'medium.mid').read_bytes()
+    (dir_a / 'cut.mid').write_bytes(data)
+    (dir_b / 'cut.mid').write_bytes(data[: len(data) // 2])
+
+    jobs, rejected = plan_batch(dir_a, dir_b)
+
+    assert [job.name for job in jobs] == ['large.mid', 'medium.mid', 'small.mid']
+    assert [item.name for item in rejected] == ['cut.mid', 'only-a.mid']
+    assert 'is truncated' in rejected[0].reason
+    assert rejected[1].reason == f'missing from {dir_b}'
+
+    out_dir = tmp_path / 'out'
+    results = run_batch(jobs, out_dir, workers=2)
+    assert sorted(result.job.name for result in results) == ['large.mid', 'medium.mid', 'small.mid']
+    for result in results:
+        assert result.error is None
+        assert result.output == output_path(out_dir, result.job.name, 'jsonl')
+        diff, _ppq = diff_files(result.job.file_a, result.job.file_b)
+        rows = result.output.read_text().splitlines()
+        assert len(rows) == len(diff.only_in_a_records) + len(diff.only_in_b_records) == sum(result.counts.values())
+        assert all(json.loads(row) for row in rows)
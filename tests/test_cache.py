@@ -0,0 +1,134 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    tests/test_cache.py
+
+Description:
+    Diff result cache: misses compute and store, hits reproduce the same output without
+    recomputing, and anything that changes the result changes the key.
+"""
+
+from __future__ import annotations
+
+import os
+import stat
+import sys
+import zipfile
+import zlib
+
+import pytest
+
+from midi_diff import core
+from midi_diff.cache import DiffCache, content_hash, decode_entries, encode_entries
+from midi_diff.report import FORMAT_CSV, FORMAT_JSONL, FORMAT_MID, REPORT_SUFFIXES
+
+
+def run_diff(capsys, tmp_path, name, *sources, **options) -> tuple[bytes, str]:
+    """Run :func:`midi_diff.core.main` into a fresh file and return its bytes and log."""
+    out_file = tmp_path / (name + REPORT_SUFFIXES[options.get('output_format', FORMAT_MID)])
+    core.main(*sources, out_file, **options)
+    return out_file.read_bytes(), capsys.readouterr().out
+
+
+def no_recompute(*_args, **_kwargs):
+    raise AssertionError('a cache hit must not diff the inputs again')
+
+
+@pytest.mark.parametrize('output_format', [FORMAT_MID, FORMAT_JSONL])
+def test_cache_miss_then_hit(midi_pair, tmp_path, capsys, monkeypatch, output_format):
+    cache = DiffCache(tmp_path / 'cache')
+    options = dict(report_changes=True, output_format=output_format, cache=cache)
+
+    first, log = run_diff(capsys, tmp_path, 'first', *midi_pair, **options)
+    assert '(cached)' not in log
+    uncached, _ = run_diff(capsys, tmp_path, 'uncached', *midi_pair, report_changes=True, output_format=output_format)
+    assert first == uncached
+
+    monkeypatch.setattr(core, 'stream_diff_files', no_recompute)
+    second, log = run_diff(capsys, tmp_path, 'second', *midi_pair, **options)
+    assert '(cached)' in log
+    assert second == first
+
+
+def test_cache_hit_renders_other_formats(midi_pair, tmp_path, capsys, monkeypatch):
+    cache = DiffCache(tmp_path / 'cache')
+    run_diff(capsys, tmp_path, 'warm', *midi_pair, cache=cache)
+    expected, _ = run_diff(capsys, tmp_path, 'expected', *midi_pair, output_format=FORMAT_CSV)
+
+    monkeypatch.setattr(core, 'stream_diff_files', no_recompute)
+    data, log = run_diff(capsys, tmp_path, 'hit', *midi_pair, output_format=FORMAT_CSV, cache=cache)
+    assert '(cached)' in log
+    assert data == expected
+
+
+def test_refresh_recomputes(midi_pair, tmp_path, capsys):
+    cache = DiffCache(tmp_path / 'cache')
+    run_diff(capsys, tmp_path, 'warm', *midi_pair, cache=cache)
+    _data, log = run_diff(capsys, tmp_path, 'refreshed', *midi_pair, cache=cache, refresh=True)
+    assert '(cached)' not in log
+
+
+def test_key_depends_on_contents_and_options(midi_pair, tmp_path):
+    cache = DiffCache(tmp_path)
+    a, b = midi_pair
+    key = cache.key_for(a, b, {'window': None})
+
+    assert cache.get(key) is None
+    assert cache.key_for(a, b, {'window': None}) == key
+    assert cache.key_for(b, a, {'window': None}) != key
+    assert cache.key_for(a, b, {'window': [0, 10]}) != key
+    assert cache.key_for(a.read_bytes(), b, {'window': None}) == key
+    with a.open('rb') as fh:
+        assert cache.key_for(fh, b, {'window': None}) is None
+
+
+def test_zip_members_are_keyed_by_contents(midi_pair, tmp_path):
+    a, b = midi_pair
+    archive = tmp_path / 'songs.zip'
+    with zipfile.ZipFile(archive, 'w') as zf:
+        zf.write(a, 'a.mid')
+        zf.write(b, 'b.mid')
+    assert content_hash(f'{archive}::a.mid') == content_hash(a)
+    assert content_hash(f'{archive}::b.mid') == content_hash(b)
+
+    # Same CRC-32 and size, different contents: a CRC key would make these collide.
+    first, second = bytes.fromhex('410671db01000000'), bytes(8)
+    assert zlib.crc32(first) == zlib.crc32(second)
+    with zipfile.ZipFile(archive, 'w') as zf:
+        zf.writestr('first', first)
+        zf.writestr('second', second)
+    assert content_hash(f'{archive}::first') != content_hash(f'{archive}::second')
+
+
+def test_entries_round_trip(midi_pair):
+    entries, _ppq = core.stream_diff_files(*midi_pair, report_changes=True)
+    entries = list(entries)
+    assert decode_entries(encode_entries(entries)) == entries
+
+
+def test_corrupt_entry_is_a_miss(midi_pair, tmp_path, capsys):
+    cache = DiffCache(tmp_path / 'cache')
+    first, _ = run_diff(capsys, tmp_path, 'first', *midi_pair, cache=cache)
+    for path in cache.directory.iterdir():
+        path.write_bytes(b'garbage')
+
+    again, log = run_diff(capsys, tmp_path, 'again', *midi_pair, cache=cache)
+    assert '(cached)' not in log
+    assert again == first
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='POSIX permissions')
+def test_cache_files_follow_umask(midi_pair, tmp_path, capsys):
+    cache = DiffCache(tmp_path / 'cache')
+    previous = os.umask(0o022)
+    try:
+        run_diff(capsys, tmp_path, 'out', *midi_pair, cache=cache)
+    finally:
+        os.umask(previous)
+    modes = {stat.S_IMODE(path.stat().st_mode) for path in cache.directory.iterdir()}
+    assert modes == {0o644}
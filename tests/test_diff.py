@@ -0,0 +1,106 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    tests/test_diff.py
+
+Description:
+    The external-sort and online diffs must report the same notes as the in-memory diff.
+"""
+
+from __future__ import annotations
+
+import gzip
+import mmap
+from collections import Counter
+
+import mido
+
+from midi_diff import core, external
+from midi_diff.core import diff_files
+from midi_diff.diff import SIDE_A, SIDE_B, SIDE_CHANGED, iter_diff
+from midi_diff.external import current_rss, iter_external_diff
+from midi_diff.midi_utils import extract_note_records, iter_buffer_note_records
+from midi_diff.online import OnlineDiff
+
+
+def summarize(entries) -> Counter:
+    """Reduce entries to an order-independent multiset of ``(side, key, velocity, before_velocity)``."""
+    return Counter(
+        (side, record[0], record[1], None if before is None else before[1]) for side, record, before, _names in entries
+    )
+
+
+def test_file_diff_finds_every_kind_of_change(midi_pair):
+    diff, ppq = diff_files(*midi_pair, report_changes=True)
+    assert ppq == mido.MidiFile(midi_pair[0]).ticks_per_beat
+    assert diff.only_in_a_records and diff.only_in_b_records and diff.changed_records
+    assert diff_files(midi_pair[0], midi_pair[0])[0].only_in_b_records == []
+
+
+def test_external_diff_matches_in_memory(midi_pair, tmp_path):
+    records_a, records_b = (extract_note_records(path) for path in midi_pair)
+    expected = list(iter_diff(records_a, records_b))
+    budget = current_rss() + 64 * 1024 * 1024
+
+    entries = list(iter_external_diff(*midi_pair, memory_budget=budget, temp_dir=tmp_path))
+
+    assert summarize(entries) == summarize(expected)
+    keys = [record[0] for _side, record, _before, _names in entries]
+    assert keys == sorted(keys)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_external_diff_spools_compressed_input(midi_pair, tmp_path, monkeypatch):
+    compressed = tmp_path / 'a.mid.gz'
+    compressed.write_bytes(gzip.compress(midi_pair[0].read_bytes()))
+    runs = tmp_path / 'runs'
+    runs.mkdir()
+    buffers = []
+
+    def records(buf):
+        buffers.append(type(buf))
+        return iter_buffer_note_records(buf)
+
+    monkeypatch.setattr(external, 'iter_buffer_note_records', records)
+    budget = current_rss() + 8 * 1024 * 1024
+
+    entries = list(iter_external_diff(compressed, midi_pair[1], memory_budget=budget, temp_dir=runs))
+
+    assert summarize(entries) == summarize(iter_external_diff(*midi_pair, memory_budget=budget, temp_dir=runs))
+    # Both inputs are mapped, so their pages can be released while they are read.
+    assert buffers[:2] == [mmap.mmap, mmap.mmap]
+
+
+def test_memory_budget_rejects_standard_input(midi_pair, tmp_path, capsys):
+    out_file = tmp_path / 'report.jsonl'
+    core.main('-', midi_pair[1], out_file, output_format='jsonl', memory_budget=64 * 1024 * 1024)
+    assert 'standard input' in capsys.readouterr().out
+    assert not out_file.exists()
+
+
+def test_online_diff_matches_file_diff(single_track_pair):
+    diff, _ppq = diff_files(*single_track_pair, report_changes=True)
+    expected = [(SIDE_A, record, None, ()) for record in diff.only_in_a_records]
+    expected += [(SIDE_B, record, None, ()) for record in diff.only_in_b_records]
+    expected += [(SIDE_CHANGED, after, before, names) for before, after, names in diff.changed_records]
+
+    online = OnlineDiff()
+    streams = {side: iter(mido.MidiFile(path).tracks[0]) for side, path in zip((SIDE_A, SIDE_B), single_track_pair)}
+    entries = []
+    # Interleave the two sides in small chunks, as a live performance would arrive.
+    while streams:
+        for side, messages in list(streams.items()):
+            chunk = [(msg.time, msg) for _, msg in zip(range(16), messages)]
+            if chunk:
+                entries += online.feed(side, chunk, relative=True)
+            else:
+                entries += online.end(side)
+                del streams[side]
+    entries += online.close()
+
+    assert summarize(entries) == summarize(expected)
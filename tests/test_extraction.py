@@ -0,0 +1,80 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    tests/test_extraction.py
+
+Description:
+    The raw-bytes extractor must agree with mido, and windowed extraction (with or
+    without a seek index) with filtering a full extraction.
+"""
+
+from __future__ import annotations
+
+import mido
+import pytest
+
+from midi_diff.cache import DiffCache
+from midi_diff.core import load_records
+from midi_diff.midi_utils import iter_buffer_note_records, iter_note_records
+from midi_diff.note_keys import unpack_key
+from midi_diff.seek_index import SeekIndex, iter_window_records
+from midi_diff.smf import MidiFormatError
+
+from conftest import TICKS_PER_BEAT
+
+WINDOWS = [
+    (0, 1),
+    (0, 4 * TICKS_PER_BEAT),
+    (1000, 1001),
+    (17 * TICKS_PER_BEAT + 5, 60 * TICKS_PER_BEAT),
+    (150 * TICKS_PER_BEAT, 10**9),
+    (10**9, 2 * 10**9),
+]
+
+
+def in_window(records, start: int, end: int) -> list:
+    return [record for record in records if start <= unpack_key(record[0])[2] < end]
+
+
+def test_raw_extraction_matches_mido(midi_pair):
+    for path in midi_pair:
+        assert list(iter_buffer_note_records(path.read_bytes())) == list(iter_note_records(mido.MidiFile(path)))
+
+
+def test_trailing_bytes_are_ignored(midi_pair):
+    buf = midi_pair[0].read_bytes()
+    expected = list(iter_buffer_note_records(buf))
+    assert list(iter_buffer_note_records(buf + b'\0' * 7)) == expected
+    assert list(iter_buffer_note_records(buf + b'MTrk\xff\xff\xff\xff')) == expected
+
+
+def test_truncated_file_is_rejected(midi_pair):
+    buf = midi_pair[0].read_bytes()
+    with pytest.raises(MidiFormatError):
+        list(iter_buffer_note_records(buf[: len(buf) // 2]))
+
+
+@pytest.mark.parametrize('start, end', WINDOWS)
+def test_window_matches_full_extraction(midi_pair, start, end):
+    buf = midi_pair[0].read_bytes()
+    expected = in_window(list(iter_buffer_note_records(buf)), start, end)
+    index = SeekIndex.build(buf, interval=TICKS_PER_BEAT)
+
+    assert list(iter_window_records(buf, start, end)) == expected
+    assert list(iter_window_records(buf, start, end, index=index)) == expected
+
+
+def test_load_records_with_cached_seek_index(midi_pair, tmp_path):
+    buf = midi_pair[1].read_bytes()
+    full = load_records(buf)
+    cache = DiffCache(tmp_path)
+    for start, end in WINDOWS:
+        assert load_records(buf, (start, end), cache=cache) == in_window(full, start, end)
+    # One seek index serves every window, and nothing is written beside the input.
+    assert len(list(tmp_path.iterdir())) == 1
+    assert sorted(path.name for path in midi_pair[1].parent.iterdir()) == ['a.mid', 'b.mid']
@@ -0,0 +1,101 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    tests/test_fragments.py
+
+Description:
+    Fragment index: a transposed, shifted excerpt is found in the file it came from,
+    from any working directory, and indexed files that disappear are reported.
+"""
+
+from __future__ import annotations
+
+import random
+
+import pytest
+
+from midi_diff.cli.index import find_command
+from midi_diff.fragments import FragmentIndex, find_fragment
+from midi_diff.sources import iter_midi_files
+
+from conftest import TICKS_PER_BEAT, random_notes, write_midi
+
+EXCERPT = (40 * TICKS_PER_BEAT, 44 * TICKS_PER_BEAT)
+TRANSPOSITION = 3
+SHIFT = 7 * TICKS_PER_BEAT
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    rng = random.Random(42)
+    directory = tmp_path / 'corpus'
+    directory.mkdir()
+    notes = {}
+    for i in range(6):
+        notes[i] = random_notes(rng, 200, (0, 1))
+        write_midi(directory / f'f{i}.mid', [notes[i]], midi_type=0)
+
+    start, end = EXCERPT
+    excerpt = [
+        (note_start - start + SHIFT, duration, channel, pitch - TRANSPOSITION, velocity)
+        for note_start, duration, channel, pitch, velocity in notes[3]
+        if start <= note_start < end
+    ]
+    fragment = write_midi(tmp_path / 'fragment.mid', [excerpt], midi_type=0)
+    index_dir = directory / 'midi-diff.ngidx'
+    assert FragmentIndex(index_dir).add(iter_midi_files(directory)) == 6
+    return directory, index_dir, fragment
+
+
+def test_finds_transposed_excerpt(corpus):
+    directory, index_dir, fragment = corpus
+    matches = find_fragment(index_dir, fragment)
+    assert matches
+    best = matches[0]
+    assert best.score == 1.0
+    assert best.transposition == TRANSPOSITION
+    assert best.tick >= EXCERPT[0]
+    assert (directory / 'f3.mid').samefile(best.path)
+
+
+def test_search_from_another_directory(corpus, tmp_path, monkeypatch):
+    directory, index_dir, fragment = corpus
+    elsewhere = tmp_path / 'elsewhere'
+    elsewhere.mkdir()
+    monkeypatch.chdir(elsewhere)
+
+    matches = find_fragment(index_dir, fragment)
+
+    assert matches and matches[0].score == 1.0
+    assert (directory / 'f3.mid').samefile(matches[0].path)
+
+
+def test_unchanged_files_are_skipped(corpus):
+    directory, index_dir, _fragment = corpus
+    assert FragmentIndex(index_dir).add(iter_midi_files(directory)) == 0
+
+
+def test_unreadable_candidate_is_reported(corpus):
+    directory, index_dir, fragment = corpus
+    (directory / 'f3.mid').unlink()
+    errors = []
+
+    matches = find_fragment(index_dir, fragment, on_error=lambda path, e: errors.append((path, e)))
+
+    assert matches == []
+    assert len(errors) == 1
+    assert errors[0][0].name == 'f3.mid'
+    assert isinstance(errors[0][1], FileNotFoundError)
+
+
+def test_find_command_accepts_corpus_directory(corpus, capsys):
+    directory, _index_dir, fragment = corpus
+    find_command(str(fragment), str(directory), min_score=0.9, top_k=1)
+    out = capsys.readouterr().out
+    assert out.startswith('1.000  +3 st')
+    assert 'f3.mid' in out
@@ -0,0 +1,99 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    tests/test_gitdriver.py
+
+Description:
+    Git textconv and external diff driver: listings, summaries, the blob note cache,
+    and errors that must reach standard error rather than a traceback.
+"""
+
+from __future__ import annotations
+
+from midi_diff.cache import DiffCache
+from midi_diff.cli.git import git_driver_command, textconv_command
+from midi_diff.gitdriver import NULL_PATH, git_blob_id, load_blob_notes, pitch_name
+
+from conftest import write_midi
+
+OLD_NOTES = [(0, 480, 0, 60, 90), (480, 480, 0, 64, 90), (960, 480, 0, 67, 90)]
+NEW_NOTES = [(0, 480, 0, 60, 100), (480, 480, 0, 64, 90), (1440, 480, 0, 72, 90)]
+
+
+def test_blob_id_matches_git():
+    assert git_blob_id(b'') == 'e69de29bb2d1d6434b8b29ae775ad8c2e48c5391'
+    assert git_blob_id(b'hello\n') == 'ce013625030ba8dba906f756967f9e9ca394464a'
+
+
+def test_pitch_names():
+    assert [pitch_name(p) for p in (0, 60, 61, 127)] == ['C-1', 'C4', 'C#4', 'G9']
+
+
+def test_textconv_lists_notes(tmp_path, capsys):
+    path = write_midi(tmp_path / 'song.mid', [OLD_NOTES])
+    textconv_command(str(path), use_cache=False)
+    out = capsys.readouterr()
+    assert out.out.splitlines() == [
+        'MIDI 480 ticks/beat, 3 notes',
+        '0 +480 C4 ch0 v90 t1',
+        '480 +480 E4 ch0 v90 t1',
+        '960 +480 G4 ch0 v90 t1',
+    ]
+    assert out.err == ''
+
+
+def test_textconv_reports_truncated_file(tmp_path, capsys):
+    data = write_midi(tmp_path / 'song.mid', [OLD_NOTES]).read_bytes()
+    truncated = tmp_path / 'truncated.mid'
+    truncated.write_bytes(data[: len(data) - 6])
+
+    textconv_command(str(truncated), use_cache=False)
+
+    out = capsys.readouterr()
+    assert out.out == ''
+    assert out.err.startswith(f'midi-diff textconv: {truncated}: ')
+
+
+def test_git_driver_summary(tmp_path, capsys):
+    old = write_midi(tmp_path / 'old.mid', [OLD_NOTES])
+    new = write_midi(tmp_path / 'new.mid', [NEW_NOTES])
+    args = ['song.mid', str(old), '0' * 40, '100644', str(new), '0' * 40, '100644']
+
+    git_driver_command(args, use_cache=False)
+
+    assert capsys.readouterr().out.splitlines() == [
+        'diff --midi a/song.mid b/song.mid',
+        'notes: 3 → 3 (-1 +1 ~1)',
+        '~ 0 +480 C4 ch0 v90→100 t1',
+        '- 960 +480 G4 ch0 v90 t1',
+        '+ 1440 +480 C5 ch0 v90 t1',
+    ]
+
+
+def test_git_driver_added_file_and_errors(tmp_path, capsys):
+    new = write_midi(tmp_path / 'new.mid', [NEW_NOTES])
+    git_driver_command(['song.mid', NULL_PATH, '.', '.', str(new), '0' * 40, '100644'], use_cache=False)
+    assert 'notes: 0 → 3 (-0 +3 ~0)' in capsys.readouterr().out
+
+    garbage = tmp_path / 'garbage.mid'
+    garbage.write_bytes(b'MThd\0\0\0\6\0\1\0\1\1\xe0MTrk\0\0\1\0')
+    git_driver_command(['song.mid', str(garbage), '.', '.', str(new), '0' * 40, '100644'], use_cache=False)
+    out = capsys.readouterr()
+    assert out.out == ''
+    assert out.err.startswith('midi-diff git-driver: song.mid: ')
+
+
+def test_blob_notes_are_cached_by_id(tmp_path):
+    path = write_midi(tmp_path / 'song.mid', [OLD_NOTES])
+    blob_id = git_blob_id(path.read_bytes())
+    cache = DiffCache(tmp_path / 'cache')
+
+    first = load_blob_notes(path, blob_id, cache)
+    path.write_bytes(b'not read again')
+    assert load_blob_notes(path, blob_id, cache) == first
+    assert first[0] == 480 and len(first[1]) == 3
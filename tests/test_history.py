@@ -0,0 +1,74 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    tests/test_history.py
+
+Description:
+    History: chained diffs between versions and the presence timeline of each note.
+"""
+
+from __future__ import annotations
+
+from midi_diff.cli.history import history_command
+from midi_diff.history import PresenceTimeline, Version, iter_chain, load_version
+from midi_diff.note_keys import pack_key
+
+from conftest import write_midi
+
+C4 = pack_key(60, 0, 0, 480)
+E4 = pack_key(64, 0, 480, 480)
+G4 = pack_key(67, 0, 960, 480)
+
+
+def chain(*versions: list) -> PresenceTimeline:
+    timeline = PresenceTimeline()
+    list(iter_chain((Version(f'v{i}', 480, records) for i, records in enumerate(versions)), timeline))
+    return timeline
+
+
+def test_timeline_tracks_removal_and_return():
+    timeline = chain(
+        [(C4, 90, 0), (E4, 90, 0)],
+        [(C4, 90, 0), (G4, 90, 0)],
+        [(C4, 90, 0), (E4, 90, 0), (G4, 90, 0)],
+    )
+    assert [timeline.present(E4, i) for i in range(3)] == [True, False, True]
+    assert timeline.first_disappearance(E4) == 1
+    assert timeline.first_disappearance(E4, 1) is None
+    assert timeline.toggles[G4] == [1]
+    assert timeline.first_disappearance(C4) is None
+
+
+def test_note_doubled_on_two_tracks_toggles_once():
+    timeline = chain([(C4, 90, 1), (C4, 90, 2), (E4, 90, 1)], [(E4, 90, 1)])
+    assert timeline.present(C4, 0)
+    assert not timeline.present(C4, 1)
+    assert timeline.first_disappearance(C4) == 1
+
+
+def test_history_command_traces_notes(tmp_path, capsys):
+    v1 = write_midi(tmp_path / 'v1.mid', [[(0, 480, 0, 60, 90), (480, 480, 0, 64, 90)], [(0, 480, 0, 60, 90)]])
+    v2 = write_midi(tmp_path / 'v2.mid', [[(480, 480, 0, 64, 90)]])
+    assert load_version(v1).ticks_per_beat == 480
+
+    history_command([str(v1), str(v2)], git=False, window=None, notes=[(60, 0)], use_cache=False)
+
+    out = capsys.readouterr().out
+    assert f'{v1} → {v2}: -1 +0 ~0' in out
+    assert f'removed in {v2}' in out
+
+
+def test_history_command_reports_truncated_version(tmp_path, capsys):
+    v1 = write_midi(tmp_path / 'v1.mid', [[(0, 480, 0, 60, 90)]])
+    data = v1.read_bytes()
+    truncated = tmp_path / 'truncated.mid'
+    truncated.write_bytes(data[: len(data) - 6])
+
+    history_command([str(v1), str(truncated)], git=False, window=None, notes=[], use_cache=False)
+
+    assert f'Failed to read version {truncated}' in capsys.readouterr().out
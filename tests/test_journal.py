@@ -0,0 +1,88 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    tests/test_journal.py
+
+Description:
+    Checkpoint journal and batch resume: torn lines are dropped, finished pairs are
+    skipped from any working directory, and changed inputs are diffed again.
+"""
+
+from __future__ import annotations
+
+import random
+
+import pytest
+
+from midi_diff.batch import DEFAULT_JOURNAL_NAME
+from midi_diff.cli.batch import batch_command
+from midi_diff.journal import Journal, read_journal
+
+from conftest import edit_notes, random_notes, write_midi
+
+
+@pytest.fixture
+def trees(tmp_path):
+    rng = random.Random(11)
+    dir_a, dir_b = tmp_path / 'old', tmp_path / 'new'
+    for name in ('one.mid', 'sub/two.mid', 'three.mid'):
+        notes = random_notes(rng, 100, (0,))
+        (dir_a / name).parent.mkdir(parents=True, exist_ok=True)
+        (dir_b / name).parent.mkdir(parents=True, exist_ok=True)
+        write_midi(dir_a / name, [notes])
+        write_midi(dir_b / name, [edit_notes(rng, notes)])
+    return dir_a, dir_b
+
+
+def run_batch(dir_a, dir_b, out_dir, capsys, resume=False) -> str:
+    batch_command(str(dir_a), str(dir_b), str(out_dir), 'jsonl', False, 1, resume=resume)
+    return capsys.readouterr().out
+
+
+def test_torn_line_is_dropped(tmp_path):
+    path = tmp_path / 'journal.jsonl'
+    with Journal(path) as journal:
+        journal.append({'name': 'a'})
+        journal.append({'name': 'b'})
+    with open(path, 'ab') as fh:
+        fh.write(b'{"v":1,"name":"c"')
+    assert [record['name'] for record in read_journal(path)] == ['a', 'b']
+
+    with Journal(path, resume=True) as journal:
+        journal.append({'name': 'd'})
+    assert [record['name'] for record in read_journal(path)] == ['a', 'b', 'd']
+
+
+def test_resume_from_another_directory(trees, tmp_path, monkeypatch, capsys):
+    dir_a, dir_b = trees
+    monkeypatch.chdir(tmp_path)
+    out = run_batch('old', 'new', 'diffs', capsys)
+    assert 'Diffed 3 of 3 pairs' in out
+    outputs = sorted(record['output'] for record in read_journal(tmp_path / 'diffs' / DEFAULT_JOURNAL_NAME))
+    assert outputs == ['one.jsonl', 'sub/two.jsonl', 'three.jsonl']
+
+    elsewhere = tmp_path / 'elsewhere'
+    elsewhere.mkdir()
+    monkeypatch.chdir(elsewhere)
+    out = run_batch(dir_a, dir_b, tmp_path / 'diffs', capsys, resume=True)
+    assert 'Resuming: 3 pairs already diffed' in out
+    assert 'Diffed 0 of 3 pairs (3 resumed' in out
+
+
+def test_resume_rediffs_changed_and_missing_outputs(trees, tmp_path, capsys):
+    dir_a, dir_b = trees
+    out_dir = tmp_path / 'diffs'
+    run_batch(dir_a, dir_b, out_dir, capsys)
+    write_midi(dir_b / 'one.mid', [random_notes(random.Random(5), 50, (0,))])
+    (out_dir / 'three.jsonl').unlink()
+
+    out = run_batch(dir_a, dir_b, out_dir, capsys, resume=True)
+
+    assert 'Resuming: 1 pairs already diffed' in out
+    assert 'Diffed 2 of 3 pairs (1 resumed' in out
+    assert 'one.mid:' in out and 'three.mid:' in out and 'two.mid:' not in out
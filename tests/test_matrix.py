@@ -0,0 +1,104 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    tests/test_matrix.py
+
+Description:
+    All-pairs matrix: blocked parallel results match a direct comparison of every pair,
+    unreadable files are reported, the .npy output round-trips, and a journaled run
+    resumes without comparing again.
+"""
+
+from __future__ import annotations
+
+import io
+import random
+
+import pytest
+
+from midi_diff.journal import Journal, read_journal
+from midi_diff.matrix import METRIC_COUNTS, distance_matrix, note_table, read_npy, write_csv, write_npy
+
+from conftest import edit_notes, random_notes, write_midi
+
+
+@pytest.fixture(scope='module')
+def corpus(tmp_path_factory):
+    rng = random.Random(38)
+    directory = tmp_path_factory.mktemp('matrix')
+    base = [random_notes(rng, 150, (0,)) for _ in range(3)]
+    paths = []
+    for i, notes in enumerate(base):
+        paths.append(write_midi(directory / f'f{i}.mid', [notes], midi_type=0))
+        paths.append(write_midi(directory / f'f{i}-edit.mid', [edit_notes(rng, notes)], midi_type=0))
+    return paths
+
+
+def key_sets(paths) -> list[set[int]]:
+    return [{record[0] for record in note_table(path)} for path in paths]
+
+
+def test_jaccard_matches_direct_comparison(corpus):
+    matrix = distance_matrix(corpus, workers=2, block=2, prefilter=0)
+    sets = key_sets(corpus)
+    assert matrix.paths == [str(path) for path in corpus]
+    assert matrix.estimated == 0
+    for i, a in enumerate(sets):
+        for j, b in enumerate(sets):
+            assert matrix.value(i, j) == pytest.approx(1 - len(a & b) / len(a | b))
+
+
+def test_counts_are_only_in_a(corpus):
+    matrix = distance_matrix(corpus, metric=METRIC_COUNTS, workers=2, block=4, prefilter=0)
+    sets = key_sets(corpus)
+    for i, a in enumerate(sets):
+        for j, b in enumerate(sets):
+            assert matrix.value(i, j) == len(a - b)
+
+
+def test_prefilter_estimates_unrelated_pairs(corpus):
+    matrix = distance_matrix(corpus, workers=2, num_perm=64, prefilter=0.5)
+    # Each file shares most notes with its edit and almost none with the others.
+    assert 0 < matrix.estimated <= len(corpus) * (len(corpus) - 1) // 2 - 3
+    assert matrix.value(0, 1) < 0.5 and matrix.value(0, 2) > 0.9
+
+
+def test_unreadable_file_is_reported(corpus, tmp_path):
+    broken = tmp_path / 'broken.mid'
+    broken.write_bytes(b'MThd\0\0\0\6\0\1\0\1\1\xe0MTrk\0\0\1\0')
+    errors = []
+    matrix = distance_matrix([*corpus[:2], broken], workers=1, on_error=lambda path, e: errors.append(path))
+    assert errors == [broken]
+    assert len(matrix) == 2
+
+
+def test_outputs_round_trip(corpus):
+    matrix = distance_matrix(corpus[:3], workers=1, prefilter=0)
+    out = io.BytesIO()
+    write_npy(matrix, out)
+    out.seek(0)
+    assert read_npy(out) == ((3, 3), matrix.values)
+
+    text = io.StringIO(newline='')
+    write_csv(matrix, text)
+    rows = text.getvalue().splitlines()
+    assert rows[0] == ','.join(['path', *matrix.paths])
+    assert rows[1].startswith(f'{matrix.paths[0]},0.000000,')
+
+
+def test_resume_skips_journaled_blocks(corpus, tmp_path):
+    with Journal(tmp_path / 'first.jsonl') as journal:
+        first = distance_matrix(corpus, workers=2, block=2, prefilter=0, journal=journal)
+    records = read_journal(tmp_path / 'first.jsonl')
+    assert len(records) == 6  # the upper triangle of 3 x 3 blocks
+
+    with Journal(tmp_path / 'second.jsonl') as journal:
+        second = distance_matrix(corpus, workers=2, block=2, prefilter=0, journal=journal, resume_from=records)
+
+    assert second.values == first.values
+    assert read_journal(tmp_path / 'second.jsonl') == []
@@ -0,0 +1,87 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    tests/test_metrics.py
+
+Description:
+    Metrics: histogram quantiles and Prometheus rendering, merging worker snapshots,
+    the stages a real diff records, and the local /metrics endpoint.
+"""
+
+from __future__ import annotations
+
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from midi_diff import core
+from midi_diff.metrics import STAGES, Histogram, Registry, active, collecting, observe_diff
+
+
+def test_histogram_quantiles_and_rendering():
+    histogram = Histogram('h', 'help', (), threading.Lock(), buckets=(1.0, 2.0, 4.0))
+    for value in (0.5, 1.5, 1.5, 3.0, 10.0):
+        histogram.observe(value)
+    assert histogram.quantile(0.5) == pytest.approx(1.75)
+    assert histogram.quantile(1.0) == 4.0
+    assert histogram.describe()['count'] == 5
+    assert histogram.render()[2:] == [
+        'h_bucket{le="1"} 1',
+        'h_bucket{le="2"} 3',
+        'h_bucket{le="4"} 4',
+        'h_bucket{le="+Inf"} 5',
+        'h_sum 16.5',
+        'h_count 5',
+    ]
+
+
+def test_snapshots_merge():
+    parent = Registry()
+    for seconds in (0.01, 0.02):
+        with collecting() as worker:
+            observe_diff(seconds, {'a': 2, 'b': 1})
+        parent.merge(worker.snapshot())
+    summary = parent.summary()
+    assert summary['diffs'] == {'ok': 2, 'failed': 0}
+    assert summary['differences'] == {'a': 4, 'b': 2}
+    assert summary['latency_seconds']['count'] == 2
+
+
+def test_diff_records_every_stage(midi_pair, tmp_path, capsys):
+    assert active() is None
+    with collecting() as registry:
+        core.main(*midi_pair, tmp_path / 'diff.jsonl', output_format='jsonl')
+    assert active() is None
+    capsys.readouterr()
+
+    summary = registry.summary()
+    assert summary['diffs'] == {'ok': 1, 'failed': 0}
+    assert all(summary['stages'][stage]['count'] == 1 for stage in STAGES)
+    assert summary['notes'] > 0
+    rows = (tmp_path / 'diff.jsonl').read_text().splitlines()
+    assert sum(summary['differences'].values()) == len(rows)
+    assert 'midi_diff_diffs_total{result="ok"} 1' in registry.render_prometheus()
+
+
+def test_metrics_endpoint():
+    registry = Registry()
+    registry.diffs.inc(labels=('ok',))
+    server = registry.serve(0)
+    try:
+        port = server.server_address[1]
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics') as response:
+            body = response.read().decode('utf-8')
+            assert response.headers['Content-Type'].startswith('text/plain')
+        assert 'midi_diff_diffs_total{result="ok"} 1' in body
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/other')
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,66 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    tests/test_note_keys.py
+
+Description:
+    Packed note keys: fields round-trip, keys sort by start tick, every key fits the
+    64-bit on-disk encoding, and fields outside their widths are rejected.
+"""
+
+from __future__ import annotations
+
+import random
+
+import pytest
+
+from midi_diff.note_keys import (
+    DURATION_MAX,
+    START_MAX,
+    keys_from_bytes,
+    keys_to_bytes,
+    pack_key,
+    unpack_key,
+)
+
+EXTREMES = [(0, 0, 0, 0), (127, 15, START_MAX, DURATION_MAX), (60, 9, 480, 1)]
+
+
+@pytest.mark.parametrize('fields', EXTREMES)
+def test_fields_round_trip(fields):
+    assert unpack_key(pack_key(*fields)) == fields
+
+
+def test_keys_sort_by_start_then_duration():
+    rng = random.Random(3)
+    fields = [(rng.randrange(128), rng.randrange(16), rng.randrange(5000), rng.randrange(1, 2000)) for _ in range(500)]
+    keys = sorted(pack_key(*f) for f in fields)
+    starts = [(unpack_key(key)[2], unpack_key(key)[3]) for key in keys]
+    assert starts == sorted(starts)
+
+
+def test_keys_fit_disk_encoding():
+    keys = [pack_key(*fields) for fields in EXTREMES]
+    assert list(keys_from_bytes(keys_to_bytes(keys))) == keys
+
+
+@pytest.mark.parametrize(
+    'fields, name',
+    [
+        ((128, 0, 0, 1), 'pitch'),
+        ((-1, 0, 0, 1), 'pitch'),
+        ((60, 16, 0, 1), 'channel'),
+        ((60, 0, START_MAX + 1, 1), 'start'),
+        ((60, 0, -480, 1), 'start'),
+        ((60, 0, 0, DURATION_MAX + 1), 'duration'),
+        ((60, 0, 0, -1), 'duration'),
+    ],
+)
+def test_out_of_range_fields_are_rejected(fields, name):
+    with pytest.raises(ValueError, match=f'^{name} must be in'):
+        pack_key(*fields)
@@ -0,0 +1,91 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    tests/test_outputs.py
+
+Description:
+    Output allocation: taken names get the next free ``stem_N``, concurrent writers
+    never share a file, and atomic writes leave either the whole output or nothing.
+"""
+
+from __future__ import annotations
+
+import os
+import stat
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from midi_diff.outputs import allocate_output_path, atomic_output, replace_output, write_atomic
+
+
+def iter_failing():
+    yield b'x'
+    raise ValueError('chunk failed')
+
+
+def test_allocation_skips_taken_names(tmp_path):
+    assert allocate_output_path(tmp_path / 'diff.mid') == tmp_path / 'diff.mid'
+    assert allocate_output_path(tmp_path / 'diff.mid') == tmp_path / 'diff_1.mid'
+    (tmp_path / 'report_7.jsonl').touch()
+    (tmp_path / 'report.jsonl').touch()
+    assert allocate_output_path(tmp_path / 'report', '.jsonl') == tmp_path / 'report_8.jsonl'
+
+
+def test_allocation_resyncs_with_other_writers(tmp_path):
+    assert allocate_output_path(tmp_path / 'x.mid').name == 'x.mid'
+    # Another process claims the names this one would try next.
+    for index in (1, 2, 5):
+        (tmp_path / f'x_{index}.mid').touch()
+    assert allocate_output_path(tmp_path / 'x.mid').name == 'x_6.mid'
+
+
+def test_concurrent_allocations_are_distinct(tmp_path):
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        paths = list(pool.map(lambda _: allocate_output_path(tmp_path / 'out' / 'diff.mid'), range(64)))
+    assert len(set(paths)) == 64
+    assert len(os.listdir(tmp_path / 'out')) == 64
+
+
+def test_atomic_output_writes_whole_file(tmp_path):
+    with atomic_output(tmp_path / 'diff.mid') as (fh, final):
+        fh.write(b'data')
+        assert final.read_bytes() == b''
+    assert final.read_bytes() == b'data'
+    assert os.listdir(tmp_path) == ['diff.mid']
+
+
+def test_atomic_output_cleans_up_on_failure(tmp_path):
+    with pytest.raises(RuntimeError), atomic_output(tmp_path / 'diff.mid') as (fh, _final):
+        fh.write(b'partial')
+        raise RuntimeError('render failed')
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='POSIX permissions')
+def test_replace_output_keeps_mode(tmp_path):
+    path = tmp_path / 'live.jsonl'
+    path.write_bytes(b'old')
+    os.chmod(path, 0o640)
+    with replace_output(path) as fh:
+        fh.write(b'new')
+    assert path.read_bytes() == b'new'
+    assert stat.S_IMODE(path.stat().st_mode) == 0o640
+    assert os.listdir(tmp_path) == ['live.jsonl']
+
+
+def test_write_atomic_replaces_contents(tmp_path):
+    path = tmp_path / 'index.bin'
+    write_atomic(path, [b'a', b'b'])
+    write_atomic(path, [b'c'])
+    assert path.read_bytes() == b'c'
+    with pytest.raises(ValueError):
+        write_atomic(path, iter_failing())
+    assert path.read_bytes() == b'c'
+    assert os.listdir(tmp_path) == ['index.bin']
@@ -0,0 +1,92 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    tests/test_provenance.py
+
+Description:
+    Multi-track diff output: notes keep their source track, side and channel, and
+    every track carries its source's names, program changes and the conductor's tempo.
+"""
+
+from __future__ import annotations
+
+import mido
+import pytest
+
+from midi_diff import core
+from midi_diff.report import FORMAT_TRACKS
+
+from conftest import TICKS_PER_BEAT, build_track
+
+PIANO = [(0, 480, 0, 60, 90), (480, 480, 0, 64, 90), (960, 480, 0, 67, 90)]
+BASS = [(0, 960, 1, 36, 100), (960, 960, 1, 43, 100)]
+
+
+def write_song(path, tracks, programs):
+    mid = mido.MidiFile(type=1, ticks_per_beat=TICKS_PER_BEAT)
+    conductor = mido.MidiTrack()
+    conductor.append(mido.MetaMessage('set_tempo', tempo=500000, time=0))
+    conductor.append(mido.MetaMessage('time_signature', numerator=3, denominator=4, time=0))
+    conductor.append(mido.MetaMessage('set_tempo', tempo=400000, time=960))
+    mid.tracks.append(conductor)
+    for (name, notes), program in zip(tracks, programs):
+        track = build_track(notes, name=name)
+        track.insert(1, mido.Message('program_change', channel=notes[0][2], program=program, time=0))
+        mid.tracks.append(track)
+    mid.save(path)
+    return path
+
+
+@pytest.fixture
+def song_pair(tmp_path):
+    a = write_song(tmp_path / 'a.mid', [('Piano', PIANO), ('Bass', BASS)], [0, 33])
+    # The piano's last note moves up a tone and the bass's first note gets louder.
+    piano_b = PIANO[:2] + [(960, 480, 0, 69, 90)]
+    bass_b = [(0, 960, 1, 36, 120)] + BASS[1:]
+    b = write_song(tmp_path / 'b.mid', [('Piano', piano_b), ('Bass', bass_b)], [0, 33])
+    return a, b
+
+
+def run_tracks(song_pair, out_file, **options) -> mido.MidiFile:
+    core.main(*song_pair, out_file, output_format=FORMAT_TRACKS, report_changes=True, **options)
+    return mido.MidiFile(out_file)
+
+
+def absolute(track) -> list:
+    tick, events = 0, []
+    for msg in track:
+        tick += msg.time
+        events.append((tick, msg))
+    return events
+
+
+def test_tracks_keep_source_context(song_pair, tmp_path):
+    mid = run_tracks(song_pair, tmp_path / 'diff.mid')
+
+    assert mid.type == 1
+    tempos = [(tick, msg.tempo) for tick, msg in absolute(mid.tracks[0]) if msg.type == 'set_tempo']
+    assert tempos == [(0, 500000), (960, 400000)]
+    assert any(msg.type == 'time_signature' for msg in mid.tracks[0])
+
+    by_name = {track.name: track for track in mid.tracks[1:]}
+    assert sorted(by_name) == ['changed: Bass', 'only in A: Piano', 'only in B: Piano']
+    assert [msg.note for msg in by_name['only in A: Piano'] if msg.type == 'note_on'] == [67]
+    assert [msg.note for msg in by_name['only in B: Piano'] if msg.type == 'note_on'] == [69]
+    bass = [msg for msg in by_name['changed: Bass'] if msg.type in ('note_on', 'program_change')]
+    assert [(msg.type, msg.channel) for msg in bass] == [('program_change', 1), ('note_on', 1)]
+    assert bass[0].program == 33 and bass[1].velocity == 120
+
+
+def test_tracks_are_rescaled(song_pair, tmp_path):
+    mid = run_tracks(song_pair, tmp_path / 'diff.mid', ppq=960)
+
+    assert mid.ticks_per_beat == 960
+    tempos = [tick for tick, msg in absolute(mid.tracks[0]) if msg.type == 'set_tempo']
+    assert tempos == [0, 1920]
+    notes = [(tick, msg.note) for track in mid.tracks[1:] for tick, msg in absolute(track) if msg.type == 'note_on']
+    assert sorted(notes) == [(0, 36), (1920, 67), (1920, 69)]
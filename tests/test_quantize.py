@@ -0,0 +1,84 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    tests/test_quantize.py
+
+Description:
+    Quantized matching: grid slots with and without swing, and a loosely played take
+    matching its quantized score at another resolution.
+"""
+
+from __future__ import annotations
+
+import random
+
+import mido
+import pytest
+
+from midi_diff.core import diff_files
+from midi_diff.note_keys import pack_key, unpack_key
+from midi_diff.quantize import Grid, quantize_records
+
+from conftest import TICKS_PER_BEAT, build_track
+
+
+def write_notes(path, notes, ticks_per_beat: int):
+    mid = mido.MidiFile(type=0, ticks_per_beat=ticks_per_beat)
+    mid.tracks.append(build_track(notes))
+    mid.save(path)
+    return path
+
+
+def test_straight_grid_slots():
+    grid = Grid(16)
+    # Sixteenths are 120 ticks apart at 480 ticks per beat; ties go to the later line.
+    assert [grid.slot(tick, 480) for tick in (0, 59, 60, 119, 180, 181)] == [0, 0, 1, 1, 2, 2]
+    # The same positions at twice the resolution fall in the same slots.
+    assert [grid.slot(2 * tick, 960) for tick in (0, 59, 60, 119, 180, 181)] == [0, 0, 1, 1, 2, 2]
+
+
+def test_swung_grid_slots():
+    grid = Grid(8, swing=66)
+    # The off-beat eighth sits at 66 % of the 480-tick pair, at tick 316.8.
+    assert [grid.slot(tick, 480) for tick in (158, 159, 398, 399, 480)] == [0, 1, 1, 2, 2]
+
+
+@pytest.mark.parametrize('division, swing', [(0, 50), (16, 49), (16, 76)])
+def test_invalid_grids(division, swing):
+    with pytest.raises(ValueError):
+        Grid(division, swing)
+
+
+def test_short_notes_keep_one_slot():
+    records = [(pack_key(60, 0, 475, 10), 90, 0)]
+    snapped, origin = quantize_records(records, TICKS_PER_BEAT, Grid(16))
+    assert unpack_key(snapped[0][0]) == (60, 0, 4, 1)
+    assert origin[snapped[0][0]] == records[0][0]
+
+
+def test_played_take_matches_score(tmp_path):
+    rng = random.Random(43)
+    step = TICKS_PER_BEAT // 4
+    # Neighbouring notes never share a pitch, so jitter cannot reorder a pitch's on/off pairs.
+    score = [(2 * i * step, rng.randrange(1, 4) * step, 0, 36 + i % 48, 90) for i in range(150)]
+    played = []
+    for start, duration, channel, pitch, velocity in score:
+        # Both ends stay within half a sixteenth (60 ticks) of the grid line.
+        new_start = max(0, start + rng.randrange(-50, 51))
+        new_end = start + duration + rng.randrange(-50, 51)
+        played.append((new_start, new_end - new_start, channel, pitch, velocity))
+    doubled = [(2 * start, 2 * duration, channel, pitch, velocity) for start, duration, channel, pitch, velocity in score]
+    take = write_notes(tmp_path / 'take.mid', played, TICKS_PER_BEAT)
+    notated = write_notes(tmp_path / 'score.mid', doubled, 2 * TICKS_PER_BEAT)
+
+    exact, _ppq = diff_files(take, notated)
+    assert exact.only_in_a_records
+
+    snapped, ppq = diff_files(take, notated, quantize=Grid(16))
+    assert ppq == TICKS_PER_BEAT
+    assert snapped.only_in_a_records == [] and snapped.only_in_b_records == []
@@ -0,0 +1,95 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    tests/test_report.py
+
+Description:
+    Structured reports must decode back to exactly the entries that were written.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import json
+from collections import Counter
+
+import pytest
+
+from midi_diff.core import stream_diff_files
+from midi_diff.note_keys import unpack_key
+from midi_diff.report import (
+    FORMAT_BIN,
+    FORMAT_CSV,
+    FORMAT_JSONL,
+    REPORT_FIELDS,
+    iter_binary_report,
+    read_binary_header,
+    write_report,
+)
+
+
+def expected_rows(entries) -> list[tuple]:
+    rows = []
+    for side, (key, velocity, track), before, _names in entries:
+        pitch, channel, start, duration = unpack_key(key)
+        rows.append((side, pitch, start, duration, velocity, channel, track, None if before is None else before[1]))
+    return rows
+
+
+def read_jsonl(data: bytes) -> list[tuple]:
+    rows = [json.loads(line) for line in data.decode('utf-8').splitlines()]
+    assert all(list(row) == list(REPORT_FIELDS) for row in rows)
+    return [tuple(row.values()) for row in rows]
+
+
+def read_csv(data: bytes) -> list[tuple]:
+    reader = csv.reader(io.StringIO(data.decode('utf-8'), newline=''))
+    assert next(reader) == list(REPORT_FIELDS)
+    return [(side, *map(int, numbers), int(before) if before else None) for side, *numbers, before in reader]
+
+
+def read_bin(data: bytes) -> list[tuple]:
+    return list(iter_binary_report(data))
+
+
+READERS = {FORMAT_JSONL: read_jsonl, FORMAT_CSV: read_csv, FORMAT_BIN: read_bin}
+
+
+@pytest.fixture(scope='module')
+def diff_entries(midi_pair) -> tuple[list, int]:
+    entries, ppq = stream_diff_files(*midi_pair, report_changes=True)
+    return list(entries), ppq
+
+
+@pytest.mark.parametrize('output_format', sorted(READERS))
+def test_report_round_trip(diff_entries, output_format):
+    entries, ppq = diff_entries
+    out = io.BytesIO()
+
+    counts = write_report(iter(entries), output_format, out, ppq)
+
+    assert counts == Counter(entry[0] for entry in entries)
+    assert READERS[output_format](out.getvalue()) == expected_rows(entries)
+    if output_format == FORMAT_BIN:
+        assert read_binary_header(out.getvalue()) == ppq
+
+
+def test_empty_report_round_trip():
+    for output_format, reader in READERS.items():
+        out = io.BytesIO()
+        write_report([], output_format, out, 96)
+        assert reader(out.getvalue()) == []
+
+
+def test_binary_report_rejects_partial_record(diff_entries):
+    entries, ppq = diff_entries
+    out = io.BytesIO()
+    write_report(entries, FORMAT_BIN, out, ppq)
+    with pytest.raises(ValueError):
+        list(iter_binary_report(out.getvalue()[:-1]))
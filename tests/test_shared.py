@@ -0,0 +1,90 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    tests/test_shared.py
+
+Description:
+    Shared-memory note tables: records round-trip through a block, another process
+    can attach to it and diff the views directly, and handles clean up after themselves.
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import pytest
+
+from midi_diff.diff import diff_records
+from midi_diff.midi_utils import extract_note_records
+from midi_diff.shared import SharedNoteTables, share_notes
+
+
+def diff_in_worker(name: str) -> tuple[int, int, int]:
+    """Attach to a two-table block and diff its tables."""
+    with SharedNoteTables.attach(name) as tables:
+        diff = diff_records(tables[0], tables[1])
+        return len(diff.only_in_a_records), len(diff.only_in_b_records), len(diff.changed_records)
+
+
+def test_tables_round_trip(midi_pair):
+    records = [extract_note_records(path) for path in midi_pair]
+    with SharedNoteTables.create([records[0], [], records[1]]) as tables:
+        assert len(tables) == 3
+        assert tables.total == len(records[0]) + len(records[1])
+        assert list(tables[0]) == records[0]
+        assert list(tables[1]) == []
+        assert list(tables[-1]) == records[1]
+        assert tables[2][5] == records[1][5]
+        with pytest.raises(IndexError):
+            tables[3]
+
+
+def test_worker_diffs_attached_views(midi_pair):
+    records = [extract_note_records(path) for path in midi_pair]
+    expected = diff_records(*records)
+
+    with SharedNoteTables.create(records) as tables:
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context()) as pool:
+            counts = pool.submit(diff_in_worker, tables.name).result()
+
+    assert counts == (
+        len(expected.only_in_a_records),
+        len(expected.only_in_b_records),
+        len(expected.changed_records),
+    )
+
+
+def test_attached_views_are_read_only(midi_pair):
+    records = extract_note_records(midi_pair[0])
+    with share_notes(records) as owner:
+        with SharedNoteTables.attach(owner.name) as attached:
+            view = attached[0]
+            assert view.keys.readonly
+            assert list(view) == records
+            del view
+
+
+def test_block_is_unlinked_on_exit():
+    with share_notes([(1, 64, 0)]) as tables:
+        name = tables.name
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name)
+
+
+def test_rejects_foreign_blocks_and_wide_tracks():
+    block = shared_memory.SharedMemory(create=True, size=64)
+    try:
+        with pytest.raises(ValueError):
+            SharedNoteTables.attach(block.name)
+    finally:
+        block.close()
+        block.unlink()
+    with pytest.raises(ValueError):
+        share_notes([(1, 64, 0x10000)])
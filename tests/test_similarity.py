@@ -0,0 +1,103 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    tests/test_similarity.py
+
+Description:
+    MinHash/LSH similarity index: near-duplicates are found and verified from any
+    working directory, rebuilds reuse unchanged sketches, and hashes are portable.
+"""
+
+from __future__ import annotations
+
+import random
+
+import pytest
+
+from midi_diff import similarity
+from midi_diff.cli.index import index_query_command
+from midi_diff.note_keys import stable_hash
+from midi_diff.similarity import SimilarityIndex, build_index, query_index
+from midi_diff.sources import iter_midi_files
+
+from conftest import random_notes, write_midi
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    rng = random.Random(7)
+    directory = tmp_path / 'corpus'
+    directory.mkdir()
+    notes = [random_notes(rng, 300, (0,)) for _ in range(8)]
+    for i, file_notes in enumerate(notes):
+        write_midi(directory / f'f{i}.mid', [file_notes], midi_type=0)
+    # A light edit of f5: a few notes dropped, the rest kept.
+    edited = [note for i, note in enumerate(notes[5]) if i % 40]
+    query = write_midi(tmp_path / 'query.mid', [edited], midi_type=0)
+    index_path = directory / similarity.DEFAULT_INDEX_NAME
+    assert build_index(iter_midi_files(directory), index_path) == 8
+    return directory, index_path, query
+
+
+def test_stable_hash_is_fixed():
+    # Persisted in indexes: these values must never change between builds.
+    assert stable_hash([1, 2, 3]) == 13041116711478803063
+    assert stable_hash([-1, 2**63]) == 11784376789966194157
+
+
+def test_query_finds_near_duplicate(corpus):
+    directory, index_path, query = corpus
+    matches = query_index(index_path, query, top_k=3)
+    assert (directory / 'f5.mid').samefile(matches[0].path)
+    assert 0.5 < matches[0].similarity < 1.0
+    assert matches[0].estimate > 0.3
+
+
+def test_query_from_another_directory(corpus, tmp_path, monkeypatch):
+    directory, index_path, query = corpus
+    elsewhere = tmp_path / 'elsewhere'
+    elsewhere.mkdir()
+    monkeypatch.chdir(elsewhere)
+
+    matches = query_index(index_path, query, top_k=1)
+
+    assert matches[0].similarity is not None
+    assert (directory / 'f5.mid').samefile(matches[0].path)
+
+
+def test_rebuild_reuses_unchanged_sketches(corpus, monkeypatch):
+    directory, index_path, _query = corpus
+    with SimilarityIndex(index_path) as index:
+        before = [list(index.signature(i)) for i in range(len(index))]
+
+    def no_parse(path):
+        raise AssertionError(f'{path} is unchanged and must not be parsed again')
+
+    monkeypatch.setattr(similarity, 'extract_note_records', no_parse)
+    assert build_index(iter_midi_files(directory), index_path) == 8
+    with SimilarityIndex(index_path) as index:
+        assert [list(index.signature(i)) for i in range(len(index))] == before
+
+
+def test_unreadable_candidate_is_reported(corpus):
+    directory, index_path, query = corpus
+    (directory / 'f5.mid').unlink()
+    errors = []
+
+    matches = query_index(index_path, query, top_k=1, on_error=lambda path, e: errors.append(path))
+
+    assert matches[0].similarity is None
+    assert [path.name for path in errors] == ['f5.mid']
+
+
+def test_query_command_accepts_corpus_directory(corpus, capsys):
+    directory, _index_path, query = corpus
+    index_query_command(str(query), str(directory), top_k=1, verify=True)
+    out = capsys.readouterr().out
+    assert 'f5.mid' in out
+    assert 'exact' in out
@@ -0,0 +1,120 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    tests/test_sources.py
+
+Description:
+    Every kind of source (path, bytes, memoryview, file object, standard input,
+    compressed file, zip member) decodes to the same notes, whether it is mapped,
+    held in memory or spooled to a temporary file.
+"""
+
+from __future__ import annotations
+
+import bz2
+import gzip
+import io
+import lzma
+import mmap
+import sys
+import zipfile
+
+import pytest
+
+from midi_diff import core
+from midi_diff.midi_utils import extract_note_records, iter_buffer_note_records
+from midi_diff.report import FORMAT_JSONL, FORMAT_TRACKS, REPORT_SUFFIXES
+from midi_diff.sources import open_source
+
+COMPRESSORS = [gzip.compress, bz2.compress, lzma.compress]
+
+
+@pytest.fixture
+def plain(midi_pair):
+    data = midi_pair[0].read_bytes()
+    return data, list(iter_buffer_note_records(data))
+
+
+@pytest.mark.parametrize('compress', COMPRESSORS)
+@pytest.mark.parametrize('spool_limit', [0, 1 << 30])
+def test_compressed_file(plain, tmp_path, compress, spool_limit):
+    data, expected = plain
+    path = tmp_path / 'song.mid.z'
+    path.write_bytes(compress(data))
+
+    with open_source(path, spool_limit=spool_limit) as buf:
+        assert isinstance(buf, mmap.mmap) == (spool_limit == 0)
+        assert list(iter_buffer_note_records(buf)) == expected
+
+
+@pytest.mark.parametrize('spool_limit', [0, 1 << 30])
+def test_zip_member(plain, tmp_path, spool_limit):
+    data, expected = plain
+    archive = tmp_path / 'songs.zip'
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('a/song.mid', data)
+        zf.writestr('a/song.mid.gz', gzip.compress(data))
+
+    for member in ('a/song.mid', 'a/song.mid.gz'):
+        with open_source(f'{archive}::{member}', spool_limit=spool_limit) as buf:
+            assert bytes(buf) == data
+            assert list(iter_buffer_note_records(buf)) == expected
+
+
+def test_missing_zip_member(tmp_path):
+    archive = tmp_path / 'songs.zip'
+    with zipfile.ZipFile(archive, 'w') as zf:
+        zf.writestr('song.mid', b'')
+    with pytest.raises(KeyError), open_source(f'{archive}::other.mid'):
+        pass
+
+
+class FailingStream(io.RawIOBase):
+    def readable(self):
+        return True
+
+    def readinto(self, _buffer):
+        raise OSError('device not ready')
+
+
+def with_stdin(monkeypatch, data: bytes) -> None:
+    monkeypatch.setattr(sys, 'stdin', io.TextIOWrapper(io.BytesIO(data)))
+
+
+def run_main(tmp_path, name, output_format, *sources) -> bytes:
+    out_file = tmp_path / (name + REPORT_SUFFIXES[output_format])
+    core.main(*sources, out_file, output_format=output_format)
+    return out_file.read_bytes()
+
+
+def test_in_memory_sources(midi_pair):
+    data = midi_pair[0].read_bytes()
+    expected = extract_note_records(midi_pair[0])
+    assert extract_note_records(data) == expected
+    assert extract_note_records(memoryview(data)) == expected
+    assert extract_note_records(io.BytesIO(data)) == expected
+    with midi_pair[0].open('rb') as fh:
+        assert extract_note_records(fh) == expected
+
+
+@pytest.mark.parametrize('output_format', [FORMAT_JSONL, FORMAT_TRACKS])
+def test_main_reads_standard_input(midi_pair, tmp_path, monkeypatch, capsys, output_format):
+    a, b = midi_pair
+    expected = run_main(tmp_path, 'paths', output_format, a, b)
+    with_stdin(monkeypatch, a.read_bytes())
+
+    assert run_main(tmp_path, 'stdin', output_format, '-', b) == expected
+    assert run_main(tmp_path, 'stream', output_format, a, io.BytesIO(b.read_bytes())) == expected
+    assert 'Failed' not in capsys.readouterr().out
+
+
+def test_main_reports_unreadable_stream(midi_pair, tmp_path, capsys):
+    out_file = tmp_path / 'tracks.mid'
+    core.main(midi_pair[0], io.BufferedReader(FailingStream()), out_file, output_format=FORMAT_TRACKS)
+    assert 'Failed to load MIDI files: device not ready' in capsys.readouterr().out
+    assert not out_file.exists()
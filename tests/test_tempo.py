@@ -0,0 +1,86 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    tests/test_tempo.py
+
+Description:
+    Tempo maps and time-domain comparison: tick-to-microsecond conversion across tempo
+    changes, and files that sound the same at different resolutions diffing as equal.
+"""
+
+from __future__ import annotations
+
+import random
+
+import mido
+import pytest
+
+from midi_diff.core import diff_files
+from midi_diff.tempo import DEFAULT_TEMPO, TempoMap, micros_to_ticks
+
+from conftest import TICKS_PER_BEAT, build_track, random_notes
+
+
+def write_song(path, notes, ticks_per_beat: int, tempos: list[tuple[int, int]]):
+    """Write one note track plus a conductor track holding ``(tick, tempo)`` changes."""
+    mid = mido.MidiFile(type=1, ticks_per_beat=ticks_per_beat)
+    conductor = mido.MidiTrack()
+    last = 0
+    for tick, tempo in tempos:
+        conductor.append(mido.MetaMessage('set_tempo', tempo=tempo, time=tick - last))
+        last = tick
+    mid.tracks.append(conductor)
+    mid.tracks.append(build_track(notes))
+    mid.save(path)
+    return path
+
+
+def test_conversion_across_tempo_changes():
+    tempo_map = TempoMap.from_changes(480, [(960, 250000), (0, 600000), (0, 500000), (1920, 250000)])
+    # Later changes at the same tick win, and a repeated tempo adds no segment.
+    assert tempo_map.ticks == (0, 960)
+    assert tempo_map.tempos == (500000, 250000)
+    assert tempo_map.to_micros(480) == 500000
+    assert tempo_map.to_micros(960) == 1000000
+    assert tempo_map.to_micros(1440) == 1250000
+    assert tempo_map.note_times(720, 480) == (750000, 375000)
+    assert micros_to_ticks(1000000, 960) == 1920
+    with pytest.raises(ValueError):
+        TempoMap.from_changes(0, [])
+
+
+def test_buffer_tempo_map_matches_mido(midi_pair):
+    for path in midi_pair:
+        assert TempoMap.from_buffer(path.read_bytes()) == TempoMap.from_midi(mido.MidiFile(path))
+
+
+def test_same_music_at_another_resolution(tmp_path):
+    notes = random_notes(random.Random(27), 200, (0, 1))
+    changes = [(0, DEFAULT_TEMPO), (16 * TICKS_PER_BEAT, 400000)]
+    a = write_song(tmp_path / 'a.mid', notes, TICKS_PER_BEAT, changes)
+    doubled = [(start * 2, duration * 2, channel, pitch, velocity) for start, duration, channel, pitch, velocity in notes]
+    b = write_song(tmp_path / 'b.mid', doubled, 2 * TICKS_PER_BEAT, [(tick * 2, tempo) for tick, tempo in changes])
+
+    by_ticks, _ppq = diff_files(a, b)
+    assert by_ticks.only_in_a_records and by_ticks.only_in_b_records
+
+    by_time, ppq = diff_files(a, b, time_domain=True, ppq=960)
+    assert ppq == 960
+    assert by_time.only_in_a_records == [] and by_time.only_in_b_records == []
+
+
+def test_time_domain_reports_moved_note(tmp_path):
+    notes = [(0, 480, 0, 60, 90), (960, 480, 0, 64, 90)]
+    a = write_song(tmp_path / 'a.mid', notes, TICKS_PER_BEAT, [(0, DEFAULT_TEMPO)])
+    # A slower tempo after the first note moves the second one later in time.
+    b = write_song(tmp_path / 'b.mid', notes, TICKS_PER_BEAT, [(0, DEFAULT_TEMPO), (480, 1000000)])
+
+    diff, ppq = diff_files(a, b, time_domain=True)
+
+    assert ppq == TICKS_PER_BEAT
+    assert len(diff.only_in_a_records) == len(diff.only_in_b_records) == 1
@@ -0,0 +1,124 @@
+"""
+Author:
+    Inspyre Softworks
+
+Project:
+    MIDIDiff
+
+File:
+    tests/test_watch.py
+
+Description:
+    Watch mode must keep the same diff as ``diff`` across saves, and survive a save
+    that is still being written.
+"""
+
+from __future__ import annotations
+
+import queue
+import random
+import shutil
+import threading
+
+import pytest
+
+from midi_diff.core import diff_files
+from midi_diff.diff import SIDE_A, SIDE_B
+from midi_diff.watch import WatchSession, watch
+
+from conftest import edit_notes, random_notes, write_midi
+
+
+def save_until(results: queue.Queue, path, data: bytes):
+    """Save ``data`` until the watcher reacts, since it only starts watching after the first write."""
+    for _ in range(50):
+        path.write_bytes(data)
+        try:
+            return results.get(timeout=0.2)
+        except queue.Empty:
+            continue
+    raise AssertionError(f'watch never reacted to saving {path}')
+
+
+def session_sides(session: WatchSession) -> tuple[set[int], set[int]]:
+    return set(session.only_a), set(session.only_b)
+
+
+def file_sides(file_a, file_b) -> tuple[set[int], set[int]]:
+    diff, _ppq = diff_files(file_a, file_b)
+    return {record[0] for record in diff.only_in_a_records}, {record[0] for record in diff.only_in_b_records}
+
+
+@pytest.fixture
+def watched(midi_pair, tmp_path):
+    a, b = tmp_path / 'a.mid', tmp_path / 'b.mid'
+    shutil.copyfile(midi_pair[0], a)
+    shutil.copyfile(midi_pair[1], b)
+    return a, b
+
+
+def test_session_matches_diff_after_edits(watched):
+    a, b = watched
+    session = WatchSession(a, b)
+    assert session_sides(session) == file_sides(a, b)
+
+    rng = random.Random(99)
+    write_midi(b, [edit_notes(rng, random_notes(rng, 50, (0,))), random_notes(rng, 50, (9,))])
+    assert session.refresh({b})
+    assert session_sides(session) == file_sides(a, b)
+    assert not session.refresh({b})
+
+
+def test_truncated_save_keeps_last_good_state(watched):
+    a, b = watched
+    session = WatchSession(a, b)
+    before = session_sides(session)
+    data = b.read_bytes()
+
+    b.write_bytes(data[: len(data) // 2])
+    with pytest.raises(ValueError):
+        session.refresh({b})
+    assert session_sides(session) == before
+
+    b.write_bytes(a.read_bytes())
+    assert session.refresh({b})
+    assert session.only_b == set()
+    assert session_sides(session)[0] == set()
+
+
+def test_watch_loop_survives_truncated_save(watched, tmp_path):
+    a, b = watched
+    out = tmp_path / 'out.jsonl'
+    updates: queue.Queue = queue.Queue()
+    errors: queue.Queue = queue.Queue()
+    stop = threading.Event()
+    thread = threading.Thread(
+        target=watch,
+        args=(a, b, out),
+        kwargs=dict(
+            output_format='jsonl',
+            debounce=0.05,
+            poll=True,
+            poll_interval=0.01,
+            on_update=lambda counts, _seconds: updates.put(counts),
+            on_error=errors.put,
+            stop=stop,
+        ),
+        daemon=True,
+    )
+    thread.start()
+    try:
+        first = updates.get(timeout=10)
+        assert first[SIDE_A] and first[SIDE_B]
+
+        data = b.read_bytes()
+        assert isinstance(save_until(errors, b, data[: len(data) // 2]), ValueError)
+        assert thread.is_alive()
+
+        counts = save_until(updates, b, a.read_bytes())
+        assert counts[SIDE_A] == counts[SIDE_B] == 0
+        assert out.read_bytes() == b''
+    finally:
+        stop.set()
+        thread.join(timeout=10)
+    assert not thread.is_alive()